@@ -11,11 +11,13 @@ from fastapi.responses import JSONResponse
 import httpx
 import os
 import jwt
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, AsyncIterator
+import json
 import logging
 from datetime import datetime, timedelta
 from pydantic import BaseModel, Field
 import asyncio
+import time
 from contextlib import asynccontextmanager
 
 # Import security middleware
@@ -82,6 +84,8 @@ async def lifespan(app: FastAPI):
     http_client = httpx.AsyncClient(timeout=30.0)
     logger.info("Auth Service started")
     yield
+    if jwks_refresh_task and not jwks_refresh_task.done():
+        jwks_refresh_task.cancel()
     await http_client.aclose()
     logger.info("Auth Service shutdown")
 
@@ -115,46 +119,93 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Global JWKS cache
-jwks_cache = {}
-jwks_cache_time = None
+# Global JWKS key ring: kid -> parsed public key object, so tokens can be
+# verified without re-converting the JWK on every request
+jwks_keys: Dict[str, Any] = {}
+jwks_cache_time: Optional[float] = None
 JWKS_CACHE_DURATION = 3600  # 1 hour
+JWKS_REFRESH_AHEAD = 300  # refresh in the background 5 minutes before expiry
+JWKS_MIN_REFETCH_INTERVAL = 30  # throttle refetches triggered by unknown kids
+jwks_refresh_lock = asyncio.Lock()
+jwks_refresh_task: Optional[asyncio.Task] = None
+
+def jwk_to_public_key(key: Dict[str, Any]):
+    """Convert an RSA JWK into a cryptography public key object"""
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    import base64
+
+    # Extract RSA components
+    n = base64.urlsafe_b64decode(key["n"] + "====")
+    e = base64.urlsafe_b64decode(key["e"] + "====")
+
+    public_numbers = rsa.RSAPublicNumbers(
+        int.from_bytes(e, 'big'),
+        int.from_bytes(n, 'big')
+    )
+    return public_numbers.public_key()
+
+async def fetch_jwks() -> Dict[str, Any]:
+    """Fetch the JWKS document from Keycloak"""
+    keycloak_config_url = f"{KEYCLOAK_URL}/realms/{KEYCLOAK_REALM}/.well-known/openid_configuration"
 
-async def get_jwks_key(token: str) -> str:
-    """Get the appropriate public key from Keycloak JWKS endpoint"""
-    global jwks_cache, jwks_cache_time
+    try:
+        config_response = await http_client.get(keycloak_config_url)
+    except httpx.RequestError as e:
+        logger.error(f"Network error fetching Keycloak configuration: {e}")
+        raise HTTPException(status_code=503, detail="Cannot fetch Keycloak configuration")
 
-    # Check cache validity
-    if jwks_cache_time and (datetime.utcnow() - jwks_cache_time).seconds < JWKS_CACHE_DURATION:
-        jwks = jwks_cache
-    else:
-        # Fetch JWKS from Keycloak
-        keycloak_config_url = f"{KEYCLOAK_URL}/realms/{KEYCLOAK_REALM}/.well-known/openid_configuration"
+    if config_response.status_code != 200:
+        raise HTTPException(status_code=401, detail="Cannot fetch Keycloak configuration")
 
-        try:
-            config_response = await http_client.get(keycloak_config_url)
-        except httpx.RequestError as e:
-            logger.error(f"Network error fetching Keycloak configuration: {e}")
-            raise HTTPException(status_code=503, detail="Cannot fetch Keycloak configuration")
+    config = config_response.json()
+    jwks_uri = config["jwks_uri"]
 
-        if config_response.status_code != 200:
-            raise HTTPException(status_code=401, detail="Cannot fetch Keycloak configuration")
+    try:
+        jwks_response = await http_client.get(jwks_uri)
+    except httpx.RequestError as e:
+        logger.error(f"Network error fetching JWKS: {e}")
+        raise HTTPException(status_code=503, detail="Cannot fetch JWKS")
 
-        config = config_response.json()
-        jwks_uri = config["jwks_uri"]
+    if jwks_response.status_code != 200:
+        raise HTTPException(status_code=401, detail="Cannot fetch JWKS")
 
-        try:
-            jwks_response = await http_client.get(jwks_uri)
-        except httpx.RequestError as e:
-            logger.error(f"Network error fetching JWKS: {e}")
-            raise HTTPException(status_code=503, detail="Cannot fetch JWKS")
+    return jwks_response.json()
+
+async def refresh_jwks_keys(min_age: float = 0) -> None:
+    """Refresh the key ring; concurrent callers share a single fetch.
 
-        if jwks_response.status_code != 200:
-            raise HTTPException(status_code=401, detail="Cannot fetch JWKS")
+    Callers that were waiting on the lock skip the fetch when the ring was
+    refreshed less than ``min_age`` seconds ago by whoever held it.
+    """
+    global jwks_keys, jwks_cache_time
 
-        jwks = jwks_response.json()
-        jwks_cache = jwks
-        jwks_cache_time = datetime.utcnow()
+    async with jwks_refresh_lock:
+        if jwks_cache_time and time.monotonic() - jwks_cache_time < min_age:
+            return
+
+        jwks = await fetch_jwks()
+        keys = {}
+        for key in jwks.get("keys", []):
+            if key.get("kty") != "RSA" or "kid" not in key:
+                continue
+            try:
+                keys[key["kid"]] = jwk_to_public_key(key)
+            except (KeyError, ValueError) as e:
+                logger.warning(f"Skipping malformed JWK {key.get('kid')}: {e}")
+
+        jwks_keys = keys
+        jwks_cache_time = time.monotonic()
+
+async def _background_jwks_refresh() -> None:
+    """Refresh-ahead task; failures keep serving the current key ring"""
+    try:
+        await refresh_jwks_keys(min_age=JWKS_CACHE_DURATION - JWKS_REFRESH_AHEAD)
+    except Exception as e:
+        logger.warning(f"Background JWKS refresh failed: {e}")
+
+async def get_jwks_key(token: str):
+    """Get the appropriate public key from the cached Keycloak JWKS key ring"""
+    global jwks_refresh_task
 
     # Decode token header to get key ID
     unverified_header = jwt.get_unverified_header(token)
@@ -163,33 +214,25 @@ async def get_jwks_key(token: str) -> str:
     if not kid:
         raise HTTPException(status_code=401, detail="Token missing key ID")
 
-    # Find matching key
-    for key in jwks["keys"]:
-        if key["kid"] == kid:
-            # Convert JWK to PEM format
-            from cryptography.hazmat.primitives import serialization
-            from cryptography.hazmat.primitives.asymmetric import rsa
-            import base64
-
-            # Extract RSA components
-            n = base64.urlsafe_b64decode(key["n"] + "====")
-            e = base64.urlsafe_b64decode(key["e"] + "====")
-
-            # Create RSA public key
-            public_numbers = rsa.RSAPublicNumbers(
-                int.from_bytes(e, 'big'),
-                int.from_bytes(n, 'big')
-            )
-            public_key = public_numbers.public_key()
+    age = time.monotonic() - jwks_cache_time if jwks_cache_time else None
 
-            # Convert to PEM
-            pem = public_key.public_bytes(
-                encoding=serialization.Encoding.PEM,
-                format=serialization.PublicFormat.SubjectPublicKeyInfo
-            )
-            return pem.decode('utf-8')
+    if age is None or age >= JWKS_CACHE_DURATION:
+        # Cold or expired cache: every waiter shares the same fetch
+        await refresh_jwks_keys(min_age=JWKS_CACHE_DURATION - JWKS_REFRESH_AHEAD)
+    elif age >= JWKS_CACHE_DURATION - JWKS_REFRESH_AHEAD:
+        if jwks_refresh_task is None or jwks_refresh_task.done():
+            jwks_refresh_task = asyncio.create_task(_background_jwks_refresh())
 
-    raise HTTPException(status_code=401, detail="Unable to find appropriate key")
+    public_key = jwks_keys.get(kid)
+    if public_key is None:
+        # Unknown kid, most likely a key rotation: refetch once, throttled
+        await refresh_jwks_keys(min_age=JWKS_MIN_REFETCH_INTERVAL)
+        public_key = jwks_keys.get(kid)
+
+    if public_key is None:
+        raise HTTPException(status_code=401, detail="Unable to find appropriate key")
+
+    return public_key
 
 # Authentication Dependencies
 async def verify_token(credentials: HTTPAuthorizationCredentials = Depends(security)) -> Dict[str, Any]:
@@ -448,37 +491,255 @@ async def get_keycloak_admin_token() -> str:
         raise HTTPException(status_code=502, detail="Keycloak connection failed")
 
 
-async def fetch_keycloak_users(admin_token: str) -> list[Dict[str, Any]]:
-    """Fetch all users from Keycloak handling pagination"""
-    users: list[Dict[str, Any]] = []
+async def iter_keycloak_user_pages(
+    admin_token: str, page_size: int = 100
+) -> AsyncIterator[list[Dict[str, Any]]]:
+    """Yield Keycloak users one page at a time instead of buffering the realm"""
     first = 0
-    max_results = 100
 
     while True:
         try:
             resp = await http_client.get(
                 f"{KEYCLOAK_URL}/admin/realms/{KEYCLOAK_REALM}/users",
                 headers={"Authorization": f"Bearer {admin_token}"},
-                params={"first": first, "max": max_results},
+                params={"first": first, "max": page_size},
             )
-            if resp.status_code != 200:
-                logger.error(
-                    f"Failed to fetch users: {resp.status_code} {resp.text}"
-                )
-                raise HTTPException(
-                    status_code=resp.status_code, detail="Failed to fetch users"
-                )
-            batch = resp.json()
-            if not isinstance(batch, list):
-                raise HTTPException(status_code=500, detail="Invalid response format")
-            users.extend(batch)
-            if len(batch) < max_results:
-                break
-            first += max_results
         except httpx.RequestError as e:
             logger.error(f"Network error fetching users: {e}")
             raise HTTPException(status_code=502, detail="Keycloak connection failed")
-    return users
+        if resp.status_code != 200:
+            logger.error(
+                f"Failed to fetch users: {resp.status_code} {resp.text}"
+            )
+            raise HTTPException(
+                status_code=resp.status_code, detail="Failed to fetch users"
+            )
+        batch = resp.json()
+        if not isinstance(batch, list):
+            raise HTTPException(status_code=500, detail="Invalid response format")
+        if batch:
+            yield batch
+        if len(batch) < page_size:
+            break
+        first += page_size
+
+# Keycloak user events (self-service) that change or remove a user
+USER_CHANGE_EVENT_TYPES = ["REGISTER", "UPDATE_PROFILE", "UPDATE_EMAIL", "VERIFY_EMAIL"]
+USER_DELETE_EVENT_TYPES = ["DELETE_ACCOUNT"]
+
+async def iter_keycloak_events(
+    admin_token: str, path: str, params: Dict[str, Any], since_ms: int, page_size: int = 100
+) -> AsyncIterator[Dict[str, Any]]:
+    """Yield Keycloak events from an events endpoint newer than since_ms"""
+    first = 0
+    date_from = datetime.utcfromtimestamp(since_ms / 1000).strftime("%Y-%m-%d")
+
+    while True:
+        try:
+            resp = await http_client.get(
+                f"{KEYCLOAK_URL}/admin/realms/{KEYCLOAK_REALM}/{path}",
+                headers={"Authorization": f"Bearer {admin_token}"},
+                params={**params, "dateFrom": date_from, "first": first, "max": page_size},
+            )
+        except httpx.RequestError as e:
+            logger.error(f"Network error fetching {path}: {e}")
+            raise HTTPException(status_code=502, detail="Keycloak connection failed")
+        if resp.status_code != 200:
+            logger.error(f"Failed to fetch {path}: {resp.status_code} {resp.text}")
+            raise HTTPException(status_code=resp.status_code, detail=f"Failed to fetch {path}")
+        events = resp.json()
+        for event in events:
+            # dateFrom only has day granularity, so filter precisely here
+            if event.get("time", 0) > since_ms:
+                yield event
+        if len(events) < page_size:
+            break
+        first += page_size
+
+async def fetch_user_changes(admin_token: str, since_ms: int) -> tuple[set[str], set[str]]:
+    """Ids of users changed and deleted since the watermark
+
+    Admin events cover changes made through the admin API or console; user
+    events cover self-service registration, profile edits and account
+    deletion, which produce no admin event.
+    """
+    changed: set[str] = set()
+    deleted: set[str] = set()
+
+    async for event in iter_keycloak_events(
+        admin_token, "admin-events", {"resourceTypes": "USER"}, since_ms
+    ):
+        parts = (event.get("resourcePath") or "").split("/")
+        if len(parts) < 2 or parts[0] != "users":
+            continue
+        # Only deleting the user itself removes it, not one of its sub-resources
+        if event.get("operationType") == "DELETE" and len(parts) == 2:
+            deleted.add(parts[1])
+        else:
+            changed.add(parts[1])
+
+    async for event in iter_keycloak_events(
+        admin_token, "events", {"type": USER_CHANGE_EVENT_TYPES + USER_DELETE_EVENT_TYPES}, since_ms
+    ):
+        user_id = event.get("userId")
+        if not user_id:
+            continue
+        if event.get("type") in USER_DELETE_EVENT_TYPES:
+            deleted.add(user_id)
+        else:
+            changed.add(user_id)
+
+    return changed - deleted, deleted
+
+# User sync watermark
+USER_SYNC_STATE_FILE = os.getenv("USER_SYNC_STATE_FILE", "/tmp/makrx-auth-user-sync.json")
+USER_SYNC_BATCH_SIZE = int(os.getenv("USER_SYNC_BATCH_SIZE", "50"))
+SERVICE_TOKEN = os.getenv("SERVICE_TOKEN")
+
+# Batch user sync endpoints and the actions each service applies; the Store
+# keeps no user records (profiles come from the token), so it only needs
+# deletions to drop the user's carts and subscriptions
+USER_SYNC_TARGETS = {
+    "makrcave": (f"{MAKRCAVE_API_URL}/api/v1/bridge/users/sync", {"update", "delete"}),
+    "store": (f"{STORE_API_URL}/bridge/users/sync", {"delete"}),
+}
+
+def load_user_sync_watermark() -> Optional[int]:
+    """Return the last successful sync time in epoch milliseconds"""
+    try:
+        with open(USER_SYNC_STATE_FILE) as f:
+            return json.load(f).get("last_synced_ms")
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable user sync state: {e}")
+        return None
+
+def save_user_sync_watermark(last_synced_ms: int) -> None:
+    """Persist the watermark atomically so a crash never leaves a torn file"""
+    os.makedirs(os.path.dirname(USER_SYNC_STATE_FILE) or ".", exist_ok=True)
+    tmp_path = f"{USER_SYNC_STATE_FILE}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"last_synced_ms": last_synced_ms}, f)
+    os.replace(tmp_path, USER_SYNC_STATE_FILE)
+
+def keycloak_user_to_sync_request(user: Dict[str, Any]) -> UserSyncRequest:
+    """Map a Keycloak user representation onto a downstream upsert"""
+    return UserSyncRequest(
+        user_id=user["id"],
+        portal="all",
+        action="update",
+        data={
+            "username": user.get("username"),
+            "email": user.get("email"),
+            "first_name": user.get("firstName"),
+            "last_name": user.get("lastName"),
+            "enabled": user.get("enabled", True),
+            "attributes": user.get("attributes", {}),
+        },
+    )
+
+async def push_user_batch(service: str, batch: list[UserSyncRequest]) -> Dict[str, Any]:
+    """Send a batch of upserts and deletes to a service in one request"""
+    url, actions = USER_SYNC_TARGETS[service]
+    users = [req.dict() for req in batch if req.action in actions]
+    if not users:
+        return {"success": True, "applied": 0}
+
+    headers = {"Authorization": f"Bearer {SERVICE_TOKEN}"} if SERVICE_TOKEN else {}
+    try:
+        response = await http_client.post(url, json={"users": users}, headers=headers)
+    except httpx.RequestError as e:
+        logger.error(f"Network error syncing {len(users)} users to {service}: {e}")
+        return {"success": False, "error": "network_error"}
+    if response.status_code not in (200, 201):
+        logger.warning(f"Failed to sync {len(users)} users to {service}: HTTP {response.status_code}")
+        return {"success": False, "error": f"HTTP {response.status_code}"}
+
+    result = response.json()
+    failed = result.get("failed") or []
+    if failed:
+        logger.warning(f"{service} rejected {len(failed)} of {len(users)} synced users")
+        return {"success": False, "error": f"{len(failed)} users failed", "failed": failed}
+    return {"success": True, "applied": result.get("applied", len(users))}
+
+async def run_keycloak_user_sync(admin_token: str, full: bool = False) -> Dict[str, Any]:
+    """Stream Keycloak users into downstream services.
+
+    Pages are fetched by a producer while the consumer pushes batched
+    upserts, so at most a couple of pages are held in memory. Incremental
+    runs only push users created or modified since the stored watermark,
+    followed by deletes for users removed since then.
+    """
+    started_ms = int(time.time() * 1000)
+    watermark = None if full else load_user_sync_watermark()
+    changed_ids, deleted_ids = (
+        await fetch_user_changes(admin_token, watermark) if watermark else (set(), set())
+    )
+
+    pages: asyncio.Queue = asyncio.Queue(maxsize=2)
+    stats = {"scanned": 0, "synced": 0, "deleted": 0, "batches": 0, "failed_batches": 0}
+
+    async def produce():
+        try:
+            async for page in iter_keycloak_user_pages(admin_token):
+                await pages.put(page)
+        finally:
+            await pages.put(None)
+
+    async def flush(batch: list[UserSyncRequest], counter: str = "synced"):
+        results = await asyncio.gather(
+            *(push_user_batch(service, batch) for service in USER_SYNC_TARGETS)
+        )
+        stats["batches"] += 1
+        if all(result["success"] for result in results):
+            stats[counter] += len(batch)
+        else:
+            stats["failed_batches"] += 1
+
+    producer = asyncio.create_task(produce())
+    batch: list[UserSyncRequest] = []
+    try:
+        while (page := await pages.get()) is not None:
+            for user in page:
+                stats["scanned"] += 1
+                if watermark and user.get("createdTimestamp", 0) <= watermark \
+                        and user.get("id") not in changed_ids:
+                    continue
+                batch.append(keycloak_user_to_sync_request(user))
+                if len(batch) >= USER_SYNC_BATCH_SIZE:
+                    await flush(batch)
+                    batch = []
+        if batch:
+            await flush(batch)
+        # Surface producer errors (e.g. Keycloak outage mid-stream)
+        await producer
+    finally:
+        if not producer.done():
+            producer.cancel()
+
+    deletes = [
+        UserSyncRequest(user_id=user_id, portal="all", action="delete")
+        for user_id in sorted(deleted_ids)
+    ]
+    for start in range(0, len(deletes), USER_SYNC_BATCH_SIZE):
+        await flush(deletes[start:start + USER_SYNC_BATCH_SIZE], "deleted")
+
+    # Only advance the watermark when every batch landed, so failures retry
+    watermark_saved = False
+    if stats["failed_batches"] == 0:
+        try:
+            save_user_sync_watermark(started_ms)
+            watermark_saved = True
+        except OSError as e:
+            # The sync itself went through; the next run just covers more
+            logger.error(f"Failed to save user sync watermark to {USER_SYNC_STATE_FILE}: {e}")
+
+    return {
+        "mode": "incremental" if watermark else "full",
+        "watermark_saved": watermark_saved,
+        **stats,
+    }
 
 # Admin Endpoints
 @app.get("/admin/users")
@@ -490,7 +751,9 @@ async def list_all_users(user_data: Dict[str, Any] = Depends(verify_token)):
 
     try:
         admin_token = await get_keycloak_admin_token()
-        users = await fetch_keycloak_users(admin_token)
+        users: list[Dict[str, Any]] = []
+        async for page in iter_keycloak_user_pages(admin_token):
+            users.extend(page)
         return {"users": users}
 
     except HTTPException:
@@ -499,6 +762,24 @@ async def list_all_users(user_data: Dict[str, Any] = Depends(verify_token)):
         logger.error(f"Admin user listing error: {e}")
         raise HTTPException(status_code=500, detail="Failed to list users")
 
+@app.post("/admin/users/sync")
+async def sync_keycloak_users(full: bool = False, user_data: Dict[str, Any] = Depends(verify_token)):
+    """Push Keycloak users to all services (incremental unless full=true)"""
+    roles = user_data.get("realm_access", {}).get("roles", [])
+    if "admin" not in roles and "super-admin" not in roles:
+        raise HTTPException(status_code=403, detail="Admin access required")
+
+    try:
+        admin_token = await get_keycloak_admin_token()
+        result = await run_keycloak_user_sync(admin_token, full=full)
+        return {"message": "Keycloak user sync completed", **result}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Keycloak user sync error: {e}")
+        raise HTTPException(status_code=500, detail="Keycloak user sync failed")
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -4,46 +4,37 @@ Rate limiting, input validation, and security headers
 """
 
 import asyncio
-import time
-from collections import defaultdict
 from typing import Dict, Any
 from fastapi import Request, Response, HTTPException, status
 from fastapi.middleware.base import BaseHTTPMiddleware
 import logging
 
+from makrx_rate_limit import create_rate_limit_backend
+
 logger = logging.getLogger(__name__)
 
 class RateLimitMiddleware(BaseHTTPMiddleware):
     """Rate limiting middleware to prevent brute force attacks"""
     
-    def __init__(self, app, calls: int = 100, period: int = 3600):
+    def __init__(self, app, calls: int = 100, period: int = 3600, backend=None):
         super().__init__(app)
         self.calls = calls
         self.period = period
-        self.clients = defaultdict(list)
+        self.backend = backend or create_rate_limit_backend()
         
     async def dispatch(self, request: Request, call_next):
         # Get client IP
         client_ip = request.client.host
         
-        # Clean old entries
-        now = time.time()
-        self.clients[client_ip] = [
-            call_time for call_time in self.clients[client_ip]
-            if now - call_time < self.period
-        ]
-        
-        # Check rate limit
-        if len(self.clients[client_ip]) >= self.calls:
+        # Check and record this call
+        allowed, _ = await self.backend.hit(f"auth:{client_ip}", self.calls, self.period)
+        if not allowed:
             logger.warning(f"Rate limit exceeded for IP: {client_ip}")
             raise HTTPException(
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
                 detail="Rate limit exceeded. Please try again later."
             )
         
-        # Record this call
-        self.clients[client_ip].append(now)
-        
         # Process request
         response = await call_next(request)
         return response
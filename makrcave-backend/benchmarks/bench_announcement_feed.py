@@ -0,0 +1,220 @@
+"""
+Member announcement feed: targeting index vs per-announcement filtering
+
+Seeds one makerspace with --announcements announcements spread over every
+target audience, --members members with roles, plans and skills, and
+--acknowledgments acknowledgments, then times the member feed for a sample
+of members two ways:
+
+- index: member_announcements_query, the query behind GET /member
+- python: the previous implementation, which loaded every live
+  announcement, ran is_targeted_to_member on each and dropped the member's
+  acknowledged ids in Python
+
+Both paths must return the same announcements in the same order; the run
+fails otherwise. Uses an in-memory SQLite database unless --database-url
+is given (its announcement tables are dropped and recreated).
+
+    python benchmarks/bench_announcement_feed.py --announcements 5000 --members 10000
+"""
+
+import argparse
+import importlib.util
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from types import SimpleNamespace
+
+from sqlalchemy import Column, Index, MetaData, Table, Uuid, create_engine
+from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.orm import sessionmaker
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+# The backend uses package-relative imports from a directory whose name is
+# not importable; register it as `makrcave` (as tests/conftest.py does)
+if "makrcave" not in sys.modules:
+    spec = importlib.util.spec_from_file_location(
+        "makrcave", BACKEND_DIR / "__init__.py", submodule_search_locations=[str(BACKEND_DIR)]
+    )
+    package = importlib.util.module_from_spec(spec)
+    sys.modules["makrcave"] = package
+    spec.loader.exec_module(package)
+
+# Announcements relate to Makerspace, User and Member; import them for the mappers
+import makrcave.models.inventory  # noqa: E402,F401
+import makrcave.models.member  # noqa: E402,F401
+from makrcave.models.announcements import (  # noqa: E402
+    ADMIN_ROLES, Announcement, AnnouncementAcknowledgment, AnnouncementTarget,
+    Priority, TargetAudience, member_announcements_query
+)
+
+ROLES = ["member"] * 8 + ADMIN_ROLES
+PLANS = [str(uuid.uuid4()) for _ in range(10)]
+SKILLS = [str(uuid.uuid4()) for _ in range(40)]
+PRIORITY_ORDER = {
+    Priority.CRITICAL: 5, Priority.URGENT: 4, Priority.HIGH: 3, Priority.NORMAL: 2, Priority.LOW: 1
+}
+
+def create_tables(engine):
+    """Create the feed tables without foreign keys to the rest of the schema"""
+    def column_type(column):
+        # postgresql.UUID has no DDL on other databases; Uuid stores it as CHAR(32)
+        if isinstance(column.type, UUID) and engine.dialect.name != "postgresql":
+            return Uuid()
+        return column.type
+
+    metadata = MetaData()
+    for source in (Announcement.__table__, AnnouncementTarget.__table__, AnnouncementAcknowledgment.__table__):
+        table = Table(source.name, metadata, *(
+            Column(column.name, column_type(column), primary_key=column.primary_key,
+                   nullable=column.nullable, server_default=column.server_default)
+            for column in source.columns
+        ))
+        for index in source.indexes:
+            Index(index.name, *(table.c[column.name] for column in index.columns))
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+
+def seed(db, makerspace_id, args, rnd):
+    now = datetime.utcnow()
+    members = [
+        SimpleNamespace(
+            id=uuid.uuid4(),
+            makerspace_id=makerspace_id,
+            is_active=rnd.random() < 0.9,
+            created_at=now - timedelta(days=rnd.randrange(365)),
+            role=rnd.choice(ROLES),
+            membership_plan_id=rnd.choice(PLANS),
+            skills=rnd.sample(SKILLS, rnd.randrange(4)),
+        )
+        for _ in range(args.members)
+    ]
+
+    audiences = list(TargetAudience)
+    announcements = []
+    for n in range(args.announcements):
+        audience = rnd.choice(audiences)
+        announcement = Announcement(
+            id=uuid.uuid4(),
+            makerspace_id=makerspace_id,
+            title=f"Announcement {n}",
+            content="Benchmark announcement",
+            priority=rnd.choice(list(Priority)),
+            target_audience=audience,
+            target_membership_plans=rnd.sample(PLANS, 2) if audience == TargetAudience.SPECIFIC_PLANS else None,
+            target_skills=rnd.sample(SKILLS, 3) if audience == TargetAudience.SPECIFIC_SKILLS else None,
+            target_members=(
+                [str(member.id) for member in rnd.sample(members, 20)]
+                if audience == TargetAudience.SPECIFIC_MEMBERS else None
+            ),
+            is_published=rnd.random() < 0.8,
+            is_pinned=rnd.random() < 0.05,
+            expires_at=now + timedelta(days=rnd.choice([-1, 30])),
+            created_at=now - timedelta(seconds=n),
+            created_by=uuid.uuid4(),
+        )
+        announcements.append(announcement)
+        db.add(announcement)
+    db.flush()
+
+    for _ in range(args.acknowledgments):
+        db.add(AnnouncementAcknowledgment(
+            id=uuid.uuid4(),
+            announcement_id=rnd.choice(announcements).id,
+            member_id=rnd.choice(members).id,
+        ))
+    db.commit()
+    return members
+
+def python_feed(db, member, limit):
+    """The feed as computed before the targeting index"""
+    current_time = datetime.utcnow()
+    live = db.query(Announcement).filter(
+        Announcement.makerspace_id == member.makerspace_id,
+        Announcement.is_published == True,  # noqa: E712
+        (Announcement.publish_at.is_(None)) | (Announcement.publish_at <= current_time),
+        (Announcement.expires_at.is_(None)) | (Announcement.expires_at > current_time),
+    ).all()
+    acknowledged = {
+        str(row[0]) for row in db.query(AnnouncementAcknowledgment.announcement_id).filter(
+            AnnouncementAcknowledgment.member_id == member.id
+        ).all()
+    }
+    targeted = [
+        announcement for announcement in live
+        if announcement.is_targeted_to_member(member) and str(announcement.id) not in acknowledged
+    ]
+    targeted.sort(
+        key=lambda a: (bool(a.is_pinned), PRIORITY_ORDER.get(a.priority, 2), a.created_at),
+        reverse=True,
+    )
+    return targeted[:limit]
+
+def index_feed(db, member, limit):
+    return member_announcements_query(db, member).limit(limit).all()
+
+def measure(session_factory, feed, members, limit):
+    timings, results = [], []
+    for member in members:
+        db = session_factory()
+        try:
+            start = time.perf_counter()
+            announcements = feed(db, member, limit)
+            timings.append(time.perf_counter() - start)
+            results.append([announcement.id for announcement in announcements])
+        finally:
+            db.close()
+    return timings, results
+
+def report(name, timings):
+    timings = sorted(timings)
+    p95 = timings[max(int(len(timings) * 0.95) - 1, 0)]
+    print(f"{name:<8} p50 {statistics.median(timings) * 1e3:8.2f} ms   p95 {p95 * 1e3:8.2f} ms")
+    return statistics.median(timings)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--announcements", type=int, default=5000)
+    parser.add_argument("--members", type=int, default=10000)
+    parser.add_argument("--acknowledgments", type=int, default=10000)
+    parser.add_argument("--samples", type=int, default=200, help="members whose feed is timed")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--database-url", default="sqlite://")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    create_tables(engine)
+    session_factory = sessionmaker(bind=engine)
+    rnd = random.Random(args.seed)
+
+    start = time.perf_counter()
+    with session_factory() as db:
+        members = seed(db, uuid.uuid4(), args, rnd)
+    print(
+        f"seeded {args.announcements} announcements, {args.members} members, "
+        f"{args.acknowledgments} acknowledgments in {time.perf_counter() - start:.1f}s"
+    )
+
+    sample = rnd.sample(members, min(args.samples, len(members)))
+    python_timings, python_results = measure(session_factory, python_feed, sample, args.limit)
+    index_timings, index_results = measure(session_factory, index_feed, sample, args.limit)
+    # Unlimited feeds must match too, not only the first page
+    _, python_full = measure(session_factory, python_feed, sample[:20], None)
+    _, index_full = measure(session_factory, index_feed, sample[:20], None)
+
+    before = report("python", python_timings)
+    after = report("index", index_timings)
+    print(f"speedup  {before / after:.1f}x at limit {args.limit}")
+
+    if python_results != index_results or python_full != index_full:
+        sys.exit("feeds differ between the two implementations")
+    print(f"feeds identical for {len(sample)} members")
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session, joinedload, selectinload
 from sqlalchemy import and_, or_, desc, func, text
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
@@ -10,6 +10,7 @@ from ..models.access_control import (
     create_default_permissions, create_default_roles
 )
 from ..models.enhanced_member import Member
+from ..services.permission_cache import permission_cache
 from ..schemas.access_control import (
     PermissionCreate, PermissionUpdate, RoleCreate, RoleUpdate,
     UserSessionCreate, AccessLogCreate, RoleAssignmentCreate,
@@ -68,6 +69,7 @@ def update_permission(db: Session, permission_id: str, permission_update: Permis
         setattr(db_permission, field, value)
     
     db.commit()
+    permission_cache.invalidate_all()
     db.refresh(db_permission)
     return db_permission
 
@@ -79,6 +81,7 @@ def delete_permission(db: Session, permission_id: str) -> bool:
     
     db.delete(db_permission)
     db.commit()
+    permission_cache.invalidate_all()
     return True
 
 # Role CRUD operations
@@ -152,6 +155,7 @@ def update_role(db: Session, role_id: str, role_update: RoleUpdate, updated_by:
     
     db_role.last_modified_by = updated_by
     db.commit()
+    permission_cache.invalidate_all()
     db.refresh(db_role)
     return db_role
 
@@ -195,7 +199,7 @@ def assign_role_to_user(db: Session, assignment: RoleAssignmentCreate, assigned_
         modified_by=assigned_by,
         action="assigned",
         previous_permissions=previous_permissions,
-        new_permissions=user.get_effective_permissions(),
+        new_permissions=list(user.compute_effective_permissions()),
         reason=assignment.reason,
         effective_date=assignment.effective_date,
         expiry_date=assignment.expiry_date
@@ -203,6 +207,7 @@ def assign_role_to_user(db: Session, assignment: RoleAssignmentCreate, assigned_
     
     db.add(log_entry)
     db.commit()
+    permission_cache.invalidate(str(user.id))
     db.refresh(log_entry)
     return log_entry
 
@@ -227,12 +232,13 @@ def revoke_role_from_user(db: Session, role_id: str, user_id: str, revoked_by: s
         modified_by=revoked_by,
         action="revoked",
         previous_permissions=previous_permissions,
-        new_permissions=user.get_effective_permissions(),
+        new_permissions=list(user.compute_effective_permissions()),
         reason=reason
     )
     
     db.add(log_entry)
     db.commit()
+    permission_cache.invalidate(str(user.id))
     return True
 
 # User session management
@@ -366,15 +372,21 @@ def validate_password(db: Session, password: str, makerspace_id: str) -> dict:
 # User access management
 def get_user_access_summary(db: Session, user_id: str) -> Optional[dict]:
     """Get comprehensive user access summary"""
+    # selectinload avoids the roles x permissions x sessions cartesian product
     user = db.query(Member).options(
-        joinedload(Member.roles).joinedload(Role.permissions),
-        joinedload(Member.sessions)
+        selectinload(Member.roles).selectinload(Role.permissions)
     ).filter(Member.id == user_id).first()
     
     if not user:
         return None
     
-    active_sessions = [s for s in user.sessions if s.is_active and not s.is_expired()]
+    active_sessions = db.query(func.count(UserSession.id)).filter(
+        and_(
+            UserSession.user_id == user.id,
+            UserSession.is_active == True,
+            UserSession.expires_at >= datetime.utcnow()
+        )
+    ).scalar() or 0
     
     return {
         "user_id": str(user.id),
@@ -382,7 +394,7 @@ def get_user_access_summary(db: Session, user_id: str) -> Optional[dict]:
         "user_name": f"{user.first_name} {user.last_name}",
         "roles": [role.to_dict() for role in user.roles],
         "permissions": user.get_effective_permissions(),
-        "active_sessions": len(active_sessions),
+        "active_sessions": active_sessions,
         "last_login": user.last_login,
         "account_locked": user.account_locked,
         "password_expires_at": user.password_expires_at,
@@ -644,6 +656,7 @@ def import_roles(db: Session, import_data: RoleImport, imported_by: str) -> dict
                 existing.last_modified_by = imported_by
                 
                 db.commit()
+                permission_cache.invalidate_all()
                 results["updated"].append(role_data.name)
             else:
                 # Create new role
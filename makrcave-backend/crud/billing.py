@@ -1,14 +1,20 @@
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import and_, or_, func, desc, asc, extract
+from sqlalchemy.orm import Session, joinedload, object_session
+from sqlalchemy import (
+    and_, or_, func, desc, asc, extract, update, delete, insert, select,
+    case, cast, literal, event, text, String
+)
+from sqlalchemy.exc import IntegrityError
 from typing import List, Optional, Dict, Any, Tuple
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
+import os
+import threading
 import uuid
 import secrets
 
 from ..models.billing import (
     Transaction, Invoice, CreditWallet, CreditTransaction, Refund,
-    PaymentMethod, BillingPlan, TransactionType, TransactionStatus,
-    PaymentGateway, InvoiceStatus
+    PaymentMethod, BillingPlan, InvoiceSequence, BillingDailyFact,
+    TransactionType, TransactionStatus, PaymentGateway, InvoiceStatus
 )
 from ..schemas.billing import (
     TransactionCreate, TransactionUpdate, TransactionFilter, TransactionSort,
@@ -253,21 +259,106 @@ def update_invoice(db: Session, invoice_id: str, update: InvoiceUpdate) -> Optio
     db.refresh(db_invoice)
     return db_invoice
 
+def _create_invoice_sequence(db: Session, makerspace_id: str, now: datetime):
+    """Create the counter row for a month, continuing any pre-counter numbering"""
+    invoices = Invoice.__table__
+    existing = db.execute(
+        select(func.count()).select_from(invoices).where(and_(
+            invoices.c.makerspace_id == makerspace_id,
+            extract('year', invoices.c.created_at) == now.year,
+            extract('month', invoices.c.created_at) == now.month
+        ))
+    ).scalar()
+
+    try:
+        with db.begin_nested():
+            db.execute(insert(InvoiceSequence.__table__).values(
+                makerspace_id=makerspace_id,
+                period=f"{now.year}-{now.month:02d}",
+                last_value=existing or 0
+            ))
+    except IntegrityError:
+        # Another worker created it first
+        pass
+
+def reserve_invoice_numbers(db: Session, makerspace_id: str, now: datetime, count: int = 1) -> int:
+    """Atomically advance the month's counter by `count` and return its new value.
+
+    The UPDATE holds the counter row lock until the caller's transaction
+    ends, so concurrent reservations for the same makerspace and month are
+    serialised and a rolled-back transaction releases its numbers.
+    """
+    sequence = InvoiceSequence.__table__
+    stmt = (
+        update(sequence)
+        .where(and_(
+            sequence.c.makerspace_id == makerspace_id,
+            sequence.c.period == f"{now.year}-{now.month:02d}"
+        ))
+        .values(last_value=sequence.c.last_value + count, updated_at=func.now())
+        .returning(sequence.c.last_value)
+    )
+
+    last_value = db.execute(stmt).scalar()
+    if last_value is None:
+        _create_invoice_sequence(db, makerspace_id, now)
+        last_value = db.execute(stmt).scalar()
+    return last_value
+
+class InvoiceNumberAllocator:
+    """Allocates invoice numbers from the per-makerspace monthly counters.
+
+    With block_size=1 (the default) each number is taken inside the invoice's
+    own transaction, which keeps numbering gap-free. Larger blocks reserve a
+    range per worker in a separate transaction to cut counter contention,
+    at the cost of gaps when a worker exits and of numbers from different
+    workers interleaving out of creation order.
+    """
+
+    def __init__(self, block_size: int = 1):
+        self.block_size = max(1, block_size)
+        # (makerspace_id, period) -> [next value, last reserved value]
+        self._blocks: Dict[Tuple[str, str], List[int]] = {}
+        self._lock = threading.Lock()
+
+    def next_number(self, db: Session, makerspace_id: str, now: Optional[datetime] = None) -> str:
+        now = now or datetime.now()
+        if self.block_size == 1:
+            value = reserve_invoice_numbers(db, makerspace_id, now)
+        else:
+            value = self._next_from_block(db, makerspace_id, now)
+        return f"INV-{now.year}-{now.month:02d}-{value:05d}"
+
+    def _next_from_block(self, db: Session, makerspace_id: str, now: datetime) -> int:
+        period = f"{now.year}-{now.month:02d}"
+        key = (makerspace_id, period)
+        with self._lock:
+            block = self._blocks.get(key)
+            if block is None or block[0] > block[1]:
+                block_db = Session(bind=db.get_bind())
+                try:
+                    last_value = reserve_invoice_numbers(block_db, makerspace_id, now, self.block_size)
+                    block_db.commit()
+                finally:
+                    block_db.close()
+
+                # Blocks from previous months can never be used again
+                for stale in [k for k in self._blocks if k[1] != period]:
+                    del self._blocks[stale]
+                block = self._blocks[key] = [last_value - self.block_size + 1, last_value]
+
+            value = block[0]
+            block[0] += 1
+            return value
+
+# Global invoice number allocator
+invoice_number_allocator = InvoiceNumberAllocator(
+    int(os.getenv("INVOICE_NUMBER_BLOCK_SIZE", "1"))
+)
+
 def generate_invoice_number(db: Session, makerspace_id: str) -> str:
-    """Generate a unique invoice number"""
-    current_year = datetime.now().year
-    current_month = datetime.now().month
-    
-    # Count invoices for this month
-    count = db.query(Invoice).filter(
-        and_(
-            Invoice.makerspace_id == makerspace_id,
-            extract('year', Invoice.created_at) == current_year,
-            extract('month', Invoice.created_at) == current_month
-        )
-    ).count()
-    
-    return f"INV-{current_year}-{current_month:02d}-{(count + 1):05d}"
+    """Allocate the next invoice number for the makerspace's current month"""
+    return invoice_number_allocator.next_number(db, makerspace_id)
 
 # Credit Wallet CRUD operations
 def get_or_create_credit_wallet(db: Session, user_id: str, makerspace_id: str) -> CreditWallet:
@@ -326,7 +417,7 @@ def create_credit_transaction(db: Session, credit_transaction: CreditTransaction
         service_type=credit_transaction.service_type,
         service_id=credit_transaction.service_id,
         description=credit_transaction.description,
-        metadata=credit_transaction.metadata,
+        transaction_metadata=credit_transaction.metadata,
         processed_by=credit_transaction.processed_by
     )
     
@@ -486,133 +577,300 @@ def delete_payment_method(db: Session, user_id: str, payment_method_id: str) ->
     db.commit()
     return result > 0
 
+# Billing facts rollup
+BILLING_FACT_COLUMNS = [
+    "makerspace_id", "day", "source", "category", "status", "gateway",
+    "service_type", "record_count", "amount", "credits_used", "credits_earned"
+]
+
+def _billing_fact_sources(start: datetime, end: datetime, makerspace_id: Optional[str]):
+    """SELECTs producing the fact rows for raw records created in [start, end)"""
+    tx_day = func.date(Transaction.created_at)
+    tx_type = cast(Transaction.type, String)
+    tx_status = cast(Transaction.status, String)
+    tx_gateway = func.coalesce(cast(Transaction.gateway, String), "")
+    tx_service = func.coalesce(Transaction.service_type, "")
+    transactions = select(
+        Transaction.makerspace_id, tx_day, literal("transaction"), tx_type, tx_status,
+        tx_gateway, tx_service, func.count(Transaction.id),
+        func.coalesce(func.sum(Transaction.amount), 0),
+        func.coalesce(func.sum(Transaction.credits_used), 0),
+        func.coalesce(func.sum(Transaction.credits_earned), 0)
+    ).where(
+        and_(Transaction.created_at >= start, Transaction.created_at < end)
+    ).group_by(Transaction.makerspace_id, tx_day, tx_type, tx_status, tx_gateway, tx_service)
+
+    refund_day = func.date(Refund.created_at)
+    refund_type = func.coalesce(Refund.type, "")
+    refund_status = func.coalesce(Refund.status, "")
+    refunds = select(
+        Refund.makerspace_id, refund_day, literal("refund"), refund_type, refund_status,
+        literal(""), literal(""), func.count(Refund.id),
+        func.coalesce(func.sum(Refund.amount), 0), literal(0), literal(0)
+    ).where(
+        and_(Refund.created_at >= start, Refund.created_at < end)
+    ).group_by(Refund.makerspace_id, refund_day, refund_type, refund_status)
+
+    credit_day = func.date(CreditTransaction.created_at)
+    credit_type = func.coalesce(CreditTransaction.type, "")
+    credit_service = func.coalesce(CreditTransaction.service_type, "")
+    credits = select(
+        CreditWallet.makerspace_id, credit_day, literal("credit"), credit_type, literal(""),
+        literal(""), credit_service, func.count(CreditTransaction.id), literal(0.0),
+        func.coalesce(func.sum(case((CreditTransaction.amount < 0, -CreditTransaction.amount), else_=0)), 0),
+        func.coalesce(func.sum(case((CreditTransaction.amount > 0, CreditTransaction.amount), else_=0)), 0)
+    ).join(
+        CreditWallet, CreditWallet.id == CreditTransaction.wallet_id
+    ).where(
+        and_(CreditTransaction.created_at >= start, CreditTransaction.created_at < end)
+    ).group_by(CreditWallet.makerspace_id, credit_day, credit_type, credit_service)
+
+    if makerspace_id:
+        transactions = transactions.where(Transaction.makerspace_id == makerspace_id)
+        refunds = refunds.where(Refund.makerspace_id == makerspace_id)
+        credits = credits.where(CreditWallet.makerspace_id == makerspace_id)
+
+    return transactions, refunds, credits
+
+def rebuild_billing_facts(connection, start_day: date, end_day: date, makerspace_id: Optional[str] = None):
+    """Recompute the daily billing facts for [start_day, end_day] from the raw tables"""
+    facts = BillingDailyFact.__table__
+    if connection.dialect.name == "postgresql":
+        # Writers add deltas under ROW EXCLUSIVE; wait for them to commit and
+        # hold theirs back until this rebuild commits, so none is lost or counted twice
+        connection.execute(text(f"LOCK TABLE {facts.name} IN SHARE ROW EXCLUSIVE MODE"))
+    clear = delete(facts).where(and_(facts.c.day >= start_day, facts.c.day <= end_day))
+    if makerspace_id:
+        clear = clear.where(facts.c.makerspace_id == makerspace_id)
+    connection.execute(clear)
+
+    start = datetime.combine(start_day, datetime.min.time())
+    end = datetime.combine(end_day + timedelta(days=1), datetime.min.time())
+    for source in _billing_fact_sources(start, end, makerspace_id):
+        connection.execute(insert(facts).from_select(BILLING_FACT_COLUMNS, source))
+
+def refresh_billing_facts(db: Session, days: int = 2, makerspace_id: str = None) -> None:
+    """Catch-up job: rebuild the last `days` days of facts (days=0 rebuilds all history).
+
+    The flush hooks below apply deltas for changes made through the ORM;
+    this covers bulk/raw SQL changes and backfills the table on first deploy.
+    """
+    end_day = datetime.now().date()
+    if days:
+        start_day = end_day - timedelta(days=days - 1)
+    else:
+        earliest = [
+            db.query(func.min(Transaction.created_at)).scalar(),
+            db.query(func.min(Refund.created_at)).scalar(),
+            db.query(func.min(CreditTransaction.created_at)).scalar()
+        ]
+        earliest = [value for value in earliest if value]
+        start_day = min(earliest).date() if earliest else end_day
+
+    rebuild_billing_facts(db.connection(), start_day, end_day, makerspace_id)
+    db.commit()
+
+BILLING_FACT_KEY = BILLING_FACT_COLUMNS[:7]
+BILLING_FACT_VALUES = BILLING_FACT_COLUMNS[7:]
+
+def _billing_fact_row(connection, mapper, target_id, lock: bool = False):
+    """The fact key and values one raw record contributes, read from the database"""
+    if mapper.class_ is CreditTransaction:
+        query = select(
+            CreditWallet.makerspace_id, CreditTransaction.created_at, literal("credit"),
+            func.coalesce(CreditTransaction.type, ""), literal(""), literal(""),
+            func.coalesce(CreditTransaction.service_type, ""), CreditTransaction.amount
+        ).join(
+            CreditWallet, CreditWallet.id == CreditTransaction.wallet_id
+        ).where(CreditTransaction.id == target_id)
+    elif mapper.class_ is Refund:
+        query = select(
+            Refund.makerspace_id, Refund.created_at, literal("refund"),
+            func.coalesce(Refund.type, ""), func.coalesce(Refund.status, ""), literal(""),
+            literal(""), func.coalesce(Refund.amount, 0)
+        ).where(Refund.id == target_id)
+    else:
+        query = select(
+            Transaction.makerspace_id, Transaction.created_at, literal("transaction"),
+            cast(Transaction.type, String), cast(Transaction.status, String),
+            func.coalesce(cast(Transaction.gateway, String), ""),
+            func.coalesce(Transaction.service_type, ""), func.coalesce(Transaction.amount, 0),
+            func.coalesce(Transaction.credits_used, 0), func.coalesce(Transaction.credits_earned, 0)
+        ).where(Transaction.id == target_id)
+    if lock:
+        query = query.with_for_update()
+
+    row = connection.execute(query).first()
+    if row is None or not row[0] or row[1] is None:
+        return None
+    makerspace_id, created_at, source, category, fact_status, gateway, service_type, amount = row[:8]
+    key = (makerspace_id, created_at.date(), source, category, fact_status, gateway, service_type)
+    if source == "credit":
+        amount = amount or 0
+        return key, (1, 0.0, -amount if amount < 0 else 0, amount if amount > 0 else 0)
+    if source == "refund":
+        return key, (1, amount, 0, 0)
+    return key, (1, amount, row[8], row[9])
+
+def _add_billing_fact_delta(connection, target, mapper, sign: int, lock: bool = False):
+    session = object_session(target)
+    if session is None:
+        return
+    fact = _billing_fact_row(connection, mapper, target.id, lock)
+    if fact is None:
+        return
+    key, values = fact
+    deltas = session.info.setdefault("billing_fact_deltas", {})
+    delta = deltas.setdefault(key, [0, 0.0, 0, 0])
+    for index, value in enumerate(values):
+        delta[index] += sign * value
+
+@event.listens_for(Transaction, "before_update")
+@event.listens_for(Transaction, "before_delete")
+@event.listens_for(Refund, "before_update")
+@event.listens_for(Refund, "before_delete")
+def _on_billing_row_removed(mapper, connection, target):
+    # Take the old row out of its facts; the row lock keeps a concurrent
+    # update from changing it between this read and our UPDATE
+    _add_billing_fact_delta(connection, target, mapper, -1, lock=True)
+
+@event.listens_for(Transaction, "after_insert")
+@event.listens_for(Transaction, "after_update")
+@event.listens_for(Refund, "after_insert")
+@event.listens_for(Refund, "after_update")
+@event.listens_for(CreditTransaction, "after_insert")
+def _on_billing_row_added(mapper, connection, target):
+    # Read back from the row so server defaults (created_at) are included
+    _add_billing_fact_delta(connection, target, mapper, 1)
+
+def apply_billing_fact_deltas(connection, deltas: Dict[tuple, List[float]]) -> None:
+    """Add per-key deltas to the facts table with one upsert per key.
+
+    The upsert adds to whatever row is there (INSERT ... ON CONFLICT DO
+    UPDATE SET amount = amount + excluded.amount), so concurrent writers
+    touching the same day each apply their own change instead of
+    recomputing and colliding on the row. Keys are applied in sorted order
+    so two writers always lock fact rows in the same order.
+    """
+    if connection.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as upsert
+
+    facts = BillingDailyFact.__table__
+    for key, delta in sorted(deltas.items()):
+        if not any(delta):
+            continue
+        statement = upsert(facts).values(**dict(zip(BILLING_FACT_COLUMNS, (*key, *delta))))
+        connection.execute(statement.on_conflict_do_update(
+            index_elements=BILLING_FACT_KEY,
+            set_={column: facts.c[column] + statement.excluded[column] for column in BILLING_FACT_VALUES}
+        ))
+        if delta[0] < 0:
+            connection.execute(delete(facts).where(and_(
+                *(facts.c[column] == value for column, value in zip(BILLING_FACT_KEY, key)),
+                facts.c.record_count <= 0
+            )))
+
+@event.listens_for(Session, "after_flush_postexec")
+def _apply_billing_fact_deltas_after_flush(session, flush_context):
+    # Applied inside the same transaction as the change
+    deltas = session.info.pop("billing_fact_deltas", None)
+    if deltas:
+        apply_billing_fact_deltas(session.connection(), deltas)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_billing_fact_deltas(session):
+    session.info.pop("billing_fact_deltas", None)
+
 # Analytics and reporting
+def _enum_value(enum_class, stored: str) -> str:
+    """Map a stored enum name from the facts table back to its API value"""
+    member = enum_class.__members__.get(stored)
+    return member.value if member else stored
+
 def get_billing_analytics(db: Session, makerspace_id: str, start_date: datetime = None, end_date: datetime = None) -> Dict[str, Any]:
-    """Get billing analytics for a makerspace"""
+    """Get billing analytics for a makerspace from the daily facts rollup"""
     if not start_date:
         start_date = datetime.now() - timedelta(days=365)
     if not end_date:
         end_date = datetime.now()
-    
-    # Base query for successful transactions
-    base_query = db.query(Transaction).filter(
+
+    facts = db.query(
+        BillingDailyFact.day, BillingDailyFact.source, BillingDailyFact.category,
+        BillingDailyFact.status, BillingDailyFact.gateway, BillingDailyFact.service_type,
+        BillingDailyFact.record_count, BillingDailyFact.amount,
+        BillingDailyFact.credits_used, BillingDailyFact.credits_earned
+    ).filter(
         and_(
-            Transaction.makerspace_id == makerspace_id,
-            Transaction.status == TransactionStatus.SUCCESS,
-            Transaction.created_at >= start_date,
-            Transaction.created_at <= end_date
+            BillingDailyFact.makerspace_id == makerspace_id,
+            BillingDailyFact.day >= start_date.date(),
+            BillingDailyFact.day <= end_date.date()
         )
-    )
-    
-    # Total revenue
-    total_revenue = base_query.with_entities(func.sum(Transaction.amount)).scalar() or 0
-    
-    # Current month revenue
-    current_month_start = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    revenue_this_month = base_query.filter(
-        Transaction.created_at >= current_month_start
-    ).with_entities(func.sum(Transaction.amount)).scalar() or 0
-    
-    # Last month revenue
+    ).all()
+
+    current_month_start = datetime.now().date().replace(day=1)
     last_month_start = (current_month_start - timedelta(days=1)).replace(day=1)
-    last_month_end = current_month_start - timedelta(microseconds=1)
-    revenue_last_month = base_query.filter(
-        and_(
-            Transaction.created_at >= last_month_start,
-            Transaction.created_at <= last_month_end
-        )
-    ).with_entities(func.sum(Transaction.amount)).scalar() or 0
-    
-    # Revenue growth
+    months = []
+    month = current_month_start
+    for _ in range(12):
+        months.append(month.strftime("%Y-%m"))
+        month = (month - timedelta(days=1)).replace(day=1)
+    revenue_by_month = {key: 0.0 for key in reversed(months)}
+
+    total_revenue = revenue_this_month = revenue_last_month = 0.0
+    total_transactions = successful_transactions = failed_transactions = pending_transactions = 0
+    revenue_by_type: Dict[str, float] = {}
+    services: Dict[str, List[float]] = {}
+    payment_method_distribution: Dict[str, int] = {}
+    refund_count = 0
+    refunded_amount = 0.0
+    credits_earned = credits_spent = 0
+
+    for day, source, category, fact_status, gateway, service_type, count, amount, used, earned in facts:
+        if source == "refund":
+            refund_count += count
+            refunded_amount += amount
+            continue
+        if source == "credit":
+            credits_spent += used
+            credits_earned += earned
+            continue
+
+        total_transactions += count
+        if fact_status == TransactionStatus.FAILED.name:
+            failed_transactions += count
+        elif fact_status == TransactionStatus.PENDING.name:
+            pending_transactions += count
+        if fact_status != TransactionStatus.SUCCESS.name:
+            continue
+
+        successful_transactions += count
+        total_revenue += amount
+        if day >= current_month_start:
+            revenue_this_month += amount
+        elif day >= last_month_start:
+            revenue_last_month += amount
+
+        month_key = day.strftime("%Y-%m")
+        if month_key in revenue_by_month:
+            revenue_by_month[month_key] += amount
+
+        tx_type = _enum_value(TransactionType, category)
+        revenue_by_type[tx_type] = revenue_by_type.get(tx_type, 0.0) + amount
+        if service_type:
+            service = services.setdefault(service_type, [0.0, 0])
+            service[0] += amount
+            service[1] += count
+        if gateway:
+            gateway_value = _enum_value(PaymentGateway, gateway)
+            payment_method_distribution[gateway_value] = payment_method_distribution.get(gateway_value, 0) + count
+
     revenue_growth = ((revenue_this_month - revenue_last_month) / revenue_last_month * 100) if revenue_last_month > 0 else 0
-    
-    # Transaction counts
-    total_transactions = db.query(Transaction).filter(
-        and_(
-            Transaction.makerspace_id == makerspace_id,
-            Transaction.created_at >= start_date,
-            Transaction.created_at <= end_date
-        )
-    ).count()
-    
-    successful_transactions = base_query.count()
-    
-    failed_transactions = db.query(Transaction).filter(
-        and_(
-            Transaction.makerspace_id == makerspace_id,
-            Transaction.status == TransactionStatus.FAILED,
-            Transaction.created_at >= start_date,
-            Transaction.created_at <= end_date
-        )
-    ).count()
-    
-    pending_transactions = db.query(Transaction).filter(
-        and_(
-            Transaction.makerspace_id == makerspace_id,
-            Transaction.status == TransactionStatus.PENDING,
-            Transaction.created_at >= start_date,
-            Transaction.created_at <= end_date
-        )
-    ).count()
-    
-    # Average transaction value
     average_transaction_value = total_revenue / successful_transactions if successful_transactions > 0 else 0
-    
-    # Revenue by type
-    revenue_by_type = {}
-    type_revenue = base_query.with_entities(
-        Transaction.type, func.sum(Transaction.amount)
-    ).group_by(Transaction.type).all()
-    
-    for tx_type, revenue in type_revenue:
-        revenue_by_type[tx_type.value] = float(revenue)
-    
-    # Revenue by month (last 12 months)
-    revenue_by_month = []
-    for i in range(12):
-        month_start = (datetime.now().replace(day=1) - timedelta(days=30*i)).replace(hour=0, minute=0, second=0, microsecond=0)
-        month_end = (month_start + timedelta(days=31)).replace(day=1) - timedelta(microseconds=1)
-        
-        month_revenue = base_query.filter(
-            and_(
-                Transaction.created_at >= month_start,
-                Transaction.created_at <= month_end
-            )
-        ).with_entities(func.sum(Transaction.amount)).scalar() or 0
-        
-        revenue_by_month.append({
-            "month": month_start.strftime("%Y-%m"),
-            "revenue": float(month_revenue)
-        })
-    
-    revenue_by_month.reverse()
-    
-    # Top services by revenue
-    top_services = base_query.filter(
-        Transaction.service_type.isnot(None)
-    ).with_entities(
-        Transaction.service_type, func.sum(Transaction.amount), func.count(Transaction.id)
-    ).group_by(Transaction.service_type).order_by(desc(func.sum(Transaction.amount))).limit(10).all()
-    
-    top_services_data = [
-        {
-            "service": service,
-            "revenue": float(revenue),
-            "transactions": count
-        }
-        for service, revenue, count in top_services
-    ]
-    
-    # Payment method distribution
-    payment_method_distribution = {}
-    gateway_counts = base_query.with_entities(
-        Transaction.gateway, func.count(Transaction.id)
-    ).group_by(Transaction.gateway).all()
-    
-    for gateway, count in gateway_counts:
-        if gateway:
-            payment_method_distribution[gateway.value] = count
-    
+
+    top_services = sorted(services.items(), key=lambda item: item[1][0], reverse=True)[:10]
+
     return {
         "total_revenue": float(total_revenue),
         "revenue_this_month": float(revenue_this_month),
@@ -624,9 +882,19 @@ def get_billing_analytics(db: Session, makerspace_id: str, start_date: datetime
         "pending_transactions": pending_transactions,
         "average_transaction_value": float(average_transaction_value),
         "revenue_by_type": revenue_by_type,
-        "revenue_by_month": revenue_by_month,
-        "top_services": top_services_data,
-        "payment_method_distribution": payment_method_distribution
+        "revenue_by_month": [
+            {"month": month_key, "revenue": revenue}
+            for month_key, revenue in revenue_by_month.items()
+        ],
+        "top_services": [
+            {"service": service, "revenue": revenue, "transactions": count}
+            for service, (revenue, count) in top_services
+        ],
+        "payment_method_distribution": payment_method_distribution,
+        "refund_count": refund_count,
+        "refunded_amount": float(refunded_amount),
+        "credits_earned": credits_earned,
+        "credits_spent": credits_spent
     }
 
 # Helper functions
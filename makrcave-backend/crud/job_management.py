@@ -1,7 +1,11 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_, desc, asc, func
+from sqlalchemy.orm import Session, object_session
+from sqlalchemy import (
+    and_, or_, desc, asc, func, select, union_all, tuple_, null, true,
+    type_coerce, event, Float, Enum as SAEnum
+)
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
+import time
 
 from ..models.job_management import (
     ServiceJob, ServiceJobFile, JobStatusUpdate, JobMaterialUsage,
@@ -434,179 +438,223 @@ def create_provider_equipment(
     return db_equipment
 
 # Dashboard and Analytics Functions
+# Dashboard statistics
+#
+# Both dashboards are computed with a single statement using conditional
+# aggregates (COUNT(*) FILTER (WHERE ...)); on PostgreSQL the status,
+# priority and job type breakdowns come from one GROUPING SETS scan, other
+# dialects fall back to UNION ALL of the equivalent GROUP BYs. Results are
+# cached briefly and dropped whenever a job status or material usage commit
+# lands (see the session listeners below).
+
+ACTIVE_JOB_STATUSES = [JobStatus.ACCEPTED, JobStatus.IN_PROGRESS, JobStatus.PRINTING, JobStatus.POST_PROCESSING]
+JOB_STATS_CACHE_TTL_SECONDS = 30
+
+_job_stats_cache: Dict[tuple, tuple] = {}
+
+def invalidate_job_stats_cache() -> None:
+    """Drop cached dashboard/provider statistics"""
+    _job_stats_cache.clear()
+
+def _cached_job_stats(key: tuple, compute):
+    now = time.monotonic()
+    cached = _job_stats_cache.get(key)
+    if cached and cached[0] > now:
+        return cached[1]
+    result = compute()
+    _job_stats_cache[key] = (now + JOB_STATS_CACHE_TTL_SECONDS, result)
+    return result
+
+def _mark_job_stats_dirty(target) -> None:
+    session = object_session(target)
+    if session is not None:
+        session.info["job_stats_dirty"] = True
+
+@event.listens_for(ServiceJob.status, "set")
+def _on_job_status_set(target, value, oldvalue, initiator):
+    if value != oldvalue:
+        _mark_job_stats_dirty(target)
+
+@event.listens_for(ServiceJob, "after_insert")
+@event.listens_for(ServiceJob, "after_delete")
+@event.listens_for(JobMaterialUsage, "after_insert")
+def _on_job_row_change(mapper, connection, target):
+    _mark_job_stats_dirty(target)
+
+@event.listens_for(Session, "after_commit")
+def _on_commit_invalidate_job_stats(session):
+    if session.info.pop("job_stats_dirty", False):
+        invalidate_job_stats_cache()
+
+def _duration_days(db: Session, start, end):
+    """Dialect-specific (end - start) in days"""
+    if db.bind.dialect.name == "postgresql":
+        return func.extract("epoch", end - start) / 86400.0
+    return func.julianday(end) - func.julianday(start)
+
 def get_job_dashboard_stats(
     db: Session,
     user_id: Optional[str] = None,
     user_role: Optional[str] = None
 ) -> Dict[str, Any]:
     """Get job dashboard statistics"""
-    base_query = db.query(ServiceJob)
-    
-    # Apply user filtering for non-admin users
-    if user_role not in ["super_admin", "makerspace_admin"]:
-        base_query = base_query.filter(
-            or_(
-                ServiceJob.customer_id == user_id,
-                ServiceJob.assigned_provider_id == user_id
-            )
-        )
-    
-    # Total jobs
-    total_jobs = base_query.count()
-    
-    # Jobs by status
-    status_counts = {}
-    for status in JobStatus:
-        count = base_query.filter(ServiceJob.status == status).count()
-        status_counts[status.value] = count
-    
-    # Jobs by priority
-    priority_counts = {}
-    for priority in JobPriority:
-        count = base_query.filter(ServiceJob.priority == priority).count()
-        priority_counts[priority.value] = count
-    
-    # Jobs by type
-    type_counts = {}
-    for job_type in JobType:
-        count = base_query.filter(ServiceJob.job_type == job_type).count()
-        type_counts[job_type.value] = count
-    
-    # Active jobs (in progress statuses)
-    active_statuses = [JobStatus.ACCEPTED, JobStatus.IN_PROGRESS, JobStatus.PRINTING, JobStatus.POST_PROCESSING]
-    active_jobs = base_query.filter(ServiceJob.status.in_(active_statuses)).count()
-    
-    # Pending jobs
-    pending_jobs = base_query.filter(ServiceJob.status == JobStatus.PENDING).count()
-    
-    # Completed today
-    today = datetime.utcnow().date()
-    completed_today = base_query.filter(
-        and_(
-            ServiceJob.status == JobStatus.COMPLETED,
-            func.date(ServiceJob.actual_completion) == today
-        )
-    ).count()
-    
-    # Average completion time calculation
-    thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-    completed_jobs = base_query.filter(
-        and_(
-            ServiceJob.status == JobStatus.COMPLETED,
-            ServiceJob.actual_completion >= thirty_days_ago,
-            ServiceJob.actual_start.isnot(None)
-        )
-    ).all()
-    
-    average_completion_time = None
-    if completed_jobs:
-        total_time = sum([
-            (job.actual_completion - job.actual_start).total_seconds() / 86400  # days
-            for job in completed_jobs
-            if job.actual_completion and job.actual_start
-        ])
-        average_completion_time = total_time / len(completed_jobs)
-    
-    # Material usage today (simplified)
-    material_usage_today = {}
-    for material_type in FilamentType:
-        usage = db.query(func.sum(JobMaterialUsage.actual_weight)).filter(
-            and_(
-                JobMaterialUsage.material_type == material_type,
-                func.date(JobMaterialUsage.recorded_at) == today
+    scoped = user_role not in ["super_admin", "makerspace_admin"]
+    return _cached_job_stats(
+        ("dashboard", user_id if scoped else None),
+        lambda: _compute_job_dashboard_stats(db, user_id if scoped else None, scoped)
+    )
+
+def _compute_job_dashboard_stats(db: Session, user_id: Optional[str], scoped: bool) -> Dict[str, Any]:
+    now = datetime.utcnow()
+    today = now.date()
+    thirty_days_ago = now - timedelta(days=30)
+    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+    completed = ServiceJob.status == JobStatus.COMPLETED
+    completed_today_cond = and_(completed, func.date(ServiceJob.actual_completion) == today)
+    recent_completed_cond = and_(
+        completed,
+        ServiceJob.actual_completion >= thirty_days_ago,
+        ServiceJob.actual_start.isnot(None)
+    )
+    aggregates = [
+        func.count().label("jobs"),
+        func.count().filter(ServiceJob.status.in_(ACTIVE_JOB_STATUSES)).label("active_jobs"),
+        func.count().filter(ServiceJob.status == JobStatus.PENDING).label("pending_jobs"),
+        func.count().filter(completed_today_cond).label("completed_today"),
+        func.avg(
+            _duration_days(db, ServiceJob.actual_start, ServiceJob.actual_completion)
+        ).filter(recent_completed_cond).label("average_completion_time"),
+        func.sum(ServiceJob.final_price).filter(completed_today_cond).label("revenue_today"),
+        func.sum(ServiceJob.final_price).filter(
+            and_(completed, ServiceJob.actual_completion >= month_start)
+        ).label("revenue_this_month"),
+        type_coerce(null(), Float).label("material_weight"),
+    ]
+    job_filter = (
+        or_(ServiceJob.customer_id == user_id, ServiceJob.assigned_provider_id == user_id)
+        if scoped else true()
+    )
+    dimensions = [ServiceJob.status, ServiceJob.priority, ServiceJob.job_type]
+    no_material = type_coerce(null(), SAEnum(FilamentType)).label("material_type")
+
+    if db.bind.dialect.name == "postgresql":
+        job_branches = [
+            select(
+                *dimensions, no_material, *aggregates
+            ).where(job_filter).group_by(
+                func.grouping_sets(*[tuple_(column) for column in dimensions], tuple_())
             )
-        ).scalar() or 0.0
-        material_usage_today[material_type.value] = usage
-    
-    # Revenue calculations
-    revenue_today = db.query(func.sum(ServiceJob.final_price)).filter(
-        and_(
-            ServiceJob.status == JobStatus.COMPLETED,
-            func.date(ServiceJob.actual_completion) == today
+        ]
+    else:
+        job_branches = [
+            select(
+                *[column if column is grouped else type_coerce(null(), column.type).label(column.key)
+                  for column in dimensions],
+                no_material, *aggregates
+            ).where(job_filter).group_by(grouped)
+            for grouped in dimensions
+        ]
+        job_branches.append(
+            select(
+                *[type_coerce(null(), column.type).label(column.key) for column in dimensions],
+                no_material, *aggregates
+            ).where(job_filter)
         )
-    ).scalar() or 0.0
-    
-    # Revenue this month
-    month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    revenue_this_month = db.query(func.sum(ServiceJob.final_price)).filter(
-        and_(
-            ServiceJob.status == JobStatus.COMPLETED,
-            ServiceJob.actual_completion >= month_start
-        )
-    ).scalar() or 0.0
-    
+
+    # Material usage today rides along as extra rows of the same statement
+    material_branch = select(
+        *[type_coerce(null(), column.type).label(column.key) for column in dimensions],
+        JobMaterialUsage.material_type,
+        *[type_coerce(null(), aggregate.type).label(aggregate.name) for aggregate in aggregates[:-1]],
+        func.sum(JobMaterialUsage.actual_weight).label("material_weight"),
+    ).where(func.date(JobMaterialUsage.recorded_at) == today).group_by(JobMaterialUsage.material_type)
+
+    rows = db.execute(union_all(*job_branches, material_branch)).all()
+
+    status_counts = {status.value: 0 for status in JobStatus}
+    priority_counts = {priority.value: 0 for priority in JobPriority}
+    type_counts = {job_type.value: 0 for job_type in JobType}
+    material_usage_today = {material_type.value: 0.0 for material_type in FilamentType}
+    totals = None
+
+    for row in rows:
+        if row.material_type is not None:
+            material_usage_today[row.material_type.value] = row.material_weight or 0.0
+        elif row.status is not None:
+            status_counts[row.status.value] = row.jobs
+        elif row.priority is not None:
+            priority_counts[row.priority.value] = row.jobs
+        elif row.job_type is not None:
+            type_counts[row.job_type.value] = row.jobs
+        elif row.jobs is not None:
+            totals = row
+
     return {
-        "total_jobs": total_jobs,
+        "total_jobs": totals.jobs if totals else 0,
         "jobs_by_status": status_counts,
         "jobs_by_priority": priority_counts,
         "jobs_by_type": type_counts,
-        "pending_jobs": pending_jobs,
-        "active_jobs": active_jobs,
-        "completed_today": completed_today,
-        "average_completion_time": average_completion_time,
+        "pending_jobs": totals.pending_jobs if totals else 0,
+        "active_jobs": totals.active_jobs if totals else 0,
+        "completed_today": totals.completed_today if totals else 0,
+        "average_completion_time": (
+            float(totals.average_completion_time)
+            if totals and totals.average_completion_time is not None else None
+        ),
         "material_usage_today": material_usage_today,
-        "revenue_today": revenue_today,
-        "revenue_this_month": revenue_this_month
+        "revenue_today": (totals.revenue_today if totals else None) or 0.0,
+        "revenue_this_month": (totals.revenue_this_month if totals else None) or 0.0
     }
 
 def get_provider_stats(db: Session, provider_id: str) -> Dict[str, Any]:
     """Get statistics for a specific service provider"""
-    provider_query = db.query(ServiceJob).filter(ServiceJob.assigned_provider_id == provider_id)
-    
-    # Active jobs
-    active_statuses = [JobStatus.ACCEPTED, JobStatus.IN_PROGRESS, JobStatus.PRINTING, JobStatus.POST_PROCESSING]
-    active_jobs = provider_query.filter(ServiceJob.status.in_(active_statuses)).count()
-    
-    # Pending jobs
-    pending_jobs = provider_query.filter(ServiceJob.status == JobStatus.PENDING).count()
-    
-    # Completed this month
+    return _cached_job_stats(
+        ("provider", provider_id),
+        lambda: _compute_provider_stats(db, provider_id)
+    )
+
+def _compute_provider_stats(db: Session, provider_id: str) -> Dict[str, Any]:
     month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    completed_this_month = provider_query.filter(
-        and_(
-            ServiceJob.status == JobStatus.COMPLETED,
-            ServiceJob.actual_completion >= month_start
-        )
-    ).count()
-    
-    # Revenue this month
-    revenue_this_month = db.query(func.sum(ServiceJob.final_price)).filter(
-        and_(
-            ServiceJob.assigned_provider_id == provider_id,
-            ServiceJob.status == JobStatus.COMPLETED,
-            ServiceJob.actual_completion >= month_start
-        )
-    ).scalar() or 0.0
-    
-    # Average job value
-    completed_jobs = provider_query.filter(ServiceJob.status == JobStatus.COMPLETED).all()
-    average_job_value = 0.0
-    if completed_jobs:
-        total_value = sum([job.final_price or 0 for job in completed_jobs])
-        average_job_value = total_value / len(completed_jobs)
-    
+    completed = ServiceJob.status == JobStatus.COMPLETED
+    completed_this_month_cond = and_(completed, ServiceJob.actual_completion >= month_start)
+
+    row = db.execute(
+        select(
+            func.count().filter(ServiceJob.status.in_(ACTIVE_JOB_STATUSES)).label("active_jobs"),
+            func.count().filter(ServiceJob.status == JobStatus.PENDING).label("pending_jobs"),
+            func.count().filter(completed_this_month_cond).label("completed_this_month"),
+            func.sum(ServiceJob.final_price).filter(completed_this_month_cond).label("revenue_this_month"),
+            func.count().filter(completed).label("completed_jobs"),
+            func.avg(func.coalesce(ServiceJob.final_price, 0.0)).filter(completed).label("average_job_value"),
+            func.avg(ServiceJob.quality_rating).filter(
+                and_(completed, ServiceJob.quality_rating.isnot(None), ServiceJob.quality_rating != 0)
+            ).label("average_rating"),
+            func.count().filter(
+                and_(
+                    completed,
+                    ServiceJob.deadline.isnot(None),
+                    ServiceJob.actual_completion <= ServiceJob.deadline
+                )
+            ).label("on_time_jobs"),
+        ).where(ServiceJob.assigned_provider_id == provider_id)
+    ).one()
+
     # Equipment utilization (simplified)
-    utilization_rate = min(75.0 + (active_jobs * 5), 100.0)  # Simplified calculation
-    
-    # Customer satisfaction (from completed jobs with ratings)
-    jobs_with_ratings = [job for job in completed_jobs if job.quality_rating]
-    customer_satisfaction = 0.8  # Default
-    if jobs_with_ratings:
-        avg_rating = sum([job.quality_rating for job in jobs_with_ratings]) / len(jobs_with_ratings)
-        customer_satisfaction = avg_rating / 5.0  # Convert to 0-1 scale
-    
+    utilization_rate = min(75.0 + (row.active_jobs * 5), 100.0)  # Simplified calculation
+
+    # Customer satisfaction (from completed jobs with ratings), 0-1 scale
+    customer_satisfaction = row.average_rating / 5.0 if row.average_rating is not None else 0.8
+
     # On-time delivery rate
-    on_time_jobs = [job for job in completed_jobs if job.deadline and job.actual_completion <= job.deadline]
-    on_time_delivery = 0.85  # Default
-    if completed_jobs:
-        on_time_delivery = len(on_time_jobs) / len(completed_jobs)
-    
+    on_time_delivery = row.on_time_jobs / row.completed_jobs if row.completed_jobs else 0.85
+
     return {
-        "active_jobs": active_jobs,
-        "pending_jobs": pending_jobs,
-        "completed_this_month": completed_this_month,
-        "revenue_this_month": revenue_this_month,
-        "average_job_value": average_job_value,
+        "active_jobs": row.active_jobs,
+        "pending_jobs": row.pending_jobs,
+        "completed_this_month": row.completed_this_month,
+        "revenue_this_month": row.revenue_this_month or 0.0,
+        "average_job_value": float(row.average_job_value or 0.0),
         "utilization_rate": utilization_rate,
         "customer_satisfaction": customer_satisfaction,
         "on_time_delivery": on_time_delivery
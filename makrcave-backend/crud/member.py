@@ -1,5 +1,6 @@
-from sqlalchemy.orm import Session, joinedload
-from sqlalchemy import and_, or_, func, desc, asc
+from sqlalchemy.orm import Session, joinedload, object_session
+from sqlalchemy import and_, or_, func, desc, asc, case, event, inspect, update
+from sqlalchemy.exc import IntegrityError
 from typing import List, Optional, Dict, Any
 from datetime import datetime, timedelta
 import uuid
@@ -7,7 +8,8 @@ import secrets
 
 from ..models.member import (
     Member, MembershipPlan, MemberInvite, MemberActivityLog, 
-    MembershipTransaction, MemberRole, MemberStatus, InviteStatus
+    MembershipTransaction, MemberStatisticsSnapshot, MemberRole, MemberStatus,
+    InviteStatus
 )
 from ..schemas.member import (
     MemberCreate, MemberUpdate, MemberSuspend, MemberFilter, MemberSort,
@@ -442,72 +444,149 @@ def get_member_activities(db: Session, member_id: str, limit: int = 50) -> List[
     ).order_by(desc(MemberActivityLog.created_at)).limit(limit).all()
 
 # Statistics and analytics
-def get_member_statistics(db: Session, makerspace_id: str) -> Dict[str, Any]:
-    """Get member statistics for a makerspace"""
-    total_members = db.query(Member).filter(Member.makerspace_id == makerspace_id).count()
-    
-    active_members = db.query(Member).filter(
-        and_(Member.makerspace_id == makerspace_id, Member.status == MemberStatus.ACTIVE)
-    ).count()
-    
-    expired_members = db.query(Member).filter(
-        and_(Member.makerspace_id == makerspace_id, Member.status == MemberStatus.EXPIRED)
-    ).count()
-    
-    pending_members = db.query(Member).filter(
-        and_(Member.makerspace_id == makerspace_id, Member.status == MemberStatus.PENDING)
-    ).count()
-    
-    suspended_members = db.query(Member).filter(
-        and_(Member.makerspace_id == makerspace_id, Member.status == MemberStatus.SUSPENDED)
-    ).count()
-    
-    # Members by role
-    role_stats = db.query(Member.role, func.count(Member.id)).filter(
+# Time-dependent figures (new this month, expiring soon) drift even without
+# member changes, so snapshots are also recomputed after this long
+MEMBER_STATS_SNAPSHOT_TTL = timedelta(minutes=10)
+
+# Member columns that feed the statistics
+MEMBER_STATS_FIELDS = ("status", "role", "membership_plan_id", "end_date", "makerspace_id")
+
+def _compute_member_statistics(db: Session, makerspace_id: str) -> Dict[str, Any]:
+    """Compute member statistics with a single grouped aggregation"""
+    now = datetime.utcnow()
+    start_of_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    expiring_soon_date = now + timedelta(days=30)
+
+    rows = db.query(
+        Member.status,
+        Member.role,
+        MembershipPlan.name,
+        func.count(Member.id),
+        func.sum(case((Member.created_at >= start_of_month, 1), else_=0)),
+        func.sum(case((
+            and_(
+                Member.status == MemberStatus.ACTIVE,
+                Member.end_date <= expiring_soon_date,
+                Member.end_date > now
+            ), 1), else_=0))
+    ).outerjoin(
+        MembershipPlan, Member.membership_plan_id == MembershipPlan.id
+    ).filter(
         Member.makerspace_id == makerspace_id
-    ).group_by(Member.role).all()
-    
-    members_by_role = {role: count for role, count in role_stats}
-    
-    # Members by plan
-    plan_stats = db.query(MembershipPlan.name, func.count(Member.id)).join(
-        Member, Member.membership_plan_id == MembershipPlan.id
-    ).filter(Member.makerspace_id == makerspace_id).group_by(MembershipPlan.name).all()
-    
-    members_by_plan = {plan: count for plan, count in plan_stats}
-    
-    # New members this month
-    start_of_month = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-    new_members_this_month = db.query(Member).filter(
-        and_(
-            Member.makerspace_id == makerspace_id,
-            Member.created_at >= start_of_month
-        )
-    ).count()
-    
-    # Expiring soon (next 30 days)
-    expiring_soon_date = datetime.utcnow() + timedelta(days=30)
-    expiring_soon = db.query(Member).filter(
-        and_(
-            Member.makerspace_id == makerspace_id,
-            Member.status == MemberStatus.ACTIVE,
-            Member.end_date <= expiring_soon_date,
-            Member.end_date > datetime.utcnow()
-        )
-    ).count()
-    
+    ).group_by(Member.status, Member.role, MembershipPlan.name).all()
+
+    members_by_status = {member_status: 0 for member_status in MemberStatus}
+    members_by_role: Dict[str, int] = {}
+    members_by_plan: Dict[str, int] = {}
+    new_members_this_month = 0
+    expiring_soon = 0
+
+    for member_status, role, plan_name, count, new_count, expiring_count in rows:
+        members_by_status[member_status] += count
+        members_by_role[role.value] = members_by_role.get(role.value, 0) + count
+        if plan_name is not None:
+            members_by_plan[plan_name] = members_by_plan.get(plan_name, 0) + count
+        new_members_this_month += new_count or 0
+        expiring_soon += expiring_count or 0
+
     return {
-        "total_members": total_members,
-        "active_members": active_members,
-        "expired_members": expired_members,
-        "pending_members": pending_members,
-        "suspended_members": suspended_members,
+        "total_members": sum(members_by_status.values()),
+        "active_members": members_by_status[MemberStatus.ACTIVE],
+        "expired_members": members_by_status[MemberStatus.EXPIRED],
+        "pending_members": members_by_status[MemberStatus.PENDING],
+        "suspended_members": members_by_status[MemberStatus.SUSPENDED],
         "members_by_role": members_by_role,
         "members_by_plan": members_by_plan,
         "new_members_this_month": new_members_this_month,
         "expiring_soon": expiring_soon
     }
 
+def refresh_member_statistics(db: Session, makerspace_id: str) -> Dict[str, Any]:
+    """Recompute and store the statistics snapshot for a makerspace
+
+    Runs in its own session on db's engine, so refreshing from a read path
+    never commits or rolls back the caller's pending changes.
+    """
+    with Session(bind=db.get_bind()) as refresh_db:
+        snapshot = refresh_db.query(MemberStatisticsSnapshot).filter(
+            MemberStatisticsSnapshot.makerspace_id == makerspace_id
+        ).first()
+        # Changes that land while computing bump generation past this value,
+        # which keeps the stored snapshot stale
+        generation = snapshot.generation if snapshot else 0
+        statistics = _compute_member_statistics(refresh_db, makerspace_id)
+
+        if snapshot:
+            snapshot.statistics = statistics
+            snapshot.computed_generation = generation
+            snapshot.computed_at = datetime.utcnow()
+            refresh_db.commit()
+            return statistics
+
+        try:
+            refresh_db.add(MemberStatisticsSnapshot(
+                makerspace_id=makerspace_id,
+                statistics=statistics,
+                generation=0,
+                computed_generation=0,
+                computed_at=datetime.utcnow()
+            ))
+            refresh_db.commit()
+        except IntegrityError:
+            # Created concurrently; it will be refreshed on its own schedule
+            refresh_db.rollback()
+    return statistics
+
+def get_member_statistics(db: Session, makerspace_id: str) -> Dict[str, Any]:
+    """Get member statistics for a makerspace from its snapshot"""
+    snapshot = db.query(MemberStatisticsSnapshot).filter(
+        MemberStatisticsSnapshot.makerspace_id == makerspace_id
+    ).first()
+
+    now = datetime.utcnow()
+    if (
+        snapshot
+        and snapshot.computed_generation == snapshot.generation
+        and snapshot.computed_at > now - MEMBER_STATS_SNAPSHOT_TTL
+        and (snapshot.computed_at.year, snapshot.computed_at.month) == (now.year, now.month)
+    ):
+        return dict(snapshot.statistics)
+
+    return refresh_member_statistics(db, makerspace_id)
+
+def _mark_member_statistics_dirty(target, makerspace_id: Optional[str]) -> None:
+    session = object_session(target)
+    if session is not None and makerspace_id:
+        session.info.setdefault("member_stats_dirty", set()).add(makerspace_id)
+
+@event.listens_for(Member, "after_insert")
+@event.listens_for(Member, "after_delete")
+def _on_member_insert_or_delete(mapper, connection, target):
+    _mark_member_statistics_dirty(target, target.__dict__.get("makerspace_id"))
+
+@event.listens_for(Member, "after_update")
+def _on_member_update(mapper, connection, target):
+    # Logins and profile edits don't affect the statistics
+    state = inspect(target)
+    if not any(state.attrs[field].history.has_changes() for field in MEMBER_STATS_FIELDS):
+        return
+    makerspace_history = state.attrs.makerspace_id.history
+    for makerspace_id in list(makerspace_history.added) + list(makerspace_history.deleted):
+        _mark_member_statistics_dirty(target, makerspace_id)
+    _mark_member_statistics_dirty(target, target.__dict__.get("makerspace_id"))
+
+@event.listens_for(Session, "after_flush_postexec")
+def _invalidate_member_statistics_after_flush(session, flush_context):
+    dirty = session.info.pop("member_stats_dirty", None)
+    if not dirty:
+        return
+    snapshots = MemberStatisticsSnapshot.__table__
+    session.connection().execute(
+        update(snapshots)
+        .where(snapshots.c.makerspace_id.in_(sorted(dirty)))
+        .values(generation=snapshots.c.generation + 1)
+    )
+
 # Helper functions
 def _has_member_access(db: Session, member: Member, user_id: str) -> bool:
     """Check if user has access to view/edit member"""
@@ -557,5 +636,9 @@ def check_expired_memberships(db: Session) -> List[Member]:
     
     if expired_members:
         db.commit()
+        
+        # Refresh dashboards for the affected makerspaces
+        for makerspace_id in {member.makerspace_id for member in expired_members}:
+            refresh_member_statistics(db, makerspace_id)
     
     return expired_members
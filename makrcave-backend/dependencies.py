@@ -188,95 +188,99 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+# Role-based permission matrix based on the user specification
+ROLE_PERMISSIONS = {
+    "super_admin": {
+        "view_inventory": True,
+        "add_edit_items": True,
+        "issue_items": True,
+        "reorder_from_store": True,
+        "view_usage_logs": True,
+        "link_to_boms": True,
+        "delete_items": True,
+        # Equipment permissions
+        "view_equipment": True,
+        "reserve": True,
+        "create_equipment": True,
+        "maintenance_logs": True,
+        "access_control": True,
+        "delete_equipment": True
+    },
+    "makerspace_admin": {
+        "view_inventory": True,  # own cave only
+        "add_edit_items": True,
+        "issue_items": True,
+        "reorder_from_store": True,
+        "view_usage_logs": True,
+        "link_to_boms": True,
+        "delete_items": True,
+        # Equipment permissions
+        "view_equipment": True,  # own cave only
+        "reserve": True,
+        "create_equipment": True,
+        "maintenance_logs": True,
+        "access_control": True,
+        "delete_equipment": True
+    },
+    "admin": {
+        "view_inventory": True,
+        "add_edit_items": False,
+        "issue_items": False,
+        "reorder_from_store": False,
+        "view_usage_logs": False,
+        "link_to_boms": False,
+        "delete_items": False,
+        # Equipment permissions
+        "view_equipment": True,
+        "reserve": False,
+        "create_equipment": False,
+        "maintenance_logs": False,
+        "access_control": False,
+        "delete_equipment": False
+    },
+    "user": {
+        "view_inventory": True,  # read-only
+        "add_edit_items": False,
+        "issue_items": False,
+        "reorder_from_store": False,
+        "view_usage_logs": False,
+        "link_to_boms": True,  # view-only
+        "delete_items": False,
+        # Equipment permissions
+        "view_equipment": True,
+        "reserve": True,
+        "create_equipment": False,
+        "maintenance_logs": False,
+        "access_control": False,
+        "delete_equipment": False
+    },
+    "service_provider": {
+        "view_inventory": True,  # own inventory only
+        "add_edit_items": True,  # only own items
+        "issue_items": True,
+        "reorder_from_store": True,
+        "view_usage_logs": True,
+        "link_to_boms": True,  # for jobs
+        "delete_items": True,  # own only
+        # Equipment permissions
+        "view_equipment": True,  # own only
+        "reserve": True,
+        "create_equipment": True,  # own only
+        "maintenance_logs": True,
+        "access_control": True,
+        "delete_equipment": True  # own only
+    }
+}
+
+# Compiled once at import: role -> frozenset of granted permissions
+ROLE_PERMISSION_SETS = {
+    role: frozenset(permission for permission, granted in grants.items() if granted)
+    for role, grants in ROLE_PERMISSIONS.items()
+}
+
 def check_permission(user_role: str, permission: str) -> bool:
     """Check if user role has specific permission"""
-    
-    # Role-based permission matrix based on the user specification
-    permissions = {
-        "super_admin": {
-            "view_inventory": True,
-            "add_edit_items": True,
-            "issue_items": True,
-            "reorder_from_store": True,
-            "view_usage_logs": True,
-            "link_to_boms": True,
-            "delete_items": True,
-            # Equipment permissions
-            "view_equipment": True,
-            "reserve": True,
-            "create_equipment": True,
-            "maintenance_logs": True,
-            "access_control": True,
-            "delete_equipment": True
-        },
-        "makerspace_admin": {
-            "view_inventory": True,  # own cave only
-            "add_edit_items": True,
-            "issue_items": True,
-            "reorder_from_store": True,
-            "view_usage_logs": True,
-            "link_to_boms": True,
-            "delete_items": True,
-            # Equipment permissions
-            "view_equipment": True,  # own cave only
-            "reserve": True,
-            "create_equipment": True,
-            "maintenance_logs": True,
-            "access_control": True,
-            "delete_equipment": True
-        },
-        "admin": {
-            "view_inventory": True,
-            "add_edit_items": False,
-            "issue_items": False,
-            "reorder_from_store": False,
-            "view_usage_logs": False,
-            "link_to_boms": False,
-            "delete_items": False,
-            # Equipment permissions
-            "view_equipment": True,
-            "reserve": False,
-            "create_equipment": False,
-            "maintenance_logs": False,
-            "access_control": False,
-            "delete_equipment": False
-        },
-        "user": {
-            "view_inventory": True,  # read-only
-            "add_edit_items": False,
-            "issue_items": False,
-            "reorder_from_store": False,
-            "view_usage_logs": False,
-            "link_to_boms": True,  # view-only
-            "delete_items": False,
-            # Equipment permissions
-            "view_equipment": True,
-            "reserve": True,
-            "create_equipment": False,
-            "maintenance_logs": False,
-            "access_control": False,
-            "delete_equipment": False
-        },
-        "service_provider": {
-            "view_inventory": True,  # own inventory only
-            "add_edit_items": True,  # only own items
-            "issue_items": True,
-            "reorder_from_store": True,
-            "view_usage_logs": True,
-            "link_to_boms": True,  # for jobs
-            "delete_items": True,  # own only
-            # Equipment permissions
-            "view_equipment": True,  # own only
-            "reserve": True,
-            "create_equipment": True,  # own only
-            "maintenance_logs": True,
-            "access_control": True,
-            "delete_equipment": True  # own only
-        }
-    }
-    
-    role_permissions = permissions.get(user_role, {})
-    return role_permissions.get(permission, False)
+    return permission in ROLE_PERMISSION_SETS.get(user_role, frozenset())
 
 def require_permission(permission: str):
     """Dependency to require specific permission"""
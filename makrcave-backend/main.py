@@ -1,6 +1,7 @@
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+import asyncio
 import uvicorn
 import os
 
@@ -29,6 +30,7 @@ from .routes.enhanced_analytics import router as enhanced_analytics_router
 from .routes.notifications import router as notifications_router
 from .routes.collaboration import router as collaboration_router
 from .routes.project_showcase import router as project_showcase_router
+from .services.billing_facts import BILLING_FACTS_REFRESH_SECONDS, billing_fact_refresh_loop
 
 # Create FastAPI application
 app = FastAPI(
@@ -85,6 +87,20 @@ async def global_exception_handler(request, exc):
         content={"detail": "Internal server error", "type": "server_error"}
     )
 
+# Background jobs
+background_tasks: list = []
+
+@app.on_event("startup")
+async def start_background_jobs():
+    if BILLING_FACTS_REFRESH_SECONDS > 0:
+        background_tasks.append(asyncio.create_task(billing_fact_refresh_loop()))
+
+@app.on_event("shutdown")
+async def stop_background_jobs():
+    for task in background_tasks:
+        task.cancel()
+    background_tasks.clear()
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
@@ -4,20 +4,21 @@ Rate limiting, security headers, and request validation
 """
 
 import time
-from collections import defaultdict
 from typing import Dict, Any
 from fastapi import Request, Response, HTTPException, status
 from fastapi.middleware.base import BaseHTTPMiddleware
 import logging
 
+from makrx_rate_limit import create_rate_limit_backend
+
 logger = logging.getLogger(__name__)
 
 class RateLimitMiddleware(BaseHTTPMiddleware):
     """Rate limiting middleware with endpoint-specific limits"""
     
-    def __init__(self, app):
+    def __init__(self, app, backend=None):
         super().__init__(app)
-        self.clients = defaultdict(lambda: defaultdict(list))
+        self.backend = backend or create_rate_limit_backend()
         
         # Endpoint-specific rate limits (calls per hour)
         self.limits = {
@@ -46,18 +47,15 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
         calls_limit = limit_config["calls"]
         period = limit_config["period"]
         
-        # Clean old entries
+        # Check and record this call
         now = time.time()
-        self.clients[client_ip][endpoint_category] = [
-            call_time for call_time in self.clients[client_ip][endpoint_category]
-            if now - call_time < period
-        ]
-        
-        # Check rate limit
-        if len(self.clients[client_ip][endpoint_category]) >= calls_limit:
+        allowed, count = await self.backend.hit(
+            f"makrcave:{client_ip}:{endpoint_category}", calls_limit, period
+        )
+        if not allowed:
             logger.warning(
                 f"Rate limit exceeded for IP {client_ip} on {endpoint_category}: "
-                f"{len(self.clients[client_ip][endpoint_category])}/{calls_limit}"
+                f"{count}/{calls_limit}"
             )
             raise HTTPException(
                 status_code=status.HTTP_429_TOO_MANY_REQUESTS,
@@ -65,15 +63,10 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
                 headers={"Retry-After": str(period)}
             )
         
-        # Record this call
-        self.clients[client_ip][endpoint_category].append(now)
-        
         # Add rate limit headers
         response = await call_next(request)
         response.headers["X-RateLimit-Limit"] = str(calls_limit)
-        response.headers["X-RateLimit-Remaining"] = str(
-            calls_limit - len(self.clients[client_ip][endpoint_category])
-        )
+        response.headers["X-RateLimit-Remaining"] = str(max(calls_limit - count, 0))
         response.headers["X-RateLimit-Reset"] = str(int(now + period))
         
         return response
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Create and backfill the announcement targeting index.
+
+The member announcement feed resolves targeting through the
+`announcement_targets` table and anti-joins acknowledgments through
+`idx_announcement_ack_member`. This script creates both and fills the
+targeting index for announcements that existed before it, so the feed is
+complete right after deploy. Run it once when deploying the targeting
+index; re-running is safe, as it only backfills an empty index unless
+--rebuild is given.
+"""
+
+import sys
+import logging
+
+from sqlalchemy import func, text
+
+from ..database import engine, Base, get_db_session
+from ..models.announcements import Announcement, AnnouncementTarget, rebuild_announcement_targets
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def upgrade(rebuild: bool = False) -> bool:
+    """Create the targeting index table and backfill it"""
+    try:
+        logger.info("Creating announcement targeting tables...")
+        Base.metadata.create_all(bind=engine, tables=[AnnouncementTarget.__table__])
+        with engine.begin() as conn:
+            # create_all does not add indexes to an existing table
+            conn.execute(text(
+                "CREATE INDEX IF NOT EXISTS idx_announcement_ack_member "
+                "ON announcement_acknowledgments (member_id, announcement_id)"
+            ))
+
+        db = get_db_session()
+        try:
+            indexed = db.query(func.count(AnnouncementTarget.announcement_id)).scalar()
+            if indexed and not rebuild:
+                logger.info(f"Targeting index already holds {indexed} rows, skipping backfill")
+                return True
+            total = db.query(func.count(Announcement.id)).scalar()
+            logger.info(f"Backfilling targeting index for {total} announcements...")
+            indexed = rebuild_announcement_targets(db)
+            logger.info(f"Indexed {indexed} announcements")
+        finally:
+            db.close()
+        return True
+    except Exception as exc:
+        logger.error(f"Error creating announcement targeting tables: {exc}")
+        return False
+
+
+def downgrade() -> bool:
+    """Drop the targeting index table"""
+    try:
+        AnnouncementTarget.__table__.drop(bind=engine, checkfirst=True)
+        logger.info("Dropped announcement targeting tables")
+        return True
+    except Exception as exc:
+        logger.error(f"Error dropping announcement targeting tables: {exc}")
+        return False
+
+
+if __name__ == "__main__":
+    if "--downgrade" in sys.argv:
+        sys.exit(0 if downgrade() else 1)
+    sys.exit(0 if upgrade(rebuild="--rebuild" in sys.argv) else 1)
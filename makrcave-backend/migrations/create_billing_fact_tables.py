@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Create and backfill the daily billing facts rollup.
+
+Billing analytics read `billing_daily_facts`, which the billing flush hooks
+keep current for new changes. This script creates the table and rebuilds
+it over the whole billing history, so dashboards show past revenue right
+after deploy. Run it once when deploying the rollup; re-running is safe,
+as it only backfills an empty table unless --rebuild is given.
+"""
+
+import sys
+import logging
+
+from sqlalchemy import func
+
+from ..database import engine, Base, get_db_session
+from ..models.billing import BillingDailyFact
+from ..crud.billing import refresh_billing_facts
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def upgrade(rebuild: bool = False) -> bool:
+    """Create the billing facts table and backfill it from all history"""
+    try:
+        logger.info("Creating billing facts table...")
+        Base.metadata.create_all(bind=engine, tables=[BillingDailyFact.__table__])
+
+        db = get_db_session()
+        try:
+            rows = db.query(func.count()).select_from(BillingDailyFact).scalar()
+            if rows and not rebuild:
+                logger.info(f"Billing facts already hold {rows} rows, skipping backfill")
+                return True
+            logger.info("Backfilling billing facts from all billing history...")
+            refresh_billing_facts(db, days=0)
+            rows = db.query(func.count()).select_from(BillingDailyFact).scalar()
+            logger.info(f"Billing facts hold {rows} rows")
+        finally:
+            db.close()
+        return True
+    except Exception as exc:
+        logger.error(f"Error creating billing facts table: {exc}")
+        return False
+
+
+def downgrade() -> bool:
+    """Drop the billing facts table"""
+    try:
+        BillingDailyFact.__table__.drop(bind=engine, checkfirst=True)
+        logger.info("Dropped billing facts table")
+        return True
+    except Exception as exc:
+        logger.error(f"Error dropping billing facts table: {exc}")
+        return False
+
+
+if __name__ == "__main__":
+    if "--downgrade" in sys.argv:
+        sys.exit(0 if downgrade() else 1)
+    sys.exit(0 if upgrade(rebuild="--rebuild" in sys.argv) else 1)
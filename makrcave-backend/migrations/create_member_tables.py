@@ -20,6 +20,7 @@ from ..models.member import (
     MemberActivityLog,
     MembershipTransaction,
     MemberFollow,
+    MemberStatisticsSnapshot,
 )
 from ..database import DATABASE_URL, engine
 import logging
@@ -40,6 +41,7 @@ def create_member_tables():
             MemberActivityLog.__table__,
             MembershipTransaction.__table__,
             MemberFollow.__table__,
+            MemberStatisticsSnapshot.__table__,
         ])
         
         logger.info("Member tables created successfully!")
@@ -1,7 +1,9 @@
-from sqlalchemy import Column, String, Boolean, Integer, ForeignKey, JSON, DateTime, Text, Enum as SQLEnum
+from sqlalchemy import Column, String, Boolean, Integer, ForeignKey, JSON, DateTime, Text, Enum as SQLEnum, Index, event, delete, insert, inspect
+from sqlalchemy import and_, or_, case, desc, exists, select
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from datetime import datetime, timedelta
 import uuid
 import enum
 from .base import Base
@@ -33,6 +35,9 @@ class TargetAudience(enum.Enum):
     ADMINS_ONLY = "admins_only"
     NEW_MEMBERS = "new_members"
 
+ADMIN_ROLES = ['admin', 'makerspace_admin', 'super_admin']
+NEW_MEMBER_DAYS = 30
+
 class Announcement(Base):
     __tablename__ = "announcements"
     
@@ -180,39 +185,25 @@ class Announcement(Base):
 
     def is_targeted_to_member(self, member):
         """Check if announcement is targeted to a specific member"""
+        return not self.get_target_keys().isdisjoint(member_target_keys(member))
+
+    def get_target_keys(self):
+        """Targeting index keys for this announcement (see AnnouncementTarget)"""
         if self.target_audience == TargetAudience.ALL_MEMBERS:
-            return True
-        
+            return {"all"}
         if self.target_audience == TargetAudience.ACTIVE_MEMBERS:
-            return member.is_active if hasattr(member, 'is_active') else True
-        
+            return {"active"}
+        if self.target_audience == TargetAudience.NEW_MEMBERS:
+            return {"new"}
+        if self.target_audience == TargetAudience.ADMINS_ONLY:
+            return {f"role:{role}" for role in ADMIN_ROLES}
         if self.target_audience == TargetAudience.SPECIFIC_PLANS:
-            if self.target_membership_plans and member.membership_plan_id:
-                return str(member.membership_plan_id) in self.target_membership_plans
-            return False
-        
+            return {f"plan:{plan_id}" for plan_id in self.target_membership_plans or []}
         if self.target_audience == TargetAudience.SPECIFIC_SKILLS:
-            if self.target_skills and hasattr(member, 'skills'):
-                member_skills = [str(skill.id) for skill in member.skills]
-                return any(skill_id in member_skills for skill_id in self.target_skills)
-            return False
-        
+            return {f"skill:{skill_id}" for skill_id in self.target_skills or []}
         if self.target_audience == TargetAudience.SPECIFIC_MEMBERS:
-            if self.target_members:
-                return str(member.id) in self.target_members
-            return False
-        
-        if self.target_audience == TargetAudience.ADMINS_ONLY:
-            return member.role in ['admin', 'makerspace_admin', 'super_admin'] if hasattr(member, 'role') else False
-        
-        if self.target_audience == TargetAudience.NEW_MEMBERS:
-            # Consider members joined in last 30 days as new
-            from datetime import datetime, timedelta
-            if hasattr(member, 'created_at'):
-                return member.created_at > (datetime.utcnow() - timedelta(days=30))
-            return False
-        
-        return False
+            return {f"member:{member_id}" for member_id in self.target_members or []}
+        return set()
 
     def get_priority_color(self):
         """Get color class for priority display"""
@@ -249,6 +240,165 @@ class Announcement(Base):
         self.click_count += 1
 
 
+class AnnouncementTarget(Base):
+    """Targeting index: one row per (announcement, audience key).
+
+    Keys are "all", "active", "new", "role:<role>", "plan:<id>",
+    "skill:<id>" and "member:<id>". A member matches an announcement when
+    any of their keys (member_target_keys) has a row, so the member feed is
+    an indexed lookup instead of evaluating every announcement in Python.
+    Rows are kept in sync with the announcement by the mapper hooks below.
+    """
+    __tablename__ = "announcement_targets"
+
+    announcement_id = Column(UUID(as_uuid=True), ForeignKey("announcements.id"), primary_key=True)
+    target_key = Column(String(120), primary_key=True)
+    makerspace_id = Column(UUID(as_uuid=True), nullable=False)
+
+    __table_args__ = (
+        Index("idx_announcement_target_lookup", "makerspace_id", "target_key", "announcement_id"),
+    )
+
+
+def member_target_keys(member, current_time=None):
+    """Targeting index keys that match a member"""
+    if current_time is None:
+        current_time = datetime.utcnow()
+
+    keys = {"all", f"member:{member.id}"}
+    if getattr(member, 'is_active', True):
+        keys.add("active")
+
+    created_at = getattr(member, 'created_at', None)
+    if created_at and created_at.replace(tzinfo=None) > current_time - timedelta(days=NEW_MEMBER_DAYS):
+        keys.add("new")
+
+    role = getattr(member, 'role', None)
+    if role is not None:
+        keys.add(f"role:{getattr(role, 'value', role)}")
+
+    if getattr(member, 'membership_plan_id', None):
+        keys.add(f"plan:{member.membership_plan_id}")
+
+    for skill in getattr(member, 'skills', None) or []:
+        keys.add(f"skill:{getattr(skill, 'id', skill)}")
+
+    return keys
+
+
+def _write_announcement_targets(connection, announcement):
+    targets = AnnouncementTarget.__table__
+    connection.execute(delete(targets).where(targets.c.announcement_id == announcement.id))
+    rows = [
+        {"announcement_id": announcement.id, "target_key": key, "makerspace_id": announcement.makerspace_id}
+        for key in sorted(announcement.get_target_keys())
+    ]
+    if rows:
+        connection.execute(insert(targets), rows)
+
+
+@event.listens_for(Announcement, "after_insert")
+def _on_announcement_insert(mapper, connection, target):
+    _write_announcement_targets(connection, target)
+
+
+@event.listens_for(Announcement, "after_update")
+def _on_announcement_update(mapper, connection, target):
+    state = inspect(target)
+    targeting_fields = (
+        "target_audience", "target_membership_plans", "target_skills", "target_members", "makerspace_id"
+    )
+    if any(state.attrs[field].history.has_changes() for field in targeting_fields):
+        _write_announcement_targets(connection, target)
+
+
+@event.listens_for(Announcement, "before_delete")
+def _on_announcement_delete(mapper, connection, target):
+    targets = AnnouncementTarget.__table__
+    connection.execute(delete(targets).where(targets.c.announcement_id == target.id))
+
+
+def rebuild_announcement_targets(db, makerspace_id=None, batch_size: int = 1000):
+    """Rebuild the targeting index (backfill)
+
+    Covers one makerspace when makerspace_id is given, otherwise every
+    announcement. Replaces the rows in one transaction, inserting
+    batch_size rows per statement. Returns the number of announcements
+    indexed.
+    """
+    connection = db.connection()
+    targets = AnnouncementTarget.__table__
+    announcements = db.query(Announcement)
+    stale_targets = delete(targets)
+    if makerspace_id is not None:
+        announcements = announcements.filter(Announcement.makerspace_id == makerspace_id)
+        stale_targets = stale_targets.where(targets.c.makerspace_id == makerspace_id)
+    connection.execute(stale_targets)
+
+    indexed = 0
+    rows = []
+    for announcement in announcements.yield_per(batch_size):
+        indexed += 1
+        rows.extend(
+            {"announcement_id": announcement.id, "target_key": key, "makerspace_id": announcement.makerspace_id}
+            for key in sorted(announcement.get_target_keys())
+        )
+        if len(rows) >= batch_size:
+            connection.execute(insert(targets), rows)
+            rows = []
+    if rows:
+        connection.execute(insert(targets), rows)
+    db.commit()
+    return indexed
+
+
+def member_announcements_query(db, member, include_acknowledged=False, current_time=None):
+    """Live announcements targeted to a member, pinned and most urgent first
+
+    Targeting is resolved through the announcement_targets index and
+    acknowledged announcements are dropped with an anti-join, so the whole
+    feed is one indexed statement.
+    """
+    if current_time is None:
+        current_time = datetime.utcnow()
+
+    query = db.query(Announcement).filter(
+        and_(
+            Announcement.makerspace_id == member.makerspace_id,
+            Announcement.is_published == True,
+            or_(Announcement.publish_at.is_(None), Announcement.publish_at <= current_time),
+            or_(Announcement.expires_at.is_(None), Announcement.expires_at > current_time),
+            Announcement.id.in_(
+                select(AnnouncementTarget.announcement_id).where(
+                    and_(
+                        AnnouncementTarget.makerspace_id == member.makerspace_id,
+                        AnnouncementTarget.target_key.in_(member_target_keys(member, current_time))
+                    )
+                )
+            )
+        )
+    )
+
+    if not include_acknowledged:
+        query = query.filter(
+            ~exists().where(
+                and_(
+                    AnnouncementAcknowledgment.announcement_id == Announcement.id,
+                    AnnouncementAcknowledgment.member_id == member.id
+                )
+            )
+        )
+
+    priority_order = case(
+        (Announcement.priority == Priority.CRITICAL, 5),
+        (Announcement.priority == Priority.URGENT, 4),
+        (Announcement.priority == Priority.HIGH, 3),
+        (Announcement.priority == Priority.LOW, 1),
+        else_=2
+    )
+    return query.order_by(desc(Announcement.is_pinned), desc(priority_order), desc(Announcement.created_at))
+
+
 class AnnouncementAcknowledgment(Base):
     __tablename__ = "announcement_acknowledgments"
     
@@ -264,6 +414,11 @@ class AnnouncementAcknowledgment(Base):
     announcement = relationship("Announcement", back_populates="acknowledgments")
     member = relationship("Member")
     
+    __table_args__ = (
+        # Member feed anti-join
+        Index("idx_announcement_ack_member", "member_id", "announcement_id"),
+    )
+    
     def __repr__(self):
         return f"<AnnouncementAcknowledgment(announcement_id={self.announcement_id}, member_id={self.member_id})>"
 
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, Boolean, DateTime, Float, Text, ForeignKey, JSON, Enum
+from sqlalchemy import Column, String, Integer, Boolean, Date, DateTime, Float, Text, ForeignKey, JSON, Enum
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.sql import func
@@ -138,6 +138,15 @@ class Invoice(Base):
     transaction = relationship("Transaction", back_populates="invoices")
     member = relationship("Member")
 
+class InvoiceSequence(Base):
+    """Per-makerspace, per-month invoice number counter"""
+    __tablename__ = "invoice_sequences"
+
+    makerspace_id = Column(String, primary_key=True)
+    period = Column(String(7), primary_key=True)  # YYYY-MM
+    last_value = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
 class CreditWallet(Base):
     __tablename__ = "credit_wallets"
 
@@ -186,9 +195,9 @@ class CreditTransaction(Base):
     service_type = Column(String(50))
     service_id = Column(String)
     
-    # Description and metadata
+    # Description and metadata ("metadata" is reserved on declarative models)
     description = Column(Text)
-    metadata = Column(JSON, default=dict)
+    transaction_metadata = Column("metadata", JSON, default=dict)
     
     # Admin fields
     processed_by = Column(String)  # For manual adjustments
@@ -226,6 +235,28 @@ class Refund(Base):
     # Relationships
     original_transaction = relationship("Transaction", back_populates="refunds")
 
+class BillingDailyFact(Base):
+    """Daily billing rollup per makerspace, maintained by crud.billing.
+
+    One row per (day, source, category, status, gateway, service type), where
+    source is "transaction", "refund" or "credit". Enum-backed dimensions hold
+    the stored enum name; absent dimensions are stored as "".
+    """
+    __tablename__ = "billing_daily_facts"
+
+    makerspace_id = Column(String, primary_key=True)
+    day = Column(Date, primary_key=True)
+    source = Column(String(20), primary_key=True)
+    category = Column(String(50), primary_key=True, default="")
+    status = Column(String(50), primary_key=True, default="")
+    gateway = Column(String(50), primary_key=True, default="")
+    service_type = Column(String(50), primary_key=True, default="")
+
+    record_count = Column(Integer, nullable=False, default=0)
+    amount = Column(Float, nullable=False, default=0)
+    credits_used = Column(Integer, nullable=False, default=0)
+    credits_earned = Column(Integer, nullable=False, default=0)
+
 class PaymentMethod(Base):
     __tablename__ = "payment_methods"
 
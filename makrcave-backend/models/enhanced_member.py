@@ -1,4 +1,5 @@
 from sqlalchemy import Column, String, Integer, Boolean, DateTime, Float, Text, ForeignKey, JSON, Enum, Table
+from sqlalchemy import inspect
 from sqlalchemy.orm import relationship
 from sqlalchemy.dialects.postgresql import UUID, ARRAY
 from sqlalchemy.sql import func
@@ -9,6 +10,7 @@ from datetime import datetime
 
 # Import access control models
 from .access_control import user_roles, UserSession, AccessLog
+from ..services.permission_cache import permission_cache
 
 class MemberRole(str, enum.Enum):
     MAKER = "maker"
@@ -137,13 +139,31 @@ class Member(Base):
     def __repr__(self):
         return f"<Member(email={self.email}, name={self.first_name} {self.last_name})>"
     
-    def get_effective_permissions(self):
-        """Get all effective permissions from all assigned roles"""
+    def compute_effective_permissions(self) -> frozenset:
+        """Compile permission codenames from all assigned roles (uncached)"""
         permissions = set()
         for role in self.roles:
             role_permissions = role.get_effective_permissions()
             permissions.update([perm.codename for perm in role_permissions])
-        return list(permissions)
+        return frozenset(permissions)
+    
+    def get_permission_set(self) -> frozenset:
+        """Get effective permissions from the versioned permission cache"""
+        user_id = str(self.id)
+        permissions = permission_cache.get(user_id)
+        if permissions is None:
+            # Read the version first and reload the roles after it, so the
+            # set stored under this version reflects every change before it
+            version = permission_cache.version(user_id)
+            state = inspect(self)
+            if state.persistent and not state.attrs.roles.history.has_changes():
+                state.session.expire(self, ["roles"])
+            permissions = permission_cache.set(user_id, self.compute_effective_permissions(), version=version)
+        return permissions
+    
+    def get_effective_permissions(self):
+        """Get all effective permissions from all assigned roles"""
+        return list(self.get_permission_set())
     
     def has_permission(self, permission_code: str) -> bool:
         """Check if member has specific permission"""
@@ -152,8 +172,7 @@ class Member(Base):
             return True
         
         # Check through roles
-        effective_permissions = self.get_effective_permissions()
-        return permission_code in effective_permissions
+        return permission_code in self.get_permission_set()
     
     def has_role(self, role_name: str) -> bool:
         """Check if member has specific role"""
@@ -200,6 +200,22 @@ class MemberFollow(Base):
     __table_args__ = (
         UniqueConstraint("follower_id", "followed_id", name="uq_member_follow"),
     )
+
+
+class MemberStatisticsSnapshot(Base):
+    """Precomputed member statistics per makerspace, maintained by crud.member.
+
+    Member lifecycle changes bump `generation`; the snapshot is current while
+    `computed_generation` matches it.
+    """
+    __tablename__ = "member_statistics_snapshots"
+
+    makerspace_id = Column(String, primary_key=True)
+    statistics = Column(JSON, nullable=False, default=dict)
+    generation = Column(Integer, nullable=False, default=0)
+    computed_generation = Column(Integer, nullable=False, default=0)
+    computed_at = Column(DateTime, nullable=False)  # UTC
+
 # Indexes for better performance
 from sqlalchemy import Index
 
@@ -0,0 +1,168 @@
+from sqlalchemy import Column, String, Integer, Float, JSON, DateTime, Text, ForeignKey, Index, event, delete, insert, inspect
+from datetime import datetime
+import uuid
+
+from ..database import Base
+from ..utils import geohash
+
+# Stored geohash precision (~150m cells); searches match on shorter prefixes
+PROVIDER_GEOHASH_PRECISION = 7
+
+class NetworkProvider(Base):
+    """Service provider registered with the dispatch network"""
+    __tablename__ = "network_providers"
+
+    id = Column(String(100), primary_key=True, default=lambda: str(uuid.uuid4()))
+    makerspace_id = Column(String(100), nullable=False, index=True)
+    name = Column(String(200), nullable=False)
+    contact_email = Column(String(255), nullable=False)
+    status = Column(String(20), nullable=False, default="active")  # active, inactive, busy, maintenance
+
+    # Capabilities (the lists are mirrored into provider_capability_index)
+    capabilities = Column(JSON, default=list)
+    machine_types = Column(JSON, default=list)
+    available_materials = Column(JSON, default=list)
+    quality_levels = Column(JSON, default=list)
+    max_build_volume = Column(JSON, default=dict)  # {x, y, z} in mm
+    min_build_dimension = Column(Float, nullable=True)  # smallest axis of max_build_volume
+
+    # Pricing
+    hourly_rate = Column(Float, nullable=False)
+    setup_fee = Column(Float, default=0.0)
+
+    # Load and performance history
+    rating = Column(Float, default=5.0)
+    total_jobs = Column(Integer, default=0)
+    queue_length = Column(Integer, default=0)
+    estimated_capacity_hours = Column(Integer, default=40)
+    on_time_jobs = Column(Integer, default=0)
+    late_jobs = Column(Integer, default=0)
+
+    # Location; geohash is derived from latitude/longitude
+    location = Column(JSON, default=dict)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    geohash = Column(String(12), nullable=True)
+
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        Index("idx_network_provider_geohash", "geohash"),
+        Index("idx_network_provider_volume", "status", "min_build_dimension"),
+    )
+
+    def capability_keys(self):
+        """(kind, value) pairs stored in the capability index"""
+        keys = set()
+        for kind, values in (
+            ("material", self.available_materials),
+            ("quality", self.quality_levels),
+            ("machine", self.machine_types),
+            ("capability", self.capabilities),
+        ):
+            for value in values or []:
+                keys.add((kind, str(getattr(value, "value", value)).lower()))
+        return keys
+
+    @property
+    def sla_rate(self) -> float:
+        """Smoothed on-time delivery rate (0.5 for providers with no history)"""
+        return ((self.on_time_jobs or 0) + 1) / ((self.on_time_jobs or 0) + (self.late_jobs or 0) + 2)
+
+class ProviderCapabilityIndex(Base):
+    """Capability index: one row per (kind, value, provider).
+
+    Lets provider search resolve material/quality/machine filters with an
+    indexed lookup instead of scanning every provider's JSON lists. Rows are
+    kept in sync with NetworkProvider by the mapper hooks below.
+    """
+    __tablename__ = "provider_capability_index"
+
+    kind = Column(String(20), primary_key=True)
+    value = Column(String(100), primary_key=True)
+    provider_id = Column(String(100), ForeignKey("network_providers.id"), primary_key=True)
+
+class NetworkJob(Base):
+    """Job dispatched to a network provider"""
+    __tablename__ = "network_jobs"
+
+    id = Column(String(100), primary_key=True)
+    service_order_id = Column(String(100), nullable=False, index=True)  # From Store
+    provider_id = Column(String(100), ForeignKey("network_providers.id"), nullable=True)
+    customer_email = Column(String(255), nullable=False)
+    files = Column(JSON, default=list)
+    specifications = Column(JSON, default=dict)
+    quantity = Column(Integer, default=1)
+    priority = Column(String(20), nullable=False, default="normal")
+    estimated_value = Column(Float, default=0.0)
+    estimated_hours = Column(Float, nullable=True)
+    deadline = Column(DateTime, nullable=False)
+    status = Column(String(20), nullable=False, default="pending")
+    dispatch_score = Column(Float, nullable=True)
+    assigned_at = Column(DateTime, nullable=True)
+    started_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
+    notes = Column(Text, nullable=True)
+    tracking_info = Column(JSON, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        Index("idx_network_job_provider", "provider_id", "status", "deadline"),
+    )
+
+
+def _derive_index_columns(provider):
+    if provider.latitude is not None and provider.longitude is not None:
+        provider.geohash = geohash.encode(provider.latitude, provider.longitude, PROVIDER_GEOHASH_PRECISION)
+    else:
+        provider.geohash = None
+    dimensions = [float(v) for v in (provider.max_build_volume or {}).values()]
+    provider.min_build_dimension = min(dimensions) if dimensions else None
+
+def _write_capability_index(connection, provider):
+    connection.execute(
+        delete(ProviderCapabilityIndex).where(ProviderCapabilityIndex.provider_id == provider.id)
+    )
+    rows = [
+        {"kind": kind, "value": value, "provider_id": provider.id}
+        for kind, value in provider.capability_keys()
+    ]
+    if rows:
+        connection.execute(insert(ProviderCapabilityIndex), rows)
+
+@event.listens_for(NetworkProvider, "before_insert")
+@event.listens_for(NetworkProvider, "before_update")
+def _provider_before_save(mapper, connection, target):
+    _derive_index_columns(target)
+
+@event.listens_for(NetworkProvider, "after_insert")
+def _provider_after_insert(mapper, connection, target):
+    _write_capability_index(connection, target)
+
+@event.listens_for(NetworkProvider, "after_update")
+def _provider_after_update(mapper, connection, target):
+    state = inspect(target)
+    if any(
+        state.attrs[field].history.has_changes()
+        for field in ("available_materials", "quality_levels", "machine_types", "capabilities")
+    ):
+        _write_capability_index(connection, target)
+
+@event.listens_for(NetworkProvider, "before_delete")
+def _provider_before_delete(mapper, connection, target):
+    connection.execute(
+        delete(ProviderCapabilityIndex).where(ProviderCapabilityIndex.provider_id == target.id)
+    )
+
+def rebuild_capability_index(db):
+    """Recompute derived columns and capability rows for every provider"""
+    connection = db.connection()
+    connection.execute(delete(ProviderCapabilityIndex))
+    providers = db.query(NetworkProvider).all()
+    for provider in providers:
+        _derive_index_columns(provider)
+        _write_capability_index(connection, provider)
+    db.commit()
+    return len(providers)
@@ -10,7 +10,7 @@ from ..dependencies import get_current_user, get_current_admin_user
 from ..models.user import User
 from ..models.announcements import (
     Announcement, AnnouncementAcknowledgment, AnnouncementView,
-    AnnouncementType, Priority, TargetAudience
+    AnnouncementType, Priority, TargetAudience, member_announcements_query, rebuild_announcement_targets
 )
 from ..models.member import Member
 
@@ -196,52 +196,11 @@ async def get_member_announcements(
             detail="Member record not found"
         )
     
-    # Get all active announcements for the makerspace
-    current_time = datetime.utcnow()
-    query = db.query(Announcement).filter(
-        and_(
-            Announcement.makerspace_id == member.makerspace_id,
-            Announcement.is_published == True,
-            or_(Announcement.publish_at.is_(None), Announcement.publish_at <= current_time),
-            or_(Announcement.expires_at.is_(None), Announcement.expires_at > current_time)
-        )
-    )
-    
-    all_announcements = query.all()
-    
-    # Filter announcements targeted to this member
-    targeted_announcements = []
-    for announcement in all_announcements:
-        if announcement.is_targeted_to_member(member):
-            targeted_announcements.append(announcement)
-    
-    # If not including acknowledged, filter out acknowledged announcements
-    if not include_acknowledged:
-        acknowledged_ids = db.query(AnnouncementAcknowledgment.announcement_id).filter(
-            AnnouncementAcknowledgment.member_id == member.id
-        ).all()
-        acknowledged_ids = [str(ack[0]) for ack in acknowledged_ids]
-        
-        targeted_announcements = [
-            ann for ann in targeted_announcements 
-            if str(ann.id) not in acknowledged_ids
-        ]
-    
-    # Sort by priority and pinned status
-    def sort_key(ann):
-        priority_order = {
-            Priority.CRITICAL: 5,
-            Priority.URGENT: 4,
-            Priority.HIGH: 3,
-            Priority.NORMAL: 2,
-            Priority.LOW: 1
-        }
-        return (ann.is_pinned, priority_order.get(ann.priority, 2), ann.created_at)
-    
-    targeted_announcements.sort(key=sort_key, reverse=True)
-    
-    # Limit results
-    targeted_announcements = targeted_announcements[:limit]
+    # Active announcements for the makerspace that match any of the member's
+    # targeting keys, resolved through the announcement_targets index
+    targeted_announcements = member_announcements_query(
+        db, member, include_acknowledged=include_acknowledged
+    ).limit(limit).all()
     
     # Format response
     response_announcements = []
@@ -478,6 +437,24 @@ async def delete_announcement(
     
     return None
 
+@router.post("/targets/rebuild", response_model=Dict[str, str])
+async def rebuild_targeting_index(
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_admin_user)
+):
+    """Rebuild the announcement targeting index for the current makerspace (e.g. after a bulk import)"""
+    
+    makerspace_id = getattr(current_user, 'makerspace_id', None)
+    if not makerspace_id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No makerspace associated with current user"
+        )
+    
+    indexed = rebuild_announcement_targets(db, makerspace_id=makerspace_id)
+    
+    return {"message": f"Announcement targeting index rebuilt for {indexed} announcements"}
+
 @router.post("/{announcement_id}/acknowledge", response_model=Dict[str, Any])
 async def acknowledge_announcement(
     announcement_id: str,
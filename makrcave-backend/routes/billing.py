@@ -602,6 +602,24 @@ async def get_billing_analytics(
     
     return BillingAnalytics(**analytics)
 
+@router.post("/analytics/refresh")
+async def refresh_billing_analytics(
+    days: int = Query(2, ge=0, le=3650, description="Days to rebuild; 0 rebuilds all history"),
+    current_user: dict = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Rebuild the billing facts rollup (catch-up job)"""
+    if not _can_manage_billing(current_user):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Insufficient permissions"
+        )
+    
+    makerspace_id = None if current_user.get("role") == "super_admin" else _get_user_makerspace_id(current_user)
+    crud_billing.refresh_billing_facts(db, days=days, makerspace_id=makerspace_id)
+    
+    return {"message": "Billing analytics refreshed", "days": days}
+
 # Webhook routes
 @router.post("/webhooks/razorpay")
 async def razorpay_webhook(
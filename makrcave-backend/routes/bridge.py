@@ -1,10 +1,13 @@
 """Bridge API routes for Cave <-> Store communication"""
+import hmac
 import httpx
 import logging
 from datetime import datetime
 from typing import Dict, Any, Optional, List
 
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Header, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 
@@ -12,7 +15,7 @@ from core.config import settings
 
 from database import get_db
 from models.project import Job, JobStatus
-from models.job_management import ServiceProvider
+from models.job_management import ServiceProvider, ServiceJob, JobType
 from models.inventory import User
 from schemas.project import JobCreate, JobUpdate
 from dependencies import get_current_user
@@ -142,6 +145,85 @@ async def receive_job_from_store(
             detail="Failed to create job"
         )
 
+class StorePublishRequest(BaseModel):
+    """Paid service order published by the MakrX Store outbox"""
+    service_order_id: str
+    upload_file_key: str
+    material: Optional[str] = None
+    quality: Optional[str] = None
+    est_weight_g: float = 0.0
+    est_time_min: int = 0
+    delivery: Dict[str, Any] = {}
+    capabilities: Dict[str, Any] = {}
+
+STORE_SOURCE = "makrx_store"
+
+def store_job_id(service_order_id: str) -> str:
+    """Job id of a Store service order; each service order has at most one job"""
+    return f"store_{service_order_id}"
+
+@router.post("/jobs/publish")
+async def publish_job_from_store(
+    publish: StorePublishRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    db: Session = Depends(get_db)
+):
+    """Create the job for a paid Store service order
+
+    The Store outbox may deliver a publish more than once (a retry after a
+    timeout, a replay after it gave up). The job id is derived from the
+    service order, so a repeated publish returns the existing job, and a
+    concurrent one loses on the primary key instead of adding a second job.
+    """
+    job_id = store_job_id(publish.service_order_id)
+    job = db.query(ServiceJob).filter(ServiceJob.job_id == job_id).first()
+    created = False
+    if job is None:
+        job = ServiceJob(
+            job_id=job_id,
+            external_order_id=publish.service_order_id,
+            source=STORE_SOURCE,
+            title=f"Store service order {publish.service_order_id}",
+            job_type=JobType.THREE_D_PRINT,
+            estimated_print_time=publish.est_time_min,
+            estimated_material_weight=publish.est_weight_g,
+            special_requirements={
+                "upload_file_key": publish.upload_file_key,
+                "material": publish.material,
+                "quality": publish.quality,
+                "capabilities": publish.capabilities,
+            },
+            delivery_method=publish.delivery.get("mode") or "ship",
+            delivery_address=publish.delivery.get("address"),
+        )
+        db.add(job)
+        try:
+            db.commit()
+            created = True
+        except IntegrityError:
+            db.rollback()
+            job = db.query(ServiceJob).filter(ServiceJob.job_id == job_id).first()
+            if job is None:
+                raise HTTPException(
+                    status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                    detail="Failed to create job"
+                )
+
+    if created:
+        logger.info(f"Created job {job_id} from Store service order {publish.service_order_id}")
+    else:
+        logger.info(
+            f"Repeated publish of Store service order {publish.service_order_id} "
+            f"(Idempotency-Key {idempotency_key}); returning job {job_id}"
+        )
+
+    return {
+        "success": True,
+        "job_id": job.job_id,
+        "accept_url": f"https://makrcave.com/provider/jobs/{job.job_id}",
+        "created": created
+    }
+
 async def auto_assign_provider(job: Job, db: Session) -> Optional[Dict[str, Any]]:
     """Auto-assign job to best available provider"""
     try:
@@ -372,6 +454,78 @@ async def sync_user_profile_from_store(
             detail="Failed to sync user profile"
         )
 
+service_bearer = HTTPBearer(auto_error=False)
+
+def verify_service_token(credentials: Optional[HTTPAuthorizationCredentials] = Depends(service_bearer)) -> None:
+    """Accept only callers holding the shared service token"""
+    if credentials is None or not hmac.compare_digest(credentials.credentials, settings.SERVICE_JWT):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid service token"
+        )
+
+class KeycloakUserSync(BaseModel):
+    """One user upsert or delete from the auth service's Keycloak sync"""
+    user_id: str
+    action: str  # create|update|delete
+    data: Optional[Dict[str, Any]] = None
+
+class KeycloakUserSyncBatch(BaseModel):
+    users: List[KeycloakUserSync]
+
+def apply_user_sync(db: Session, user: Optional[User], sync: KeycloakUserSync) -> None:
+    """Upsert or deactivate one user; deleted users are kept for their history"""
+    if sync.action == "delete":
+        if user is not None:
+            user.is_active = False
+        return
+
+    data = sync.data or {}
+    if user is None:
+        user = User(id=sync.user_id, role="user", assigned_makerspaces=[])
+        db.add(user)
+    user.email = data.get("email")
+    user.username = data.get("username")
+    user.first_name = data.get("first_name")
+    user.last_name = data.get("last_name")
+    user.is_active = data.get("enabled", True)
+
+@router.post("/users/sync")
+async def sync_users_from_auth_service(
+    batch: KeycloakUserSyncBatch,
+    _: None = Depends(verify_service_token),
+    db: Session = Depends(get_db)
+):
+    """Apply a batch of Keycloak user upserts and deletes
+
+    The batch is written in one transaction. If that fails (e.g. an email
+    taken by another user), each user is retried in its own savepoint so a
+    bad row only fails itself; failed ids are returned for the next run.
+    """
+    ids = [sync.user_id for sync in batch.users]
+    existing = {user.id: user for user in db.query(User).filter(User.id.in_(ids)).all()}
+
+    try:
+        for sync in batch.users:
+            apply_user_sync(db, existing.get(sync.user_id), sync)
+        db.commit()
+        return {"success": True, "applied": len(batch.users), "failed": []}
+    except IntegrityError:
+        db.rollback()
+
+    applied, failed = 0, []
+    for sync in batch.users:
+        try:
+            with db.begin_nested():
+                user = db.query(User).filter(User.id == sync.user_id).first()
+                apply_user_sync(db, user, sync)
+            applied += 1
+        except IntegrityError as e:
+            logger.warning(f"Rejected Keycloak sync of user {sync.user_id}: {e.orig}")
+            failed.append(sync.user_id)
+    db.commit()
+    return {"success": not failed, "applied": applied, "failed": failed}
+
 @router.get("/health")
 async def bridge_health_check():
     """Health check endpoint for bridge connectivity"""
@@ -1,18 +1,25 @@
 from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
+from sqlalchemy import insert
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import Session
-from typing import List, Dict, Optional
+from typing import Any, Deque, List, Dict, Optional, Tuple
 import json
+import logging
+import os
+import time
+import uuid
 from datetime import datetime, timedelta
 import asyncio
-from collections import defaultdict
+from collections import defaultdict, deque
 
-from ..database import get_db
+from ..database import get_db, SessionLocal
 from ..models.projects import Project
 from ..models.collaboration import (
     CollaborationMessage, 
     DocumentVersion, 
     WhiteboardAction,
-    UserPresence
+    UserPresence,
+    RealTimeEdit
 )
 from ..schemas.collaboration import (
     MessageCreate,
@@ -25,17 +32,124 @@ from ..schemas.collaboration import (
 )
 from ..dependencies import get_current_user, validate_token_with_auth_service
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/api/v1/collaboration", tags=["collaboration"])
 
+COLLAB_CHANNEL_PREFIX = "makrcave:collab"
+COLLAB_FLUSH_INTERVAL_MS = int(os.getenv("COLLAB_FLUSH_INTERVAL_MS", "250"))
+COLLAB_FLUSH_MAX_BATCH = 500
+PRESENCE_TOUCH_INTERVAL = timedelta(seconds=10)
+PROJECT_CHECK_TTL_SECONDS = 60
+
 # WebSocket connection manager for real-time collaboration
 class CollaborationManager:
-    def __init__(self):
+    """Fans project events out to websockets on every worker.
+
+    Each worker delivers to its own sockets concurrently and, when REDIS_URL
+    is set, publishes the event on a per-project Redis channel. Workers
+    subscribe to a project's channel while they hold a socket for it and
+    skip their own messages (matched by instance_id). Presence is mirrored
+    into a per-project Redis hash so every worker sees the same active users.
+    Without Redis it behaves as a single-process hub.
+    """
+
+    def __init__(self, redis_url: Optional[str] = None):
         # Store active connections by project_id
         self.active_connections: Dict[str, List[WebSocket]] = defaultdict(list)
         self.user_presence: Dict[str, Dict] = {}  # user_id -> presence_data
-        
+        self.instance_id = uuid.uuid4().hex
+        self.redis = None
+        self.pubsub = None
+        self.listener_task: Optional[asyncio.Task] = None
+        if redis_url:
+            try:
+                import redis.asyncio as redis
+                self.redis = redis.from_url(redis_url)
+            except ImportError:
+                logger.warning("redis package not installed, collaboration hub is single-process")
+
+    def _channel(self, project_id: str) -> str:
+        return f"{COLLAB_CHANNEL_PREFIX}:{project_id}"
+
+    def _presence_key(self, project_id: str) -> str:
+        return f"{COLLAB_CHANNEL_PREFIX}:presence:{project_id}"
+
+    async def start(self):
+        if self.redis is not None and self.listener_task is None:
+            self.pubsub = self.redis.pubsub()
+            self.listener_task = asyncio.create_task(self._listen())
+
+    async def stop(self):
+        if self.listener_task:
+            self.listener_task.cancel()
+            self.listener_task = None
+        if self.pubsub is not None:
+            try:
+                await self.pubsub.close()
+            except Exception:
+                pass
+            self.pubsub = None
+
+    async def _listen(self):
+        """Deliver events published by other workers to local sockets"""
+        while True:
+            try:
+                if not self.pubsub.subscribed:
+                    await asyncio.sleep(0.5)
+                    continue
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if not message:
+                    continue
+                envelope = json.loads(message["data"])
+                if envelope.get("origin") == self.instance_id:
+                    continue
+                await self._deliver_local(envelope["project_id"], envelope["message"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Collaboration pub/sub listener error: {e}")
+                await asyncio.sleep(1)
+
+    async def _subscribe(self, project_id: str):
+        if self.pubsub is None:
+            return
+        try:
+            await self.pubsub.subscribe(self._channel(project_id))
+        except Exception as e:
+            logger.warning(f"Failed to subscribe to collaboration channel for {project_id}: {e}")
+
+    async def _unsubscribe(self, project_id: str):
+        if self.pubsub is None:
+            return
+        try:
+            await self.pubsub.unsubscribe(self._channel(project_id))
+        except Exception as e:
+            logger.warning(f"Failed to unsubscribe from collaboration channel for {project_id}: {e}")
+
+    async def _set_presence(self, project_id: str, user_id: str, presence: Dict[str, Any]):
+        if self.redis is None:
+            return
+        try:
+            await self.redis.hset(self._presence_key(project_id), user_id, json.dumps({
+                'status': presence['status'],
+                'last_seen': presence['last_seen'].isoformat()
+            }))
+        except Exception as e:
+            logger.warning(f"Failed to publish presence for {user_id}: {e}")
+
+    async def _clear_presence(self, project_id: str, user_id: str):
+        if self.redis is None:
+            return
+        try:
+            await self.redis.hdel(self._presence_key(project_id), user_id)
+        except Exception as e:
+            logger.warning(f"Failed to clear presence for {user_id}: {e}")
+
     async def connect(self, websocket: WebSocket, project_id: str, user_id: str):
         await websocket.accept()
+        if not self.active_connections[project_id]:
+            await self._subscribe(project_id)
         self.active_connections[project_id].append(websocket)
         
         # Update user presence
@@ -45,6 +159,7 @@ class CollaborationManager:
             'last_seen': datetime.utcnow(),
             'status': 'active'
         }
+        await self._set_presence(project_id, user_id, self.user_presence[user_id])
         
         # Notify others of user joining
         await self.broadcast_to_project(project_id, {
@@ -52,44 +167,78 @@ class CollaborationManager:
             'user_id': user_id,
             'timestamp': datetime.utcnow().isoformat()
         }, exclude_ws=websocket)
+
+    async def touch(self, user_id: str):
+        """Refresh a connected user's last_seen (throttled)"""
+        presence = self.user_presence.get(user_id)
+        if not presence:
+            return
+        now = datetime.utcnow()
+        if now - presence['last_seen'] >= PRESENCE_TOUCH_INTERVAL:
+            presence['last_seen'] = now
+            await self._set_presence(presence['project_id'], user_id, presence)
         
     def disconnect(self, websocket: WebSocket, project_id: str, user_id: str):
-        if websocket in self.active_connections[project_id]:
-            self.active_connections[project_id].remove(websocket)
+        connections = self.active_connections.get(project_id, [])
+        if websocket in connections:
+            connections.remove(websocket)
             
         # Remove user presence
         if user_id in self.user_presence:
             del self.user_presence[user_id]
             
+        asyncio.create_task(self._after_disconnect(project_id, user_id))
+
+    async def _after_disconnect(self, project_id: str, user_id: str):
+        await self._clear_presence(project_id, user_id)
+        if not self.active_connections.get(project_id):
+            self.active_connections.pop(project_id, None)
+            await self._unsubscribe(project_id)
+            
         # Notify others of user leaving
-        asyncio.create_task(self.broadcast_to_project(project_id, {
+        await self.broadcast_to_project(project_id, {
             'type': 'user_left',
             'user_id': user_id,
             'timestamp': datetime.utcnow().isoformat()
-        }))
+        })
+
+    async def _deliver_local(self, project_id: str, message_str: str, exclude_ws: Optional[WebSocket] = None):
+        """Send to this worker's sockets for a project concurrently"""
+        connections = [
+            websocket for websocket in self.active_connections.get(project_id, [])
+            if websocket is not exclude_ws
+        ]
+        if not connections:
+            return
+
+        results = await asyncio.gather(
+            *(websocket.send_text(message_str) for websocket in connections),
+            return_exceptions=True
+        )
+                
+        # Clean up disconnected websockets
+        remaining = self.active_connections.get(project_id, [])
+        for websocket, result in zip(connections, results):
+            if isinstance(result, Exception) and websocket in remaining:
+                remaining.remove(websocket)
         
     async def broadcast_to_project(self, project_id: str, message: dict, exclude_ws: Optional[WebSocket] = None):
-        """Broadcast message to all users in a project"""
-        connections = self.active_connections[project_id]
+        """Broadcast message to all users in a project, on every worker"""
         message_str = json.dumps(message)
-        
-        disconnected = []
-        for websocket in connections:
-            if websocket == exclude_ws:
-                continue
-                
+        await self._deliver_local(project_id, message_str, exclude_ws)
+
+        if self.redis is not None:
             try:
-                await websocket.send_text(message_str)
-            except:
-                disconnected.append(websocket)
-                
-        # Clean up disconnected websockets
-        for ws in disconnected:
-            if ws in connections:
-                connections.remove(ws)
+                await self.redis.publish(self._channel(project_id), json.dumps({
+                    'origin': self.instance_id,
+                    'project_id': project_id,
+                    'message': message_str
+                }))
+            except Exception as e:
+                logger.warning(f"Failed to publish collaboration event for {project_id}: {e}")
                 
     async def broadcast_to_user(self, user_id: str, message: dict):
-        """Send message to specific user"""
+        """Send message to specific user connected to this worker"""
         if user_id in self.user_presence:
             websocket = self.user_presence[user_id]['websocket']
             try:
@@ -98,8 +247,221 @@ class CollaborationManager:
                 # Clean up disconnected user
                 del self.user_presence[user_id]
 
+    async def get_project_presence(self, project_id: str) -> Dict[str, Dict[str, Any]]:
+        """Presence for a project across all workers (user_id -> status/last_seen)"""
+        presence = {
+            user_id: {'status': data['status'], 'last_seen': data['last_seen']}
+            for user_id, data in self.user_presence.items()
+            if data['project_id'] == project_id
+        }
+        if self.redis is None:
+            return presence
+
+        try:
+            shared = await self.redis.hgetall(self._presence_key(project_id))
+        except Exception as e:
+            logger.warning(f"Failed to read presence for {project_id}: {e}")
+            return presence
+
+        for user_id, raw in shared.items():
+            user_id = user_id.decode() if isinstance(user_id, bytes) else user_id
+            if user_id in presence:
+                continue
+            data = json.loads(raw)
+            presence[user_id] = {
+                'status': data['status'],
+                'last_seen': datetime.fromisoformat(data['last_seen'])
+            }
+        return presence
+
+class CollaborationWriteBuffer:
+    """Coalesces whiteboard actions and document changes into batched inserts.
+
+    Actions are queued in memory and written by a background task every
+    COLLAB_FLUSH_INTERVAL_MS (or as soon as a batch fills), one commit per
+    flush instead of one per action. Consecutive typing or deleting by the
+    same user in the same document is merged into a single change. Anything
+    still queued is written on shutdown.
+
+    When a batch insert is rejected, the rows are written one by one and the
+    ones the database still rejects go to dead_letters instead of holding
+    up the rest. When the database is unreachable the batch is queued again,
+    up to max_pending rows; rows past that are dropped and counted.
+    """
+
+    def __init__(self, flush_interval_ms: int = 250, max_batch: int = 500,
+                 max_pending: int = 10_000, max_dead_letters: int = 1000):
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.whiteboard_actions: List[Dict[str, Any]] = []
+        self.document_changes: List[Dict[str, Any]] = []
+        # (table, row, error) for rows the database rejected, newest last
+        self.dead_letters: Deque[Tuple[str, Dict[str, Any], str]] = deque(maxlen=max_dead_letters)
+        self.dropped = 0
+        self.flush_task: Optional[asyncio.Task] = None
+        self.batch_ready: Optional[asyncio.Event] = None
+
+    def _pending(self) -> int:
+        return len(self.whiteboard_actions) + len(self.document_changes)
+
+    def _maybe_wake(self):
+        if self.batch_ready is not None and self._pending() >= self.max_batch:
+            self.batch_ready.set()
+
+    def add_whiteboard_action(self, row: Dict[str, Any]):
+        self.whiteboard_actions.append(row)
+        self._maybe_wake()
+
+    def add_document_change(self, row: Dict[str, Any]):
+        if self.document_changes and self._merge_document_change(self.document_changes[-1], row):
+            return
+        self.document_changes.append(row)
+        self._maybe_wake()
+
+    @staticmethod
+    def _merge_document_change(last: Dict[str, Any], row: Dict[str, Any]) -> bool:
+        """Fold a contiguous insert/delete into the previous change"""
+        if (last['element_id'], last['user_id']) != (row['element_id'], row['user_id']):
+            return False
+
+        previous, change = last['edit_data'], row['edit_data']
+        if previous['operation'] != change['operation']:
+            return False
+
+        if change['operation'] == 'insert':
+            if change['position'] != previous['position'] + len(previous['content']):
+                return False
+            previous['content'] += change['content']
+        elif change['operation'] == 'delete':
+            if change['position'] == previous['position']:
+                # Forward delete
+                previous['content'] += change['content']
+            elif change['position'] + len(change['content']) == previous['position']:
+                # Backspace
+                previous['content'] = change['content'] + previous['content']
+                previous['position'] = change['position']
+            else:
+                return False
+        else:
+            return False
+
+        previous['merged_operations'] = previous.get('merged_operations', 1) + 1
+        return True
+
+    async def start(self):
+        if self.flush_task is None:
+            self.batch_ready = asyncio.Event()
+            self.flush_task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.flush_task:
+            self.flush_task.cancel()
+            self.flush_task = None
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.batch_ready.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.batch_ready.clear()
+            await self.flush()
+
+    async def flush(self):
+        actions, self.whiteboard_actions = self.whiteboard_actions, []
+        changes, self.document_changes = self.document_changes, []
+        if not actions and not changes:
+            return
+
+        try:
+            await asyncio.to_thread(self._write, actions, changes)
+            return
+        except OperationalError as e:
+            # Database unreachable: keep the batch for the next flush
+            logger.error(f"Failed to persist {len(actions)} whiteboard actions and {len(changes)} document changes: {e}")
+            self._requeue(actions, changes)
+            return
+        except Exception as e:
+            logger.warning(f"Batch of {len(actions) + len(changes)} collaboration rows rejected, writing one by one: {e}")
+
+        try:
+            await asyncio.to_thread(self._write_rows, actions, changes)
+        except OperationalError as e:
+            logger.error(f"Failed to persist collaboration rows one by one: {e}")
+            self._requeue(actions, changes)
+
+    def _requeue(self, actions: List[Dict[str, Any]], changes: List[Dict[str, Any]]):
+        """Put a failed batch back in front of the queue, bounded by max_pending"""
+        room = max(self.max_pending - self._pending(), 0)
+        kept_actions = actions[:room]
+        kept_changes = changes[:room - len(kept_actions)]
+        dropped = len(actions) + len(changes) - len(kept_actions) - len(kept_changes)
+        self.whiteboard_actions[:0] = kept_actions
+        self.document_changes[:0] = kept_changes
+        if dropped:
+            self.dropped += dropped
+            logger.error(
+                f"Collaboration write buffer full ({self.max_pending} rows), dropped {dropped} "
+                f"rows ({self.dropped} since start)"
+            )
+
+    @staticmethod
+    def _write(actions: List[Dict[str, Any]], changes: List[Dict[str, Any]]):
+        db = SessionLocal()
+        try:
+            if actions:
+                db.execute(insert(WhiteboardAction), actions)
+            if changes:
+                db.execute(insert(RealTimeEdit), changes)
+            db.commit()
+        finally:
+            db.close()
+
+    def _write_rows(self, actions: List[Dict[str, Any]], changes: List[Dict[str, Any]]):
+        """Write rows one by one in savepoints, dead-lettering the rejected ones"""
+        db = SessionLocal()
+        try:
+            rows = [(WhiteboardAction, row) for row in actions] + [(RealTimeEdit, row) for row in changes]
+            for model, row in rows:
+                try:
+                    with db.begin_nested():
+                        db.execute(insert(model), [row])
+                except OperationalError:
+                    raise
+                except Exception as e:
+                    self.dead_letters.append((model.__tablename__, row, str(e)))
+                    logger.error(
+                        f"Dead-lettered {model.__tablename__} row {row.get('id')} for project "
+                        f"{row.get('project_id')}: {e}"
+                    )
+            db.commit()
+        finally:
+            db.close()
+
+# Project ids recently confirmed to exist -> monotonic time of the check
+_known_projects: Dict[str, float] = {}
+
+def require_project(db: Session, project_id: str):
+    """404 unless the project exists
+
+    Existing ids are remembered for PROJECT_CHECK_TTL_SECONDS, so high-rate
+    whiteboard and typing events do not each query the projects table.
+    """
+    now = time.monotonic()
+    checked_at = _known_projects.get(project_id)
+    if checked_at is not None and now - checked_at < PROJECT_CHECK_TTL_SECONDS:
+        return
+    if not db.query(Project.project_id).filter(Project.project_id == project_id).first():
+        raise HTTPException(status_code=404, detail="Project not found")
+    if len(_known_projects) >= 10_000:
+        _known_projects.clear()
+    _known_projects[project_id] = now
+
 # Global collaboration manager instance
-collaboration_manager = CollaborationManager()
+collaboration_manager = CollaborationManager(os.getenv("REDIS_URL"))
+collaboration_write_buffer = CollaborationWriteBuffer(COLLAB_FLUSH_INTERVAL_MS, COLLAB_FLUSH_MAX_BATCH)
 
 async def send_ping(websocket: WebSocket):
     while True:
@@ -131,6 +493,7 @@ async def websocket_endpoint(websocket: WebSocket, project_id: str, user_id: str
 
             # Handle different message types
             message_type = message.get('type')
+            await collaboration_manager.touch(user_id)
 
             if message_type == 'pong':
                 continue
@@ -254,10 +617,31 @@ async def get_messages(
 @router.post("/document/change")
 async def broadcast_document_change(
     change: DocumentChangeCreate,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    db: Session = Depends(get_db)
 ):
     """Broadcast document change to collaborators"""
     
+    require_project(db, change.project_id)
+    
+    # Persisted in coalesced batches by the write buffer
+    now = datetime.utcnow()
+    collaboration_write_buffer.add_document_change({
+        'id': str(uuid.uuid4()),
+        'project_id': change.project_id,
+        'element_id': change.document_id,
+        'element_type': 'document',
+        'user_id': current_user.id,
+        'user_name': current_user.name or current_user.email,
+        'edit_type': 'change',
+        'edit_data': {
+            'operation': change.operation,
+            'position': change.position,
+            'content': change.content
+        },
+        'created_at': now
+    })
+    
     await collaboration_manager.broadcast_to_project(change.project_id, {
         'type': 'document.change',
         'payload': {
@@ -268,7 +652,7 @@ async def broadcast_document_change(
             'operation': change.operation,
             'position': change.position,
             'content': change.content,
-            'timestamp': datetime.utcnow().isoformat()
+            'timestamp': now.isoformat()
         }
     })
     
@@ -306,15 +690,18 @@ async def broadcast_whiteboard_action(
 ):
     """Broadcast whiteboard action to collaborators"""
     
-    # Save action to database
-    db_action = WhiteboardAction(
-        project_id=action.project_id,
-        user_id=current_user.id,
-        action_type=action.type,
-        action_data=action.data
-    )
-    db.add(db_action)
-    db.commit()
+    require_project(db, action.project_id)
+    
+    # Save action to database (batched by the write buffer)
+    now = datetime.utcnow()
+    collaboration_write_buffer.add_whiteboard_action({
+        'id': str(uuid.uuid4()),
+        'project_id': action.project_id,
+        'user_id': current_user.id,
+        'action_type': action.type,
+        'action_data': action.data,
+        'created_at': now
+    })
     
     # Broadcast to collaborators
     await collaboration_manager.broadcast_to_project(action.project_id, {
@@ -325,7 +712,7 @@ async def broadcast_whiteboard_action(
             'user_name': current_user.name or current_user.email,
             'type': action.type,
             'data': action.data,
-            'timestamp': datetime.utcnow().isoformat()
+            'timestamp': now.isoformat()
         }
     })
     
@@ -403,15 +790,15 @@ async def get_active_users(
     """Get list of currently active users in project"""
     
     active_users = []
-    for user_id, presence in collaboration_manager.user_presence.items():
-        if presence['project_id'] == project_id:
-            # Check if user is still active (within last 30 seconds)
-            if datetime.utcnow() - presence['last_seen'] < timedelta(seconds=30):
-                active_users.append({
-                    'user_id': user_id,
-                    'status': presence['status'],
-                    'last_seen': presence['last_seen'].isoformat()
-                })
+    presence_by_user = await collaboration_manager.get_project_presence(project_id)
+    for user_id, presence in presence_by_user.items():
+        # Check if user is still active (within last 30 seconds)
+        if datetime.utcnow() - presence['last_seen'] < timedelta(seconds=30):
+            active_users.append({
+                'user_id': user_id,
+                'status': presence['status'],
+                'last_seen': presence['last_seen'].isoformat()
+            })
     
     return {"active_users": active_users, "total": len(active_users)}
 
@@ -423,7 +810,7 @@ async def cleanup_inactive_users():
             current_time = datetime.utcnow()
             inactive_users = []
             
-            for user_id, presence in collaboration_manager.user_presence.items():
+            for user_id, presence in list(collaboration_manager.user_presence.items()):
                 if current_time - presence['last_seen'] > timedelta(minutes=5):
                     inactive_users.append(user_id)
             
@@ -432,6 +819,7 @@ async def cleanup_inactive_users():
                 if user_id in collaboration_manager.user_presence:
                     project_id = collaboration_manager.user_presence[user_id]['project_id']
                     del collaboration_manager.user_presence[user_id]
+                    await collaboration_manager._clear_presence(project_id, user_id)
                     
                     # Notify others
                     await collaboration_manager.broadcast_to_project(project_id, {
@@ -445,7 +833,20 @@ async def cleanup_inactive_users():
             
         await asyncio.sleep(60)  # Run every minute
 
-# Start cleanup task when module loads
-import atexit
-cleanup_task = asyncio.create_task(cleanup_inactive_users())
-atexit.register(lambda: cleanup_task.cancel())
+cleanup_task: Optional[asyncio.Task] = None
+
+@router.on_event("startup")
+async def start_collaboration_hub():
+    """Start pub/sub fan-out, the write buffer and presence cleanup"""
+    global cleanup_task
+    await collaboration_manager.start()
+    await collaboration_write_buffer.start()
+    cleanup_task = asyncio.create_task(cleanup_inactive_users())
+
+@router.on_event("shutdown")
+async def stop_collaboration_hub():
+    """Stop background tasks and write out queued actions"""
+    if cleanup_task:
+        cleanup_task.cancel()
+    await collaboration_manager.stop()
+    await collaboration_write_buffer.stop()
@@ -1,8 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File, Form, status
 from sqlalchemy.orm import Session, selectinload
-from sqlalchemy import and_, or_, desc, asc, func
+from sqlalchemy import or_, desc, asc
 from typing import List, Optional, Dict, Any
-from datetime import datetime, timedelta
+from datetime import datetime
 import uuid
 import json
 import hashlib
@@ -11,10 +11,11 @@ from pathlib import Path
 
 from ..database import get_db
 from ..dependencies import get_current_user, get_current_user_optional
+from ..crud import job_management as crud_jobs
 from ..models.job_management import (
     ServiceJob, ServiceJobFile, JobStatusUpdate, JobMaterialUsage, 
     JobTimeLog, JobQualityCheck, ServiceProvider, ProviderEquipment, JobTemplate,
-    JobStatus, JobPriority, JobType, FilamentType
+    JobStatus
 )
 from ..schemas.job_management import (
     ServiceJobCreate, ServiceJobUpdate, ServiceJobResponse, ServiceJobFileUpload,
@@ -693,115 +694,9 @@ async def get_dashboard_stats(
     user_role = current_user.get("role", "user")
     user_id = current_user.get("user_id")
     
-    # Build base query with user filtering
-    base_query = db.query(ServiceJob)
-    
-    if user_role not in ["super_admin", "makerspace_admin"]:
-        base_query = base_query.filter(
-            or_(
-                ServiceJob.customer_id == user_id,
-                ServiceJob.assigned_provider_id == user_id
-            )
-        )
-    
     try:
-        # Total jobs
-        total_jobs = base_query.count()
-        
-        # Jobs by status
-        status_counts = {}
-        for status in JobStatus:
-            count = base_query.filter(ServiceJob.status == status).count()
-            status_counts[status.value] = count
-        
-        # Jobs by priority
-        priority_counts = {}
-        for priority in JobPriority:
-            count = base_query.filter(ServiceJob.priority == priority).count()
-            priority_counts[priority.value] = count
-        
-        # Jobs by type
-        type_counts = {}
-        for job_type in JobType:
-            count = base_query.filter(ServiceJob.job_type == job_type).count()
-            type_counts[job_type.value] = count
-        
-        # Active jobs (in progress statuses)
-        active_statuses = [JobStatus.ACCEPTED, JobStatus.IN_PROGRESS, JobStatus.PRINTING, JobStatus.POST_PROCESSING]
-        active_jobs = base_query.filter(ServiceJob.status.in_(active_statuses)).count()
-        
-        # Pending jobs
-        pending_jobs = base_query.filter(ServiceJob.status == JobStatus.PENDING).count()
-        
-        # Completed today
-        today = datetime.utcnow().date()
-        completed_today = base_query.filter(
-            and_(
-                ServiceJob.status == JobStatus.COMPLETED,
-                func.date(ServiceJob.actual_completion) == today
-            )
-        ).count()
-        
-        # Average completion time (for completed jobs in last 30 days)
-        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-        completed_jobs = base_query.filter(
-            and_(
-                ServiceJob.status == JobStatus.COMPLETED,
-                ServiceJob.actual_completion >= thirty_days_ago,
-                ServiceJob.actual_start.isnot(None)
-            )
-        ).all()
-        
-        average_completion_time = None
-        if completed_jobs:
-            total_time = sum([
-                (job.actual_completion - job.actual_start).total_seconds() / 86400  # days
-                for job in completed_jobs
-                if job.actual_completion and job.actual_start
-            ])
-            average_completion_time = total_time / len(completed_jobs)
-        
-        # Material usage today (simplified)
-        material_usage_today = {}
-        for material_type in FilamentType:
-            usage = db.query(func.sum(JobMaterialUsage.actual_weight)).filter(
-                and_(
-                    JobMaterialUsage.material_type == material_type,
-                    func.date(JobMaterialUsage.recorded_at) == today
-                )
-            ).scalar() or 0.0
-            material_usage_today[material_type.value] = usage
-        
-        # Revenue calculations
-        revenue_today = db.query(func.sum(ServiceJob.final_price)).filter(
-            and_(
-                ServiceJob.status == JobStatus.COMPLETED,
-                func.date(ServiceJob.actual_completion) == today
-            )
-        ).scalar() or 0.0
-        
-        # Revenue this month
-        month_start = datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        revenue_this_month = db.query(func.sum(ServiceJob.final_price)).filter(
-            and_(
-                ServiceJob.status == JobStatus.COMPLETED,
-                ServiceJob.actual_completion >= month_start
-            )
-        ).scalar() or 0.0
-        
-        return JobDashboardStats(
-            total_jobs=total_jobs,
-            jobs_by_status=status_counts,
-            jobs_by_priority=priority_counts,
-            jobs_by_type=type_counts,
-            pending_jobs=pending_jobs,
-            active_jobs=active_jobs,
-            completed_today=completed_today,
-            average_completion_time=average_completion_time,
-            material_usage_today=material_usage_today,
-            revenue_today=revenue_today,
-            revenue_this_month=revenue_this_month
-        )
+        stats = crud_jobs.get_job_dashboard_stats(db, user_id=user_id, user_role=user_role)
+        return JobDashboardStats(**stats)
         
     except Exception as e:
         raise HTTPException(
@@ -4,11 +4,10 @@ Provider Network Routes - Manage service providers and job dispatch
 """
 
 from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
-from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, or_, func
-from typing import List, Dict, Any, Optional
+from sqlalchemy.orm import Session
+from sqlalchemy import select, or_, case
+from typing import List, Dict, Any, Optional, Tuple
 import logging
-import json
 import os
 from uuid import UUID, uuid4
 from datetime import datetime, timedelta
@@ -16,10 +15,12 @@ from pydantic import BaseModel, Field, EmailStr
 from enum import Enum
 import httpx
 
-from ..database import get_db
-from ..models.project import Project
-from ..models.equipment import Equipment
-from ..models.member import Member, MakerspaceSettings
+from ..database import get_db, SessionLocal
+from ..models.makerspace_settings import MakerspaceSettings
+from ..models.provider_network import (
+    NetworkProvider, ProviderCapabilityIndex, NetworkJob
+)
+from ..utils import geohash
 from ..utils.email_service import email_service
 
 logger = logging.getLogger(__name__)
@@ -59,64 +60,24 @@ class ProviderCapability(str, Enum):
     HIGH_PRECISION = "high_precision"
     POST_PROCESSING = "post_processing"
 
-# Database Models (extend existing models)
-class ServiceProvider(BaseModel):
-    id: str
-    makerspace_id: str
-    name: str
-    contact_email: str
-    status: ProviderStatus
-    capabilities: List[ProviderCapability]
-    max_build_volume: Dict[str, float]  # {x, y, z} in mm
-    available_materials: List[str]
-    quality_levels: List[str]
-    hourly_rate: float
-    setup_fee: float
-    rating: float
-    total_jobs: int
-    queue_length: int
-    estimated_capacity_hours: int
-    location: Dict[str, str]
-    created_at: datetime
-    updated_at: datetime
-
-class ServiceJob(BaseModel):
-    id: str
-    service_order_id: str  # From Store
-    provider_id: Optional[str] = None
-    customer_email: str
-    files: List[Dict[str, Any]]
-    specifications: Dict[str, Any]
-    quantity: int
-    priority: JobPriority
-    estimated_value: float
-    estimated_hours: Optional[float] = None
-    deadline: datetime
-    status: JobStatus
-    assigned_at: Optional[datetime] = None
-    started_at: Optional[datetime] = None
-    completed_at: Optional[datetime] = None
-    notes: Optional[str] = None
-    tracking_info: Optional[Dict[str, Any]] = None
-    created_at: datetime
-    updated_at: datetime
-
 # Pydantic Request/Response Models
 class ProviderRegistration(BaseModel):
     makerspace_id: str
     name: str
     contact_email: EmailStr
     capabilities: List[ProviderCapability]
+    machine_types: List[str] = ["fdm_printer"]
     max_build_volume: Dict[str, float]
     available_materials: List[str]
     quality_levels: List[str]
     hourly_rate: float = Field(gt=0, description="Hourly rate in USD")
     setup_fee: float = Field(ge=0, description="Setup fee per job")
-    location: Dict[str, str]
+    location: Dict[str, Any]  # city/state/country, plus lat/lng for geo search
 
 class ProviderSearchRequest(BaseModel):
     material: Optional[str] = None
     quality: Optional[str] = None
+    machine_type: Optional[str] = None
     volume: Optional[float] = None
     quantity: Optional[int] = None
     max_distance: Optional[float] = None
@@ -133,6 +94,7 @@ class JobDispatchRequest(BaseModel):
     estimated_value: float
     deadline: datetime
     special_instructions: Optional[str] = None
+    location: Optional[Dict[str, float]] = None  # {lat, lng} of the customer
 
 class JobUpdateRequest(BaseModel):
     status: JobStatus
@@ -155,35 +117,138 @@ class JobResponse(BaseModel):
     created_at: datetime
     updated_at: datetime
 
-# In-memory storage for demo (replace with proper database tables)
-providers_db: Dict[str, ServiceProvider] = {}
-jobs_db: Dict[str, ServiceJob] = {}
+# Providers with more queued jobs than this are skipped for multi-unit requests
+PROVIDER_QUEUE_LIMIT = 10
+
+# Dispatch score weights; each component is normalised to 0..1
+DISPATCH_WEIGHTS = {
+    "queue": float(os.getenv("DISPATCH_WEIGHT_QUEUE", "0.35")),
+    "rating": float(os.getenv("DISPATCH_WEIGHT_RATING", "0.25")),
+    "distance": float(os.getenv("DISPATCH_WEIGHT_DISTANCE", "0.2")),
+    "sla": float(os.getenv("DISPATCH_WEIGHT_SLA", "0.2")),
+}
+
+# Distance (km) at which the distance component of the score halves
+DISPATCH_DISTANCE_SCALE_KM = float(os.getenv("DISPATCH_DISTANCE_SCALE_KM", "50"))
+
+TERMINAL_JOB_STATUSES = {JobStatus.COMPLETED, JobStatus.CANCELLED, JobStatus.FAILED}
+
+def _coordinates(location: Optional[Dict[str, Any]]) -> Optional[Tuple[float, float]]:
+    """(lat, lng) from a location dict, or None if it has no usable coordinates"""
+    if not location:
+        return None
+    try:
+        return float(location["lat"]), float(location["lng"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def find_providers(
+    db: Session,
+    material: Optional[str] = None,
+    quality: Optional[str] = None,
+    machine_type: Optional[str] = None,
+    volume: Optional[float] = None,
+    quantity: Optional[int] = None,
+    origin: Optional[Tuple[float, float]] = None,
+    max_distance: Optional[float] = None
+) -> List[Tuple[NetworkProvider, Optional[float]]]:
+    """Active providers matching the requirements, with distance from origin in km
+
+    Capability filters resolve through the capability index and the distance
+    filter through geohash prefixes, so only candidate rows are loaded; the
+    exact great-circle distance is then checked for those candidates.
+    """
+    query = db.query(NetworkProvider).filter(NetworkProvider.status == ProviderStatus.ACTIVE.value)
+
+    for kind, value in (("material", material), ("quality", quality), ("machine", machine_type)):
+        if value:
+            query = query.filter(
+                select(ProviderCapabilityIndex.provider_id).where(
+                    ProviderCapabilityIndex.kind == kind,
+                    ProviderCapabilityIndex.value == value.lower(),
+                    ProviderCapabilityIndex.provider_id == NetworkProvider.id
+                ).exists()
+            )
+
+    # Check build volume (simplified - checking against smallest axis)
+    if volume:
+        query = query.filter(NetworkProvider.min_build_dimension >= volume)
+
+    # Check queue capacity
+    if quantity:
+        query = query.filter(NetworkProvider.queue_length <= PROVIDER_QUEUE_LIMIT)
+
+    if origin and max_distance:
+        cells = geohash.covering_cells(origin[0], origin[1], max_distance)
+        # Prefix match as a range scan so the geohash index is usable
+        query = query.filter(or_(*[
+            NetworkProvider.geohash.between(cell, cell.ljust(geohash.MAX_GEOHASH_LENGTH, "z"))
+            for cell in cells
+        ]))
+
+    results = []
+    for provider in query.order_by(NetworkProvider.rating.desc(), NetworkProvider.queue_length).all():
+        distance = None
+        if origin and provider.latitude is not None and provider.longitude is not None:
+            distance = geohash.haversine_km(origin[0], origin[1], provider.latitude, provider.longitude)
+        if origin and max_distance and (distance is None or distance > max_distance):
+            continue
+        results.append((provider, distance))
+    return results
+
+def score_provider(provider: NetworkProvider, distance_km: Optional[float] = None) -> float:
+    """Weighted dispatch score over queue depth, rating, distance and SLA history"""
+    queue_score = 1 - min((provider.queue_length or 0) / PROVIDER_QUEUE_LIMIT, 1)
+    rating_score = min(max((provider.rating or 0) / 5, 0), 1)
+    # Unknown distance scores neutral rather than best or worst
+    distance_score = 0.5 if distance_km is None else 1 / (1 + distance_km / DISPATCH_DISTANCE_SCALE_KM)
+
+    return (
+        DISPATCH_WEIGHTS["queue"] * queue_score
+        + DISPATCH_WEIGHTS["rating"] * rating_score
+        + DISPATCH_WEIGHTS["distance"] * distance_score
+        + DISPATCH_WEIGHTS["sla"] * provider.sla_rate
+    )
+
+def _provider_summary(provider: NetworkProvider) -> Dict[str, Any]:
+    return {
+        "id": provider.id,
+        "name": provider.name,
+        "contact_email": provider.contact_email,
+        "location": provider.location,
+        "rating": provider.rating
+    }
 
 @router.post("/register", response_model=Dict[str, Any])
 async def register_provider(
     registration: ProviderRegistration,
-    db: AsyncSession = Depends(get_db)
+    db: Session = Depends(get_db)
 ):
     """Register a new service provider"""
     try:
         # Validate makerspace exists
-        makerspace_query = await db.execute(
-            select(MakerspaceSettings).where(MakerspaceSettings.id == registration.makerspace_id)
-        )
-        makerspace = makerspace_query.scalar_one_or_none()
+        try:
+            makerspace_uuid = UUID(registration.makerspace_id)
+        except ValueError:
+            raise HTTPException(status_code=404, detail="Makerspace not found")
+
+        makerspace = db.query(MakerspaceSettings).filter(
+            MakerspaceSettings.makerspace_id == makerspace_uuid
+        ).first()
         
         if not makerspace:
             raise HTTPException(status_code=404, detail="Makerspace not found")
         
         # Create provider
-        provider_id = str(uuid4())
-        provider = ServiceProvider(
-            id=provider_id,
+        coordinates = _coordinates(registration.location)
+        provider = NetworkProvider(
+            id=str(uuid4()),
             makerspace_id=registration.makerspace_id,
             name=registration.name,
             contact_email=registration.contact_email,
-            status=ProviderStatus.ACTIVE,
-            capabilities=registration.capabilities,
+            status=ProviderStatus.ACTIVE.value,
+            capabilities=[cap.value for cap in registration.capabilities],
+            machine_types=registration.machine_types,
             max_build_volume=registration.max_build_volume,
             available_materials=registration.available_materials,
             quality_levels=registration.quality_levels,
@@ -194,24 +259,25 @@ async def register_provider(
             queue_length=0,
             estimated_capacity_hours=40,  # Default weekly capacity
             location=registration.location,
-            created_at=datetime.utcnow(),
-            updated_at=datetime.utcnow()
+            latitude=coordinates[0] if coordinates else None,
+            longitude=coordinates[1] if coordinates else None
         )
         
-        # Store in database (mock storage for now)
-        providers_db[provider_id] = provider
+        db.add(provider)
+        db.commit()
         
-        logger.info(f"Registered new provider: {provider.name} ({provider_id})")
+        logger.info(f"Registered new provider: {provider.name} ({provider.id})")
         
         return {
             "success": True,
-            "provider_id": provider_id,
+            "provider_id": provider.id,
             "message": f"Provider '{provider.name}' registered successfully"
         }
         
     except HTTPException:
         raise
     except Exception as e:
+        db.rollback()
         logger.error(f"Provider registration error: {e}")
         raise HTTPException(status_code=500, detail="Provider registration failed")
 
@@ -219,36 +285,30 @@ async def register_provider(
 async def search_providers(
     material: Optional[str] = None,
     quality: Optional[str] = None,
+    machine_type: Optional[str] = None,
     volume: Optional[float] = None,
     quantity: Optional[int] = None,
     max_distance: Optional[float] = None,
-    db: AsyncSession = Depends(get_db)
+    lat: Optional[float] = None,
+    lng: Optional[float] = None,
+    db: Session = Depends(get_db)
 ):
     """Search for available providers based on requirements"""
     try:
-        # Filter providers based on criteria
+        origin = (lat, lng) if lat is not None and lng is not None else None
+        matches = find_providers(
+            db,
+            material=material,
+            quality=quality,
+            machine_type=machine_type,
+            volume=volume,
+            quantity=quantity,
+            origin=origin,
+            max_distance=max_distance
+        )
+
         matching_providers = []
-        
-        for provider in providers_db.values():
-            if provider.status != ProviderStatus.ACTIVE:
-                continue
-                
-            # Check material capability
-            if material and material not in provider.available_materials:
-                continue
-                
-            # Check quality capability
-            if quality and quality not in provider.quality_levels:
-                continue
-                
-            # Check build volume (simplified - checking against max dimension)
-            if volume and volume > min(provider.max_build_volume.values()):
-                continue
-                
-            # Check queue capacity
-            if quantity and provider.queue_length > 10:  # Arbitrary threshold
-                continue
-                
+        for provider, distance in matches:
             # Calculate estimated delivery time
             queue_delay = provider.queue_length * 2  # 2 days per job in queue
             estimated_delivery = queue_delay + 3  # Base 3 days
@@ -257,9 +317,11 @@ async def search_providers(
                 "id": provider.id,
                 "name": provider.name,
                 "location": provider.location,
+                "distance_km": round(distance, 1) if distance is not None else None,
                 "rating": provider.rating,
                 "estimated_delivery": estimated_delivery,
-                "capabilities": [cap.value for cap in provider.capabilities],
+                "capabilities": provider.capabilities,
+                "machine_types": provider.machine_types,
                 "queue_length": provider.queue_length,
                 "hourly_rate": provider.hourly_rate,
                 "setup_fee": provider.setup_fee,
@@ -267,9 +329,6 @@ async def search_providers(
                 "quality_levels": provider.quality_levels
             })
         
-        # Sort by rating and queue length
-        matching_providers.sort(key=lambda p: (-p["rating"], p["queue_length"]))
-        
         return matching_providers
         
     except Exception as e:
@@ -280,56 +339,56 @@ async def search_providers(
 async def dispatch_job(
     job_request: JobDispatchRequest,
     background_tasks: BackgroundTasks,
-    db: AsyncSession = Depends(get_db)
+    db: Session = Depends(get_db)
 ):
     """Dispatch a job to the provider network"""
     try:
-        # Find best provider for the job
-        material = job_request.specifications.get("material", "pla")
-        quality = job_request.specifications.get("quality", "standard")
-        
-        # Search for providers
-        available_providers = []
-        for provider in providers_db.values():
-            if (provider.status == ProviderStatus.ACTIVE and
-                material in provider.available_materials and
-                quality in provider.quality_levels):
-                available_providers.append(provider)
-        
-        if not available_providers:
+        if db.get(NetworkJob, job_request.job_id):
+            raise HTTPException(status_code=409, detail="Job already dispatched")
+
+        # Find candidate providers for the job
+        specifications = job_request.specifications
+        candidates = find_providers(
+            db,
+            material=specifications.get("material", "pla"),
+            quality=specifications.get("quality", "standard"),
+            machine_type=specifications.get("machine_type"),
+            volume=specifications.get("max_dimension"),
+            origin=_coordinates(job_request.location),
+            max_distance=specifications.get("max_distance")
+        )
+        
+        if not candidates:
             raise HTTPException(
                 status_code=404,
                 detail="No available providers found for this job"
             )
         
-        # Select best provider (lowest queue + highest rating)
-        best_provider = min(available_providers, 
-                          key=lambda p: (p.queue_length, -p.rating))
+        # Select the best scoring provider
+        scored = [(score_provider(provider, distance), provider) for provider, distance in candidates]
+        best_score, best_provider = max(scored, key=lambda item: item[0])
         
         # Create job
-        job = ServiceJob(
+        job = NetworkJob(
             id=job_request.job_id,
             service_order_id=job_request.service_order_id,
             provider_id=best_provider.id,
             customer_email=job_request.customer_email,
             files=job_request.files,
-            specifications=job_request.specifications,
+            specifications=specifications,
             quantity=job_request.quantity,
-            priority=job_request.priority,
+            priority=job_request.priority.value,
             estimated_value=job_request.estimated_value,
             deadline=job_request.deadline,
-            status=JobStatus.PENDING,
-            notes=job_request.special_instructions,
-            created_at=datetime.utcnow(),
-            updated_at=datetime.utcnow()
+            status=JobStatus.PENDING.value,
+            dispatch_score=round(best_score, 4),
+            notes=job_request.special_instructions
         )
+        db.add(job)
         
-        # Store job
-        jobs_db[job.id] = job
-        
-        # Update provider queue
-        best_provider.queue_length += 1
-        best_provider.updated_at = datetime.utcnow()
+        # Update provider queue (in SQL so concurrent dispatches don't lose increments)
+        best_provider.queue_length = NetworkProvider.queue_length + 1
+        db.commit()
         
         # Schedule provider notification
         background_tasks.add_task(
@@ -338,7 +397,7 @@ async def dispatch_job(
             job.id
         )
         
-        logger.info(f"Dispatched job {job.id} to provider {best_provider.name}")
+        logger.info(f"Dispatched job {job.id} to provider {best_provider.name} (score {best_score:.3f})")
         
         return {
             "success": True,
@@ -347,11 +406,12 @@ async def dispatch_job(
                 "id": best_provider.id,
                 "name": best_provider.name,
                 "contact_email": best_provider.contact_email,
+                "score": job.dispatch_score,
                 "estimated_delivery": datetime.utcnow() + timedelta(days=3 + best_provider.queue_length)
             },
             "job_details": {
-                "status": job.status.value,
-                "priority": job.priority.value,
+                "status": job.status,
+                "priority": job.priority,
                 "estimated_value": job.estimated_value,
                 "deadline": job.deadline.isoformat()
             }
@@ -360,31 +420,26 @@ async def dispatch_job(
     except HTTPException:
         raise
     except Exception as e:
+        db.rollback()
         logger.error(f"Job dispatch error: {e}")
         raise HTTPException(status_code=500, detail="Job dispatch failed")
 
 @router.get("/jobs/{job_id}", response_model=JobResponse)
 async def get_job(
     job_id: str,
-    db: AsyncSession = Depends(get_db)
+    db: Session = Depends(get_db)
 ):
     """Get job details"""
     try:
-        job = jobs_db.get(job_id)
+        job = db.get(NetworkJob, job_id)
         if not job:
             raise HTTPException(status_code=404, detail="Job not found")
         
         provider_info = None
         if job.provider_id:
-            provider = providers_db.get(job.provider_id)
+            provider = db.get(NetworkProvider, job.provider_id)
             if provider:
-                provider_info = {
-                    "id": provider.id,
-                    "name": provider.name,
-                    "contact_email": provider.contact_email,
-                    "location": provider.location,
-                    "rating": provider.rating
-                }
+                provider_info = _provider_summary(provider)
         
         return JobResponse(
             id=job.id,
@@ -416,37 +471,31 @@ async def get_job(
 @router.get("/jobs/by-service-order/{service_order_id}")
 async def get_job_by_service_order(
     service_order_id: str,
-    db: AsyncSession = Depends(get_db)
+    db: Session = Depends(get_db)
 ):
     """Get job by service order ID"""
     try:
-        job = None
-        for j in jobs_db.values():
-            if j.service_order_id == service_order_id:
-                job = j
-                break
+        job = db.query(NetworkJob).filter(
+            NetworkJob.service_order_id == service_order_id
+        ).order_by(NetworkJob.created_at).first()
         
         if not job:
             raise HTTPException(status_code=404, detail="Job not found")
         
         provider_info = None
         if job.provider_id:
-            provider = providers_db.get(job.provider_id)
+            provider = db.get(NetworkProvider, job.provider_id)
             if provider:
-                provider_info = {
-                    "id": provider.id,
-                    "name": provider.name,
-                    "location": provider.location,
-                    "rating": provider.rating
-                }
+                provider_info = _provider_summary(provider)
+                provider_info.pop("contact_email")
         
         return {
             "job_id": job.id,
-            "status": job.status.value,
+            "status": job.status,
             "provider_info": provider_info,
             "tracking_info": job.tracking_info,
             "job_details": {
-                "priority": job.priority.value,
+                "priority": job.priority,
                 "estimated_value": job.estimated_value,
                 "deadline": job.deadline.isoformat(),
                 "progress_notes": job.notes
@@ -464,39 +513,53 @@ async def update_job_status(
     job_id: str,
     update_request: JobUpdateRequest,
     background_tasks: BackgroundTasks,
-    db: AsyncSession = Depends(get_db)
+    db: Session = Depends(get_db)
 ):
     """Update job status (provider endpoint)"""
     try:
-        job = jobs_db.get(job_id)
+        job = db.get(NetworkJob, job_id)
         if not job:
             raise HTTPException(status_code=404, detail="Job not found")
         
         # Update job status
-        old_status = job.status
-        job.status = update_request.status
-        job.updated_at = datetime.utcnow()
+        old_status = JobStatus(job.status)
+        now = datetime.utcnow()
+        job.status = update_request.status.value
         
         # Update timestamps based on status
         if update_request.status == JobStatus.ACCEPTED and job.assigned_at is None:
-            job.assigned_at = datetime.utcnow()
+            job.assigned_at = now
         elif update_request.status == JobStatus.IN_PROGRESS and job.started_at is None:
-            job.started_at = datetime.utcnow()
+            job.started_at = now
         elif update_request.status == JobStatus.COMPLETED and job.completed_at is None:
-            job.completed_at = datetime.utcnow()
-            
-            # Update provider queue
-            if job.provider_id:
-                provider = providers_db.get(job.provider_id)
-                if provider:
-                    provider.queue_length = max(0, provider.queue_length - 1)
-                    provider.total_jobs += 1
+            job.completed_at = now
+        
+        # Release the provider's queue slot and record SLA history once per job
+        if (job.provider_id and update_request.status in TERMINAL_JOB_STATUSES
+                and old_status not in TERMINAL_JOB_STATUSES):
+            changes = {
+                NetworkProvider.queue_length: case(
+                    (NetworkProvider.queue_length > 0, NetworkProvider.queue_length - 1),
+                    else_=0
+                )
+            }
+            if update_request.status == JobStatus.COMPLETED:
+                changes[NetworkProvider.total_jobs] = NetworkProvider.total_jobs + 1
+                if job.completed_at <= job.deadline:
+                    changes[NetworkProvider.on_time_jobs] = NetworkProvider.on_time_jobs + 1
+                else:
+                    changes[NetworkProvider.late_jobs] = NetworkProvider.late_jobs + 1
+            db.query(NetworkProvider).filter(
+                NetworkProvider.id == job.provider_id
+            ).update(changes, synchronize_session=False)
         
         # Update additional info
         if update_request.progress_notes:
             job.notes = update_request.progress_notes
         if update_request.tracking_info:
             job.tracking_info = update_request.tracking_info
+
+        db.commit()
         
         # Notify customer of status change
         background_tasks.add_task(
@@ -514,7 +577,7 @@ async def update_job_status(
             "message": f"Job status updated to {update_request.status.value}",
             "job": {
                 "id": job.id,
-                "status": job.status.value,
+                "status": job.status,
                 "updated_at": job.updated_at.isoformat()
             }
         }
@@ -522,6 +585,7 @@ async def update_job_status(
     except HTTPException:
         raise
     except Exception as e:
+        db.rollback()
         logger.error(f"Job status update error: {e}")
         raise HTTPException(status_code=500, detail="Failed to update job status")
 
@@ -530,39 +594,41 @@ async def get_provider_jobs(
     provider_id: str,
     status: Optional[JobStatus] = None,
     limit: int = 50,
-    db: AsyncSession = Depends(get_db)
+    db: Session = Depends(get_db)
 ):
     """Get jobs for a specific provider"""
     try:
-        provider = providers_db.get(provider_id)
+        provider = db.get(NetworkProvider, provider_id)
         if not provider:
             raise HTTPException(status_code=404, detail="Provider not found")
         
-        # Filter jobs for this provider
-        provider_jobs = []
-        for job in jobs_db.values():
-            if job.provider_id == provider_id:
-                if status is None or job.status == status:
-                    provider_jobs.append({
-                        "id": job.id,
-                        "service_order_id": job.service_order_id,
-                        "customer_email": job.customer_email,
-                        "status": job.status.value,
-                        "priority": job.priority.value,
-                        "quantity": job.quantity,
-                        "estimated_value": job.estimated_value,
-                        "deadline": job.deadline.isoformat(),
-                        "created_at": job.created_at.isoformat(),
-                        "specifications": job.specifications
-                    })
+        query = db.query(NetworkJob).filter(NetworkJob.provider_id == provider_id)
+        if status is not None:
+            query = query.filter(NetworkJob.status == status.value)
+        
+        total_jobs = query.count()
         
         # Sort by deadline and priority
-        provider_jobs.sort(key=lambda j: (j["deadline"], j["priority"]))
+        jobs = query.order_by(NetworkJob.deadline, NetworkJob.priority).limit(limit).all()
         
         return {
             "provider_id": provider_id,
-            "total_jobs": len(provider_jobs),
-            "jobs": provider_jobs[:limit]
+            "total_jobs": total_jobs,
+            "jobs": [
+                {
+                    "id": job.id,
+                    "service_order_id": job.service_order_id,
+                    "customer_email": job.customer_email,
+                    "status": job.status,
+                    "priority": job.priority,
+                    "quantity": job.quantity,
+                    "estimated_value": job.estimated_value,
+                    "deadline": job.deadline.isoformat(),
+                    "created_at": job.created_at.isoformat(),
+                    "specifications": job.specifications
+                }
+                for job in jobs
+            ]
         }
         
     except HTTPException:
@@ -575,9 +641,10 @@ async def get_provider_jobs(
 
 async def notify_provider_new_job(provider_id: str, job_id: str):
     """Notify provider of new job assignment"""
+    db = SessionLocal()
     try:
-        provider = providers_db.get(provider_id)
-        job = jobs_db.get(job_id)
+        provider = db.get(NetworkProvider, provider_id)
+        job = db.get(NetworkJob, job_id)
         
         if provider and job:
             logger.info(f"Notifying provider {provider.name} of new job {job_id}")
@@ -586,7 +653,7 @@ async def notify_provider_new_job(provider_id: str, job_id: str):
                 f"<p>Hello {provider.name},</p>"
                 f"<p>You have been assigned a new job <strong>{job_id}</strong>.</p>"
                 f"<p>Quantity: {job.quantity}<br/>"
-                f"Priority: {job.priority.value}<br/>"
+                f"Priority: {job.priority}<br/>"
                 f"Deadline: {job.deadline.isoformat()}</p>"
             )
             email_service.send_email(provider.contact_email, subject, html_body)
@@ -595,8 +662,8 @@ async def notify_provider_new_job(provider_id: str, job_id: str):
                 payload = {
                     "provider_id": provider_id,
                     "job_id": job_id,
-                    "status": job.status.value,
-                    "priority": job.priority.value,
+                    "status": job.status,
+                    "priority": job.priority,
                     "deadline": job.deadline.isoformat(),
                     "quantity": job.quantity,
                 }
@@ -608,6 +675,8 @@ async def notify_provider_new_job(provider_id: str, job_id: str):
             
     except Exception as e:
         logger.error(f"Provider notification error: {e}")
+    finally:
+        db.close()
 
 async def notify_customer_job_update(
     customer_email: str,
@@ -643,21 +712,25 @@ async def notify_customer_job_update(
         logger.error(f"Customer notification error: {e}")
 
 # Initialize some mock providers for development
-def initialize_mock_providers():
-    """Initialize mock providers for development"""
+def initialize_mock_providers(db: Session):
+    """Seed mock providers for development when the registry is empty"""
+    if db.query(NetworkProvider.id).first():
+        return
+
     mock_providers = [
-        ServiceProvider(
+        NetworkProvider(
             id="provider_1",
             makerspace_id="makerspace_1",
             name="TechMaker Hub",
             contact_email="contact@techmakerhub.com",
-            status=ProviderStatus.ACTIVE,
+            status=ProviderStatus.ACTIVE.value,
             capabilities=[
-                ProviderCapability.PLA_PRINTING,
-                ProviderCapability.ABS_PRINTING,
-                ProviderCapability.PETG_PRINTING,
-                ProviderCapability.HIGH_PRECISION
+                ProviderCapability.PLA_PRINTING.value,
+                ProviderCapability.ABS_PRINTING.value,
+                ProviderCapability.PETG_PRINTING.value,
+                ProviderCapability.HIGH_PRECISION.value
             ],
+            machine_types=["fdm_printer"],
             max_build_volume={"x": 220, "y": 220, "z": 250},
             available_materials=["pla", "abs", "petg"],
             quality_levels=["draft", "standard", "high"],
@@ -668,22 +741,23 @@ def initialize_mock_providers():
             queue_length=2,
             estimated_capacity_hours=40,
             location={"city": "San Francisco", "state": "CA", "country": "USA"},
-            created_at=datetime.utcnow(),
-            updated_at=datetime.utcnow()
+            latitude=37.7749,
+            longitude=-122.4194
         ),
-        ServiceProvider(
+        NetworkProvider(
             id="provider_2",
             makerspace_id="makerspace_2",
             name="Rapid Prototypes Inc",
             contact_email="orders@rapidprotos.com",
-            status=ProviderStatus.ACTIVE,
+            status=ProviderStatus.ACTIVE.value,
             capabilities=[
-                ProviderCapability.PLA_PRINTING,
-                ProviderCapability.ABS_PRINTING,
-                ProviderCapability.TPU_PRINTING,
-                ProviderCapability.LARGE_FORMAT,
-                ProviderCapability.POST_PROCESSING
+                ProviderCapability.PLA_PRINTING.value,
+                ProviderCapability.ABS_PRINTING.value,
+                ProviderCapability.TPU_PRINTING.value,
+                ProviderCapability.LARGE_FORMAT.value,
+                ProviderCapability.POST_PROCESSING.value
             ],
+            machine_types=["fdm_printer"],
             max_build_volume={"x": 300, "y": 300, "z": 400},
             available_materials=["pla", "abs", "tpu", "wood_pla"],
             quality_levels=["draft", "standard", "high", "ultra"],
@@ -694,13 +768,22 @@ def initialize_mock_providers():
             queue_length=5,
             estimated_capacity_hours=35,
             location={"city": "Austin", "state": "TX", "country": "USA"},
-            created_at=datetime.utcnow(),
-            updated_at=datetime.utcnow()
+            latitude=30.2672,
+            longitude=-97.7431
         )
     ]
     
-    for provider in mock_providers:
-        providers_db[provider.id] = provider
+    db.add_all(mock_providers)
+    db.commit()
 
-# Initialize mock data on module load
-initialize_mock_providers()
+@router.on_event("startup")
+async def seed_development_providers():
+    if os.getenv("ENVIRONMENT") != "development":
+        return
+    db = SessionLocal()
+    try:
+        initialize_mock_providers(db)
+    except Exception as e:
+        logger.warning(f"Could not seed mock providers: {e}")
+    finally:
+        db.close()
@@ -1,4 +1,4 @@
-from pydantic import BaseModel, EmailStr, validator, Field
+from pydantic import AliasChoices, BaseModel, EmailStr, validator, Field
 from typing import Optional, List, Dict, Any, Union
 from datetime import datetime
 from enum import Enum
@@ -182,7 +182,7 @@ class CreditWalletUpdate(BaseModel):
 class CreditTransactionCreate(BaseModel):
     wallet_id: str
     user_id: str
-    type: str = Field(..., regex="^(earned|spent|refund|manual_adjustment)$")
+    type: str = Field(..., pattern="^(earned|spent|refund|manual_adjustment)$")
     amount: int
     description: Optional[str] = None
     service_type: Optional[str] = None
@@ -201,7 +201,9 @@ class CreditTransactionResponse(BaseModel):
     service_type: Optional[str] = None
     service_id: Optional[str] = None
     description: Optional[str] = None
-    metadata: Dict[str, Any] = {}
+    metadata: Dict[str, Any] = Field(
+        default_factory=dict, validation_alias=AliasChoices("transaction_metadata", "metadata")
+    )
     processed_by: Optional[str] = None
     created_at: datetime
 
@@ -214,7 +216,7 @@ class RefundCreate(BaseModel):
     amount: float = Field(..., gt=0)
     currency: str = Field(default="INR", max_length=3)
     reason: str = Field(..., min_length=1)
-    type: str = Field(default="full", regex="^(full|partial)$")
+    type: str = Field(default="full", pattern="^(full|partial)$")
     processed_by: str
 
 class RefundResponse(BaseModel):
@@ -239,7 +241,7 @@ class RefundResponse(BaseModel):
 class PaymentMethodCreate(BaseModel):
     user_id: str
     member_id: Optional[str] = None
-    type: str = Field(..., regex="^(card|upi|bank_account)$")
+    type: str = Field(..., pattern="^(card|upi|bank_account)$")
     gateway: PaymentGateway
     gateway_method_id: str
     last_four: Optional[str] = Field(None, max_length=4)
@@ -309,6 +311,10 @@ class BillingAnalytics(BaseModel):
     revenue_by_month: List[Dict[str, Any]]
     top_services: List[Dict[str, Any]]
     payment_method_distribution: Dict[str, int]
+    refund_count: int = 0
+    refunded_amount: float = 0
+    credits_earned: int = 0
+    credits_spent: int = 0
 
 class TransactionFilter(BaseModel):
     user_id: Optional[str] = None
@@ -0,0 +1,41 @@
+"""Background refresh of the daily billing facts rollup
+
+The billing flush hooks keep billing_daily_facts current for changes made
+through the ORM; this loop rebuilds the most recent days on a timer to pick
+up bulk or raw SQL changes. If the table is empty (the migration's backfill
+has not run) the first pass rebuilds the whole history instead, so the
+dashboards never read an empty rollup for long.
+"""
+import asyncio
+import logging
+import os
+
+from ..crud.billing import refresh_billing_facts
+from ..database import get_db_session
+from ..models.billing import BillingDailyFact
+
+logger = logging.getLogger(__name__)
+
+BILLING_FACTS_REFRESH_SECONDS = float(os.getenv("BILLING_FACTS_REFRESH_SECONDS", "900"))
+BILLING_FACTS_REFRESH_DAYS = int(os.getenv("BILLING_FACTS_REFRESH_DAYS", "2"))
+
+def refresh_billing_facts_once(days: int = BILLING_FACTS_REFRESH_DAYS) -> int:
+    """Rebuild the recent facts, or all of them if none exist; returns the days argument used"""
+    db = get_db_session()
+    try:
+        if db.query(BillingDailyFact.day).first() is None:
+            days = 0
+        refresh_billing_facts(db, days=days)
+        return days
+    finally:
+        db.close()
+
+async def billing_fact_refresh_loop(interval_seconds: float = BILLING_FACTS_REFRESH_SECONDS) -> None:
+    """Run refresh_billing_facts_once every interval_seconds until cancelled"""
+    while True:
+        try:
+            days = await asyncio.to_thread(refresh_billing_facts_once)
+            logger.info(f"Refreshed billing facts ({'all history' if days == 0 else f'last {days} days'})")
+        except Exception as e:
+            logger.error(f"Billing facts refresh failed: {e}")
+        await asyncio.sleep(interval_seconds)
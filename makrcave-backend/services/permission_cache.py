@@ -0,0 +1,144 @@
+"""Versioned cache of compiled member permission sets
+
+Each member's effective permissions (all roles plus inherited parent roles)
+are compiled once into a frozenset and served from a process-local cache,
+with Redis as a shared second level when REDIS_URL is configured. Entries
+are keyed by a per-member role-assignment version that is bumped when roles
+are assigned or revoked (plus a global epoch bumped when role definitions
+change), so other workers drop their local copy on their next version check.
+Without Redis there is no shared version to check, so local entries expire
+after local_ttl_seconds: a revocation handled by one worker reaches the
+others within that time.
+
+Callers read version() before compiling and pass it to set(), which drops
+the write if the version moved meanwhile: a set compiled before a revoke is
+never stored under the version that follows it.
+"""
+import json
+import logging
+import os
+import time
+from typing import Dict, FrozenSet, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class PermissionCache:
+    """Process-local permission sets backed by an optional Redis tier"""
+
+    KEY_PREFIX = "makrcave:perms"
+
+    def __init__(self, redis_url: Optional[str] = None, version_check_interval: float = 2.0,
+                 redis_ttl_seconds: int = 3600, local_ttl_seconds: float = 30.0):
+        # user_id -> (version, permissions, last version check or, without Redis, compile time)
+        self._local: Dict[str, Tuple[str, FrozenSet[str], float]] = {}
+        self._local_epoch = 0
+        # Per-member versions when there is no Redis to hold them
+        self._local_versions: Dict[str, int] = {}
+        self.version_check_interval = version_check_interval
+        self.local_ttl_seconds = local_ttl_seconds
+        self.redis_ttl_seconds = redis_ttl_seconds
+        self.redis = None
+        if redis_url:
+            try:
+                import redis
+                self.redis = redis.Redis.from_url(redis_url, socket_timeout=0.2)
+            except ImportError:
+                logger.warning("redis package not installed, permission cache is process-local")
+
+    def version(self, user_id: str) -> Optional[str]:
+        """Current "<epoch>.<user version>" tag, or None if Redis is unreachable"""
+        if self.redis is None:
+            return f"{self._local_epoch}.{self._local_versions.get(user_id, 0)}"
+        try:
+            epoch, user_version = self.redis.mget(
+                f"{self.KEY_PREFIX}:epoch", f"{self.KEY_PREFIX}:version:{user_id}"
+            )
+            return f"{int(epoch or 0)}.{int(user_version or 0)}"
+        except Exception as e:
+            logger.warning(f"Permission cache version lookup failed: {e}")
+            return None
+
+    def get(self, user_id: str) -> Optional[FrozenSet[str]]:
+        """Return the cached permission set, or None if it must be compiled"""
+        now = time.monotonic()
+        entry = self._local.get(user_id)
+        if self.redis is None:
+            # No shared version to check; recompile once the entry is too old
+            if entry and now - entry[2] < self.local_ttl_seconds:
+                return entry[1]
+            self._local.pop(user_id, None)
+            return None
+        if entry and now - entry[2] < self.version_check_interval:
+            return entry[1]
+
+        version = self.version(user_id)
+        if version is None:
+            return None
+        if entry and entry[0] == version:
+            self._local[user_id] = (version, entry[1], now)
+            return entry[1]
+
+        if self.redis is not None:
+            try:
+                raw = self.redis.get(f"{self.KEY_PREFIX}:{user_id}:{version}")
+            except Exception as e:
+                logger.warning(f"Permission cache read failed: {e}")
+                raw = None
+            if raw:
+                permissions = frozenset(json.loads(raw))
+                self._local[user_id] = (version, permissions, now)
+                return permissions
+
+        self._local.pop(user_id, None)
+        return None
+
+    def set(self, user_id: str, permissions: Iterable[str], version: Optional[str] = None) -> FrozenSet[str]:
+        """Store a freshly compiled permission set
+
+        version is the tag read before compiling; if a role change moved it
+        since, the set may predate that change and is not stored.
+        """
+        permissions = frozenset(permissions)
+        current = self.version(user_id)
+        if current is None or (version is not None and version != current):
+            return permissions
+        version = current
+
+        self._local[user_id] = (version, permissions, time.monotonic())
+        if self.redis is not None:
+            try:
+                self.redis.set(
+                    f"{self.KEY_PREFIX}:{user_id}:{version}",
+                    json.dumps(sorted(permissions)),
+                    ex=self.redis_ttl_seconds
+                )
+            except Exception as e:
+                logger.warning(f"Permission cache write failed: {e}")
+        return permissions
+
+    def invalidate(self, user_id: str) -> None:
+        """Bump the member's role-assignment version (call after role changes)"""
+        self._local.pop(user_id, None)
+        if self.redis is None:
+            self._local_versions[user_id] = self._local_versions.get(user_id, 0) + 1
+        else:
+            try:
+                self.redis.incr(f"{self.KEY_PREFIX}:version:{user_id}")
+            except Exception as e:
+                logger.warning(f"Permission cache invalidation failed: {e}")
+
+    def invalidate_all(self) -> None:
+        """Bump the global epoch (call after role or permission definitions change)"""
+        self._local.clear()
+        self._local_epoch += 1
+        if self.redis is not None:
+            try:
+                self.redis.incr(f"{self.KEY_PREFIX}:epoch")
+            except Exception as e:
+                logger.warning(f"Permission cache invalidation failed: {e}")
+
+# Global permission cache
+permission_cache = PermissionCache(
+    os.getenv("REDIS_URL"),
+    local_ttl_seconds=float(os.getenv("PERMISSION_CACHE_LOCAL_TTL_SECONDS", "30")),
+)
@@ -0,0 +1 @@
+"""MakrCave backend tests."""
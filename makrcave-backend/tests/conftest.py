@@ -0,0 +1,20 @@
+"""
+Test setup: expose the backend as the `makrcave` package
+
+The backend modules use package-relative imports, but the directory name
+(makrcave-backend) is not importable, so register it under a valid name.
+"""
+
+import importlib.util
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+if "makrcave" not in sys.modules:
+    spec = importlib.util.spec_from_file_location(
+        "makrcave", BACKEND_DIR / "__init__.py", submodule_search_locations=[str(BACKEND_DIR)]
+    )
+    package = importlib.util.module_from_spec(spec)
+    sys.modules["makrcave"] = package
+    spec.loader.exec_module(package)
@@ -0,0 +1,141 @@
+"""
+Parallel stress test for InvoiceNumberAllocator
+
+Many threads allocate invoice numbers at once, each number in its own
+session and transaction like a checkout does. Numbers must be unique per
+makerspace and month, increase within every worker, and with block_size=1
+stay gap-free. Runs on SQLite by default; set TEST_DATABASE_URL to run the
+same checks against PostgreSQL, where the counter row lock is exercised.
+"""
+
+import os
+import threading
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import sessionmaker
+
+from makrcave.crud.billing import InvoiceNumberAllocator
+from makrcave.models.billing import InvoiceSequence
+
+WORKERS = 8
+PER_WORKER = 25
+NOW = datetime(2024, 3, 15, 12, 0, 0)
+
+@pytest.fixture
+def session_factory(tmp_path):
+    url = os.getenv("TEST_DATABASE_URL") or f"sqlite:///{tmp_path / 'invoices.db'}"
+    if url.startswith("sqlite"):
+        engine = create_engine(url, connect_args={"check_same_thread": False, "timeout": 30})
+
+        # SQLite has no row locks: take the write lock when the transaction
+        # starts so concurrent counter updates queue instead of failing
+        @event.listens_for(engine, "connect")
+        def _autocommit_off(dbapi_connection, connection_record):
+            dbapi_connection.isolation_level = None
+
+        @event.listens_for(engine, "begin")
+        def _begin_immediate(connection):
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+    else:
+        engine = create_engine(url, pool_size=WORKERS, max_overflow=WORKERS)
+
+    with engine.begin() as connection:
+        connection.execute(text("DROP TABLE IF EXISTS invoice_sequences"))
+        connection.execute(text("DROP TABLE IF EXISTS invoices"))
+        # Only the columns the allocator reads when it starts a new month
+        connection.execute(text(
+            "CREATE TABLE invoices (id VARCHAR PRIMARY KEY, makerspace_id VARCHAR, created_at TIMESTAMP)"
+        ))
+    InvoiceSequence.__table__.create(engine)
+
+    yield sessionmaker(bind=engine, autocommit=False, autoflush=False)
+
+    with engine.begin() as connection:
+        connection.execute(text("DROP TABLE IF EXISTS invoice_sequences"))
+        connection.execute(text("DROP TABLE IF EXISTS invoices"))
+    engine.dispose()
+
+def allocate_in_parallel(session_factory, allocator, makerspaces):
+    """Run WORKERS threads of PER_WORKER allocations; returns numbers per worker"""
+    results = {}
+    errors = []
+    start = threading.Barrier(WORKERS)
+
+    def worker(index):
+        makerspace_id = makerspaces[index % len(makerspaces)]
+        numbers = []
+        try:
+            start.wait()
+            for _ in range(PER_WORKER):
+                db = session_factory()
+                try:
+                    numbers.append(allocator.next_number(db, makerspace_id, NOW))
+                    db.commit()
+                finally:
+                    db.close()
+        except Exception as e:  # surfaced in the main thread
+            errors.append(e)
+        results[index] = (makerspace_id, numbers)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(WORKERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors, errors
+    return results
+
+def sequence_values(numbers):
+    prefix = f"INV-{NOW.year}-{NOW.month:02d}-"
+    assert all(number.startswith(prefix) for number in numbers)
+    return [int(number[len(prefix):]) for number in numbers]
+
+@pytest.mark.parametrize("makerspaces", [["ms-1"], ["ms-1", "ms-2"]])
+def test_single_numbers_are_unique_monotonic_and_gap_free(session_factory, makerspaces):
+    results = allocate_in_parallel(session_factory, InvoiceNumberAllocator(), makerspaces)
+
+    for makerspace_id in makerspaces:
+        values = []
+        for owner, numbers in results.values():
+            if owner == makerspace_id:
+                worker_values = sequence_values(numbers)
+                assert worker_values == sorted(worker_values)
+                assert len(set(worker_values)) == len(worker_values)
+                values.extend(worker_values)
+        assert sorted(values) == list(range(1, len(values) + 1))
+
+def test_block_numbers_are_unique_and_monotonic_per_worker(session_factory):
+    allocator = InvoiceNumberAllocator(block_size=10)
+    results = allocate_in_parallel(session_factory, allocator, ["ms-1"])
+
+    values = []
+    for _, numbers in results.values():
+        worker_values = sequence_values(numbers)
+        assert worker_values == sorted(worker_values)
+        values.extend(worker_values)
+    assert len(set(values)) == WORKERS * PER_WORKER
+    # Blocks are handed out whole, so at most one block is left partly unused
+    assert max(values) <= WORKERS * PER_WORKER + allocator.block_size
+
+def test_rolled_back_number_is_reused(session_factory):
+    allocator = InvoiceNumberAllocator()
+
+    db = session_factory()
+    first = allocator.next_number(db, "ms-1", NOW)
+    db.commit()
+    db.close()
+
+    db = session_factory()
+    abandoned = allocator.next_number(db, "ms-1", NOW)
+    db.rollback()
+    db.close()
+
+    db = session_factory()
+    reused = allocator.next_number(db, "ms-1", NOW)
+    db.commit()
+    db.close()
+
+    assert sequence_values([first, abandoned, reused]) == [1, 2, 2]
@@ -0,0 +1,87 @@
+"""
+Role revocation racing a permission compile in PermissionCache
+
+get_permission_set reads the version, compiles, then stores the set with
+that version. A revoke that lands while the compile runs bumps the version,
+so the set compiled from the old roles must not be stored or served, with
+Redis as the shared tier or without it.
+"""
+
+import pytest
+
+from makrcave.services.permission_cache import PermissionCache
+
+class FakeRedis:
+    """The handful of Redis commands the cache uses, in memory"""
+
+    def __init__(self):
+        self.data = {}
+
+    def mget(self, *keys):
+        return [self.data.get(key) for key in keys]
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def incr(self, key):
+        self.data[key] = int(self.data.get(key) or 0) + 1
+        return self.data[key]
+
+@pytest.fixture(params=["redis", "local"])
+def cache(request):
+    cache = PermissionCache(version_check_interval=0, local_ttl_seconds=60)
+    if request.param == "redis":
+        cache.redis = FakeRedis()
+    return cache
+
+def compile_permissions(cache, user_id, compile):
+    """The miss path of Member.get_permission_set"""
+    permissions = cache.get(user_id)
+    if permissions is None:
+        version = cache.version(user_id)
+        permissions = cache.set(user_id, compile(), version=version)
+    return permissions
+
+def test_revoke_during_compile_is_not_cached(cache):
+    roles = {"admin": {"inventory.delete"}, "member": {"inventory.view"}}
+
+    def compile_then_revoke():
+        # The compile has read the roles when the revoke commits and bumps the version
+        permissions = set().union(*roles.values())
+        roles.pop("admin")
+        cache.invalidate("u1")
+        return permissions
+
+    stale = compile_permissions(cache, "u1", compile_then_revoke)
+    assert "inventory.delete" in stale  # the in-flight request still sees its own compile
+
+    assert cache.get("u1") is None
+    fresh = compile_permissions(cache, "u1", lambda: set().union(*roles.values()))
+    assert fresh == {"inventory.view"}
+    assert cache.get("u1") == {"inventory.view"}
+
+def test_revoke_during_compile_is_not_shared_through_redis():
+    redis = FakeRedis()
+    worker_a = PermissionCache(version_check_interval=0)
+    worker_b = PermissionCache(version_check_interval=0)
+    worker_a.redis = worker_b.redis = redis
+
+    def compile_then_revoke():
+        permissions = {"inventory.delete"}
+        worker_b.invalidate("u1")
+        return permissions
+
+    compile_permissions(worker_a, "u1", compile_then_revoke)
+
+    assert worker_b.get("u1") is None
+    assert worker_a.get("u1") is None
+
+def test_set_without_version_stores_under_current_version(cache):
+    cache.set("u1", {"inventory.view"})
+    assert cache.get("u1") == {"inventory.view"}
+
+    cache.invalidate("u1")
+    assert cache.get("u1") is None
@@ -0,0 +1,82 @@
+"""
+Geohash encoding and proximity helpers for provider lookups
+"""
+
+import math
+from typing import List, Tuple
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+EARTH_RADIUS_KM = 6371.0
+
+MAX_PRECISION = 9
+MAX_GEOHASH_LENGTH = 12
+
+def encode(lat: float, lng: float, precision: int = 7) -> str:
+    """Encode a coordinate as a geohash string"""
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+
+    while len(chars) < precision:
+        rng, coord = (lng_range, lng) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+
+    return "".join(chars)
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """Cell (height, width) in degrees at the given precision"""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = (5 * precision) // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lng_bits)
+
+def precision_for_radius(radius_km: float, lat: float = 0.0) -> int:
+    """Finest precision whose cells at this latitude span at least radius_km"""
+    km_per_degree = math.pi * EARTH_RADIUS_KM / 180.0
+    # Longitude degrees shrink towards the poles; size for the poleward edge
+    edge_lat = min(abs(lat) + radius_km / km_per_degree, 89.0)
+    lng_scale = max(math.cos(math.radians(edge_lat)), 0.01)
+    for precision in range(MAX_PRECISION, 0, -1):
+        height, width = cell_size(precision)
+        if height * km_per_degree >= radius_km and width * km_per_degree * lng_scale >= radius_km:
+            return precision
+    return 1
+
+def covering_cells(lat: float, lng: float, radius_km: float) -> List[str]:
+    """Geohash prefixes (centre cell plus neighbours) covering a search radius
+
+    Cells are chosen at least radius_km across, so the 3x3 block around the
+    centre cell contains every point within the radius.
+    """
+    precision = precision_for_radius(radius_km, lat)
+    height, width = cell_size(precision)
+
+    cells = set()
+    for dlat in (-height, 0.0, height):
+        for dlng in (-width, 0.0, width):
+            cell_lat = max(-89.999999, min(89.999999, lat + dlat))
+            cell_lng = (lng + dlng + 180.0) % 360.0 - 180.0
+            cells.add(encode(cell_lat, cell_lng, precision))
+    return sorted(cells)
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance between two coordinates in km"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
@@ -89,7 +89,11 @@ class Settings(BaseSettings):
         default_factory=lambda: secrets.token_urlsafe(32),
         description="Service-to-service authentication token"
     )
-    
+    SERVICE_EVENTS_URL: str = Field(
+        "http://localhost:8004",
+        description="Event service URL"
+    )
+
     # Pricing Configuration
     PRICE_SETUP_FEE: float = Field(50.0, description="Base setup fee for services")
     RATE_PLA_PER_CM3: float = Field(0.15, description="PLA material rate per cm³")
@@ -114,6 +118,7 @@ class Settings(BaseSettings):
     
     # Logging
     LOG_LEVEL: str = Field("INFO", regex="^(DEBUG|INFO|WARNING|ERROR|CRITICAL)$")
+    AUDIT_LOG_DIR: str = Field(".", description="Directory for security audit and performance logs")
     
     # Celery (for future async tasks)
     CELERY_BROKER: str = Field(
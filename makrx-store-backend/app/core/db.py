@@ -6,7 +6,7 @@ SQLAlchemy with async PostgreSQL support
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Session
-from sqlalchemy import MetaData
+from sqlalchemy import MetaData, text
 import logging
 
 from app.core.config import settings
@@ -65,6 +65,8 @@ async def create_tables():
                 commerce, services, admin
             )
             
+            # Trigram operator classes used by the product search indexes
+            await conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
             await conn.run_sync(Base.metadata.create_all)
             logger.info("Database tables created successfully")
     except Exception as e:
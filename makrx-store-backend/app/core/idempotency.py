@@ -0,0 +1,280 @@
+"""
+Shared idempotency store
+Idempotency keys are claimed in PostgreSQL, which keeps the durable record,
+with Redis in front: SET NX EX settles concurrent attempts across workers
+before they reach the database, and completed responses are cached there so
+retries are answered without a query. Redis entries and database rows both
+expire, so the store stays bounded under sustained traffic.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, NamedTuple, Optional
+
+import redis.asyncio as redis
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+
+from app.core.config import settings
+from app.core.quote_cache import stable_hash
+
+logger = logging.getLogger(__name__)
+
+IN_PROGRESS = "in_progress"
+COMPLETED = "completed"
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a different request"""
+
+class IdempotencyInProgress(Exception):
+    """Another attempt currently holds the key"""
+
+class Claim(NamedTuple):
+    acquired: bool  # True: run the operation, then complete() or release()
+    response: Any = None  # cached response when the key was already completed
+
+class IdempotencyRecord(NamedTuple):
+    status: str
+    fingerprint: Optional[str]
+    response: Any
+
+def request_fingerprint(*parts: Any) -> str:
+    """Fingerprint of the request a key was used for (see stable_hash)"""
+    return stable_hash(*parts)
+
+class IdempotencyStore:
+    """Redis + PostgreSQL idempotency keys shared by every worker
+
+    Redis is optional: without it, or while it is unreachable, every call
+    goes to the database, which alone is enough for correctness.
+    """
+
+    def __init__(self, redis_url: Optional[str] = None, ttl_seconds: int = 72 * 3600,
+                 lock_seconds: int = 300, purge_seconds: int = 3600):
+        self.redis_client = redis.Redis.from_url(redis_url, decode_responses=True) if redis_url else None
+        self.ttl_seconds = ttl_seconds
+        self.lock_seconds = lock_seconds
+        self.purge_seconds = purge_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _redis_key(scope: str, key: str) -> str:
+        return f"idempotency:{scope}:{key}"
+
+    @staticmethod
+    def _check_fingerprint(scope: str, key: str, stored: Optional[str], fingerprint: Optional[str]) -> None:
+        if stored and fingerprint and stored != fingerprint:
+            raise IdempotencyConflict(f"Idempotency key {key} was already used for a different {scope} request")
+
+    async def claim(self, scope: str, key: str, fingerprint: Optional[str] = None) -> Claim:
+        """Claim key for scope before running the operation
+
+        Returns Claim(acquired=True) when the caller should run it, or the
+        cached response when it already completed. Raises
+        IdempotencyInProgress while another attempt holds the key and
+        IdempotencyConflict when the key was used with another fingerprint.
+        """
+        redis_key = self._redis_key(scope, key)
+        redis_claimed = False
+        if self.redis_client:
+            try:
+                pending = json.dumps({"status": IN_PROGRESS, "fingerprint": fingerprint})
+                redis_claimed = bool(await self.redis_client.set(redis_key, pending, nx=True, ex=self.lock_seconds))
+                if not redis_claimed:
+                    cached = await self.redis_client.get(redis_key)
+                    if cached:
+                        cached = json.loads(cached)
+                        self._check_fingerprint(scope, key, cached.get("fingerprint"), fingerprint)
+                        if cached["status"] == COMPLETED:
+                            return Claim(False, cached.get("response"))
+                        raise IdempotencyInProgress(f"{scope} {key} is already in progress")
+            except (IdempotencyConflict, IdempotencyInProgress):
+                raise
+            except Exception as e:
+                logger.warning(f"Redis idempotency check failed, using the database: {e}")
+
+        from app.core.db import AsyncSessionLocal
+        from app.models.admin import IdempotencyKey
+
+        table = IdempotencyKey.__table__
+        now = datetime.now(timezone.utc)
+        async with AsyncSessionLocal() as db:
+            # Take the key if it is new, expired, or an abandoned in_progress claim
+            stmt = pg_insert(table).values(
+                scope=scope,
+                key=key,
+                fingerprint=fingerprint,
+                status=IN_PROGRESS,
+                locked_until=now + timedelta(seconds=self.lock_seconds),
+                expires_at=now + timedelta(seconds=self.ttl_seconds),
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[table.c.scope, table.c.key],
+                set_={
+                    "fingerprint": stmt.excluded.fingerprint,
+                    "status": IN_PROGRESS,
+                    "response": None,
+                    "created_at": now,
+                    "locked_until": stmt.excluded.locked_until,
+                    "completed_at": None,
+                    "expires_at": stmt.excluded.expires_at,
+                },
+                where=or_(
+                    table.c.expires_at < now,
+                    and_(table.c.status == IN_PROGRESS, table.c.locked_until < now),
+                ),
+            ).returning(table.c.id)
+            acquired = (await db.execute(stmt)).first() is not None
+            await db.commit()
+            if acquired:
+                return Claim(True)
+
+            record = await self._load(db, scope, key)
+
+        if record is not None and record.status == COMPLETED:
+            self._check_fingerprint(scope, key, record.fingerprint, fingerprint)
+            await self._cache(scope, key, record.fingerprint, record.response)
+            return Claim(False, record.response)
+
+        # The database claim belongs to someone else (or was just released);
+        # do not leave our Redis entry standing in for it
+        if redis_claimed:
+            try:
+                await self.redis_client.delete(redis_key)
+            except Exception as e:
+                logger.warning(f"Failed to clear idempotency key in Redis: {e}")
+        if record is not None:
+            self._check_fingerprint(scope, key, record.fingerprint, fingerprint)
+        raise IdempotencyInProgress(f"{scope} {key} is already in progress")
+
+    async def complete(self, scope: str, key: str, response: Any) -> Any:
+        """Store the response of a claimed operation; returns it JSON-encoded"""
+        from app.core.db import AsyncSessionLocal
+        from app.models.admin import IdempotencyKey
+
+        response = jsonable_encoder(response)
+        now = datetime.now(timezone.utc)
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                update(IdempotencyKey)
+                .where(IdempotencyKey.scope == scope, IdempotencyKey.key == key)
+                .values(
+                    status=COMPLETED,
+                    response=response,
+                    locked_until=None,
+                    completed_at=now,
+                    expires_at=now + timedelta(seconds=self.ttl_seconds),
+                )
+                .returning(IdempotencyKey.fingerprint)
+            )
+            row = result.first()
+            await db.commit()
+        await self._cache(scope, key, row.fingerprint if row else None, response)
+        return response
+
+    async def release(self, scope: str, key: str) -> None:
+        """Give up a claim after the operation failed so a retry can run it"""
+        from app.core.db import AsyncSessionLocal
+        from app.models.admin import IdempotencyKey
+
+        if self.redis_client:
+            try:
+                await self.redis_client.delete(self._redis_key(scope, key))
+            except Exception as e:
+                logger.warning(f"Failed to release idempotency key in Redis: {e}")
+        async with AsyncSessionLocal() as db:
+            await db.execute(
+                delete(IdempotencyKey).where(
+                    IdempotencyKey.scope == scope,
+                    IdempotencyKey.key == key,
+                    IdempotencyKey.status == IN_PROGRESS,
+                )
+            )
+            await db.commit()
+
+    async def lookup(self, scope: str, key: str) -> Optional[IdempotencyRecord]:
+        """Current record for key, or None if it is unused or expired"""
+        if self.redis_client:
+            try:
+                cached = await self.redis_client.get(self._redis_key(scope, key))
+                if cached:
+                    cached = json.loads(cached)
+                    if cached["status"] == COMPLETED:
+                        return IdempotencyRecord(COMPLETED, cached.get("fingerprint"), cached.get("response"))
+            except Exception as e:
+                logger.warning(f"Redis idempotency lookup failed, using the database: {e}")
+
+        from app.core.db import AsyncSessionLocal
+
+        async with AsyncSessionLocal() as db:
+            return await self._load(db, scope, key)
+
+    async def purge_expired(self) -> int:
+        """Delete expired rows; Redis entries expire on their own"""
+        from app.core.db import AsyncSessionLocal
+        from app.models.admin import IdempotencyKey
+
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                delete(IdempotencyKey).where(IdempotencyKey.expires_at < datetime.now(timezone.utc))
+            )
+            await db.commit()
+        return result.rowcount
+
+    @staticmethod
+    async def _load(db, scope: str, key: str) -> Optional[IdempotencyRecord]:
+        from app.models.admin import IdempotencyKey
+
+        row = (
+            await db.execute(
+                select(IdempotencyKey.status, IdempotencyKey.fingerprint, IdempotencyKey.response).where(
+                    IdempotencyKey.scope == scope,
+                    IdempotencyKey.key == key,
+                    IdempotencyKey.expires_at >= datetime.now(timezone.utc),
+                )
+            )
+        ).first()
+        return IdempotencyRecord(*row) if row else None
+
+    async def _cache(self, scope: str, key: str, fingerprint: Optional[str], response: Any) -> None:
+        if not self.redis_client:
+            return
+        try:
+            await self.redis_client.set(
+                self._redis_key(scope, key),
+                json.dumps({"status": COMPLETED, "fingerprint": fingerprint, "response": response}),
+                ex=self.ttl_seconds,
+            )
+        except Exception as e:
+            logger.warning(f"Failed to cache idempotent response in Redis: {e}")
+
+    async def start(self) -> None:
+        if self.purge_seconds and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _loop(self) -> None:
+        while True:
+            try:
+                purged = await self.purge_expired()
+                if purged:
+                    logger.info(f"Purged {purged} expired idempotency keys")
+            except Exception as e:
+                logger.error(f"Failed to purge idempotency keys: {e}")
+            await asyncio.sleep(self.purge_seconds)
+
+# Global idempotency store; webhook providers retry for up to three days
+idempotency_store = IdempotencyStore(
+    redis_url=getattr(settings, "REDIS_URL", None),
+    ttl_seconds=int(os.getenv("IDEMPOTENCY_TTL_SECONDS", str(72 * 3600))),
+    lock_seconds=int(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "300")),
+    purge_seconds=int(os.getenv("IDEMPOTENCY_PURGE_SECONDS", "3600")),
+)
@@ -21,6 +21,7 @@ import razorpay
 from dataclasses import dataclass
 
 from app.core.config import settings
+from app.core.idempotency import COMPLETED, idempotency_store
 
 logger = logging.getLogger(__name__)
 
@@ -172,33 +173,27 @@ class IdempotentPaymentProcessor:
     - Prevent double-processing of payments
     """
     
-    def __init__(self):
-        self.processed_events = {}  # In production, use Redis
-        self.payment_intents = {}   # Track payment intent states
-    
     async def is_duplicate_event(self, event_id: str, provider: PaymentProvider) -> bool:
         """Check if webhook event was already processed"""
-        event_key = f"{provider.value}:{event_id}"
-        return event_key in self.processed_events
+        record = await idempotency_store.lookup(f"webhook:{provider.value}", event_id)
+        return record is not None and record.status == COMPLETED
     
     async def mark_event_processed(self, event_id: str, provider: PaymentProvider, 
                                  result: Dict[str, Any]):
         """Mark webhook event as processed"""
-        event_key = f"{provider.value}:{event_id}"
-        self.processed_events[event_key] = {
-            "processed_at": datetime.utcnow().isoformat(),
-            "result": result
-        }
+        await idempotency_store.complete(f"webhook:{provider.value}", event_id, result)
     
     async def get_cached_result(self, event_id: str, provider: PaymentProvider) -> Optional[Dict[str, Any]]:
         """Get cached result for duplicate event"""
-        event_key = f"{provider.value}:{event_id}"
-        cached = self.processed_events.get(event_key)
-        return cached["result"] if cached else None
+        record = await idempotency_store.lookup(f"webhook:{provider.value}", event_id)
+        return record.response if record and record.status == COMPLETED else None
     
     async def process_payment_event(self, webhook_data: Dict[str, Any]) -> Dict[str, Any]:
         """
         Process payment webhook event idempotently
+        The event id is claimed in the shared idempotency store first, so a
+        retry delivered to another worker (or after a restart) gets the
+        stored result instead of being processed again.
         """
         try:
             provider = webhook_data["provider"]
@@ -208,21 +203,28 @@ class IdempotentPaymentProcessor:
             if not event_id:
                 raise Exception("Missing event ID")
             
-            # Check for duplicate
-            if await self.is_duplicate_event(event_id, provider):
+            # Claim the event; duplicates get the stored result, and a
+            # concurrent delivery fails so the provider retries it later
+            scope = f"webhook:{provider.value}"
+            claim = await idempotency_store.claim(scope, event_id)
+            if not claim.acquired:
                 logger.info(f"Duplicate webhook event ignored: {event_id}")
-                return await self.get_cached_result(event_id, provider)
+                return claim.response
             
-            # Process based on provider and event type
-            if provider == PaymentProvider.STRIPE:
-                result = await self._process_stripe_event(event)
-            elif provider == PaymentProvider.RAZORPAY:
-                result = await self._process_razorpay_event(event)
-            else:
-                raise Exception(f"Unsupported provider: {provider}")
+            try:
+                # Process based on provider and event type
+                if provider == PaymentProvider.STRIPE:
+                    result = await self._process_stripe_event(event)
+                elif provider == PaymentProvider.RAZORPAY:
+                    result = await self._process_razorpay_event(event)
+                else:
+                    raise Exception(f"Unsupported provider: {provider}")
+            except Exception:
+                await idempotency_store.release(scope, event_id)
+                raise
             
             # Mark as processed
-            await self.mark_event_processed(event_id, provider, result)
+            await idempotency_store.complete(scope, event_id, result)
             
             return result
             
@@ -9,6 +9,7 @@ from decimal import Decimal, ROUND_HALF_UP
 import logging
 
 from app.core.config import settings, MATERIAL_RATES, MATERIAL_DENSITIES, QUALITY_MULTIPLIERS
+from app.core.quote_cache import pricing_cache, pricing_table_version, stable_hash
 
 logger = logging.getLogger(__name__)
 
@@ -20,6 +21,10 @@ class PricingEngine:
         self.material_rates = {k: Decimal(str(v)) for k, v in MATERIAL_RATES.items()}
         self.material_densities = MATERIAL_DENSITIES.copy()
         self.quality_multipliers = QUALITY_MULTIPLIERS.copy()
+        # Cached quotes are only reused while the pricing tables are unchanged
+        self.pricing_version = pricing_table_version(
+            str(self.setup_fee), MATERIAL_RATES, MATERIAL_DENSITIES, QUALITY_MULTIPLIERS
+        )
     
     def calculate_quote(
         self,
@@ -30,7 +35,8 @@ class PricingEngine:
         supports: bool = False,
         layer_height: float = 0.2,
         rush_order: bool = False,
-        quantity: int = 1
+        quantity: int = 1,
+        geometry_hash: Optional[str] = None
     ) -> Dict[str, any]:
         """
         Calculate comprehensive quote for 3D printing job
@@ -44,10 +50,44 @@ class PricingEngine:
             layer_height: Layer height in mm
             rush_order: Whether this is a rush order
             quantity: Number of parts to print
+            geometry_hash: Mesh content hash, if known (part of the cache key)
         
         Returns:
             Dictionary with pricing breakdown and estimates
         """
+        cache_key = "quote:" + stable_hash(
+            self.pricing_version,
+            geometry_hash,
+            volume_mm3,
+            material.lower(),
+            quality,
+            infill_percentage,
+            supports,
+            layer_height,
+            rush_order,
+            quantity
+        )
+        quote = pricing_cache.get(cache_key)
+        if quote is None:
+            quote = self._compute_quote(
+                volume_mm3, material, quality, infill_percentage,
+                supports, layer_height, rush_order, quantity
+            )
+            pricing_cache.set(cache_key, quote)
+        return quote
+    
+    def _compute_quote(
+        self,
+        volume_mm3: float,
+        material: str,
+        quality: str,
+        infill_percentage: int,
+        supports: bool,
+        layer_height: float,
+        rush_order: bool,
+        quantity: int
+    ) -> Dict[str, any]:
+        """Uncached quote calculation (see calculate_quote)"""
         try:
             # Convert volume to cm³
             volume_cm3 = Decimal(str(volume_mm3 / 1000))
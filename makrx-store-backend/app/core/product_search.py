@@ -0,0 +1,40 @@
+"""
+Product full-text search
+Builds the match condition and relevance expression over the weighted
+products.search_vector column, with pg_trgm word similarity on name and
+brand so misspelled or partial queries still find products
+"""
+
+from typing import Tuple
+
+from sqlalchemy import func, or_
+from sqlalchemy.sql.elements import ColumnElement
+
+from app.models.commerce import Product
+
+SEARCH_CONFIG = "english"
+
+# Weight of the trigram name/brand similarity relative to ts_rank
+TRIGRAM_RANK_WEIGHT = 0.5
+
+def product_text_search(q: str) -> Tuple[ColumnElement, ColumnElement]:
+    """Return (match condition, relevance expression) for a search query
+
+    Every branch of the condition is served by a GIN index: the tsvector
+    match by ix_products_search_vector, the trigram matches by
+    ix_products_name_trgm / ix_products_brand_trgm.
+    """
+    q = q.strip()
+    tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, q)
+
+    condition = or_(
+        Product.search_vector.op("@@")(tsquery),
+        # word_similarity(q, column) above pg_trgm.word_similarity_threshold
+        Product.name.op("%>")(q),
+        Product.brand.op("%>")(q),
+    )
+    relevance = func.ts_rank(Product.search_vector, tsquery) + TRIGRAM_RANK_WEIGHT * func.greatest(
+        func.word_similarity(q, Product.name),
+        func.coalesce(func.word_similarity(q, Product.brand), 0),
+    )
+    return condition, relevance
@@ -0,0 +1,70 @@
+"""
+Deterministic caches for quote calculation
+Geometry results keyed by mesh content, pricing results keyed by geometry
+fingerprint, print parameters and pricing-table version
+"""
+
+import copy
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+def stable_hash(*parts: Any) -> str:
+    """SHA-256 of the JSON encoding of parts (dict keys sorted)"""
+    encoded = json.dumps(parts, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+def pricing_table_version(*tables: Any) -> str:
+    """Short version tag for pricing inputs; changes whenever any table changes"""
+    return stable_hash(*tables)[:12]
+
+class QuoteCache:
+    """Thread-safe in-process LRU cache with a TTL
+
+    Values are deep-copied on the way in and out so callers can mutate the
+    results they get back without corrupting cached entries.
+    """
+
+    def __init__(self, max_entries: int = 10_000, ttl_seconds: int = 3600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            value = entry[1]
+        return copy.deepcopy(value)
+
+    def set(self, key: str, value: Any) -> None:
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+# Geometry stage: mesh analysis results, keyed by mesh content hash or upload
+geometry_cache = QuoteCache(max_entries=5_000, ttl_seconds=24 * 3600)
+
+# Pricing stage: cost/time breakdowns, keyed by geometry fingerprint,
+# print parameters and pricing-table version
+pricing_cache = QuoteCache(max_entries=20_000, ttl_seconds=3600)
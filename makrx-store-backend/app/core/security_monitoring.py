@@ -9,9 +9,13 @@ Implements security monitoring per specification:
 """
 import json
 import logging
+import math
+import os
+import gzip
+import shutil
 import time
 import asyncio
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Tuple
 from datetime import datetime, timedelta
 from enum import Enum
 from dataclasses import dataclass, asdict
@@ -104,6 +108,146 @@ class MonitoringConfig:
     AUDIT_LOG_RETENTION_DAYS = 365   # 1 year minimum
     SECURITY_LOG_RETENTION_DAYS = 90  # 90 days
     PERFORMANCE_LOG_RETENTION_DAYS = 30  # 30 days
+    
+    # Background audit writer
+    AUDIT_BUFFER_SIZE = 65536            # Ring buffer capacity (records)
+    AUDIT_BATCH_SIZE = 2000              # Max records serialized per write
+    AUDIT_FLUSH_INTERVAL_SECONDS = 1.0
+    AUDIT_LOG_MAX_BYTES = 50 * 1024 * 1024  # Rotate and gzip segments at 50MB
+    
+    # Rolling metric buckets
+    METRIC_BUCKET_SECONDS = 60
+    METRIC_RETENTION_HOURS = 24 * 7
+    METRIC_MAX_ENDPOINTS = 500       # Further endpoints share one overflow key per method
+    SLO_REPORT_MAX_ENDPOINTS = 50
+
+# ==========================================
+# Background Audit Log Writer
+# ==========================================
+
+class AuditLogWriter:
+    """
+    Batched, off-loop writer for audit and metric logs
+    - Request path only appends to a bounded ring buffer (deque appends are
+      atomic, so producers never take a lock)
+    - A daemon thread drains the buffer, serializes and writes in batches
+    - Segments rotate by size/day and are gzip-compressed, expired ones pruned
+    """
+    
+    STREAMS = {
+        "security": ("security_audit.log", MonitoringConfig.AUDIT_LOG_RETENTION_DAYS),
+        "performance": ("performance_metrics.log", MonitoringConfig.PERFORMANCE_LOG_RETENTION_DAYS),
+    }
+    
+    def __init__(self, log_dir: str = "."):
+        self.log_dir = log_dir
+        self.buffer = deque(maxlen=MonitoringConfig.AUDIT_BUFFER_SIZE)
+        self.dropped = 0
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._files: Dict[str, Any] = {}
+        self._opened_on: Dict[str, str] = {}
+    
+    def enqueue(self, stream: str, record: Any):
+        """Queue a record (dataclass or dict) for the background writer"""
+        if self._thread is None:
+            self.start()
+        if len(self.buffer) == self.buffer.maxlen:
+            # Oldest record is overwritten; count it so overload is visible
+            self.dropped += 1
+        self.buffer.append((stream, record))
+        if len(self.buffer) >= MonitoringConfig.AUDIT_BATCH_SIZE:
+            self._wakeup.set()
+    
+    def start(self):
+        """Start the writer thread (idempotent)"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        os.makedirs(self.log_dir, exist_ok=True)
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="audit-log-writer", daemon=True)
+        self._thread.start()
+    
+    def stop(self, timeout: float = 5.0):
+        """Flush remaining records and stop the writer thread"""
+        if self._thread is None:
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        self._thread.join(timeout)
+        self._thread = None
+    
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(MonitoringConfig.AUDIT_FLUSH_INTERVAL_SECONDS)
+            self._wakeup.clear()
+            self._drain()
+        self._drain()
+        for handle in self._files.values():
+            handle.close()
+        self._files.clear()
+    
+    def _drain(self):
+        try:
+            while self.buffer:
+                lines: Dict[str, List[str]] = defaultdict(list)
+                for _ in range(min(len(self.buffer), MonitoringConfig.AUDIT_BATCH_SIZE)):
+                    stream, record = self.buffer.popleft()
+                    if not isinstance(record, dict):
+                        record = asdict(record)
+                    lines[stream].append(json.dumps(record, default=str))
+                
+                for stream, batch in lines.items():
+                    handle = self._get_file(stream)
+                    handle.write("\n".join(batch) + "\n")
+                    handle.flush()
+            
+            if self.dropped:
+                logging.warning(f"Audit log buffer overflow, {self.dropped} records dropped")
+                self.dropped = 0
+        except Exception as e:
+            logging.error(f"Audit log writer failed: {e}")
+    
+    def _get_file(self, stream: str):
+        filename, _ = self.STREAMS[stream]
+        path = os.path.join(self.log_dir, filename)
+        today = datetime.utcnow().strftime("%Y%m%d")
+        handle = self._files.get(stream)
+        
+        if handle is not None and (
+            self._opened_on[stream] != today or handle.tell() >= MonitoringConfig.AUDIT_LOG_MAX_BYTES
+        ):
+            handle.close()
+            self._rotate(stream, path)
+            handle = None
+        
+        if handle is None:
+            handle = open(path, "a", encoding="utf-8")
+            self._files[stream] = handle
+            self._opened_on[stream] = today
+        return handle
+    
+    def _rotate(self, stream: str, path: str):
+        """Compress the finished segment and prune segments past retention"""
+        if not os.path.exists(path):
+            return
+        segment = f"{path}.{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.gz"
+        with open(path, "rb") as src, gzip.open(segment, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(path)
+        
+        _, retention_days = self.STREAMS[stream]
+        cutoff = time.time() - retention_days * 86400
+        prefix = os.path.basename(path) + "."
+        for name in os.listdir(self.log_dir):
+            if name.startswith(prefix) and name.endswith(".gz"):
+                full_path = os.path.join(self.log_dir, name)
+                if os.path.getmtime(full_path) < cutoff:
+                    os.remove(full_path)
+
+# Global audit log writer
+audit_log_writer = AuditLogWriter(getattr(settings, "AUDIT_LOG_DIR", "."))
 
 # ==========================================
 # Security Event Logger
@@ -126,15 +270,12 @@ class SecurityEventLogger:
             '{"timestamp": "%(asctime)s", "level": "%(levelname)s", "logger": "%(name)s", "message": %(message)s}'
         )
         
-        # Console handler
+        # Console handler for events worth surfacing immediately; the full
+        # audit trail is written in batches by audit_log_writer
         console_handler = logging.StreamHandler()
         console_handler.setFormatter(formatter)
+        console_handler.setLevel(logging.WARNING)
         self.logger.addHandler(console_handler)
-        
-        # File handler for audit trail
-        file_handler = logging.FileHandler("security_audit.log")
-        file_handler.setFormatter(formatter)
-        self.logger.addHandler(file_handler)
     
     async def log_security_event(self, event_type: SecurityEventType, action: str,
                                success: bool, user_id: Optional[str] = None,
@@ -159,8 +300,10 @@ class SecurityEventLogger:
             source_service=settings.SERVICE_NAME if hasattr(settings, 'SERVICE_NAME') else "makrx-store"
         )
         
-        # Log event
-        self.logger.info(json.dumps(asdict(event)))
+        # Queue event for the background audit writer
+        audit_log_writer.enqueue("security", event)
+        if severity in (AlertSeverity.HIGH, AlertSeverity.CRITICAL):
+            self.logger.warning(json.dumps(asdict(event), default=str))
         
         # Trigger real-time monitoring
         await security_monitor.process_security_event(event)
@@ -448,6 +591,67 @@ class RealTimeSecurityMonitor:
 # Global security monitor
 security_monitor = RealTimeSecurityMonitor()
 
+# ==========================================
+# Latency Histograms & Time Buckets
+# ==========================================
+
+class LatencyHistogram:
+    """
+    Log-linear latency histogram (HDR-style)
+    - Fixed relative error (~2%) at any magnitude, constant-size merge
+    - Exact counts are kept separately by the bucket; this only serves quantiles
+    """
+    
+    GROWTH = 1.02
+    _LOG_GROWTH = math.log(GROWTH)
+    
+    __slots__ = ("counts",)
+    
+    def __init__(self):
+        self.counts: Dict[int, int] = defaultdict(int)
+    
+    def record(self, value_ms: float):
+        index = int(math.log(value_ms) / self._LOG_GROWTH) if value_ms > 1 else 0
+        self.counts[index] += 1
+    
+    def merge(self, other: "LatencyHistogram"):
+        for index, count in other.counts.items():
+            self.counts[index] += count
+    
+    def percentile(self, percent: float) -> Optional[float]:
+        total = sum(self.counts.values())
+        if not total:
+            return None
+        rank = total * percent / 100
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                # Upper bound of the bucket, so reported latency never understates
+                return round(self.GROWTH ** (index + 1), 2)
+        return None
+
+class MetricBucket:
+    """Aggregated API metrics for one endpoint over one time slice"""
+    
+    __slots__ = ("total", "errors", "fast", "duration_sum_ms", "histogram")
+    
+    def __init__(self):
+        self.total = 0
+        self.errors = 0
+        self.fast = 0
+        self.duration_sum_ms = 0.0
+        self.histogram = LatencyHistogram()
+    
+    def add(self, duration_ms: float, status_code: int):
+        self.total += 1
+        self.duration_sum_ms += duration_ms
+        if status_code >= 500:
+            self.errors += 1
+        if duration_ms <= MonitoringConfig.API_LATENCY_SLO:
+            self.fast += 1
+        self.histogram.record(duration_ms)
+
 # ==========================================
 # Performance Monitor
 # ==========================================
@@ -461,9 +665,17 @@ class PerformanceMonitor:
     - Uptime monitoring
     """
     
+    OVERFLOW_ENDPOINT = "<other>"
+    
     def __init__(self):
-        self.metrics_buffer = deque(maxlen=10000)  # Recent metrics
+        # "METHOD route template" -> {bucket start (epoch seconds) -> MetricBucket}
+        self.metric_buckets: Dict[str, Dict[int, MetricBucket]] = defaultdict(dict)
+        # [bucket start, total, errors] over all endpoints, for the error rate SLO
+        self.recent_totals = deque(
+            maxlen=MonitoringConfig.MONITORING_WINDOW_MINUTES * 60 // MonitoringConfig.METRIC_BUCKET_SECONDS + 1
+        )
         self.slo_violations = deque(maxlen=1000)   # SLO violations
+        self._last_prune = 0
         self._lock = threading.Lock()
     
     async def record_api_metric(self, endpoint: str, method: str, duration_ms: float,
@@ -471,7 +683,12 @@ class PerformanceMonitor:
                               response_size: Optional[int] = None,
                               database_time_ms: Optional[float] = None,
                               cache_hit: Optional[bool] = None):
-        """Record API performance metric"""
+        """Record API performance metric
+        
+        endpoint should be the route template (e.g. /api/products/{product_id}),
+        not the raw path, so that IDs and unmatched probes do not each get
+        their own buckets.
+        """
         
         metric = PerformanceMetric(
             metric_id=secrets.token_urlsafe(8),
@@ -487,14 +704,80 @@ class PerformanceMonitor:
             cache_hit=cache_hit
         )
         
-        with self._lock:
-            self.metrics_buffer.append(metric)
+        self._add_to_bucket(metric)
         
         # Check SLO violations
         await self._check_slo_violations(metric)
         
-        # Log metric
-        logging.info(f"PERFORMANCE_METRIC: {json.dumps(asdict(metric))}")
+        # Queue metric for the background log writer
+        audit_log_writer.enqueue("performance", metric)
+    
+    def _add_to_bucket(self, metric: PerformanceMetric):
+        """Fold a metric into its endpoint's current time bucket"""
+        now = int(time.time())
+        bucket_start = now - now % MonitoringConfig.METRIC_BUCKET_SECONDS
+        
+        with self._lock:
+            key = f"{metric.method} {metric.endpoint}"
+            if key not in self.metric_buckets and len(self.metric_buckets) >= MonitoringConfig.METRIC_MAX_ENDPOINTS:
+                key = f"{metric.method} {self.OVERFLOW_ENDPOINT}"
+            buckets = self.metric_buckets[key]
+            bucket = buckets.get(bucket_start)
+            if bucket is None:
+                bucket = buckets[bucket_start] = MetricBucket()
+            bucket.add(metric.duration_ms, metric.status_code)
+            
+            if not self.recent_totals or self.recent_totals[-1][0] != bucket_start:
+                self.recent_totals.append([bucket_start, 0, 0])
+            self.recent_totals[-1][1] += 1
+            if metric.status_code >= 500:
+                self.recent_totals[-1][2] += 1
+            
+            if bucket_start - self._last_prune >= MonitoringConfig.METRIC_BUCKET_SECONDS:
+                self._last_prune = bucket_start
+                self._prune_buckets(now)
+    
+    def _prune_buckets(self, now: int):
+        """Drop buckets older than the retention window (caller holds lock)"""
+        cutoff = now - MonitoringConfig.METRIC_RETENTION_HOURS * 3600
+        for endpoint in list(self.metric_buckets):
+            buckets = self.metric_buckets[endpoint]
+            for bucket_start in [start for start in buckets if start < cutoff]:
+                del buckets[bucket_start]
+            if not buckets:
+                del self.metric_buckets[endpoint]
+    
+    def _aggregate(self, window_seconds: int,
+                   endpoint: Optional[str] = None) -> Tuple[MetricBucket, Dict[str, MetricBucket]]:
+        """Merge buckets inside the window, overall and per endpoint"""
+        now = int(time.time())
+        cutoff = now - window_seconds
+        overall = MetricBucket()
+        per_endpoint: Dict[str, MetricBucket] = {}
+        
+        with self._lock:
+            for key, buckets in self.metric_buckets.items():
+                if endpoint and not key.endswith(f" {endpoint}"):
+                    continue
+                merged = MetricBucket()
+                for bucket_start, bucket in buckets.items():
+                    # Include a bucket once any part of it falls in the window
+                    if bucket_start + MonitoringConfig.METRIC_BUCKET_SECONDS <= cutoff:
+                        continue
+                    merged.total += bucket.total
+                    merged.errors += bucket.errors
+                    merged.fast += bucket.fast
+                    merged.duration_sum_ms += bucket.duration_sum_ms
+                    merged.histogram.merge(bucket.histogram)
+                if merged.total:
+                    per_endpoint[key] = merged
+                    overall.total += merged.total
+                    overall.errors += merged.errors
+                    overall.fast += merged.fast
+                    overall.duration_sum_ms += merged.duration_sum_ms
+                    overall.histogram.merge(merged.histogram)
+        
+        return overall, per_endpoint
     
     async def _check_slo_violations(self, metric: PerformanceMetric):
         """Check for SLO violations"""
@@ -551,19 +834,19 @@ class PerformanceMonitor:
     
     async def _check_error_rate_slo(self):
         """Check error rate SLO"""
-        # Calculate error rate over last 5 minutes
-        cutoff_time = datetime.utcnow() - timedelta(minutes=5)
-        
-        recent_metrics = [
-            m for m in self.metrics_buffer
-            if datetime.fromisoformat(m.timestamp) > cutoff_time
-        ]
+        # Calculate error rate over last 5 minutes from the rolling totals
+        cutoff = int(time.time()) - MonitoringConfig.MONITORING_WINDOW_MINUTES * 60
+        total = errors = 0
+        with self._lock:
+            for bucket_start, bucket_total, bucket_errors in self.recent_totals:
+                if bucket_start + MonitoringConfig.METRIC_BUCKET_SECONDS > cutoff:
+                    total += bucket_total
+                    errors += bucket_errors
         
-        if len(recent_metrics) < 10:  # Need minimum sample size
+        if total < 10:  # Need minimum sample size
             return
         
-        error_count = sum(1 for m in recent_metrics if m.status_code >= 500)
-        error_rate = (error_count / len(recent_metrics)) * 100
+        error_rate = (errors / total) * 100
         
         if error_rate > MonitoringConfig.HIGH_ERROR_RATE_THRESHOLD:
             await security_monitor._trigger_security_alert(
@@ -572,33 +855,27 @@ class PerformanceMonitor:
                 details={
                     "error_rate_percent": error_rate,
                     "threshold_percent": MonitoringConfig.HIGH_ERROR_RATE_THRESHOLD,
-                    "sample_size": len(recent_metrics),
-                    "timeframe": "5 minutes"
+                    "sample_size": total,
+                    "timeframe": f"{MonitoringConfig.MONITORING_WINDOW_MINUTES} minutes"
                 }
             )
     
-    async def get_slo_report(self) -> Dict[str, Any]:
-        """Generate SLO compliance report"""
-        cutoff_time = datetime.utcnow() - timedelta(hours=24)  # Last 24 hours
-        
-        recent_metrics = [
-            m for m in self.metrics_buffer
-            if datetime.fromisoformat(m.timestamp) > cutoff_time
-        ]
+    async def get_slo_report(self, window_hours: int = 24,
+                             endpoint: Optional[str] = None) -> Dict[str, Any]:
+        """Generate SLO compliance report from the rolling time buckets"""
+        window_hours = max(1, min(window_hours, MonitoringConfig.METRIC_RETENTION_HOURS))
+        overall, per_endpoint = self._aggregate(window_hours * 3600, endpoint)
         
-        if not recent_metrics:
+        if not overall.total:
             return {"error": "No metrics available"}
         
         # Calculate SLO compliance
-        total_requests = len(recent_metrics)
-        successful_requests = sum(1 for m in recent_metrics if m.status_code < 500)
-        fast_requests = sum(1 for m in recent_metrics if m.duration_ms <= MonitoringConfig.API_LATENCY_SLO)
-        
-        uptime_slo = (successful_requests / total_requests) * 100
-        latency_slo = (fast_requests / total_requests) * 100
+        total_requests = overall.total
+        uptime_slo = ((total_requests - overall.errors) / total_requests) * 100
+        latency_slo = (overall.fast / total_requests) * 100
         
         return {
-            "report_period": "24_hours",
+            "report_period": f"{window_hours}_hours",
             "total_requests": total_requests,
             "uptime_slo": {
                 "target_percent": MonitoringConfig.API_UPTIME_SLO,
@@ -610,8 +887,28 @@ class PerformanceMonitor:
                 "actual_percent_compliant": latency_slo,
                 "compliant": latency_slo >= 95  # 95% of requests should be fast
             },
+            "latency_ms": self._latency_summary(overall),
+            "endpoints": {
+                key: {
+                    "total_requests": bucket.total,
+                    "error_rate_percent": (bucket.errors / bucket.total) * 100,
+                    "latency_ms": self._latency_summary(bucket)
+                }
+                for key, bucket in sorted(
+                    per_endpoint.items(), key=lambda item: item[1].total, reverse=True
+                )[:MonitoringConfig.SLO_REPORT_MAX_ENDPOINTS]
+            },
             "generated_at": datetime.utcnow().isoformat()
         }
+    
+    @staticmethod
+    def _latency_summary(bucket: MetricBucket) -> Dict[str, Optional[float]]:
+        return {
+            "mean": round(bucket.duration_sum_ms / bucket.total, 2),
+            "p50": bucket.histogram.percentile(50),
+            "p95": bucket.histogram.percentile(95),
+            "p99": bucket.histogram.percentile(99)
+        }
 
 # Global performance monitor
 performance_monitor = PerformanceMonitor()
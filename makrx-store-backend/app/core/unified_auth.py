@@ -12,6 +12,7 @@ from datetime import datetime, timedelta
 import json
 
 from app.core.config import settings
+from app.core.idempotency import COMPLETED, Claim, idempotency_store
 
 logger = logging.getLogger(__name__)
 security = HTTPBearer()
@@ -309,30 +310,34 @@ async def get_idempotency_key(
     return idempotency_key
 
 class IdempotencyChecker:
-    """Check and store idempotency keys to prevent duplicate operations"""
+    """Check and store idempotency keys to prevent duplicate operations
+
+    Keys live in the shared idempotency store (Redis + database), so they
+    hold across workers and restarts. Prefer claim() before running the
+    operation, then record_operation() on success or release() on failure.
+    """
     
-    def __init__(self):
-        # In production, use Redis for distributed idempotency
-        self.cache = {}
+    async def claim(self, key: str, operation: str, fingerprint: Optional[str] = None) -> Claim:
+        """Claim key for this operation; see IdempotencyStore.claim"""
+        return await idempotency_store.claim(operation, key, fingerprint)
+    
+    async def release(self, key: str, operation: str):
+        """Release a claim after the operation failed"""
+        await idempotency_store.release(operation, key)
     
     async def is_duplicate(self, key: str, operation: str) -> bool:
         """Check if this operation was already performed"""
-        cache_key = f"{operation}:{key}"
-        return cache_key in self.cache
+        record = await idempotency_store.lookup(operation, key)
+        return record is not None
     
     async def record_operation(self, key: str, operation: str, result: Any):
         """Record that this operation was completed"""
-        cache_key = f"{operation}:{key}"
-        self.cache[cache_key] = {
-            "result": result,
-            "timestamp": datetime.utcnow().isoformat()
-        }
+        return await idempotency_store.complete(operation, key, result)
     
     async def get_cached_result(self, key: str, operation: str) -> Optional[Any]:
         """Get cached result for duplicate request"""
-        cache_key = f"{operation}:{key}"
-        cached = self.cache.get(cache_key)
-        return cached["result"] if cached else None
+        record = await idempotency_store.lookup(operation, key)
+        return record.response if record and record.status == COMPLETED else None
 
 # Global idempotency checker
 idempotency = IdempotencyChecker()
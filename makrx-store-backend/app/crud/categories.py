@@ -4,16 +4,21 @@ Database operations for category management
 """
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, func, and_, desc
+from sqlalchemy import select, func, and_, desc, update
 from sqlalchemy.orm import selectinload
 from typing import List, Optional, Dict, Any
 import logging
 
 from app.models.commerce import Category, Product
 from app.schemas import CategoryCreate, CategoryUpdate
+from app.services.search_suggestions import search_suggestions
+from app.services.category_tree import category_tree, child_path
 
 logger = logging.getLogger(__name__)
 
+# A path lookup miss re-checks the tree version if the last check is older than this
+PATH_MISS_RECHECK_SECONDS = 1.0
+
 class CategoryCRUD:
     """CRUD operations for categories"""
     
@@ -21,9 +26,14 @@ class CategoryCRUD:
         """Create a new category"""
         try:
             category = Category(**category_data.dict())
+            parent = await self._get_parent(db, category.parent_id)
+            category.path = child_path(parent.path if parent else None, category.slug)
+            category.level = parent.level + 1 if parent else 0
             db.add(category)
             await db.commit()
             await db.refresh(category)
+            category_tree.invalidate()
+            search_suggestions.index.upsert_category(category)
             return category
         except Exception as e:
             await db.rollback()
@@ -58,16 +68,18 @@ class CategoryCRUD:
             logger.error(f"Failed to get category by slug {slug}: {e}")
             return None
 
-    async def get_by_path(self, db: AsyncSession, path: str) -> Optional[Category]:
+    async def get_by_path(self, db: AsyncSession, path: str) -> Optional[Dict[str, Any]]:
         """Get category by hierarchical path (e.g., 'electronics/arduino/boards')"""
         try:
-            query = select(Category).options(
-                selectinload(Category.children),
-                selectinload(Category.parent)
-            ).where(Category.path == path)
-
-            result = await db.execute(query)
-            return result.scalar_one_or_none()
+            path = path.strip("/")
+            tree = await category_tree.get()
+            node = tree.by_path.get(path)
+            if node is None:
+                # Possibly created, renamed or moved by another worker since
+                # this worker's last version check; re-check before a 404
+                tree = await category_tree.get(max_age=PATH_MISS_RECHECK_SECONDS)
+                node = tree.by_path.get(path)
+            return node
         except Exception as e:
             logger.error(f"Failed to get category by path {path}: {e}")
             return None
@@ -105,25 +117,11 @@ class CategoryCRUD:
             logger.error(f"Failed to get categories: {e}")
             return []
     
-    async def get_category_tree(self, db: AsyncSession, include_inactive: bool = False) -> List[Category]:
-        """Get full category tree (all levels)"""
+    async def get_category_tree(self, db: AsyncSession, include_inactive: bool = False) -> List[Dict[str, Any]]:
+        """Get full category tree (all levels) as root nodes with nested children"""
         try:
-            query = select(Category).options(
-                selectinload(Category.children),
-                selectinload(Category.parent)
-            )
-            
-            if not include_inactive:
-                query = query.where(Category.is_active == True)
-            
-            query = query.order_by(Category.sort_order, Category.name)
-            
-            result = await db.execute(query)
-            all_categories = list(result.scalars().all())
-            
-            # Build tree structure (return only root categories, children are loaded)
-            root_categories = [cat for cat in all_categories if cat.parent_id is None]
-            return root_categories
+            tree = await category_tree.get()
+            return tree.roots if include_inactive else tree.active_roots
         except Exception as e:
             logger.error(f"Failed to get category tree: {e}")
             return []
@@ -136,17 +134,59 @@ class CategoryCRUD:
                 return None
             
             update_data = category_data.dict(exclude_unset=True)
+            new_parent_id = update_data.pop("parent_id", category.parent_id)
+            new_slug = update_data.pop("slug", category.slug)
+            if new_parent_id != category.parent_id or new_slug != category.slug:
+                await self._move(db, category, new_parent_id, new_slug)
             for field, value in update_data.items():
                 setattr(category, field, value)
             
             await db.commit()
             await db.refresh(category)
+            category_tree.invalidate()
+            search_suggestions.index.upsert_category(category)
             return category
         except Exception as e:
             await db.rollback()
             logger.error(f"Failed to update category {category_id}: {e}")
             raise
     
+    async def _get_parent(self, db: AsyncSession, parent_id: Optional[int]) -> Optional[Category]:
+        if parent_id is None:
+            return None
+        parent = await db.get(Category, parent_id, populate_existing=True)
+        if parent is None:
+            raise ValueError(f"Parent category {parent_id} not found")
+        return parent
+    
+    async def _move(self, db: AsyncSession, category: Category, parent_id: Optional[int], slug: str) -> None:
+        """Re-parent and/or rename a category, rewriting the materialized path of its subtree"""
+        parent = await self._get_parent(db, parent_id)
+        if parent is not None and (
+            parent.id == category.id or parent.path.startswith(category.path + "/")
+        ):
+            raise ValueError("A category cannot be moved under itself")
+        
+        old_path, old_level = category.path, category.level or 0
+        new_path = child_path(parent.path if parent else None, slug)
+        new_level = parent.level + 1 if parent else 0
+        
+        # Descendants get updated_at too, so other workers' tree caches see a new version
+        await db.execute(
+            update(Category)
+            .where(Category.path.startswith(old_path + "/", autoescape=True))
+            .values(
+                path=func.concat(new_path, func.substr(Category.path, len(old_path) + 1)),
+                level=Category.level + (new_level - old_level),
+                updated_at=func.now()
+            )
+            .execution_options(synchronize_session=False)
+        )
+        category.parent_id = parent_id
+        category.slug = slug
+        category.path = new_path
+        category.level = new_level
+    
     async def delete(self, db: AsyncSession, category_id: int) -> bool:
         """Soft delete category (set is_active = False)"""
         try:
@@ -164,6 +204,8 @@ class CategoryCRUD:
                 category.is_active = False
             
             await db.commit()
+            category_tree.invalidate()
+            search_suggestions.index.remove_category(category_id)
             return True
         except Exception as e:
             await db.rollback()
@@ -247,26 +289,18 @@ class CategoryCRUD:
                         category.sort_order = sort_order
             
             await db.commit()
+            category_tree.invalidate()
             return True
         except Exception as e:
             await db.rollback()
             logger.error(f"Failed to reorder categories: {e}")
             return False
     
-    async def get_category_path(self, db: AsyncSession, category_id: int) -> List[Category]:
+    async def get_category_path(self, db: AsyncSession, category_id: int) -> List[Dict[str, Any]]:
         """Get category breadcrumb path from root to category"""
         try:
-            path = []
-            current_category = await self.get_by_id(db, category_id)
-            
-            while current_category:
-                path.insert(0, current_category)  # Insert at beginning
-                if current_category.parent_id:
-                    current_category = await self.get_by_id(db, current_category.parent_id)
-                else:
-                    break
-            
-            return path
+            tree = await category_tree.get()
+            return tree.ancestors(category_id)
         except Exception as e:
             logger.error(f"Failed to get category path for {category_id}: {e}")
             return []
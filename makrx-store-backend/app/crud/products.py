@@ -7,9 +7,12 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select, func, and_, or_, desc, asc, text
 from sqlalchemy.orm import selectinload
 from typing import List, Optional, Tuple, Dict, Any
+from datetime import datetime, timedelta, timezone
 import logging
 
-from app.models.commerce import Product, Category, OrderItem
+from app.models.commerce import Product, Category, OrderItem, ProductStats
+from app.core.product_search import product_text_search
+from app.services.search_suggestions import search_suggestions
 from app.schemas import ProductCreate, ProductUpdate, ProductSearch, ProductFilter, ProductSort
 
 logger = logging.getLogger(__name__)
@@ -24,6 +27,7 @@ class ProductCRUD:
             db.add(product)
             await db.commit()
             await db.refresh(product)
+            search_suggestions.index.upsert_product(product)
             return product
         except Exception as e:
             await db.rollback()
@@ -69,6 +73,7 @@ class ProductCRUD:
             
             await db.commit()
             await db.refresh(product)
+            search_suggestions.index.upsert_product(product)
             return product
         except Exception as e:
             await db.rollback()
@@ -84,6 +89,7 @@ class ProductCRUD:
             
             product.is_active = False
             await db.commit()
+            search_suggestions.index.remove_product(product_id)
             return True
         except Exception as e:
             await db.rollback()
@@ -189,19 +195,16 @@ class ProductCRUD:
                         count_query = count_query.where(Product.tags.contains([tag]))
             
             # Apply search query
-            if search.q:
-                search_term = f"%{search.q}%"
-                search_filter = or_(
-                    Product.name.ilike(search_term),
-                    Product.description.ilike(search_term),
-                    Product.short_description.ilike(search_term),
-                    Product.brand.ilike(search_term)
-                )
+            relevance = None
+            if search.q and search.q.strip():
+                search_filter, relevance = product_text_search(search.q)
                 query = query.where(search_filter)
                 count_query = count_query.where(search_filter)
             
             # Apply sorting
-            if search.sort == ProductSort.NAME_ASC:
+            if search.sort == ProductSort.RELEVANCE and relevance is not None:
+                query = query.order_by(desc(relevance), desc(Product.created_at))
+            elif search.sort == ProductSort.NAME_ASC:
                 query = query.order_by(asc(Product.name))
             elif search.sort == ProductSort.NAME_DESC:
                 query = query.order_by(desc(Product.name))
@@ -217,6 +220,15 @@ class ProductCRUD:
                 query = query.order_by(asc(Product.created_at))
             elif search.sort == ProductSort.CREATED_DESC:
                 query = query.order_by(desc(Product.created_at))
+            elif search.sort == ProductSort.POPULARITY:
+                query = query.outerjoin(ProductStats, ProductStats.product_id == Product.id).order_by(
+                    ProductStats.popularity_score.desc().nullslast(), desc(Product.created_at)
+                )
+            elif search.sort == ProductSort.RATING:
+                query = query.outerjoin(ProductStats, ProductStats.product_id == Product.id).order_by(
+                    ProductStats.average_rating.desc().nullslast(),
+                    ProductStats.rating_count.desc().nullslast(),
+                )
             else:  # Default to created_desc
                 query = query.order_by(desc(Product.created_at))
             
@@ -260,29 +272,38 @@ class ProductCRUD:
         limit: int = 10,
         days: int = 30
     ) -> List[Dict[str, Any]]:
-        """Get popular products based on order data"""
+        """Get popular products based on order data
+
+        Ranked by the denormalized, time-decayed popularity score in
+        product_stats (half-life POPULARITY_HALF_LIFE_DAYS); products without
+        sales in roughly the last `days` days contribute almost nothing.
+        """
         try:
-            # This would typically join with order_items and calculate popularity
-            # For now, return featured products as a placeholder
-            query = select(Product).options(
+            query = select(Product, ProductStats).join(
+                ProductStats, ProductStats.product_id == Product.id
+            ).options(
                 selectinload(Product.category)
-            ).where(Product.is_active == True)
+            ).where(
+                and_(
+                    Product.is_active == True,
+                    ProductStats.last_ordered_at >= datetime.now(timezone.utc) - timedelta(days=days)
+                )
+            )
             
             if category_id:
                 query = query.where(Product.category_id == category_id)
             
-            query = query.order_by(desc(Product.created_at)).limit(limit)
+            query = query.order_by(desc(ProductStats.popularity_score)).limit(limit)
             
             result = await db.execute(query)
-            products = result.scalars().all()
             
             return [
                 {
                     "product": product,
-                    "order_count": 0,  # Would calculate from actual orders
-                    "popularity_score": 0.0
+                    "order_count": stats.order_count,
+                    "popularity_score": stats.current_popularity
                 }
-                for product in products
+                for product, stats in result.all()
             ]
         except Exception as e:
             logger.error(f"Failed to get popular products: {e}")
@@ -290,6 +311,8 @@ class ProductCRUD:
     
     async def get_search_suggestions(self, db: AsyncSession, query: str, limit: int = 10) -> List[str]:
         """Get search suggestions for autocomplete"""
+        if search_suggestions.index.ready:
+            return search_suggestions.index.suggest(query, limit)
         try:
             search_term = f"%{query}%"
             
@@ -324,6 +347,8 @@ class ProductCRUD:
     
     async def get_all_brands(self, db: AsyncSession) -> List[str]:
         """Get all product brands"""
+        if search_suggestions.index.ready:
+            return search_suggestions.index.brands()
         try:
             query = select(Product.brand).where(
                 and_(
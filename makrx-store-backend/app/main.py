@@ -44,6 +44,12 @@ import asyncio   # Asynchronous programming support
 # Core application modules
 from app.core.config import settings                    # Application configuration
 from app.core.db import engine, create_tables          # Database connection and setup
+from app.services.bridge_service import bridge_service  # Store <-> MakrCave provider bridge
+from app.services.search_suggestions import search_suggestions  # Autocomplete index
+from app.services.recommendations import recommendations      # Co-purchase recommendations
+from app.services.reorder_forecast import reorder_forecast    # Quick reorder consumption forecasts
+from app.services.webhook_inbox import webhook_inbox          # Payment webhook processing
+from app.services.outbox import outbox_relay                  # Cross-service message delivery
 
 # API route modules - each handles specific functionality
 from app.routes import (
@@ -69,6 +75,7 @@ from app.middleware.observability import ObservabilityMiddleware # Request monit
 from app.core.enhanced_security_auth import enhanced_auth       # Advanced authentication
 from app.core.file_security import file_validator, storage_manager  # Secure file handling
 from app.core.payment_security import webhook_verifier, payment_processor  # Payment security
+from app.core.idempotency import idempotency_store              # Shared idempotency keys
 from app.core.data_protection import (                          # DPDP Act compliance
     consent_manager,     # User consent management
     retention_manager,   # Data retention policies
@@ -77,7 +84,8 @@ from app.core.data_protection import (                          # DPDP Act compl
 from app.core.security_monitoring import (                      # Security monitoring
     security_logger,     # Security event logging
     security_monitor,    # Real-time threat detection
-    performance_monitor  # Performance and anomaly detection
+    performance_monitor, # Performance and anomaly detection
+    audit_log_writer     # Batched background audit log writer
 )
 from app.core.operational_security import (                     # Operational security
     secrets_manager,     # Secret rotation and management
@@ -112,6 +120,11 @@ setup_api_security(app)
 # Add observability middleware for request tracing and monitoring
 app.add_middleware(ObservabilityMiddleware)
 
+def route_template(request: Request) -> str:
+    """Matched route path (e.g. /api/orders/{order_id}) for metric keys"""
+    route = request.scope.get("route")
+    return getattr(route, "path", None) or "<unmatched>"
+
 # Security-enhanced request processing
 @app.middleware("http")
 async def security_request_middleware(request: Request, call_next):
@@ -145,7 +158,7 @@ async def security_request_middleware(request: Request, call_next):
 
         # Record performance metrics
         await performance_monitor.record_api_metric(
-            endpoint=request.url.path,
+            endpoint=route_template(request),
             method=request.method,
             duration_ms=process_time,
             status_code=response.status_code
@@ -175,7 +188,7 @@ async def security_request_middleware(request: Request, call_next):
 
         # Record failed request metrics
         await performance_monitor.record_api_metric(
-            endpoint=request.url.path,
+            endpoint=route_template(request),
             method=request.method,
             duration_ms=process_time,
             status_code=500
@@ -261,6 +274,7 @@ async def startup_event():
 
         # Initialize security components
         logger.info("Initializing security components...")
+        audit_log_writer.start()
 
         # Check for secrets that need rotation
         due_rotations = await secrets_manager.check_rotation_due()
@@ -269,6 +283,24 @@ async def startup_event():
             for secret in due_rotations:
                 logger.warning(f"Secret '{secret['secret_name']}' overdue by {secret['days_overdue']} days")
 
+        # Build the search suggestion index and schedule its periodic rebuild
+        await search_suggestions.start()
+
+        # Load the latest recommendation build and schedule rebuilds
+        await recommendations.start()
+
+        # Schedule the quick reorder consumption forecast
+        await reorder_forecast.start()
+
+        # Purge expired idempotency keys
+        await idempotency_store.start()
+
+        # Process queued payment webhooks
+        await webhook_inbox.start()
+
+        # Deliver outbox messages to MakrCave and the event service
+        await outbox_relay.start()
+
         # Start background tasks
         asyncio.create_task(start_security_background_tasks())
 
@@ -348,6 +380,20 @@ async def shutdown_event():
         if hasattr(mfa_manager, 'user_secrets'):
             mfa_manager.user_secrets.clear()
 
+        # Flush queued audit records before exit
+        audit_log_writer.stop()
+
+        # Close the bridge service's shared HTTP session
+        await bridge_service.close()
+
+        # Stop the suggestion index rebuild loop
+        await search_suggestions.stop()
+        await recommendations.stop()
+        await reorder_forecast.stop()
+        await idempotency_store.stop()
+        await webhook_inbox.stop()
+        await outbox_relay.stop()
+
         logger.info("Security cleanup completed")
 
     except Exception as e:
@@ -233,3 +233,97 @@ class ApiKey(Base):
         Index("ix_api_keys_owner", "owner_type", "owner_id"),
         Index("ix_api_keys_active_expires", "is_active", "expires_at"),
     )
+
+class IdempotencyKey(Base):
+    """Durable record of an idempotent operation
+
+    Written by app.core.idempotency: a row is claimed as in_progress before
+    the operation runs and completed with the cached response afterwards.
+    Rows are purged once expires_at has passed.
+    """
+    __tablename__ = "idempotency_keys"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    scope = Column(String(100), nullable=False)  # operation, e.g. create_service_order, webhook:stripe
+    key = Column(String(255), nullable=False)
+    fingerprint = Column(String(64))  # SHA-256 of the request that claimed the key
+    
+    # Status: in_progress, completed
+    status = Column(String(20), nullable=False, default="in_progress")
+    response = Column(JSONB)
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    locked_until = Column(DateTime(timezone=True))  # an in_progress claim older than this can be taken over
+    completed_at = Column(DateTime(timezone=True))
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    
+    # Indexes
+    __table_args__ = (
+        Index("ix_idempotency_keys_scope_key", "scope", "key", unique=True),
+        Index("ix_idempotency_keys_expires_at", "expires_at"),
+    )
+
+class WebhookEvent(Base):
+    """Verified payment webhook waiting for (or done with) processing
+
+    Recorded by the webhook routes and applied by the worker pool in
+    app.services.webhook_inbox.
+    """
+    __tablename__ = "webhook_events"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    provider = Column(String(20), nullable=False)  # stripe, razorpay
+    event_id = Column(String(255), nullable=False)  # provider event id
+    event_type = Column(String(100), nullable=False)
+    payload = Column(JSONB, nullable=False)  # raw event body
+    
+    # Status: pending, processing, processed, failed
+    status = Column(String(20), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), server_default=func.now())
+    locked_until = Column(DateTime(timezone=True))  # a processing claim older than this is retried
+    last_error = Column(Text)
+    
+    # Timestamps
+    received_at = Column(DateTime(timezone=True), server_default=func.now())
+    processed_at = Column(DateTime(timezone=True))
+    
+    # Indexes
+    __table_args__ = (
+        Index("ix_webhook_events_provider_event", "provider", "event_id", unique=True),
+        Index("ix_webhook_events_status_next_attempt", "status", "next_attempt_at"),
+    )
+
+class OutboxMessage(Base):
+    """Cross-service message written in the same transaction as the change
+
+    Delivered by the relay in app.services.outbox, in id order within each
+    aggregate.
+    """
+    __tablename__ = "outbox_messages"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    aggregate_type = Column(String(50), nullable=False)  # order, service_order
+    aggregate_id = Column(String(255), nullable=False)
+    destination = Column(String(50), nullable=False)  # makrcave, event_service
+    topic = Column(String(255), nullable=False)  # MakrCave API path or event type
+    payload = Column(JSONB, nullable=False)
+    
+    # Status: pending, processing, sent, failed
+    status = Column(String(20), nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime(timezone=True), server_default=func.now())
+    locked_until = Column(DateTime(timezone=True))  # a processing claim older than this is retried
+    last_error = Column(Text)
+    response = Column(JSONB)
+    
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    sent_at = Column(DateTime(timezone=True))
+    
+    # Indexes
+    __table_args__ = (
+        Index("ix_outbox_messages_aggregate", "aggregate_type", "aggregate_id", "id"),
+        Index("ix_outbox_messages_status_next_attempt", "status", "next_attempt_at"),
+    )
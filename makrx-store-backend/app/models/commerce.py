@@ -3,10 +3,16 @@ SQLAlchemy models for commerce entities
 Products, Categories, Cart, Orders
 """
 
-from sqlalchemy import Column, Integer, String, Numeric, Boolean, DateTime, Text, ForeignKey, Index
-from sqlalchemy.dialects.postgresql import JSONB, UUID
-from sqlalchemy.orm import relationship
+from sqlalchemy import (
+    Column, Integer, String, Numeric, Boolean, DateTime, Text, ForeignKey, Index, Computed, Float,
+    event, inspect, select, cast
+)
+from sqlalchemy.dialects.postgresql import JSONB, UUID, TSVECTOR, insert as pg_insert
+from sqlalchemy.orm import relationship, Session
 from sqlalchemy.sql import func
+from datetime import datetime, timezone
+from typing import Dict, Optional
+import math
 import uuid
 
 from app.core.db import Base
@@ -48,6 +54,8 @@ class Category(Base):
     __table_args__ = (
         Index("ix_categories_parent_active", "parent_id", "is_active"),
         Index("ix_categories_level_sort", "level", "sort_order"),
+        # Prefix (subtree) matches on the materialized path
+        Index("ix_categories_path_prefix", "path", postgresql_ops={"path": "varchar_pattern_ops"}),
     )
 
 class Product(Base):
@@ -86,6 +94,18 @@ class Product(Base):
     meta_description = Column(String(500))
     tags = Column(JSONB, default=[])  # Array of tags
     
+    # Full-text search document, weighted name > brand > short description > description
+    search_vector = Column(
+        TSVECTOR,
+        Computed(
+            "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+            "setweight(to_tsvector('english', coalesce(brand, '')), 'B') || "
+            "setweight(to_tsvector('english', coalesce(short_description, '')), 'C') || "
+            "setweight(to_tsvector('english', coalesce(description, '')), 'D')",
+            persisted=True,
+        ),
+    )
+    
     # Status and visibility
     is_active = Column(Boolean, default=True)
     is_featured = Column(Boolean, default=False)
@@ -105,12 +125,23 @@ class Product(Base):
     variants = relationship("ProductVariant", back_populates="product", cascade="all, delete-orphan")
     cart_items = relationship("CartItem", back_populates="product")
     order_items = relationship("OrderItem", back_populates="product")
+    stats = relationship("ProductStats", uselist=False, viewonly=True)
     
     # Indexes
     __table_args__ = (
         Index("ix_products_category_active", "category_id", "is_active"),
         Index("ix_products_brand_active", "brand", "is_active"),
         Index("ix_products_price", "price"),
+        Index("ix_products_search_vector", "search_vector", postgresql_using="gin"),
+        # Trigram indexes (pg_trgm) for typo-tolerant name/brand matching
+        Index("ix_products_name_trgm", "name", postgresql_using="gin",
+              postgresql_ops={"name": "gin_trgm_ops"}),
+        Index("ix_products_brand_trgm", "brand", postgresql_using="gin",
+              postgresql_ops={"brand": "gin_trgm_ops"}),
+        Index("ix_products_tags", "tags", postgresql_using="gin",
+              postgresql_ops={"tags": "jsonb_path_ops"}),
+        Index("ix_products_attributes", "attributes", postgresql_using="gin",
+              postgresql_ops={"attributes": "jsonb_path_ops"}),
     )
 
 class Cart(Base):
@@ -138,6 +169,8 @@ class CartItem(Base):
     id = Column(Integer, primary_key=True, index=True)
     cart_id = Column(UUID(as_uuid=True), ForeignKey("carts.id"), nullable=False)
     product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    product_sku = Column(String(100))  # SKU the line was added by (bulk/BOM imports)
+    variant_id = Column(Integer, ForeignKey("product_variants.id"), nullable=True)  # Variant the SKU resolved to
     quantity = Column(Integer, nullable=False)
     unit_price = Column(Numeric(10, 2), nullable=False)  # Price at time of adding
     
@@ -150,6 +183,13 @@ class CartItem(Base):
     # Relationships
     cart = relationship("Cart", back_populates="items")
     product = relationship("Product", back_populates="cart_items")
+    variant = relationship("ProductVariant")
+    
+    # Indexes
+    __table_args__ = (
+        # Conflict target for bulk upserts; lines without a SKU never conflict
+        Index("ix_cart_items_cart_sku", "cart_id", "product_sku", unique=True),
+    )
 
 class Order(Base):
     __tablename__ = "orders"
@@ -225,6 +265,150 @@ class OrderItem(Base):
     order = relationship("Order", back_populates="items")
     product = relationship("Product", back_populates="order_items")
 
+# Orders in these statuses count towards product sales counters
+COUNTED_ORDER_STATUSES = {"paid", "processing", "shipped", "delivered", "completed"}
+
+# Popularity decays with this half-life. Scores are stored scaled to
+# POPULARITY_EPOCH (each sale adds 2 ** (age_at_sale / half_life)), so
+# ordering by the stored value equals ordering by the decayed score now.
+POPULARITY_HALF_LIFE_DAYS = 30
+POPULARITY_EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+def popularity_weight(at: Optional[datetime] = None) -> float:
+    at = at or datetime.now(timezone.utc)
+    if at.tzinfo is None:
+        at = at.replace(tzinfo=timezone.utc)
+    days = (at - POPULARITY_EPOCH).total_seconds() / 86400
+    return math.pow(2.0, days / POPULARITY_HALF_LIFE_DAYS)
+
+class ProductStats(Base):
+    """Denormalized rating and sales counters, one row per product
+
+    Maintained by the order and review flush hooks so searches can sort and
+    filter on ratings and popularity without aggregating reviews or order
+    history. Kept off the products row so counter updates do not rewrite
+    the product's search vector and indexes.
+    """
+    __tablename__ = "product_stats"
+
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+
+    # Published product reviews
+    rating_count = Column(Integer, nullable=False, default=0)
+    rating_sum = Column(Integer, nullable=False, default=0)
+    average_rating = Column(Numeric(3, 2), nullable=True)
+    verified_reviews = Column(Integer, nullable=False, default=0)
+
+    # Sales from orders in COUNTED_ORDER_STATUSES
+    units_sold = Column(Integer, nullable=False, default=0)
+    order_count = Column(Integer, nullable=False, default=0)
+    popularity_score = Column(Float, nullable=False, default=0.0)
+    last_ordered_at = Column(DateTime(timezone=True))
+
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index("ix_product_stats_rating", "average_rating"),
+        Index("ix_product_stats_popularity", "popularity_score"),
+    )
+
+    @property
+    def current_popularity(self) -> float:
+        """Popularity score decayed to the current time"""
+        return (self.popularity_score or 0.0) / popularity_weight()
+
+def bump_product_stats(connection, deltas: Dict[int, Dict[str, float]]) -> None:
+    """Atomically add per-product counter deltas (upserting missing rows)"""
+    if not deltas:
+        return
+    counters = ("rating_count", "rating_sum", "verified_reviews", "units_sold", "order_count", "popularity_score")
+    rows = []
+    # Sorted so concurrent flushes lock stats rows in the same order
+    for product_id, delta in sorted(deltas.items()):
+        row = {name: delta.get(name, 0) for name in counters}
+        row["product_id"] = product_id
+        row["last_ordered_at"] = delta.get("last_ordered_at")
+        row["average_rating"] = (
+            round(row["rating_sum"] / row["rating_count"], 2) if row["rating_count"] > 0 else None
+        )
+        rows.append(row)
+
+    stmt = pg_insert(ProductStats).values(rows)
+    excluded = stmt.excluded
+    table = ProductStats.__table__.c
+    rating_count = table.rating_count + excluded.rating_count
+    rating_sum = table.rating_sum + excluded.rating_sum
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[table.product_id],
+        set_={
+            **{name: table[name] + excluded[name] for name in counters},
+            "average_rating": func.round(
+                cast(rating_sum, Numeric) / func.nullif(rating_count, 0), 2
+            ),
+            "last_ordered_at": func.greatest(table.last_ordered_at, excluded.last_ordered_at),
+            "updated_at": func.now(),
+        },
+    )
+    connection.execute(stmt)
+
+def attribute_before_flush(obj, name):
+    """Value an attribute had before the pending flush"""
+    history = inspect(obj).attrs[name].history
+    if history.deleted:
+        return history.deleted[0]
+    if history.added and not history.unchanged:
+        return None
+    return getattr(obj, name)
+
+@event.listens_for(Session, "after_flush")
+def _count_order_sales(session, flush_context):
+    """Apply sales counter changes for orders entering or leaving a counted status"""
+    signs = {}
+    for order in session.new:
+        if isinstance(order, Order) and order.status in COUNTED_ORDER_STATUSES:
+            signs[order.id] = (1, order)
+    for order in session.dirty:
+        if isinstance(order, Order) and inspect(order).attrs.status.history.has_changes():
+            was_counted = attribute_before_flush(order, "status") in COUNTED_ORDER_STATUSES
+            if was_counted != (order.status in COUNTED_ORDER_STATUSES):
+                signs[order.id] = (-1 if was_counted else 1, order)
+    if not signs:
+        return
+
+    connection = session.connection()
+    items = connection.execute(
+        select(OrderItem.order_id, OrderItem.product_id, func.sum(OrderItem.quantity))
+        .where(OrderItem.order_id.in_(list(signs)))
+        .group_by(OrderItem.order_id, OrderItem.product_id)
+    ).all()
+
+    deltas: Dict[int, Dict[str, float]] = {}
+    for order_id, product_id, quantity in items:
+        sign, order = signs[order_id]
+        # Read without triggering a load mid-flush (server default may be unloaded)
+        weight = popularity_weight(inspect(order).dict.get("created_at"))
+        delta = deltas.setdefault(product_id, {"units_sold": 0, "order_count": 0, "popularity_score": 0.0})
+        delta["units_sold"] += sign * quantity
+        delta["order_count"] += sign
+        delta["popularity_score"] += sign * quantity * weight
+        if sign > 0:
+            delta["last_ordered_at"] = datetime.now(timezone.utc)
+    bump_product_stats(connection, deltas)
+
+class RecommendationList(Base):
+    """Precomputed product recommendations for one kind and key
+
+    Replaced wholesale by the offline job in app.services.recommendations:
+    "similar" and "complementary" are keyed by product id, "trending" by
+    category id (or "all") and "personalized" by user id.
+    """
+    __tablename__ = "recommendation_lists"
+
+    kind = Column(String(20), primary_key=True)
+    key = Column(String(255), primary_key=True)
+    items = Column(JSONB, nullable=False, default=[])  # [[product_id, score], ...] best first
+    generated_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
 
 class Brand(Base):
     __tablename__ = "brands"
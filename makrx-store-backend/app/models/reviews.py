@@ -3,13 +3,14 @@ SQLAlchemy models for reviews and ratings system
 Product reviews, service reviews, ratings, and moderation
 """
 
-from sqlalchemy import Column, Integer, String, Numeric, Boolean, DateTime, Text, ForeignKey, Index
+from sqlalchemy import Column, Integer, String, Numeric, Boolean, DateTime, Text, ForeignKey, Index, event
 from sqlalchemy.dialects.postgresql import JSONB, UUID
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, Session
 from sqlalchemy.sql import func
 import uuid
 
 from app.core.db import Base
+from app.models.commerce import bump_product_stats, attribute_before_flush
 
 class Review(Base):
     __tablename__ = "reviews"
@@ -271,3 +272,48 @@ class ReviewIncentiveRedemption(Base):
     __table_args__ = (
         Index("ix_review_incentive_redemptions_user", "user_id", "incentive_id"),
     )
+
+
+def _rating_contribution(review, before_flush: bool):
+    """(product_id, rating, verified) a review adds to product stats, or None"""
+    value = (lambda name: attribute_before_flush(review, name)) if before_flush else (
+        lambda name: getattr(review, name)
+    )
+    if value("target_type") != "product" or value("status") != "published" or not value("rating"):
+        return None
+    try:
+        product_id = int(value("target_id"))
+    except (TypeError, ValueError):
+        return None
+    return product_id, int(value("rating")), bool(value("verified_purchase"))
+
+@event.listens_for(Session, "after_flush")
+def _count_product_ratings(session, flush_context):
+    """Keep ProductStats rating counters in step with published product reviews"""
+    changes = []
+    for review in session.new:
+        if isinstance(review, Review):
+            changes.append((None, _rating_contribution(review, before_flush=False)))
+    for review in session.dirty:
+        if isinstance(review, Review) and session.is_modified(review, include_collections=False):
+            changes.append((
+                _rating_contribution(review, before_flush=True),
+                _rating_contribution(review, before_flush=False),
+            ))
+    for review in session.deleted:
+        if isinstance(review, Review):
+            changes.append((_rating_contribution(review, before_flush=True), None))
+
+    deltas = {}
+    for old, new in changes:
+        if old == new:
+            continue
+        for sign, contribution in ((-1, old), (1, new)):
+            if contribution is None:
+                continue
+            product_id, rating, verified = contribution
+            delta = deltas.setdefault(product_id, {"rating_count": 0, "rating_sum": 0, "verified_reviews": 0})
+            delta["rating_count"] += sign
+            delta["rating_sum"] += sign * rating
+            delta["verified_reviews"] += sign * int(verified)
+    bump_product_stats(session.connection(), deltas)
@@ -286,3 +286,35 @@ class QuickReorder(Base):
         Index("ix_quick_reorders_user_active", "user_id", "is_active"),
         Index("ix_quick_reorders_makrcave", "makrcave_id"),
     )
+
+class ReorderSuggestion(Base):
+    """Forecast consumption of a product by one customer
+
+    Rebuilt by the job in app.services.reorder_forecast from the customer's
+    order history; quick reorder suggestions and threshold checks read it.
+    """
+    __tablename__ = "reorder_suggestions"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(String(255), nullable=False)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    
+    # Purchase history summary
+    order_count = Column(Integer, nullable=False)
+    total_quantity = Column(Integer, nullable=False)
+    last_ordered_at = Column(DateTime(timezone=True), nullable=False)
+    last_quantity = Column(Integer, nullable=False)
+    
+    # Exponentially smoothed forecast
+    interval_days = Column(Numeric(10, 2), nullable=False)  # Days between purchases
+    consumption_rate = Column(Numeric(12, 4), nullable=False)  # Units per day
+    suggested_quantity = Column(Integer, nullable=False)
+    predicted_depletion_at = Column(DateTime(timezone=True), nullable=False)
+    
+    generated_at = Column(DateTime(timezone=True), nullable=False)
+    
+    # Indexes
+    __table_args__ = (
+        Index("ix_reorder_suggestions_user_product", "user_id", "product_id", unique=True),
+        Index("ix_reorder_suggestions_user_depletion", "user_id", "predicted_depletion_at"),
+    )
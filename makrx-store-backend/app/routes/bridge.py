@@ -1,19 +1,24 @@
 """Bridge API routes for Store <-> Cave communication"""
 
+import hmac
 import logging
-from datetime import datetime
-from typing import Any, Dict, Optional
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
 
 import httpx
 from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from pydantic import BaseModel
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.core.config import settings
 from app.core.db import get_db
 from app.core.security import get_current_user
-from app.models.commerce import Order, Product, ProductVariant
+from app.models.commerce import Cart, CartItem, Order, Product, ProductVariant
 from app.models.services import ServiceOrder
+from app.models.subscriptions import Subscription
 from app.schemas.services import ServiceOrderCreate, ServiceOrderUpdate
 from app.services.notification_service import (
     NotificationCategory,
@@ -360,6 +365,65 @@ async def sync_user_profile(
         )
 
 
+service_bearer = HTTPBearer(auto_error=False)
+
+
+def verify_service_token(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(service_bearer),
+) -> None:
+    """Accept only callers holding the shared service token"""
+    if credentials is None or not hmac.compare_digest(
+        credentials.credentials, settings.SERVICE_TOKEN
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid service token",
+        )
+
+
+class KeycloakUserSync(BaseModel):
+    """One user upsert or delete from the auth service's Keycloak sync"""
+
+    user_id: str
+    action: str  # create|update|delete
+    data: Optional[Dict[str, Any]] = None
+
+
+class KeycloakUserSyncBatch(BaseModel):
+    users: List[KeycloakUserSync]
+
+
+@router.post("/users/sync")
+async def sync_users_from_auth_service(
+    batch: KeycloakUserSyncBatch,
+    _: None = Depends(verify_service_token),
+    db: AsyncSession = Depends(get_db),
+):
+    """Apply a batch of Keycloak user changes
+
+    The Store keeps no user records (profiles come from the token), so
+    upserts need no work. Deleted users lose their carts and active
+    subscriptions; orders stay for accounting.
+    """
+    deleted = [sync.user_id for sync in batch.users if sync.action == "delete"]
+    if deleted:
+        carts = select(Cart.id).where(Cart.user_id.in_(deleted))
+        await db.execute(delete(CartItem).where(CartItem.cart_id.in_(carts)))
+        await db.execute(delete(Cart).where(Cart.user_id.in_(deleted)))
+        await db.execute(
+            update(Subscription)
+            .where(
+                Subscription.user_id.in_(deleted),
+                Subscription.status.notin_(["cancelled", "expired"]),
+            )
+            .values(status="cancelled", cancelled_at=datetime.now(timezone.utc))
+        )
+        await db.commit()
+        logger.info(f"Removed carts and subscriptions of {len(deleted)} deleted users")
+
+    return {"success": True, "applied": len(batch.users), "failed": []}
+
+
 @router.get("/status")
 async def bridge_status():
     """Check bridge service connectivity"""
@@ -4,17 +4,18 @@ Cart Bulk Operations - Handle bulk cart additions from external sources
 """
 
 from fastapi import APIRouter, HTTPException, Depends, BackgroundTasks
-from sqlalchemy.orm import Session
-from sqlalchemy import select, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select, and_, or_, func, literal_column
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from typing import List, Dict, Any, Optional
+from decimal import Decimal
 import logging
 from uuid import UUID, uuid4
-from datetime import datetime
+from datetime import datetime, timedelta
 from pydantic import BaseModel, Field, EmailStr
 
 from ..core.db import get_db
-from ..models.commerce import Cart, CartItem, Product
-from ..schemas.commerce import CartResponse, CartItemResponse
+from ..models.commerce import Cart, CartItem, Product, ProductVariant
 from ..services.notification_service import (
     NotificationCategory,
     NotificationRequest,
@@ -59,12 +60,19 @@ class CartValidationResult(BaseModel):
     valid_items: List[BulkCartItem]
     invalid_items: List[Dict[str, Any]]
     product_map: Dict[str, Product]
+    variant_ids: Dict[str, Optional[int]] = {}  # SKU -> resolved variant, None for a product slug
+    unit_prices: Dict[str, Decimal] = {}  # SKU -> effective unit price
+
+    class Config:
+        arbitrary_types_allowed = True
+
+MERGE_STRATEGIES = ("add", "replace", "update")
 
 @router.post("/bulk-add", response_model=BulkCartResponse)
 async def bulk_add_to_cart(
     bulk_request: BulkCartRequest,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Bulk add items to user's cart
@@ -105,8 +113,8 @@ async def bulk_add_to_cart(
         )
         
         # Recalculate cart totals
-        await recalculate_cart_totals(cart, db)
-        db.commit()
+        totals = await recalculate_cart_totals(cart, db)
+        await db.commit()
         
         # Schedule background tasks
         background_tasks.add_task(
@@ -127,8 +135,8 @@ async def bulk_add_to_cart(
             added_items=results["added_items"],
             updated_items=results["updated_items"],
             failed_items=results["failed_items"],
-            total_cart_items=len(cart.items),
-            cart_total=float(cart.total_amount or 0),
+            total_cart_items=totals["item_count"],
+            cart_total=float(totals["total_amount"]),
             details=results["details"],
             cart_url=cart_url
         )
@@ -137,110 +145,116 @@ async def bulk_add_to_cart(
         raise
     except Exception as e:
         logger.error(f"Bulk cart addition error: {e}")
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail="Bulk cart addition failed")
 
 async def validate_bulk_cart_items(
     items: List[BulkCartItem],
-    db: Session
+    db: AsyncSession
 ) -> CartValidationResult:
-    """Validate all cart items and prepare product mappings"""
+    """Validate all cart items and prepare product mappings
+
+    Repeated SKUs are merged into one line (quantities summed). All SKUs are
+    resolved in a single query, as a product slug or a product variant SKU.
+    """
     valid_items = []
     invalid_items = []
     product_map = {}
+    variant_ids = {}
+    unit_prices = {}
     
-    # Get all SKUs for batch lookup
-    skus = [item.sku for item in items]
+    # Merge repeated SKUs so each cart line is written once
+    merged: Dict[str, BulkCartItem] = {}
+    for item in items:
+        existing = merged.get(item.sku)
+        if existing is None:
+            merged[item.sku] = item.copy()
+            continue
+        existing.quantity += item.quantity
+        if item.notes:
+            existing.notes = f"{existing.notes or ''}\n{item.notes}".strip()
+        if item.unit_price_override is not None:
+            existing.unit_price_override = item.unit_price_override
     
-    # Batch fetch products
-    products_query = db.query(Product).filter(Product.sku.in_(skus))
-    products = products_query.all()
-    sku_to_product = {p.sku: p for p in products}
+    # Batch fetch products and variants for all SKUs
+    skus = list(merged)
+    rows = (await db.execute(
+        select(Product, ProductVariant).outerjoin(
+            ProductVariant,
+            and_(ProductVariant.product_id == Product.id, ProductVariant.sku.in_(skus))
+        ).where(
+            or_(Product.slug.in_(skus), ProductVariant.id.isnot(None))
+        )
+    )).all()
+    sku_to_match = {}
+    for product, variant in rows:
+        if variant is not None:
+            sku_to_match[variant.sku] = (product, variant)
+        if product.slug in merged:
+            sku_to_match[product.slug] = (product, None)
     
-    for item in items:
-        try:
-            # Check if product exists
-            product = sku_to_product.get(item.sku)
-            if not product:
-                invalid_items.append({
-                    "sku": item.sku,
-                    "quantity": item.quantity,
-                    "reason": "Product not found",
-                    "error_code": "PRODUCT_NOT_FOUND"
-                })
-                continue
-            
-            # Check if product is active
-            if not product.is_active:
-                invalid_items.append({
-                    "sku": item.sku,
-                    "quantity": item.quantity,
-                    "reason": "Product is not active",
-                    "error_code": "PRODUCT_INACTIVE"
-                })
-                continue
-            
-            # Check inventory availability
-            if product.track_inventory and product.stock_quantity < item.quantity:
-                invalid_items.append({
-                    "sku": item.sku,
-                    "quantity": item.quantity,
-                    "available_quantity": product.stock_quantity,
-                    "reason": "Insufficient inventory",
-                    "error_code": "INSUFFICIENT_INVENTORY"
-                })
-                continue
-            
-            # Check quantity limits
-            if product.min_order_quantity and item.quantity < product.min_order_quantity:
-                invalid_items.append({
-                    "sku": item.sku,
-                    "quantity": item.quantity,
-                    "min_quantity": product.min_order_quantity,
-                    "reason": f"Minimum order quantity is {product.min_order_quantity}",
-                    "error_code": "BELOW_MIN_QUANTITY"
-                })
-                continue
-            
-            if product.max_order_quantity and item.quantity > product.max_order_quantity:
-                invalid_items.append({
-                    "sku": item.sku,
-                    "quantity": item.quantity,
-                    "max_quantity": product.max_order_quantity,
-                    "reason": f"Maximum order quantity is {product.max_order_quantity}",
-                    "error_code": "ABOVE_MAX_QUANTITY"
-                })
-                continue
-            
-            # Item is valid
-            valid_items.append(item)
-            product_map[item.sku] = product
-            
-        except Exception as e:
-            logger.error(f"Error validating item {item.sku}: {e}")
+    for item in merged.values():
+        # Check if product exists
+        match = sku_to_match.get(item.sku)
+        if not match:
             invalid_items.append({
                 "sku": item.sku,
                 "quantity": item.quantity,
-                "reason": f"Validation error: {str(e)}",
-                "error_code": "VALIDATION_ERROR"
+                "reason": "Product not found",
+                "error_code": "PRODUCT_NOT_FOUND"
             })
+            continue
+        product, variant = match
+        
+        # Check if product is active
+        if not product.is_active or (variant is not None and not variant.is_active):
+            invalid_items.append({
+                "sku": item.sku,
+                "quantity": item.quantity,
+                "reason": "Product is not active",
+                "error_code": "PRODUCT_INACTIVE"
+            })
+            continue
+        
+        # Check inventory availability
+        available = (variant.stock_qty if variant is not None else product.stock_qty) or 0
+        if product.track_inventory and not product.allow_backorder and available < item.quantity:
+            invalid_items.append({
+                "sku": item.sku,
+                "quantity": item.quantity,
+                "available_quantity": available,
+                "reason": "Insufficient inventory",
+                "error_code": "INSUFFICIENT_INVENTORY"
+            })
+            continue
+        
+        # Item is valid
+        if item.unit_price_override is not None:
+            unit_price = Decimal(str(item.unit_price_override))
+        elif variant is not None and (variant.sale_price or variant.price):
+            unit_price = variant.sale_price or variant.price
+        else:
+            unit_price = product.sale_price or product.price
+        valid_items.append(item)
+        product_map[item.sku] = product
+        variant_ids[item.sku] = variant.id if variant is not None else None
+        unit_prices[item.sku] = unit_price
     
     return CartValidationResult(
         valid_items=valid_items,
         invalid_items=invalid_items,
-        product_map=product_map
+        product_map=product_map,
+        variant_ids=variant_ids,
+        unit_prices=unit_prices
     )
 
-async def get_or_create_user_cart(user_email: str, db: Session) -> Cart:
+async def get_or_create_user_cart(user_email: str, db: AsyncSession) -> Cart:
     """Get existing cart or create new one for user"""
     try:
-        # Try to find existing active cart
-        existing_cart = db.query(Cart).filter(
-            and_(
-                Cart.user_email == user_email,
-                Cart.status == "active"
-            )
-        ).first()
+        # Bulk sources identify the shopper by email, stored as the cart owner
+        existing_cart = (await db.execute(
+            select(Cart).where(Cart.user_id == user_email)
+        )).scalars().first()
         
         if existing_cart:
             return existing_cart
@@ -248,15 +262,15 @@ async def get_or_create_user_cart(user_email: str, db: Session) -> Cart:
         # Create new cart
         new_cart = Cart(
             id=uuid4(),
-            user_email=user_email,
-            status="active",
+            user_id=user_email,
             currency="INR",
+            expires_at=datetime.utcnow() + timedelta(days=7),
             created_at=datetime.utcnow(),
             updated_at=datetime.utcnow()
         )
         
         db.add(new_cart)
-        db.flush()  # Get the ID
+        await db.flush()  # Get the ID
         
         return new_cart
         
@@ -268,9 +282,22 @@ async def process_bulk_cart_additions(
     cart: Cart,
     validation_result: CartValidationResult,
     bulk_request: BulkCartRequest,
-    db: Session
+    db: AsyncSession
 ) -> Dict[str, Any]:
-    """Process the actual cart additions based on merge strategy"""
+    """Process the actual cart additions based on merge strategy
+
+    All valid lines are written with one INSERT ... ON CONFLICT (cart_id,
+    product_sku) DO UPDATE whose update clause implements the merge strategy,
+    so the cart's rows are locked for a single statement rather than a
+    Python loop.
+    """
+    strategy = bulk_request.merge_strategy
+    if strategy not in MERGE_STRATEGIES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown merge strategy '{strategy}' (expected one of {', '.join(MERGE_STRATEGIES)})"
+        )
+    
     added_items = 0
     updated_items = 0
     failed_items = len(validation_result.invalid_items)
@@ -285,115 +312,120 @@ async def process_bulk_cart_additions(
             "error_code": invalid_item.get("error_code")
         })
     
-    # Get existing cart items for conflict resolution
-    existing_items = {item.product_sku: item for item in cart.items}
+    if not validation_result.valid_items:
+        return {
+            "added_items": added_items,
+            "updated_items": updated_items,
+            "failed_items": failed_items,
+            "details": details
+        }
     
-    for bulk_item in validation_result.valid_items:
-        try:
-            product = validation_result.product_map[bulk_item.sku]
-            
-            # Calculate pricing
-            unit_price = bulk_item.unit_price_override or product.price
-            line_total = unit_price * bulk_item.quantity
-            
-            if bulk_item.sku in existing_items:
-                # Handle existing item based on merge strategy
-                existing_item = existing_items[bulk_item.sku]
-                
-                if bulk_request.merge_strategy == "add":
-                    # Add to existing quantity
-                    new_quantity = existing_item.quantity + bulk_item.quantity
-                    existing_item.quantity = new_quantity
-                    existing_item.line_total = unit_price * new_quantity
-                    existing_item.updated_at = datetime.utcnow()
-                    
-                    # Update notes if provided
-                    if bulk_item.notes:
-                        existing_notes = existing_item.notes or ""
-                        existing_item.notes = f"{existing_notes}\n{bulk_item.notes}".strip()
-                    
-                    updated_items += 1
-                    details.append({
-                        "sku": bulk_item.sku,
-                        "status": "updated",
-                        "old_quantity": existing_item.quantity - bulk_item.quantity,
-                        "new_quantity": new_quantity,
-                        "action": "quantity_added"
-                    })
-                    
-                elif bulk_request.merge_strategy == "replace":
-                    # Replace existing item
-                    existing_item.quantity = bulk_item.quantity
-                    existing_item.unit_price = unit_price
-                    existing_item.line_total = line_total
-                    existing_item.notes = bulk_item.notes
-                    existing_item.updated_at = datetime.utcnow()
-                    
-                    updated_items += 1
-                    details.append({
-                        "sku": bulk_item.sku,
-                        "status": "updated",
-                        "new_quantity": bulk_item.quantity,
-                        "action": "replaced"
-                    })
-                    
-                elif bulk_request.merge_strategy == "update":
-                    # Update quantity only if new quantity is higher
-                    if bulk_item.quantity > existing_item.quantity:
-                        existing_item.quantity = bulk_item.quantity
-                        existing_item.line_total = unit_price * bulk_item.quantity
-                        existing_item.updated_at = datetime.utcnow()
-                        
-                        updated_items += 1
-                        details.append({
-                            "sku": bulk_item.sku,
-                            "status": "updated",
-                            "new_quantity": bulk_item.quantity,
-                            "action": "quantity_increased"
-                        })
-                    else:
-                        details.append({
-                            "sku": bulk_item.sku,
-                            "status": "skipped",
-                            "reason": "Existing quantity is higher",
-                            "existing_quantity": existing_item.quantity,
-                            "requested_quantity": bulk_item.quantity
-                        })
-            else:
-                # Add new item to cart
-                cart_item = CartItem(
-                    id=uuid4(),
-                    cart_id=cart.id,
-                    product_id=product.id,
-                    product_sku=product.sku,
-                    product_name=product.name,
-                    quantity=bulk_item.quantity,
-                    unit_price=unit_price,
-                    line_total=line_total,
-                    notes=bulk_item.notes,
-                    project_reference=bulk_item.project_reference,
-                    created_at=datetime.utcnow(),
-                    updated_at=datetime.utcnow()
-                )
-                
-                db.add(cart_item)
-                added_items += 1
-                
-                details.append({
-                    "sku": bulk_item.sku,
-                    "status": "added",
-                    "quantity": bulk_item.quantity,
-                    "unit_price": float(unit_price),
-                    "line_total": float(line_total)
-                })
-                
-        except Exception as e:
-            logger.error(f"Error processing cart item {bulk_item.sku}: {e}")
-            failed_items += 1
+    # Sorted so concurrent bulk writes to one cart lock rows in the same order
+    valid_items = sorted(validation_result.valid_items, key=lambda item: item.sku)
+    skus = [item.sku for item in valid_items]
+    
+    # Quantities before the write, for the per-line report
+    existing_quantities = dict((await db.execute(
+        select(CartItem.product_sku, CartItem.quantity).where(
+            and_(CartItem.cart_id == cart.id, CartItem.product_sku.in_(skus))
+        )
+    )).all())
+    
+    rows = []
+    for bulk_item in valid_items:
+        product = validation_result.product_map[bulk_item.sku]
+        meta = {"source": bulk_request.source}
+        if bulk_request.project_id:
+            meta["project_id"] = bulk_request.project_id
+        if bulk_item.project_reference:
+            meta["project_reference"] = bulk_item.project_reference
+        if bulk_item.notes:
+            meta["notes"] = bulk_item.notes
+        rows.append({
+            "cart_id": cart.id,
+            "product_id": product.id,
+            "product_sku": bulk_item.sku,
+            "variant_id": validation_result.variant_ids.get(bulk_item.sku),
+            "quantity": bulk_item.quantity,
+            "unit_price": validation_result.unit_prices[bulk_item.sku],
+            "meta": meta,
+        })
+    
+    stmt = pg_insert(CartItem).values(rows)
+    excluded = stmt.excluded
+    where = None
+    if strategy == "add":
+        # Add to existing quantity, appending notes
+        set_ = {
+            "quantity": CartItem.quantity + excluded.quantity,
+            "variant_id": excluded.variant_id,
+            "unit_price": excluded.unit_price,
+            "meta": CartItem.meta.op("||")(excluded.meta).op("||")(
+                func.jsonb_strip_nulls(func.jsonb_build_object(
+                    "notes",
+                    func.nullif(func.concat_ws("\n", CartItem.meta["notes"].astext, excluded.meta["notes"].astext), "")
+                ))
+            ),
+        }
+    elif strategy == "replace":
+        # Replace existing line
+        set_ = {
+            "quantity": excluded.quantity,
+            "variant_id": excluded.variant_id,
+            "unit_price": excluded.unit_price,
+            "meta": excluded.meta,
+        }
+    else:
+        # Update quantity only if new quantity is higher
+        set_ = {
+            "quantity": excluded.quantity,
+            "variant_id": excluded.variant_id,
+            "unit_price": excluded.unit_price,
+        }
+        where = CartItem.quantity < excluded.quantity
+    set_["updated_at"] = func.now()
+    
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CartItem.cart_id, CartItem.product_sku],
+        set_=set_,
+        where=where,
+    ).returning(
+        CartItem.product_sku,
+        CartItem.quantity,
+        literal_column("xmax = 0").label("inserted"),  # true for freshly inserted rows
+    )
+    written = {row.product_sku: row for row in await db.execute(stmt)}
+    
+    actions = {"add": "quantity_added", "replace": "replaced", "update": "quantity_increased"}
+    for bulk_item in valid_items:
+        row = written.get(bulk_item.sku)
+        unit_price = validation_result.unit_prices[bulk_item.sku]
+        if row is None:
+            # Conflict row left alone by the "update" strategy
             details.append({
                 "sku": bulk_item.sku,
-                "status": "failed",
-                "reason": f"Processing error: {str(e)}"
+                "status": "skipped",
+                "reason": "Existing quantity is higher",
+                "existing_quantity": existing_quantities.get(bulk_item.sku),
+                "requested_quantity": bulk_item.quantity
+            })
+        elif row.inserted:
+            added_items += 1
+            details.append({
+                "sku": bulk_item.sku,
+                "status": "added",
+                "quantity": bulk_item.quantity,
+                "unit_price": float(unit_price),
+                "line_total": float(unit_price * bulk_item.quantity)
+            })
+        else:
+            updated_items += 1
+            details.append({
+                "sku": bulk_item.sku,
+                "status": "updated",
+                "old_quantity": existing_quantities.get(bulk_item.sku),
+                "new_quantity": row.quantity,
+                "action": actions[strategy]
             })
     
     return {
@@ -403,33 +435,42 @@ async def process_bulk_cart_additions(
         "details": details
     }
 
-async def recalculate_cart_totals(cart: Cart, db: Session):
-    """Recalculate cart totals after bulk operations"""
+async def recalculate_cart_totals(cart: Cart, db: AsyncSession) -> Dict[str, Any]:
+    """Recalculate cart totals after bulk operations
+
+    Aggregated in SQL over the cart's lines instead of loading them.
+    """
     try:
-        # Refresh cart items
-        db.refresh(cart)
-        
-        subtotal = sum(item.line_total for item in cart.items)
+        item_count, total_quantity, subtotal = (await db.execute(
+            select(
+                func.count(CartItem.id),
+                func.coalesce(func.sum(CartItem.quantity), 0),
+                func.coalesce(func.sum(CartItem.quantity * CartItem.unit_price), 0),
+            ).where(CartItem.cart_id == cart.id)
+        )).one()
         
         # Apply any applicable discounts (placeholder for future)
-        discount_amount = 0.0
+        discount_amount = Decimal("0")
         
         # Calculate tax (placeholder - implement tax calculation)
-        tax_rate = 0.0  # Implement proper tax calculation
+        tax_rate = Decimal("0")  # Implement proper tax calculation
         tax_amount = subtotal * tax_rate
         
         # Calculate shipping (placeholder - implement shipping calculation)
-        shipping_amount = 0.0
+        shipping_amount = Decimal("0")
         
-        # Update cart totals
-        cart.subtotal = subtotal
-        cart.discount_amount = discount_amount
-        cart.tax_amount = tax_amount
-        cart.shipping_amount = shipping_amount
-        cart.total_amount = subtotal - discount_amount + tax_amount + shipping_amount
-        cart.item_count = len(cart.items)
         cart.updated_at = datetime.utcnow()
         
+        return {
+            "item_count": item_count,
+            "total_quantity": total_quantity,
+            "subtotal": subtotal,
+            "discount_amount": discount_amount,
+            "tax_amount": tax_amount,
+            "shipping_amount": shipping_amount,
+            "total_amount": subtotal - discount_amount + tax_amount + shipping_amount,
+        }
+        
     except Exception as e:
         logger.error(f"Error recalculating cart totals: {e}")
         raise
@@ -497,7 +538,7 @@ async def notify_bulk_cart_addition(
 @router.post("/bulk-validate", response_model=Dict[str, Any])
 async def validate_bulk_cart_items_endpoint(
     items: List[BulkCartItem],
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Validate bulk cart items without adding them
@@ -516,7 +557,7 @@ async def validate_bulk_cart_items_endpoint(
                         "sku": item.sku,
                         "quantity": item.quantity,
                         "product_name": validation_result.product_map[item.sku].name,
-                        "unit_price": float(validation_result.product_map[item.sku].price)
+                        "unit_price": float(validation_result.unit_prices[item.sku])
                     }
                     for item in validation_result.valid_items
                 ],
@@ -3,7 +3,7 @@ Catalog API routes
 Products and categories endpoints
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Path
+from fastapi import APIRouter, Depends, HTTPException, Query, Path, Request
 from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 import logging
@@ -16,6 +16,7 @@ from app.schemas import (
 )
 from app.crud.products import product_crud
 from app.crud.categories import category_crud
+from app.services.search_suggestions import search_suggestions, searcher_key
 from app.utils.pagination import paginate_query
 
 logger = logging.getLogger(__name__)
@@ -81,6 +82,7 @@ async def get_category_by_path(
 # Product endpoints
 @router.get("/products", response_model=ProductList)
 async def get_products(
+    request: Request,
     q: Optional[str] = Query(None, description="Search query"),
     category_id: Optional[int] = Query(None, description="Filter by category"),
     brand: Optional[str] = Query(None, description="Filter by brand"),
@@ -89,7 +91,7 @@ async def get_products(
     in_stock: Optional[bool] = Query(None, description="Filter by stock availability"),
     is_featured: Optional[bool] = Query(None, description="Filter featured products"),
     tags: Optional[List[str]] = Query(None, description="Filter by tags"),
-    sort: str = Query("created_desc", description="Sort order"),
+    sort: Optional[str] = Query(None, description="Sort order (default: relevance when searching, else created_desc)"),
     page: int = Query(1, ge=1, description="Page number"),
     per_page: int = Query(20, ge=1, le=100, description="Items per page"),
     db: AsyncSession = Depends(get_db)
@@ -111,12 +113,14 @@ async def get_products(
         search = ProductSearch(
             q=q,
             filters=filters,
-            sort=sort,
+            sort=sort or ("relevance" if q else "created_desc"),
             page=page,
             per_page=per_page
         )
         
         products, total = await product_crud.search_products(db, search)
+        if q and page == 1:
+            search_suggestions.index.record_query(q, total, searcher_key(request))
         
         return ProductList(
             products=products,
@@ -7,14 +7,18 @@ from sqlalchemy.orm import Session
 from typing import Optional, Dict, Any, List
 from pydantic import BaseModel
 from datetime import datetime, timedelta
-import httpx
 import json
+import logging
 
 from app.core.db import get_db
+from app.core.idempotency import IdempotencyConflict, IdempotencyInProgress, request_fingerprint
 from app.core.unified_auth import get_current_user, get_idempotency_key, idempotency
 from app.middleware.observability import audit, metrics, track_quote_to_order_conversion
 from app.models.commerce import Order, Product
 from app.models.services import ServiceOrder, Upload, Quote
+from app.services.outbox import CAVE_PUBLISH_PATH, MAKRCAVE, enqueue
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
@@ -356,15 +360,23 @@ async def create_service_order_from_quote(
     Convert quote to service order → triggers job publishing to Cave
     Implements: Quote → Payment → Service Order → Cave Job Pipeline
     """
-    try:
-        # Check for duplicate requests
-        if idempotency_key:
-            cached_result = await idempotency.get_cached_result(
-                idempotency_key, "create_service_order"
+    # Claim the idempotency key (scoped to the user) before doing any work;
+    # a retry of the same request gets the stored result
+    if idempotency_key:
+        idempotency_key = f"{current_user['keycloak_id']}:{idempotency_key}"
+        try:
+            claim = await idempotency.claim(
+                idempotency_key, "create_service_order",
+                fingerprint=request_fingerprint(request.dict())
             )
-            if cached_result:
-                return cached_result
-        
+        except IdempotencyConflict as e:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+        except IdempotencyInProgress as e:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+        if not claim.acquired:
+            return claim.response
+    
+    try:
         # Validate quote
         quote = db.query(Quote).filter(
             Quote.id == request.quote_id,
@@ -408,10 +420,25 @@ async def create_service_order_from_quote(
         
         db.add(service_order)
         db.commit()
-        db.refresh(service_order)
         
-        # Prepare for payment
-        payment_metadata = {
+    except Exception as e:
+        # Nothing was committed, so a retry with the same key may run again
+        if idempotency_key:
+            await idempotency.release(idempotency_key, "create_service_order")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Failed to create service order: {str(e)}"
+        )
+    
+    # The order exists from here on: never release the key (a retry would
+    # create a second order) and store the result before any side effect
+    # that can fail
+    result = {
+        "service_order_id": service_order.id,
+        "status": "pending_payment",
+        "payment_amount": quote.price,
+        "currency": quote.currency,
+        "payment_metadata": {
             "service_order_id": service_order.id,
             "quote_id": quote.id,
             "upload_file_key": upload.file_key,
@@ -419,33 +446,25 @@ async def create_service_order_from_quote(
             "quality": quote.quality,
             "estimated_time_minutes": quote.estimated_time_minutes,
             "user_id": current_user["keycloak_id"]
-        }
-        
-        result = {
-            "service_order_id": service_order.id,
-            "status": "pending_payment",
-            "payment_amount": quote.price,
-            "currency": quote.currency,
-            "payment_metadata": payment_metadata,
-            "next_step": "complete_payment"
-        }
-        
-        # Cache result for idempotency
-        if idempotency_key:
-            await idempotency.record_operation(
+        },
+        "next_step": "complete_payment"
+    }
+    
+    if idempotency_key:
+        try:
+            result = await idempotency.record_operation(
                 idempotency_key, "create_service_order", result
             )
-        
-        # Track quote conversion
+        except Exception as e:
+            logger.error(f"Failed to store result for service order {service_order.id}: {e}")
+    
+    # Track quote conversion
+    try:
         track_quote_to_order_conversion(request.quote_id, True, "unknown")
-        
-        return result
-        
     except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to create service order: {str(e)}"
-        )
+        logger.warning(f"Failed to track conversion of quote {request.quote_id}: {e}")
+    
+    return result
 
 @router.post("/service-orders/{service_order_id}/publish-to-cave")
 async def publish_service_order_to_cave(
@@ -468,6 +487,15 @@ async def publish_service_order_to_cave(
                 detail="Service order not found"
             )
         
+        # Already queued or published: repeated webhook calls are no-ops
+        if service_order.status in ("publishing", "dispatched"):
+            return {
+                "success": True,
+                "service_order_id": service_order_id,
+                "status": service_order.status,
+                "cave_job_id": (service_order.tracking or {}).get("makrcave_job_id")
+            }
+        
         # Get quote and upload
         quote = db.query(Quote).filter(Quote.id == service_order.quote_id).first()
         upload = db.query(Upload).filter(Upload.id == service_order.upload_id).first()
@@ -497,43 +525,28 @@ async def publish_service_order_to_cave(
             }
         }
         
-        # Call Cave bridge API
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{settings.MAKRCAVE_API_URL}/api/v1/bridge/jobs/publish",
-                json=cave_job_request,
-                headers={
-                    "Authorization": f"Bearer {settings.SERVICE_JWT}",
-                    "Content-Type": "application/json"
-                }
-            )
-            response.raise_for_status()
-            cave_response = response.json()
-        
-        # Update service order with Cave job mapping
-        service_order.status = "assigned_to_provider"
-        service_order.cave_job_id = cave_response["job_id"]
-        service_order.provider_accept_url = cave_response["accept_url"]
-        
+        # Queue the Cave publish in the same transaction as the status change;
+        # the outbox relay delivers it and records the Cave job mapping
+        service_order.status = "publishing"
+        message = enqueue(
+            db, MAKRCAVE, CAVE_PUBLISH_PATH, cave_job_request,
+            "service_order", service_order.id
+        )
         db.commit()
         
-        # Log successful job publication
+        # Log queued job publication
         audit.log_service_order_lifecycle(
             service_order_id=service_order_id,
-            status="published_to_cave",
-            metadata={
-                "cave_job_id": cave_response["job_id"],
-                "accept_url": cave_response["accept_url"]
-            },
+            status="queued_for_cave",
+            metadata={"outbox_message_id": message.id},
             request_id="webhook_triggered"
         )
         
         return {
             "success": True,
             "service_order_id": service_order_id,
-            "cave_job_id": cave_response["job_id"],
-            "status": "published_to_cave",
-            "provider_accept_url": cave_response["accept_url"]
+            "status": "publishing",
+            "outbox_message_id": message.id
         }
         
     except Exception as e:
@@ -3,8 +3,8 @@ Enhanced Catalog API Routes
 Advanced search, filtering, maker-specific features, and integration capabilities
 """
 
-from fastapi import APIRouter, Depends, HTTPException, Query, Path, BackgroundTasks
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, Path, BackgroundTasks, Request
+from sqlalchemy.orm import Session, contains_eager
 from sqlalchemy import select, and_, or_, text, func
 from typing import List, Optional, Dict, Any
 import logging
@@ -12,9 +12,13 @@ import json
 from datetime import datetime, timedelta
 
 from app.core.db import get_db
-from app.models.commerce import Product, Category, Order, OrderItem
+from app.core.product_search import product_text_search
+from app.core.security import get_current_user
+from app.services.search_suggestions import search_suggestions, searcher_key
+from app.services.category_tree import category_tree
+from app.services.recommendations import recommendations
+from app.models.commerce import Product, Category, Order, ProductStats
 from app.models.subscriptions import QuickReorder, BOMIntegration
-from app.models.reviews import Review, ProductRatingSummary
 from pydantic import BaseModel, Field
 from app.utils.pagination import paginate_query
 
@@ -76,7 +80,6 @@ class AdvancedSearchResponse(BaseModel):
 
 class ProductRecommendationRequest(BaseModel):
     product_id: Optional[int] = None
-    user_id: Optional[str] = None
     category_id: Optional[int] = None
     recommendation_type: str = Field("similar", description="similar, complementary, trending, personalized")
     limit: int = Field(10, ge=1, le=50)
@@ -84,6 +87,7 @@ class ProductRecommendationRequest(BaseModel):
 @router.post("/search/advanced", response_model=AdvancedSearchResponse)
 async def advanced_product_search(
     request: AdvancedSearchRequest,
+    http_request: Request,
     background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
@@ -93,27 +97,24 @@ async def advanced_product_search(
     start_time = datetime.now()
     
     try:
-        # Build base query
-        query = db.query(Product).filter(Product.is_active == True)
+        # Build base query; denormalized rating/sales counters are joined once
+        query = db.query(Product).outerjoin(
+            ProductStats, ProductStats.product_id == Product.id
+        ).options(contains_eager(Product.stats)).filter(Product.is_active == True)
         
         # Apply text search
-        if request.query:
-            search_terms = request.query.strip().split()
-            search_conditions = []
-            
-            for term in search_terms:
-                term_condition = or_(
-                    Product.name.ilike(f"%{term}%"),
-                    Product.description.ilike(f"%{term}%"),
-                    Product.short_description.ilike(f"%{term}%"),
-                    Product.brand.ilike(f"%{term}%"),
-                    Product.tags.op('@>')([term.lower()]),  # JSONB contains
-                    Product.attributes.op('@>')({f"material": term.lower()})
+        relevance = None
+        if request.query and request.query.strip():
+            text_condition, relevance = product_text_search(request.query)
+            # Tags and material attributes still match per term (GIN-indexed JSONB containment)
+            attribute_condition = and_(*[
+                or_(
+                    Product.tags.op('@>')([term.lower()]),
+                    Product.attributes.op('@>')({"material": term.lower()})
                 )
-                search_conditions.append(term_condition)
-            
-            if search_conditions:
-                query = query.filter(and_(*search_conditions))
+                for term in request.query.split()
+            ])
+            query = query.filter(or_(text_condition, attribute_condition))
         
         # Apply filters
         if request.filters:
@@ -176,22 +177,13 @@ async def advanced_product_search(
                 query = query.filter(Product.sale_price.isnot(None))
             
             if filters.rating_min:
-                # Join with rating summary
-                query = query.join(ProductRatingSummary, Product.id == ProductRatingSummary.product_id)
-                query = query.filter(ProductRatingSummary.average_rating >= filters.rating_min)
+                query = query.filter(ProductStats.average_rating >= filters.rating_min)
             
-            if filters.has_reviews:
-                review_subquery = db.query(Review.target_id).filter(
-                    and_(
-                        Review.target_type == "product",
-                        Review.status == "published"
-                    )
-                ).distinct()
-                
+            if filters.has_reviews is not None:
                 if filters.has_reviews:
-                    query = query.filter(Product.id.in_(review_subquery))
+                    query = query.filter(ProductStats.rating_count > 0)
                 else:
-                    query = query.filter(~Product.id.in_(review_subquery))
+                    query = query.filter(func.coalesce(ProductStats.rating_count, 0) == 0)
         
         # Get total count before pagination
         total_count = query.count()
@@ -204,18 +196,12 @@ async def advanced_product_search(
         elif request.sort_by == "newest":
             query = query.order_by(Product.created_at.desc())
         elif request.sort_by == "rating":
-            query = query.outerjoin(ProductRatingSummary, Product.id == ProductRatingSummary.product_id)
-            query = query.order_by(ProductRatingSummary.average_rating.desc().nullslast())
+            query = query.order_by(ProductStats.average_rating.desc().nullslast())
         elif request.sort_by == "popularity":
-            # Order by total orders (simplified)
-            popularity_subquery = db.query(
-                OrderItem.product_id,
-                func.sum(OrderItem.quantity).label('total_orders')
-            ).group_by(OrderItem.product_id).subquery()
-            
-            query = query.outerjoin(popularity_subquery, Product.id == popularity_subquery.c.product_id)
-            query = query.order_by(popularity_subquery.c.total_orders.desc().nullslast())
-        else:  # relevance (default)
+            query = query.order_by(ProductStats.popularity_score.desc().nullslast())
+        elif relevance is not None:  # relevance (default) with a search query
+            query = query.order_by(relevance.desc(), Product.is_featured.desc())
+        else:
             query = query.order_by(Product.is_featured.desc(), Product.created_at.desc())
         
         # Apply pagination and execute query
@@ -251,15 +237,12 @@ async def advanced_product_search(
             }
             
             # Add rating data if available
-            rating_summary = db.query(ProductRatingSummary).filter(
-                ProductRatingSummary.product_id == product.id
-            ).first()
-            
-            if rating_summary:
+            stats = product.stats
+            if stats and stats.rating_count:
                 product_dict["rating"] = {
-                    "average": float(rating_summary.average_rating),
-                    "count": rating_summary.total_reviews,
-                    "verified_count": rating_summary.verified_reviews
+                    "average": float(stats.average_rating),
+                    "count": stats.rating_count,
+                    "verified_count": stats.verified_reviews
                 }
             
             product_list.append(product_dict)
@@ -279,7 +262,7 @@ async def advanced_product_search(
         
         # Add suggestions if requested
         if request.include_suggestions and request.query:
-            background_tasks.add_task(log_search_query, request.query, total_count)
+            background_tasks.add_task(log_search_query, request.query, total_count, searcher_key(http_request))
             suggestions = await get_search_suggestions(db, request.query)
             response.suggestions = suggestions
         
@@ -297,10 +280,14 @@ async def advanced_product_search(
 @router.get("/recommendations", response_model=List[Dict[str, Any]])
 async def get_product_recommendations(
     request: ProductRecommendationRequest = Depends(),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    user_id: Optional[str] = Depends(get_current_user)
 ):
     """
     Get product recommendations based on various algorithms
+
+    Personalized lists are only served for the authenticated caller;
+    anonymous callers get the trending fallback.
     """
     try:
         recommendations = []
@@ -314,8 +301,8 @@ async def get_product_recommendations(
         elif request.recommendation_type == "trending":
             recommendations = await get_trending_products(db, request.category_id, request.limit)
         
-        elif request.recommendation_type == "personalized" and request.user_id:
-            recommendations = await get_personalized_recommendations(db, request.user_id, request.limit)
+        elif request.recommendation_type == "personalized":
+            recommendations = await get_personalized_recommendations(db, user_id, request.limit)
         
         else:
             # Default to popular products
@@ -458,52 +445,29 @@ async def get_category_tree(
     Get complete category tree with optional product counts
     """
     try:
-        # Get all categories
-        categories = db.query(Category).filter(Category.is_active == True).all()
-        
-        # Build tree structure
-        category_dict = {}
-        root_categories = []
-        
-        for category in categories:
-            category_data = {
-                "id": category.id,
-                "name": category.name,
-                "slug": category.slug,
-                "description": category.description,
-                "image_url": category.image_url,
-                "sort_order": category.sort_order,
-                "children": []
-            }
-            
-            if include_product_counts:
-                product_count = db.query(Product).filter(
-                    and_(
-                        Product.category_id == category.id,
-                        Product.is_active == True
-                    )
-                ).count()
-                category_data["product_count"] = product_count
+        tree = await category_tree.get()
+        categories = tree.active_roots
+        
+        if include_product_counts:
+            # One grouped count instead of a query per category; cached nodes are copied, not mutated
+            product_counts = dict(
+                db.query(Product.category_id, func.count(Product.id))
+                .filter(Product.is_active == True)
+                .group_by(Product.category_id)
+                .all()
+            )
             
-            category_dict[category.id] = category_data
+            def with_counts(nodes):
+                return [
+                    dict(node, product_count=product_counts.get(node["id"], 0), children=with_counts(node["children"]))
+                    for node in nodes
+                ]
             
-            if category.parent_id:
-                if category.parent_id in category_dict:
-                    category_dict[category.parent_id]["children"].append(category_data)
-            else:
-                root_categories.append(category_data)
-        
-        # Sort categories by sort_order
-        def sort_categories(cats):
-            cats.sort(key=lambda x: x["sort_order"])
-            for cat in cats:
-                sort_categories(cat["children"])
-        
-        sort_categories(root_categories)
+            categories = with_counts(categories)
         
         return {
-            "categories": root_categories,
-            "total_categories": len(categories)
+            "categories": categories,
+            "total_categories": len(tree.active_nodes)
         }
         
     except Exception as e:
@@ -514,6 +478,9 @@ async def get_category_tree(
 
 async def get_search_suggestions(db: Session, query: str, limit: int = 5) -> List[str]:
     """Generate search suggestions based on query"""
+    if search_suggestions.index.ready:
+        return search_suggestions.index.suggest(query, limit)
+    
     suggestions = []
     
     # Get suggestions from product names
@@ -576,73 +543,80 @@ async def build_search_facets(db: Session, filters: Optional[AdvancedProductFilt
     
     return facets
 
+def products_in_order(db: Session, product_ids: List[int], limit: int) -> List[Dict[str, Any]]:
+    """Hydrate recommended product ids, keeping their order and dropping inactive products"""
+    if not product_ids:
+        return []
+    products = {
+        p.id: p for p in db.query(Product).filter(
+            and_(Product.id.in_(product_ids), Product.is_active == True)
+        ).all()
+    }
+    ordered = [products[product_id] for product_id in product_ids if product_id in products]
+    return [{"id": p.id, "name": p.name, "price": float(p.price)} for p in ordered[:limit]]
+
 async def get_similar_products(db: Session, product_id: int, limit: int) -> List[Dict[str, Any]]:
     """Get products similar to the given product"""
+    # Same-category products bought by the same customers (offline build)
+    similar = products_in_order(db, recommendations.get("similar", product_id, limit * 2), limit)
+    if similar:
+        return similar
+    
     base_product = db.query(Product).filter(Product.id == product_id).first()
     if not base_product:
         return []
     
-    # Find products in same category with similar attributes
-    similar = db.query(Product).filter(
+    # No purchase signal yet: best sellers in the same category
+    similar = db.query(Product).outerjoin(
+        ProductStats, Product.id == ProductStats.product_id
+    ).filter(
         and_(
             Product.id != product_id,
             Product.category_id == base_product.category_id,
             Product.is_active == True
         )
-    ).limit(limit).all()
+    ).order_by(ProductStats.popularity_score.desc().nullslast()).limit(limit).all()
     
     return [{"id": p.id, "name": p.name, "price": float(p.price)} for p in similar]
 
 async def get_complementary_products(db: Session, product_id: int, limit: int) -> List[Dict[str, Any]]:
-    """Get products that complement the given product"""
-    # This would analyze order patterns to find frequently bought together items
-    # For now, return products from related categories
-    base_product = db.query(Product).filter(Product.id == product_id).first()
-    if not base_product:
-        return []
+    """Get products frequently bought together with the given product"""
+    complementary = products_in_order(db, recommendations.get("complementary", product_id, limit * 2), limit)
+    if complementary:
+        return complementary
     
-    complementary = db.query(Product).filter(
-        and_(
-            Product.id != product_id,
-            Product.is_active == True
-        )
-    ).limit(limit).all()
-    
-    return [{"id": p.id, "name": p.name, "price": float(p.price)} for p in complementary]
+    popular = await get_popular_products(db, None, limit + 1)
+    return [p for p in popular if p["id"] != product_id][:limit]
 
 async def get_trending_products(db: Session, category_id: Optional[int], limit: int) -> List[Dict[str, Any]]:
     """Get trending products based on recent order activity"""
-    query = db.query(Product).filter(Product.is_active == True)
+    trending = products_in_order(db, recommendations.get("trending", category_id or "all", limit * 2), limit)
+    if trending:
+        return trending
     
-    if category_id:
-        query = query.filter(Product.category_id == category_id)
-    
-    # Order by recent creation date for trending effect
-    trending = query.order_by(Product.created_at.desc()).limit(limit).all()
-    
-    return [{"id": p.id, "name": p.name, "price": float(p.price)} for p in trending]
+    return await get_popular_products(db, category_id, limit)
 
-async def get_personalized_recommendations(db: Session, user_id: str, limit: int) -> List[Dict[str, Any]]:
-    """Get personalized recommendations based on user behavior"""
-    # This would analyze user's order history, browsing behavior, etc.
-    # For now, return popular products
-    return await get_popular_products(db, None, limit)
+async def get_personalized_recommendations(db: Session, user_id: Optional[str], limit: int) -> List[Dict[str, Any]]:
+    """Get personalized recommendations based on the user's order history"""
+    if user_id:
+        personalized = products_in_order(db, recommendations.get("personalized", user_id, limit * 2), limit)
+        if personalized:
+            return personalized
+    
+    return await get_trending_products(db, None, limit)
 
 async def get_popular_products(db: Session, category_id: Optional[int], limit: int) -> List[Dict[str, Any]]:
-    """Get popular products based on order frequency"""
-    # Join with order items to find most ordered products
-    query = db.query(Product, func.count(OrderItem.id).label('order_count')).outerjoin(
-        OrderItem, Product.id == OrderItem.product_id
+    """Get popular products based on decayed sales popularity"""
+    query = db.query(Product).outerjoin(
+        ProductStats, Product.id == ProductStats.product_id
     ).filter(Product.is_active == True)
     
     if category_id:
         query = query.filter(Product.category_id == category_id)
     
-    popular = query.group_by(Product.id).order_by(
-        func.count(OrderItem.id).desc()
-    ).limit(limit).all()
+    popular = query.order_by(ProductStats.popularity_score.desc().nullslast()).limit(limit).all()
     
-    return [{"id": p.Product.id, "name": p.Product.name, "price": float(p.Product.price)} for p in popular]
+    return [{"id": p.id, "name": p.name, "price": float(p.price)} for p in popular]
 
 def get_material_settings(material: str) -> Dict[str, Any]:
     """Get recommended print settings for material"""
@@ -689,7 +663,8 @@ async def find_compatible_products(db: Session, product: Product) -> List[Dict[s
     
     return compatible
 
-async def log_search_query(query: str, result_count: int):
+async def log_search_query(query: str, result_count: int, searcher: str):
     """Log search query for analytics (background task)"""
     # This would log to analytics system
     logger.info(f"Search query: '{query}' returned {result_count} results")
+    search_suggestions.index.record_query(query, result_count, searcher)
@@ -5,17 +5,18 @@ Enables makerspaces and service providers to quickly reorder frequently used ite
 
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
 from sqlalchemy.orm import Session
-from sqlalchemy import select, and_, or_, func
+from sqlalchemy import select, and_, or_
 from typing import List, Optional, Dict, Any
 import logging
 import json
-from datetime import datetime, timedelta
-from uuid import uuid4
+from datetime import datetime, timedelta, timezone
+from uuid import UUID, uuid4
 
-from app.core.db import get_db
+from app.core.db import get_db, AsyncSessionLocal
 from app.core.security import get_current_user
 from app.models.commerce import Product, Order, OrderItem, Cart, CartItem
-from app.models.subscriptions import QuickReorder
+from app.models.subscriptions import QuickReorder, ReorderSuggestion
+from app.services.reorder_forecast import REORDER_LEAD_DAYS, remaining_quantity
 from pydantic import BaseModel, Field
 
 logger = logging.getLogger(__name__)
@@ -627,52 +628,41 @@ async def get_reorder_suggestions(
     db: Session = Depends(get_db)
 ):
     """
-    Get suggested items for reordering based on usage patterns
+    Get suggested items for reordering based on forecast consumption
+    
+    Reads the precomputed forecasts in reorder_suggestions (see
+    app.services.reorder_forecast), soonest predicted run-out first.
     """
     try:
-        # This would analyze MakrCave inventory levels and usage patterns
-        # For now, return frequently ordered items
-        
-        # Get user's order history
-        recent_orders = db.query(Order).filter(
+        now = datetime.now(timezone.utc)
+        rows = db.query(ReorderSuggestion, Product).join(
+            Product, Product.id == ReorderSuggestion.product_id
+        ).filter(
             and_(
-                Order.user_id == user_id,
-                Order.created_at >= datetime.utcnow() - timedelta(days=90)
+                ReorderSuggestion.user_id == user_id,
+                Product.is_active == True
             )
-        ).all()
-        
-        order_ids = [order.id for order in recent_orders]
-        
-        if not order_ids:
-            return {"suggestions": []}
-        
-        # Find frequently ordered products
-        frequent_items = db.query(
-            OrderItem.product_id,
-            func.count(OrderItem.id).label('order_count'),
-            func.sum(OrderItem.quantity).label('total_quantity'),
-            func.avg(OrderItem.quantity).label('avg_quantity')
-        ).filter(
-            OrderItem.order_id.in_(order_ids)
-        ).group_by(OrderItem.product_id).having(
-            func.count(OrderItem.id) >= 2
-        ).order_by(func.count(OrderItem.id).desc()).limit(20).all()
+        ).order_by(ReorderSuggestion.predicted_depletion_at.asc()).limit(20).all()
         
         suggestions = []
-        for item in frequent_items:
-            product = db.query(Product).filter(Product.id == item.product_id).first()
-            if product and product.is_active:
-                suggestions.append({
-                    "product_id": product.id,
-                    "product_name": product.name,
-                    "brand": product.brand,
-                    "current_price": float(product.sale_price or product.price),
-                    "suggested_quantity": int(item.avg_quantity),
-                    "order_frequency": item.order_count,
-                    "total_ordered": item.total_quantity,
-                    "in_stock": product.stock_qty > 0,
-                    "stock_level": product.stock_qty
-                })
+        for suggestion, product in rows:
+            days_left = (suggestion.predicted_depletion_at - now).total_seconds() / 86400
+            suggestions.append({
+                "product_id": product.id,
+                "product_name": product.name,
+                "brand": product.brand,
+                "current_price": float(product.sale_price or product.price),
+                "suggested_quantity": suggestion.suggested_quantity,
+                "order_frequency": suggestion.order_count,
+                "total_ordered": suggestion.total_quantity,
+                "in_stock": product.stock_qty > 0,
+                "stock_level": product.stock_qty,
+                "consumption_rate_per_day": float(suggestion.consumption_rate),
+                "reorder_interval_days": float(suggestion.interval_days),
+                "predicted_depletion_date": suggestion.predicted_depletion_at.isoformat(),
+                "days_until_depletion": round(days_left, 1),
+                "reorder_due": days_left <= REORDER_LEAD_DAYS
+            })
         
         return {"suggestions": suggestions}
         
@@ -683,11 +673,58 @@ async def get_reorder_suggestions(
 # Background Tasks
 
 async def check_reorder_thresholds(user_id: str, reorder_id: str):
-    """Check if any products in the reorder are below threshold (background task)"""
+    """Check if any products in the reorder are below threshold (background task)
+    
+    Stock on hand is estimated from the consumption forecasts: a product is
+    flagged when its forecast remaining quantity is at or below the
+    reorder_threshold set for it, or, without a threshold, when it is
+    forecast to run out within REORDER_LEAD_DAYS.
+    """
     try:
-        # This would check MakrCave inventory levels and trigger notifications
-        # For now, just log the check
-        logger.info(f"Checking reorder thresholds for user {user_id}, reorder {reorder_id}")
+        async with AsyncSessionLocal() as db:
+            reorder = await db.get(QuickReorder, UUID(reorder_id))
+            if not reorder:
+                return []
+            
+            product_ids = [int(item["product_id"]) for item in reorder.products or []]
+            thresholds = reorder.reorder_threshold or {}
+            result = await db.execute(
+                select(ReorderSuggestion).where(
+                    and_(
+                        ReorderSuggestion.user_id == user_id,
+                        ReorderSuggestion.product_id.in_(product_ids)
+                    )
+                )
+            )
+            
+            now = datetime.now(timezone.utc)
+            below_threshold = []
+            for suggestion in result.scalars():
+                remaining = remaining_quantity(
+                    suggestion.last_quantity,
+                    float(suggestion.consumption_rate),
+                    suggestion.last_ordered_at,
+                    now
+                )
+                threshold = thresholds.get(str(suggestion.product_id))
+                if threshold is not None:
+                    flagged = remaining <= float(threshold)
+                else:
+                    flagged = suggestion.predicted_depletion_at <= now + timedelta(days=REORDER_LEAD_DAYS)
+                if flagged:
+                    below_threshold.append({
+                        "product_id": suggestion.product_id,
+                        "estimated_remaining": round(remaining, 1),
+                        "predicted_depletion_date": suggestion.predicted_depletion_at.isoformat()
+                    })
+        
+        if below_threshold:
+            logger.info(
+                f"Reorder {reorder_id} for user {user_id}: {len(below_threshold)} item(s) at or below threshold: "
+                + ", ".join(str(item["product_id"]) for item in below_threshold)
+            )
+        return below_threshold
         
     except Exception as e:
         logger.error(f"Reorder threshold check error: {e}")
+        return []
@@ -9,6 +9,7 @@ import uuid
 from app.schemas import MessageResponse
 from app.core.db import get_db
 from app.core.security import get_current_user
+from app.core.quote_cache import geometry_cache, pricing_cache, pricing_table_version, stable_hash
 from app.models.services import Quote, Material, ServiceOrder
 from sqlalchemy.orm import Session
 
@@ -139,6 +140,18 @@ QUALITY_SETTINGS = {
     }
 }
 
+# Base rates (INR per hour)
+MACHINE_RATE_PER_HOUR = 120.0  # Machine depreciation and electricity
+LABOR_RATE_PER_HOUR = 200.0    # Operator time for setup, monitoring, post-processing
+
+# Cached breakdowns are only reused while these tables are unchanged
+QUOTE_PRICING_VERSION = pricing_table_version(
+    {name: props.dict() for name, props in MATERIALS.items()},
+    QUALITY_SETTINGS,
+    MACHINE_RATE_PER_HOUR,
+    LABOR_RATE_PER_HOUR
+)
+
 class QuoteCalculator:
     """Advanced 3D printing quote calculator"""
     
@@ -241,10 +254,6 @@ class QuoteCalculator:
     @staticmethod
     def calculate_labor_cost(time_info: Dict[str, float], settings: PrintSettings) -> Dict[str, float]:
         """Calculate labor and machine costs"""
-        # Base rates (INR per hour)
-        machine_rate_per_hour = 120.0  # Machine depreciation and electricity
-        labor_rate_per_hour = 200.0    # Operator time for setup, monitoring, post-processing
-        
         # Setup time (fixed per job)
         setup_time_hours = 0.5 + (0.2 * settings.quantity)  # Setup scales with quantity
         
@@ -263,8 +272,8 @@ class QuoteCalculator:
         rush_multiplier = 1.8 if settings.rush_order else 1.0
         
         total_labor_time = (setup_time_hours + monitoring_time_hours + post_processing_time_hours) * quality_multiplier
-        machine_cost = time_info["total_time_hours"] * machine_rate_per_hour * rush_multiplier
-        labor_cost = total_labor_time * labor_rate_per_hour * rush_multiplier
+        machine_cost = time_info["total_time_hours"] * MACHINE_RATE_PER_HOUR * rush_multiplier
+        labor_cost = total_labor_time * LABOR_RATE_PER_HOUR * rush_multiplier
         
         return {
             "setup_time_hours": setup_time_hours,
@@ -315,6 +324,40 @@ def mock_file_analysis(upload_id: str) -> FileAnalysis:
         thin_walls_detected=False
     )
 
+def get_file_analysis(upload_id: str) -> FileAnalysis:
+    """Geometry stage: analyze an upload once and reuse the result for requotes"""
+    cache_key = f"upload:{upload_id}"
+    cached = geometry_cache.get(cache_key)
+    if cached is not None:
+        return FileAnalysis(**cached)
+    
+    file_analysis = mock_file_analysis(upload_id)
+    geometry_cache.set(cache_key, file_analysis.dict())
+    return file_analysis
+
+def calculate_print_breakdowns(file_analysis: FileAnalysis, settings: PrintSettings) -> Dict[str, Dict[str, Any]]:
+    """Pricing stage: material, time and labor breakdowns
+
+    Cached under the geometry fingerprint, the print settings (material,
+    quality, infill, quantity, ...) and the pricing-table version, so
+    requotes that only change delivery options skip the calculation.
+    """
+    cache_key = "print:" + stable_hash(
+        QUOTE_PRICING_VERSION, stable_hash(file_analysis.dict()), settings.dict()
+    )
+    breakdowns = pricing_cache.get(cache_key)
+    if breakdowns is None:
+        material_breakdown = QuoteCalculator.calculate_material_cost(file_analysis, settings)
+        time_breakdown = QuoteCalculator.calculate_print_time(file_analysis, settings)
+        labor_breakdown = QuoteCalculator.calculate_labor_cost(time_breakdown, settings)
+        breakdowns = {
+            "material": material_breakdown,
+            "time": time_breakdown,
+            "labor": labor_breakdown
+        }
+        pricing_cache.set(cache_key, breakdowns)
+    return breakdowns
+
 @router.post("/", response_model=QuoteResponse)
 async def create_quote(
     quote_request: QuoteRequest,
@@ -338,20 +381,13 @@ async def create_quote(
             )
         
         # Get file analysis (mock for now)
-        file_analysis = mock_file_analysis(quote_request.upload_id)
+        file_analysis = get_file_analysis(quote_request.upload_id)
         
         # Calculate costs
-        material_breakdown = QuoteCalculator.calculate_material_cost(
-            file_analysis, quote_request.print_settings
-        )
-        
-        time_breakdown = QuoteCalculator.calculate_print_time(
-            file_analysis, quote_request.print_settings
-        )
-        
-        labor_breakdown = QuoteCalculator.calculate_labor_cost(
-            time_breakdown, quote_request.print_settings
-        )
+        breakdowns = calculate_print_breakdowns(file_analysis, quote_request.print_settings)
+        material_breakdown = breakdowns["material"]
+        time_breakdown = breakdowns["time"]
+        labor_breakdown = breakdowns["labor"]
         
         delivery_breakdown = QuoteCalculator.calculate_delivery_cost(
             quote_request.delivery_address, quote_request.pickup_location
@@ -398,8 +434,8 @@ async def create_quote(
             "delivery": delivery_breakdown,
             "pricing_details": {
                 "material_cost_per_g": material_breakdown["cost_per_g"],
-                "machine_rate_per_hour": 120.0,
-                "labor_rate_per_hour": 200.0,
+                "machine_rate_per_hour": MACHINE_RATE_PER_HOUR,
+                "labor_rate_per_hour": LABOR_RATE_PER_HOUR,
                 "tax_rate": tax_rate
             }
         }
@@ -181,11 +181,13 @@ async def withdraw_consent(
 
 @router.get("/monitoring/slo-report", response_model=Dict[str, Any])
 async def get_slo_report(
+    window_hours: int = 24,
+    endpoint: Optional[str] = None,
     current_user: SecurityContext = Depends(require_admin)
 ):
     """Get SLO compliance report"""
     try:
-        report = await performance_monitor.get_slo_report()
+        report = await performance_monitor.get_slo_report(window_hours, endpoint)
         
         await security_logger.log_admin_action(
             admin_user_id=current_user.user_id,
@@ -22,6 +22,7 @@ import logging
 import os
 import json
 import io
+import hashlib
 import trimesh
 from uuid import UUID, uuid4
 from datetime import datetime, timedelta
@@ -30,10 +31,13 @@ from enum import Enum
 import redis.asyncio as redis
 
 from ..core.config import settings
+from ..core.quote_cache import geometry_cache
 
 from ..core.db import get_db, AsyncSessionLocal
 from ..core.storage import upload_file_to_storage, generate_presigned_url
 from ..core.payments import PaymentProcessor
+from ..services.outbox import MAKRCAVE, enqueue, enqueue_event
+from .webhooks import queue_webhook_event, razorpay_event_id
 from ..models.commerce import Order, OrderItem, Product
 from ..schemas import MessageResponse
 from ..schemas.commerce import OrderResponse
@@ -365,24 +369,16 @@ async def create_service_order(
         )
         
         db.add(order_item)
-        db.commit()
         
-        # Dispatch job to MakrCave providers
-        job_dispatch_result = await dispatch_job_to_providers(
+        # Queue the job dispatch to MakrCave providers; it commits with the
+        # order and the outbox relay delivers it
+        job_dispatch_result = dispatch_job_to_providers(
+            db,
             service_order_id,
             quote_data,
             order_request
         )
-        
-        if not job_dispatch_result["success"]:
-            # Rollback order if job dispatch fails
-            db.delete(order_item)
-            db.delete(order)
-            db.commit()
-            raise HTTPException(
-                status_code=500,
-                detail="Failed to dispatch job to providers"
-            )
+        db.commit()
         
         # Schedule order processing
         background_tasks.add_task(
@@ -463,8 +459,19 @@ async def get_service_order(
 # Helper Functions
 
 async def analyze_3d_file(file_url: str, filename: str, file_size: int) -> Optional[FileAnalysis]:
-    """Analyze a 3D file and return geometry statistics."""
+    """Analyze a 3D file and return geometry statistics.
+
+    Results are cached by mesh content hash, and storage URLs (unique per
+    upload) remember their hash, so re-quoting a file skips both the
+    download and the mesh processing.
+    """
     try:
+        url_key = f"url:{file_url.split('?', 1)[0]}"
+        mesh_key = geometry_cache.get(url_key)
+        cached = geometry_cache.get(mesh_key) if mesh_key else None
+        if cached is not None:
+            return FileAnalysis(**{**cached, "filename": filename})
+
         # Download the file
         async with httpx.AsyncClient() as client:
             response = await client.get(file_url)
@@ -474,6 +481,12 @@ async def analyze_3d_file(file_url: str, filename: str, file_size: int) -> Optio
         file_size = len(file_bytes)
         extension = os.path.splitext(filename)[1].lower().lstrip(".")
 
+        mesh_key = f"mesh:{extension}:{hashlib.sha256(file_bytes).hexdigest()}"
+        geometry_cache.set(url_key, mesh_key)
+        cached = geometry_cache.get(mesh_key)
+        if cached is not None:
+            return FileAnalysis(**{**cached, "filename": filename})
+
         # Load mesh using trimesh
         mesh = trimesh.load(io.BytesIO(file_bytes), file_type=extension)
 
@@ -500,7 +513,7 @@ async def analyze_3d_file(file_url: str, filename: str, file_size: int) -> Optio
 
         complexity_score = min(1.0, mesh.faces.shape[0] / 10000)
 
-        return FileAnalysis(
+        analysis = FileAnalysis(
             filename=filename,
             file_size=file_size,
             dimensions=dimensions,
@@ -512,6 +525,8 @@ async def analyze_3d_file(file_url: str, filename: str, file_size: int) -> Optio
             supports_required=supports_required,
             issues=[],
         )
+        geometry_cache.set(mesh_key, analysis.dict())
+        return analysis
     except Exception as e:
         logger.error(f"3D file analysis error: {e}")
         return None
@@ -657,55 +672,50 @@ async def find_available_providers(
         logger.error(f"Provider search error: {e}")
         return []
 
-async def dispatch_job_to_providers(
+def dispatch_job_to_providers(
+    db: Session,
     service_order_id: str,
     quote_data: Dict[str, Any],
     order_request: ServiceOrderRequest
 ) -> Dict[str, Any]:
-    """Dispatch job to MakrCave provider network"""
-    try:
-        job_id = str(uuid4())
-        
-        # Prepare job request
-        job_request = ProviderJobRequest(
-            job_id=job_id,
-            service_order_id=service_order_id,
-            customer_email=quote_data["request"]["user_email"],
-            files=quote_data["request"]["file_urls"],
-            specifications={
-                "material": quote_data["request"]["material"],
-                "quality": quote_data["request"]["quality"],
-                "priority": quote_data["request"]["priority"],
-                "supports_required": any(fa["supports_required"] for fa in quote_data["file_analyses"]),
-                "special_instructions": order_request.special_instructions
-            },
-            quantity=quote_data["request"]["quantity"],
-            priority=JobPriority(quote_data["request"]["priority"]),
-            estimated_value=quote_data["pricing"]["total"],
-            deadline=datetime.utcnow() + timedelta(days=7)
-        )
-        
-        async with get_makrcave_client() as client:
-            response = await client.post(
-                "/api/v1/jobs/dispatch",
-                json=job_request.dict()
-            )
-            
-            if response.status_code in [200, 201]:
-                job_data = response.json()
-                return {
-                    "success": True,
-                    "job_id": job_id,
-                    "provider": job_data.get("assigned_provider"),
-                    "job_details": job_data
-                }
-            else:
-                logger.error(f"Job dispatch failed: {response.status_code} - {response.text}")
-                return {"success": False, "error": "Job dispatch failed"}
-                
-    except Exception as e:
-        logger.error(f"Job dispatch error: {e}")
-        return {"success": False, "error": str(e)}
+    """Queue job dispatch to the MakrCave provider network in db's transaction"""
+    job_id = str(uuid4())
+    
+    # Prepare job request
+    job_request = ProviderJobRequest(
+        job_id=job_id,
+        service_order_id=service_order_id,
+        customer_email=quote_data["request"]["user_email"],
+        files=quote_data["request"]["file_urls"],
+        specifications={
+            "material": quote_data["request"]["material"],
+            "quality": quote_data["request"]["quality"],
+            "priority": quote_data["request"]["priority"],
+            "supports_required": any(fa["supports_required"] for fa in quote_data["file_analyses"]),
+            "special_instructions": order_request.special_instructions
+        },
+        quantity=quote_data["request"]["quantity"],
+        priority=JobPriority(quote_data["request"]["priority"]),
+        estimated_value=quote_data["pricing"]["total"],
+        deadline=datetime.utcnow() + timedelta(days=7)
+    )
+    
+    enqueue(
+        db, MAKRCAVE, "/api/v1/jobs/dispatch", job_request.dict(),
+        "service_order", service_order_id
+    )
+    enqueue_event(
+        db, "service_order.created",
+        {"service_order_id": service_order_id, "job_id": job_id},
+        "service_order", service_order_id,
+        user_id=quote_data["request"]["user_email"]
+    )
+    return {
+        "success": True,
+        "job_id": job_id,
+        "provider": None,  # assigned by MakrCave once the dispatch is delivered
+        "job_details": {"job_id": job_id, "status": "queued"}
+    }
 
 async def get_job_status_from_makrcave(service_order_id: str) -> Dict[str, Any]:
     """Get job status from MakrCave"""
@@ -836,7 +846,7 @@ async def service_order_stripe_webhook(
     request: Request,
     db: AsyncSession = Depends(get_db),
 ):
-    """Handle Stripe webhook events for service orders"""
+    """Verify Stripe webhook events for service orders and queue them"""
     payload = await request.body()
     signature = request.headers.get("stripe-signature", "")
 
@@ -848,31 +858,11 @@ async def service_order_stripe_webhook(
             status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid signature"
         )
 
+    # Store the raw body; the inbox workers apply it
+    event = json.loads(payload)
     event_type = event.get("type", "")
-    logger.info(f"Processing Stripe webhook: {event_type}")
-
-    if event_type == "payment_intent.succeeded":
-        payment_intent = event["data"]["object"]
-        order_id = payment_intent.get("metadata", {}).get("order_id")
-        if order_id:
-            order = await db.get(Order, order_id)
-            if order:
-                order.status = "paid"
-                order.payment_status = "completed"
-                order.paid_at = datetime.utcnow()
-                order.payment_id = payment_intent["id"]
-                await db.commit()
-    elif event_type == "payment_intent.payment_failed":
-        payment_intent = event["data"]["object"]
-        order_id = payment_intent.get("metadata", {}).get("order_id")
-        if order_id:
-            order = await db.get(Order, order_id)
-            if order:
-                order.payment_status = "failed"
-                order.status = "failed"
-                await db.commit()
-
-    return MessageResponse(message=f"Stripe webhook {event_type} processed successfully")
+    await queue_webhook_event(db, "stripe", event["id"], event_type, event)
+    return MessageResponse(message=f"Stripe webhook {event_type} received")
 
 
 @router.post("/webhook/razorpay", response_model=MessageResponse)
@@ -880,7 +870,7 @@ async def service_order_razorpay_webhook(
     request: Request,
     db: AsyncSession = Depends(get_db),
 ):
-    """Handle Razorpay webhook events for service orders"""
+    """Verify Razorpay webhook events for service orders and queue them"""
     payload = await request.body()
     signature = request.headers.get("x-razorpay-signature", "")
 
@@ -893,29 +883,7 @@ async def service_order_razorpay_webhook(
         )
 
     event_type = event.get("event", "")
-    logger.info(f"Processing Razorpay webhook: {event_type}")
-
-    if event_type == "payment.captured":
-        payment = event["payload"]["payment"]["entity"]
-        order_id = payment.get("notes", {}).get("order_id")
-        if order_id:
-            order = await db.get(Order, order_id)
-            if order:
-                order.status = "paid"
-                order.payment_status = "completed"
-                order.paid_at = datetime.utcnow()
-                order.payment_id = payment["id"]
-                await db.commit()
-    elif event_type == "payment.failed":
-        payment = event["payload"]["payment"]["entity"]
-        order_id = payment.get("notes", {}).get("order_id")
-        if order_id:
-            order = await db.get(Order, order_id)
-            if order:
-                order.payment_status = "failed"
-                order.status = "failed"
-                await db.commit()
-
-    return MessageResponse(
-        message=f"Razorpay webhook {event_type} processed successfully"
+    await queue_webhook_event(
+        db, "razorpay", razorpay_event_id(request, payload), event_type, event
     )
+    return MessageResponse(message=f"Razorpay webhook {event_type} received")
@@ -45,6 +45,7 @@ class CategoryCreate(CategoryBase):
 
 class CategoryUpdate(BaseModel):
     name: Optional[str] = Field(None, min_length=1, max_length=255)
+    slug: Optional[str] = Field(None, min_length=1, max_length=255)
     description: Optional[str] = None
     parent_id: Optional[int] = None
     image_url: Optional[str] = None
@@ -167,6 +168,7 @@ class CartItemUpdate(BaseModel):
 class CartItem(CartItemBase, TimestampMixin):
     id: int
     cart_id: uuid.UUID
+    variant_id: Optional[int] = None
     unit_price: Decimal
     total_price: Decimal
     product: Optional[Product] = None
@@ -335,6 +337,7 @@ class ProductSort(str, Enum):
     CREATED_DESC = "created_desc"
     POPULARITY = "popularity"
     RATING = "rating"
+    RELEVANCE = "relevance"  # Full-text rank; needs a search query
 
 class ProductSearch(BaseModel):
     q: Optional[str] = Field(None, max_length=255)  # Search query
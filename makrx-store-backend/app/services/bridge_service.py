@@ -1,8 +1,10 @@
 """Bridge service for integrating Store with MakrCave providers"""
 import os
 import asyncio
+import time
 import aiohttp
 import json
+import numpy as np
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional, Any
 from enum import Enum
@@ -67,6 +69,76 @@ class BridgeResponse(BaseModel):
     search_criteria: Dict[str, Any]
     alternatives: List[str] = []  # Alternative suggestions
 
+EARTH_RADIUS_KM = 6371.0
+
+def haversine_km(lat: float, lng: float, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+    """Great-circle distance in km from one point to arrays of points (NaN propagates)"""
+    phi1 = np.radians(lat)
+    phi2 = np.radians(lats)
+    dphi = phi2 - phi1
+    dlambda = np.radians(lngs - lng)
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi1) * np.cos(phi2) * np.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+class ProviderTable:
+    """Column arrays for one service type's providers, built once per cache refresh
+
+    Each capability row of the service type becomes one entry; rows are
+    grouped by provider so per-provider maxima can be taken with reduceat.
+    """
+
+    def __init__(self, providers: List[Provider], service_type: ServiceType):
+        self.providers = providers
+        self.fetched_at = time.monotonic()
+        # Set when this entry is a fallback after a failed fetch: no refetch
+        # (refresh-ahead included) is attempted before this monotonic time
+        self.retry_after = 0.0
+
+        capabilities = []
+        owners = []
+        for index, provider in enumerate(providers):
+            for capability in provider.capabilities:
+                if capability.service_type == service_type:
+                    capabilities.append(capability)
+                    owners.append(index)
+
+        self.capabilities = capabilities
+        self.owner = np.array(owners, dtype=np.int64)
+        # Providers with at least one matching capability, and where their rows start
+        self.provider_index, self.group_start = np.unique(self.owner, return_index=True)
+
+        def dimension(field: str, axis: str, default: float) -> np.ndarray:
+            return np.array(
+                [getattr(cap, field).get(axis, default) for cap in capabilities], dtype=float
+            )
+
+        self.max_length = dimension("max_dimensions", "length", np.inf)
+        self.max_width = dimension("max_dimensions", "width", np.inf)
+        self.max_height = dimension("max_dimensions", "height", np.inf)
+        self.min_length = dimension("min_dimensions", "length", 0.0)
+        self.min_width = dimension("min_dimensions", "width", 0.0)
+        self.min_height = dimension("min_dimensions", "height", 0.0)
+        self.precision = np.array([cap.precision for cap in capabilities], dtype=float)
+        self.lead_time_hours = np.array([cap.lead_time_hours for cap in capabilities], dtype=float)
+
+        self.material_rows: Dict[str, List[int]] = {}
+        for row, capability in enumerate(capabilities):
+            for material in set(capability.materials):
+                self.material_rows.setdefault(material, []).append(row)
+
+        # Provider-level columns for providers that have a matching capability
+        candidates = [providers[i] for i in self.provider_index]
+        self.rating = np.array([p.rating for p in candidates], dtype=float)
+        self.total_orders = np.array([p.total_orders for p in candidates], dtype=float)
+        self.success_rate = np.array([p.success_rate for p in candidates], dtype=float)
+        coordinates = [p.location.get("coordinates") or {} for p in candidates]
+        self.lat = np.array([c.get("lat", np.nan) for c in coordinates], dtype=float)
+        self.lng = np.array([c.get("lng", np.nan) for c in coordinates], dtype=float)
+
+    @property
+    def age(self) -> float:
+        return time.monotonic() - self.fetched_at
+
 class BridgeService:
     """Service to bridge Store orders with MakrCave providers"""
     
@@ -75,9 +147,17 @@ class BridgeService:
         self.api_key = os.getenv("BRIDGE_API_KEY", "")
         self.timeout = 30  # seconds
         
-        # Provider cache
-        self._provider_cache = {}
-        self._cache_expiry = None
+        # Provider cache: one entry per service type, refreshed in the
+        # background once it is refresh_ahead_ratio of the way to expiry
+        self.cache_ttl = int(os.getenv("BRIDGE_PROVIDER_CACHE_TTL", "900"))  # seconds
+        self.refresh_ahead_ratio = 0.8
+        self.failure_retry_seconds = 60
+        self._provider_cache: Dict[ServiceType, ProviderTable] = {}
+        self._cache_locks: Dict[ServiceType, asyncio.Lock] = {}
+        self._refresh_tasks: Dict[ServiceType, asyncio.Task] = {}
+        
+        # Shared HTTP session, created on first use
+        self._session: Optional[aiohttp.ClientSession] = None
         
         # Service type mapping
         self.service_mapping = {
@@ -102,9 +182,9 @@ class BridgeService:
         """Find suitable providers for a service request"""
         try:
             # Get available providers
-            providers = await self._get_providers(service_request.service_type)
+            table = await self._get_provider_table(service_request.service_type)
             
-            if not providers:
+            if not table.providers:
                 return BridgeResponse(
                     matches=[],
                     total_matches=0,
@@ -112,15 +192,18 @@ class BridgeService:
                     alternatives=["No providers available for this service type"]
                 )
             
-            # Score and match providers
-            matches = []
-            for provider in providers:
-                match = await self._evaluate_provider_match(provider, service_request)
-                if match and match.compatibility_score > 50:  # Minimum threshold
-                    matches.append(match)
+            # Score all candidates at once and rank those above the minimum threshold
+            scores, best_rows = self._score_providers(table, service_request)
+            ranked = np.argsort(-scores, kind="stable")
+            ranked = ranked[scores[ranked] > 50]
             
-            # Sort by compatibility score
-            matches.sort(key=lambda x: x.compatibility_score, reverse=True)
+            # Only the top 10 matches need costing and explanations
+            matches = [
+                await self._build_provider_match(
+                    table, int(candidate), int(best_rows[candidate]), float(scores[candidate]), service_request
+                )
+                for candidate in ranked[:10]
+            ]
             
             # Generate alternatives if no good matches
             alternatives = []
@@ -128,8 +211,8 @@ class BridgeService:
                 alternatives = await self._generate_alternatives(service_request)
             
             return BridgeResponse(
-                matches=matches[:10],  # Top 10 matches
-                total_matches=len(matches),
+                matches=matches,
+                total_matches=len(ranked),
                 search_criteria=service_request.dict(),
                 alternatives=alternatives
             )
@@ -138,46 +221,104 @@ class BridgeService:
             logger.error(f"Provider search failed: {e}")
             raise
     
-    async def _get_providers(self, service_type: ServiceType) -> List[Provider]:
-        """Get providers from MakrCave API with caching"""
-        try:
-            # Check cache
-            if (self._cache_expiry and 
-                datetime.now() < self._cache_expiry and 
-                service_type in self._provider_cache):
-                return self._provider_cache[service_type]
-            
-            # Fetch from MakrCave API
-            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout)) as session:
-                headers = {
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Shared HTTP session for MakrCave API calls"""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={
                     "Authorization": f"Bearer {self.api_key}",
                     "Content-Type": "application/json"
                 }
-                
-                async with session.get(
-                    f"{self.makrcave_api_base}/api/v1/providers",
-                    headers=headers,
-                    params={"service_type": service_type, "active_only": True}
-                ) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        providers = [Provider(**provider) for provider in data.get("providers", [])]
-                        
-                        # Cache results
-                        self._provider_cache[service_type] = providers
-                        self._cache_expiry = datetime.now() + timedelta(minutes=15)
-                        
-                        return providers
-                    else:
-                        logger.warning(f"Failed to fetch providers: {response.status}")
-                        return []
-                        
+            )
+        return self._session
+    
+    async def close(self):
+        """Stop background refreshes and close the shared HTTP session"""
+        for task in self._refresh_tasks.values():
+            task.cancel()
+        self._refresh_tasks.clear()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+    
+    async def _get_providers(self, service_type: ServiceType) -> List[Provider]:
+        """Get providers from MakrCave API with caching"""
+        table = await self._get_provider_table(service_type)
+        return table.providers
+    
+    async def _get_provider_table(self, service_type: ServiceType) -> ProviderTable:
+        """Cached providers for a service type, refreshed ahead of expiry"""
+        table = self._provider_cache.get(service_type)
+        if table and table.age < self.cache_ttl:
+            if table.retry_after:
+                refresh_due = time.monotonic() >= table.retry_after
+            else:
+                refresh_due = table.age >= self.cache_ttl * self.refresh_ahead_ratio
+            if refresh_due:
+                self._schedule_refresh(service_type)
+            return table
+        
+        # Expired or missing: fetch once even if several requests arrive together
+        lock = self._cache_locks.setdefault(service_type, asyncio.Lock())
+        async with lock:
+            table = self._provider_cache.get(service_type)
+            if table and table.age < self.cache_ttl:
+                return table
+            return await self._refresh_providers(service_type)
+    
+    def _schedule_refresh(self, service_type: ServiceType):
+        task = self._refresh_tasks.get(service_type)
+        if task is None or task.done():
+            self._refresh_tasks[service_type] = asyncio.create_task(
+                self._refresh_in_background(service_type)
+            )
+    
+    async def _refresh_in_background(self, service_type: ServiceType):
+        lock = self._cache_locks.setdefault(service_type, asyncio.Lock())
+        async with lock:
+            await self._refresh_providers(service_type)
+    
+    async def _refresh_providers(self, service_type: ServiceType) -> ProviderTable:
+        """Fetch providers for one service type and replace its cache entry
+
+        On failure the previous entry's providers (or the fallback providers)
+        are cached as a fresh entry whose retry_after holds off every refetch
+        for failure_retry_seconds; after that the next request refreshes it
+        in the background while the entry keeps being served.
+        """
+        try:
+            providers = await self._fetch_providers(service_type)
         except asyncio.TimeoutError:
             logger.warning("Provider API timeout - using fallback")
-            return await self._get_fallback_providers(service_type)
+            providers = None
         except Exception as e:
             logger.error(f"Provider fetch error: {e}")
-            return await self._get_fallback_providers(service_type)
+            providers = None
+        
+        if providers is not None:
+            table = ProviderTable(providers, service_type)
+        else:
+            stale = self._provider_cache.get(service_type)
+            fallback = stale.providers if stale else await self._get_fallback_providers(service_type)
+            table = ProviderTable(fallback, service_type)
+            table.retry_after = time.monotonic() + self.failure_retry_seconds
+        
+        self._provider_cache[service_type] = table
+        return table
+    
+    async def _fetch_providers(self, service_type: ServiceType) -> Optional[List[Provider]]:
+        """Fetch providers from the MakrCave API (None on a non-200 response)"""
+        session = await self._get_session()
+        async with session.get(
+            f"{self.makrcave_api_base}/api/v1/providers",
+            params={"service_type": service_type.value, "active_only": "true"}
+        ) as response:
+            if response.status == 200:
+                data = await response.json()
+                return [Provider(**provider) for provider in data.get("providers", [])]
+            logger.warning(f"Failed to fetch providers: {response.status}")
+            return None
     
     async def _get_fallback_providers(self, service_type: ServiceType) -> List[Provider]:
         """Get fallback/mock providers when API is unavailable"""
@@ -240,149 +381,102 @@ class BridgeService:
         return [p for p in mock_providers 
                 if any(cap.service_type == service_type for cap in p.capabilities)]
     
-    async def _evaluate_provider_match(self, provider: Provider, request: ServiceRequest) -> Optional[ProviderMatch]:
-        """Evaluate how well a provider matches the request"""
-        try:
-            # Find matching capabilities
-            matching_capabilities = [
-                cap for cap in provider.capabilities 
-                if cap.service_type == request.service_type
-            ]
-            
-            if not matching_capabilities:
-                return None
-            
-            # Use best matching capability
-            capability = max(matching_capabilities, key=lambda x: self._score_capability(x, request))
-            
-            # Calculate compatibility score
-            score = await self._calculate_compatibility_score(provider, capability, request)
-            
-            if score < 50:  # Minimum threshold
-                return None
-            
-            # Estimate cost and delivery
-            estimated_cost = await self._estimate_cost(capability, request)
-            estimated_delivery = await self._estimate_delivery_time(provider, capability, request)
-            
-            # Generate reasons and constraints
-            reasons = self._generate_match_reasons(provider, capability, request, score)
-            constraints = self._identify_constraints(capability, request)
-            
-            return ProviderMatch(
-                provider=provider,
-                compatibility_score=score,
-                estimated_cost=estimated_cost,
-                estimated_delivery=estimated_delivery,
-                reasons=reasons,
-                constraints=constraints
-            )
-            
-        except Exception as e:
-            logger.error(f"Provider evaluation failed: {e}")
-            return None
-    
-    def _score_capability(self, capability: ProviderCapability, request: ServiceRequest) -> float:
-        """Score a capability against request requirements"""
-        score = 0.0
+    def _score_providers(self, table: ProviderTable, request: ServiceRequest):
+        """Compatibility scores (0-100) for every candidate provider in one pass
+
+        Returns the per-candidate scores and, for each candidate, the row of
+        its best scoring capability.
+        """
+        rows = len(table.capabilities)
+        if rows == 0:
+            return np.zeros(0), np.zeros(0, dtype=np.int64)
+        
+        capability_score = np.zeros(rows)
         
         # Material compatibility
         required_material = request.requirements.get("material", "").upper()
-        if required_material in capability.materials:
-            score += 30
+        capability_score[table.material_rows.get(required_material, [])] += 30
         
         # Dimension compatibility
-        file_analysis = request.file_analysis
-        dimensions = file_analysis.get("dimensions", {})
-        
+        dimensions = request.file_analysis.get("dimensions", {})
         if dimensions:
             length = dimensions.get("length_mm", 0)
             width = dimensions.get("width_mm", 0)
             height = dimensions.get("height_mm", 0)
             
             # Check if dimensions fit
-            if (length <= capability.max_dimensions.get("length", float('inf')) and
-                width <= capability.max_dimensions.get("width", float('inf')) and
-                height <= capability.max_dimensions.get("height", float('inf'))):
-                score += 25
+            fits = (length <= table.max_length) & (width <= table.max_width) & (height <= table.max_height)
+            capability_score += np.where(fits, 25, 0)
             
             # Check minimum dimensions
-            if (length >= capability.min_dimensions.get("length", 0) and
-                width >= capability.min_dimensions.get("width", 0) and
-                height >= capability.min_dimensions.get("height", 0)):
-                score += 15
+            above_minimum = (length >= table.min_length) & (width >= table.min_width) & (height >= table.min_height)
+            capability_score += np.where(above_minimum, 15, 0)
         
         # Precision requirements
         required_precision = request.requirements.get("precision", 0.5)
-        if capability.precision <= required_precision:
-            score += 20
+        capability_score += np.where(table.precision <= required_precision, 20, 0)
         
         # Lead time compatibility
         urgency_hours = {"low": 168, "normal": 72, "high": 24, "urgent": 12}
         required_hours = urgency_hours.get(request.urgency, 72)
-        if capability.lead_time_hours <= required_hours:
-            score += 10
+        capability_score += np.where(table.lead_time_hours <= required_hours, 10, 0)
         
-        return score
-    
-    async def _calculate_compatibility_score(self, provider: Provider, capability: ProviderCapability, request: ServiceRequest) -> float:
-        """Calculate overall compatibility score"""
-        score = 0.0
+        # Best capability per provider (first one on ties)
+        best_capability = np.maximum.reduceat(capability_score, table.group_start)
+        group = np.searchsorted(table.group_start, np.arange(rows), side="right") - 1
+        row_or_sentinel = np.where(capability_score == best_capability[group], np.arange(rows), rows)
+        best_rows = np.minimum.reduceat(row_or_sentinel, table.group_start)
         
-        # Base capability score
-        capability_score = self._score_capability(capability, request)
-        score += capability_score * 0.4  # 40% weight
-        
-        # Provider reputation
-        reputation_score = (provider.rating / 5.0) * 100
-        score += reputation_score * 0.2  # 20% weight
-        
-        # Experience score
-        experience_score = min(100, provider.total_orders / 10)  # 1 point per 10 orders, max 100
-        score += experience_score * 0.15  # 15% weight
-        
-        # Success rate
-        success_score = provider.success_rate * 100
-        score += success_score * 0.15  # 15% weight
+        # Base capability score (40%), reputation (20%), experience (15%, 1 point
+        # per 10 orders), success rate (15%), proximity (10%)
+        score = best_capability * 0.4
+        score += (table.rating / 5.0) * 100 * 0.2
+        score += np.minimum(100, table.total_orders / 10) * 0.15
+        score += table.success_rate * 100 * 0.15
         
         # Location proximity (if customer location provided)
         if request.customer_location:
-            proximity_score = await self._calculate_proximity_score(provider, request.customer_location)
-            score += proximity_score * 0.1  # 10% weight
+            score += self._proximity_scores(table, request.customer_location) * 0.1
         
-        return min(100, score)
+        return np.minimum(100, score), best_rows
     
-    async def _calculate_proximity_score(self, provider: Provider, customer_location: Dict[str, Any]) -> float:
-        """Calculate proximity score based on distance"""
+    def _proximity_scores(self, table: ProviderTable, customer_location: Dict[str, Any]) -> np.ndarray:
+        """Proximity score per candidate from great-circle distance"""
+        customer_coords = customer_location.get("coordinates") or {}
         try:
-            # Get coordinates
-            provider_coords = provider.location.get("coordinates", {})
-            customer_coords = customer_location.get("coordinates", {})
-            
-            if not (provider_coords and customer_coords):
-                return 50  # Neutral score if coordinates missing
-            
-            # Calculate approximate distance (simplified)
-            lat_diff = abs(provider_coords["lat"] - customer_coords["lat"])
-            lng_diff = abs(provider_coords["lng"] - customer_coords["lng"])
-            
-            # Rough distance calculation (not accurate, but good enough for scoring)
-            distance_km = ((lat_diff ** 2 + lng_diff ** 2) ** 0.5) * 111  # 111 km per degree
-            
-            # Score based on distance (closer = higher score)
-            if distance_km < 10:
-                return 100
-            elif distance_km < 50:
-                return 80
-            elif distance_km < 200:
-                return 60
-            elif distance_km < 500:
-                return 40
-            else:
-                return 20
-                
-        except Exception:
-            return 50  # Neutral score on error
+            lat = float(customer_coords["lat"])
+            lng = float(customer_coords["lng"])
+        except (KeyError, TypeError, ValueError):
+            return np.full(len(table.lat), 50.0)  # Neutral score if coordinates missing
+        
+        distance_km = haversine_km(lat, lng, table.lat, table.lng)
+        
+        # Score based on distance (closer = higher score)
+        scores = np.select(
+            [distance_km < 10, distance_km < 50, distance_km < 200, distance_km < 500],
+            [100.0, 80.0, 60.0, 40.0],
+            default=20.0
+        )
+        return np.where(np.isnan(distance_km), 50.0, scores)
+    
+    async def _build_provider_match(self, table: ProviderTable, candidate: int, row: int,
+                                    score: float, request: ServiceRequest) -> ProviderMatch:
+        """Cost, delivery estimate and explanation for a scored candidate"""
+        provider = table.providers[table.provider_index[candidate]]
+        capability = table.capabilities[row]
+        
+        # Estimate cost and delivery
+        estimated_cost = await self._estimate_cost(capability, request)
+        estimated_delivery = await self._estimate_delivery_time(provider, capability, request)
+        
+        return ProviderMatch(
+            provider=provider,
+            compatibility_score=score,
+            estimated_cost=estimated_cost,
+            estimated_delivery=estimated_delivery,
+            reasons=self._generate_match_reasons(provider, capability, request, score),
+            constraints=self._identify_constraints(capability, request)
+        )
     
     async def _estimate_cost(self, capability: ProviderCapability, request: ServiceRequest) -> float:
         """Estimate cost based on capability and request"""
@@ -559,36 +653,30 @@ class BridgeService:
     async def create_service_order(self, provider_id: str, quote_data: Dict[str, Any], customer_data: Dict[str, Any]) -> Dict[str, Any]:
         """Create a service order with selected provider"""
         try:
-            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout)) as session:
-                headers = {
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                }
-                
-                order_data = {
-                    "provider_id": provider_id,
-                    "quote_data": quote_data,
-                    "customer_data": customer_data,
-                    "created_via": "store_bridge",
-                    "priority": quote_data.get("urgency", "normal")
-                }
-                
-                async with session.post(
-                    f"{self.makrcave_api_base}/api/v1/service-orders",
-                    headers=headers,
-                    json=order_data
-                ) as response:
-                    if response.status == 201:
-                        order = await response.json()
-                        
-                        # Send notifications
-                        await self._notify_order_created(order, customer_data)
-                        
-                        return order
-                    else:
-                        error = await response.text()
-                        raise Exception(f"Service order creation failed: {error}")
-                        
+            session = await self._get_session()
+            order_data = {
+                "provider_id": provider_id,
+                "quote_data": quote_data,
+                "customer_data": customer_data,
+                "created_via": "store_bridge",
+                "priority": quote_data.get("urgency", "normal")
+            }
+            
+            async with session.post(
+                f"{self.makrcave_api_base}/api/v1/service-orders",
+                json=order_data
+            ) as response:
+                if response.status == 201:
+                    order = await response.json()
+                    
+                    # Send notifications
+                    await self._notify_order_created(order, customer_data)
+                    
+                    return order
+                else:
+                    error = await response.text()
+                    raise Exception(f"Service order creation failed: {error}")
+                    
         except Exception as e:
             logger.error(f"Service order creation failed: {e}")
             raise
@@ -637,21 +725,15 @@ class BridgeService:
     async def get_order_status(self, order_id: str) -> Dict[str, Any]:
         """Get status of a service order"""
         try:
-            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=self.timeout)) as session:
-                headers = {
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                }
-                
-                async with session.get(
-                    f"{self.makrcave_api_base}/api/v1/service-orders/{order_id}",
-                    headers=headers
-                ) as response:
-                    if response.status == 200:
-                        return await response.json()
-                    else:
-                        raise Exception(f"Order not found: {order_id}")
-                        
+            session = await self._get_session()
+            async with session.get(
+                f"{self.makrcave_api_base}/api/v1/service-orders/{order_id}"
+            ) as response:
+                if response.status == 200:
+                    return await response.json()
+                else:
+                    raise Exception(f"Order not found: {order_id}")
+                    
         except Exception as e:
             logger.error(f"Order status check failed: {e}")
             raise
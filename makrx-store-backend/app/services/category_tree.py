@@ -0,0 +1,159 @@
+"""
+Versioned in-process cache of the category tree
+The whole categories table is loaded once and served as pre-serialized
+nodes with id and materialized-path lookups. Each worker re-checks a cheap
+table version (row count + latest change timestamp) at most every
+version_check_interval seconds, and local category writes invalidate
+immediately, so tree, path and breadcrumb reads do not hit the database.
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select
+
+logger = logging.getLogger(__name__)
+
+PATH_SEPARATOR = "/"
+
+def child_path(parent_path: Optional[str], slug: str) -> str:
+    """Materialized path of a category with this slug under parent_path"""
+    return f"{parent_path}{PATH_SEPARATOR}{slug}" if parent_path else slug
+
+class CategoryTree:
+    """Immutable snapshot of the category hierarchy
+
+    Nodes are plain dicts shaped like the Category response schema plus
+    path/level, with nested "children". They are shared between requests,
+    so callers must treat them as read-only.
+    """
+
+    def __init__(self, rows: List[Dict[str, Any]], version: Tuple):
+        self.version = version
+        self.nodes = self._build(rows, include_inactive=True)
+        self.active_nodes = self._build(rows, include_inactive=False)
+        self.by_path = {node["path"]: node for node in self.nodes.values() if node["path"]}
+        self.roots = self._roots(self.nodes)
+        self.active_roots = self._roots(self.active_nodes)
+
+    @staticmethod
+    def _build(rows: List[Dict[str, Any]], include_inactive: bool) -> Dict[int, Dict[str, Any]]:
+        nodes = {
+            row["id"]: dict(row, children=[])
+            for row in rows
+            if include_inactive or row["is_active"]
+        }
+        for node in nodes.values():
+            parent = nodes.get(node["parent_id"])
+            if parent is not None:
+                parent["children"].append(node)
+        if not include_inactive:
+            # Drop active categories stranded under an inactive ancestor
+            reachable = {}
+            stack = [node for node in nodes.values() if node["parent_id"] is None]
+            while stack:
+                node = stack.pop()
+                reachable[node["id"]] = node
+                stack.extend(node["children"])
+            nodes = reachable
+        for node in nodes.values():
+            node["children"].sort(key=lambda child: (child["sort_order"] or 0, child["name"]))
+        return nodes
+
+    @staticmethod
+    def _roots(nodes: Dict[int, Dict[str, Any]]) -> List[Dict[str, Any]]:
+        roots = [node for node in nodes.values() if node["parent_id"] is None]
+        roots.sort(key=lambda node: (node["sort_order"] or 0, node["name"]))
+        return roots
+
+    def ancestors(self, category_id: int) -> List[Dict[str, Any]]:
+        """Breadcrumb from the root down to category_id (empty if unknown)"""
+        path = []
+        node = self.nodes.get(category_id)
+        while node is not None and len(path) <= len(self.nodes):
+            path.append(node)
+            node = self.nodes.get(node["parent_id"])
+        path.reverse()
+        return path
+
+    def descendant_ids(self, category_id: int, include_inactive: bool = False) -> List[int]:
+        """category_id and every category below it"""
+        nodes = self.nodes if include_inactive else self.active_nodes
+        root = nodes.get(category_id)
+        if root is None:
+            return []
+        ids = []
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            ids.append(node["id"])
+            stack.extend(node["children"])
+        return ids
+
+class CategoryTreeCache:
+    """Process-local category tree, refreshed when the table version changes"""
+
+    def __init__(self, version_check_interval: float = 5.0):
+        self.version_check_interval = version_check_interval
+        self._tree: Optional[CategoryTree] = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def get(self, max_age: Optional[float] = None) -> CategoryTree:
+        """The current tree; max_age tightens the version check interval for this read"""
+        interval = self.version_check_interval if max_age is None else min(max_age, self.version_check_interval)
+        tree = self._tree
+        if tree is not None and time.monotonic() - self._checked_at < interval:
+            return tree
+
+        async with self._lock:
+            if self._tree is not None and time.monotonic() - self._checked_at < interval:
+                return self._tree
+
+            from app.core.db import AsyncSessionLocal
+
+            async with AsyncSessionLocal() as db:
+                version = await self._version(db)
+                if self._tree is None or self._tree.version != version:
+                    self._tree = CategoryTree(await self._load(db), version)
+                    logger.info(f"Category tree cache rebuilt ({len(self._tree.nodes)} categories)")
+            self._checked_at = time.monotonic()
+            return self._tree
+
+    def invalidate(self) -> None:
+        """Force a version check on the next read (call after category writes)"""
+        self._checked_at = 0.0
+
+    @staticmethod
+    async def _version(db) -> Tuple:
+        from app.models.commerce import Category
+
+        result = await db.execute(
+            select(
+                func.count(Category.id),
+                func.max(func.coalesce(Category.updated_at, Category.created_at)),
+                func.max(Category.created_at),
+            )
+        )
+        return tuple(result.one())
+
+    @staticmethod
+    async def _load(db) -> List[Dict[str, Any]]:
+        from app.models.commerce import Category
+
+        columns = [
+            Category.id, Category.name, Category.slug, Category.path, Category.level,
+            Category.description, Category.parent_id, Category.image_url,
+            Category.banner_image, Category.sort_order, Category.is_active,
+            Category.is_featured, Category.created_at, Category.updated_at,
+        ]
+        result = await db.execute(select(*columns))
+        return [dict(row._mapping) for row in result]
+
+# Global category tree cache
+category_tree = CategoryTreeCache(
+    version_check_interval=float(os.getenv("CATEGORY_TREE_VERSION_CHECK_SECONDS", "5"))
+)
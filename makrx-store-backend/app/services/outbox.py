@@ -0,0 +1,375 @@
+"""
+Transactional outbox for calls to MakrCave and the event service
+Code that changes orders or service orders adds an outbox message to the
+same session with enqueue(), so the message is committed together with the
+change or not at all. A pool of relay workers delivers committed messages
+over shared HTTP clients, retrying with exponential backoff. Messages of one
+aggregate (an order, a service order) are delivered strictly in order: a
+message is only claimed once every earlier message of its aggregate has
+been sent or given up on.
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from uuid import UUID
+
+import httpx
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import and_, delete, event, exists, or_, select, update
+from sqlalchemy.orm import Session, aliased
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+MAKRCAVE = "makrcave"
+EVENT_SERVICE = "event_service"
+
+PENDING = "pending"
+PROCESSING = "processing"
+SENT = "sent"
+FAILED = "failed"  # gave up after max_attempts; no longer blocks its aggregate
+
+# MakrCave bridge endpoint that publishes a paid service order as a job
+CAVE_PUBLISH_PATH = "/api/v1/bridge/jobs/publish"
+
+def enqueue(db, destination: str, topic: str, payload: Dict[str, Any],
+            aggregate_type: str, aggregate_id: Any):
+    """Add a message to db's transaction; it is sent after the commit
+
+    payload is stored through jsonable_encoder (datetimes, decimals and
+    enums become JSON). For MakrCave, topic is the API path the payload is
+    POSTed to.
+    """
+    from app.models.admin import OutboxMessage
+
+    message = OutboxMessage(
+        aggregate_type=aggregate_type,
+        aggregate_id=str(aggregate_id),
+        destination=destination,
+        topic=topic,
+        payload=jsonable_encoder(payload),
+        status=PENDING,
+        attempts=0,
+    )
+    db.add(message)
+    db.info["outbox_pending"] = True
+    return message
+
+def enqueue_event(db, event_type: str, payload: Dict[str, Any], aggregate_type: str,
+                  aggregate_id: Any, user_id: Optional[str] = None,
+                  target_services: Optional[List[str]] = None):
+    """Queue an event for the event service (see its Event model)"""
+    return enqueue(
+        db,
+        EVENT_SERVICE,
+        event_type,
+        {
+            "type": event_type,
+            "source_service": "store",
+            "target_services": target_services or ["makrcave"],
+            "user_id": user_id,
+            "payload": payload,
+        },
+        aggregate_type,
+        aggregate_id,
+    )
+
+@event.listens_for(Session, "after_commit")
+def _wake_relay(session):
+    if session.info.pop("outbox_pending", False):
+        outbox_relay.notify()
+
+@event.listens_for(Session, "after_rollback")
+def _discard_pending(session):
+    session.info.pop("outbox_pending", None)
+
+# ==========================================
+# Delivery hooks
+# ==========================================
+
+async def record_cave_job(db, message, response: Dict[str, Any]) -> None:
+    """Store the MakrCave job of a published service order"""
+    from app.models.services import ServiceOrder
+
+    service_order = await db.get(ServiceOrder, UUID(message.aggregate_id), with_for_update=True)
+    if service_order is None:
+        return
+    service_order.status = "dispatched"
+    service_order.tracking = {
+        **(service_order.tracking or {}),
+        "makrcave_job_id": response.get("job_id"),
+        "provider_accept_url": response.get("accept_url"),
+    }
+    service_order.routed_at = datetime.now(timezone.utc)
+    enqueue_event(
+        db,
+        "service_order.dispatched",
+        {"service_order_id": message.aggregate_id, "job_id": response.get("job_id")},
+        "service_order",
+        message.aggregate_id,
+    )
+    logger.info(f"Dispatched service order {message.aggregate_id} to MakrCave job {response.get('job_id')}")
+
+async def release_cave_publish(db, message, error: str) -> None:
+    """Put a service order whose MakrCave publish was given up on back to "paid"
+
+    Both dispatch paths skip "publishing" service orders, so left there it
+    would never be published. Back at "paid", the publish-to-cave endpoint
+    queues it again.
+    """
+    from app.models.services import ServiceOrder
+
+    service_order = await db.get(ServiceOrder, UUID(message.aggregate_id), with_for_update=True)
+    if service_order is None or service_order.status != "publishing":
+        return
+    service_order.status = "paid"
+    service_order.tracking = {
+        **(service_order.tracking or {}),
+        "makrcave_publish_error": error,
+        "makrcave_publish_failed_at": datetime.now(timezone.utc).isoformat(),
+    }
+    enqueue_event(
+        db,
+        "service_order.publish_failed",
+        {"service_order_id": message.aggregate_id, "error": error},
+        "service_order",
+        message.aggregate_id,
+    )
+    logger.error(f"Publishing service order {message.aggregate_id} to MakrCave failed; reset to paid")
+
+# Run after a message is delivered, in one transaction with marking it sent
+DELIVERY_HOOKS: Dict[str, Callable[..., Awaitable[None]]] = {
+    CAVE_PUBLISH_PATH: record_cave_job,
+}
+
+# Run with the last error when a message is given up on, in one transaction
+# with marking it failed
+FAILURE_HOOKS: Dict[str, Callable[..., Awaitable[None]]] = {
+    CAVE_PUBLISH_PATH: release_cave_publish,
+}
+
+# ==========================================
+# Relay
+# ==========================================
+
+class OutboxRelay:
+    """Delivers committed outbox messages with a pool of async workers
+
+    Every app worker runs the pool; SKIP LOCKED and the per-aggregate
+    ordering rule keep them from sending a message twice or out of order.
+    Commits that wrote messages in this process wake the pool immediately,
+    others are found by polling.
+    """
+
+    def __init__(self, workers: int = 4, batch_size: int = 20, poll_seconds: float = 5.0,
+                 lock_seconds: int = 300, max_attempts: int = 12, retention_days: int = 7):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.lock_seconds = lock_seconds
+        self.max_attempts = max_attempts
+        self.retention_days = retention_days
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    def _client(self, destination: str) -> httpx.AsyncClient:
+        client = self._clients.get(destination)
+        if client is None:
+            if destination == MAKRCAVE:
+                base_url = os.getenv("MAKRCAVE_API_URL", settings.SERVICE_MAKRCAVE_URL)
+            elif destination == EVENT_SERVICE:
+                base_url = os.getenv("EVENT_SERVICE_URL", settings.SERVICE_EVENTS_URL)
+            else:
+                raise ValueError(f"Unknown outbox destination {destination}")
+            client = httpx.AsyncClient(
+                base_url=base_url,
+                timeout=30.0,
+                headers={
+                    "Content-Type": "application/json",
+                    "Authorization": f"Bearer {settings.SERVICE_TOKEN}",
+                },
+            )
+            self._clients[destination] = client
+        return client
+
+    async def claim(self, db) -> list:
+        """Claim due messages that are first in line for their aggregate"""
+        from app.models.admin import OutboxMessage
+
+        now = datetime.now(timezone.utc)
+        earlier = aliased(OutboxMessage)
+        blocked = exists().where(
+            earlier.aggregate_type == OutboxMessage.aggregate_type,
+            earlier.aggregate_id == OutboxMessage.aggregate_id,
+            earlier.id < OutboxMessage.id,
+            earlier.status.in_([PENDING, PROCESSING]),
+        )
+        due = (
+            select(OutboxMessage.id)
+            .where(
+                or_(
+                    and_(OutboxMessage.status == PENDING, OutboxMessage.next_attempt_at <= now),
+                    and_(OutboxMessage.status == PROCESSING, OutboxMessage.locked_until < now),
+                ),
+                ~blocked,
+            )
+            .order_by(OutboxMessage.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        result = await db.execute(
+            update(OutboxMessage)
+            .where(OutboxMessage.id.in_(due.scalar_subquery()))
+            .values(
+                status=PROCESSING,
+                locked_until=now + timedelta(seconds=self.lock_seconds),
+                attempts=OutboxMessage.attempts + 1,
+            )
+            .returning(
+                OutboxMessage.id, OutboxMessage.aggregate_type, OutboxMessage.aggregate_id,
+                OutboxMessage.destination, OutboxMessage.topic, OutboxMessage.payload,
+                OutboxMessage.attempts,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        messages = result.all()
+        await db.commit()
+        return messages
+
+    async def send(self, message) -> Dict[str, Any]:
+        client = self._client(message.destination)
+        if message.destination == MAKRCAVE:
+            # MakrCave maps a service order to a single job, so a repeated
+            # delivery returns the job created by the first one
+            response = await client.post(
+                message.topic, json=message.payload,
+                headers={"Idempotency-Key": f"store-outbox-{message.id}"},
+            )
+        else:
+            response = await client.post("/events/publish", json=message.payload)
+        response.raise_for_status()
+        try:
+            return response.json()
+        except ValueError:
+            return {}
+
+    async def deliver(self, message) -> bool:
+        """Send one claimed message and record the outcome"""
+        from app.core.db import AsyncSessionLocal
+        from app.models.admin import OutboxMessage
+
+        error = None
+        response = None
+        try:
+            response = await self.send(message)
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            logger.error(
+                f"Outbox message {message.id} ({message.destination} {message.topic}) "
+                f"failed (attempt {message.attempts}): {error}"
+            )
+
+        now = datetime.now(timezone.utc)
+        if error is None:
+            values = {"status": SENT, "sent_at": now, "locked_until": None, "last_error": None, "response": response}
+        elif message.attempts >= self.max_attempts:
+            values = {"status": FAILED, "locked_until": None, "last_error": error}
+            logger.error(f"Gave up on outbox message {message.id} for {message.aggregate_type} {message.aggregate_id}")
+        else:
+            backoff = min(2 ** message.attempts * 5, 3600)
+            values = {
+                "status": PENDING,
+                "next_attempt_at": now + timedelta(seconds=backoff),
+                "locked_until": None,
+                "last_error": error,
+            }
+
+        if error is None:
+            hook, outcome = DELIVERY_HOOKS.get(message.topic), response or {}
+        elif values["status"] == FAILED:
+            hook, outcome = FAILURE_HOOKS.get(message.topic), error
+        else:
+            hook, outcome = None, None
+
+        async with AsyncSessionLocal() as db:
+            if hook is not None:
+                try:
+                    await hook(db, message, outcome)
+                except Exception as e:
+                    # The outcome stands either way; still record it
+                    logger.error(f"Outbox hook for message {message.id} failed: {e}")
+                    await db.rollback()
+            await db.execute(update(OutboxMessage).where(OutboxMessage.id == message.id).values(**values))
+            await db.commit()
+        return error is None
+
+    async def drain(self) -> int:
+        """Deliver due messages until none are claimable; returns the count"""
+        from app.core.db import AsyncSessionLocal
+
+        delivered = 0
+        while True:
+            async with AsyncSessionLocal() as db:
+                messages = await self.claim(db)
+            if not messages:
+                return delivered
+            # Claimed messages belong to different aggregates, so they can go in parallel
+            await asyncio.gather(*(self.deliver(message) for message in messages))
+            delivered += len(messages)
+
+    async def purge_sent(self) -> int:
+        """Delete sent messages older than the retention period"""
+        from app.core.db import AsyncSessionLocal
+        from app.models.admin import OutboxMessage
+
+        cutoff = datetime.now(timezone.utc) - timedelta(days=self.retention_days)
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                delete(OutboxMessage).where(OutboxMessage.status == SENT, OutboxMessage.sent_at < cutoff)
+            )
+            await db.commit()
+        return result.rowcount
+
+    async def start(self) -> None:
+        if self.workers and not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+        for client in self._clients.values():
+            await client.aclose()
+        self._clients = {}
+
+    async def _worker(self, n: int) -> None:
+        purged_at = 0.0
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await self.drain()
+                if n == 0 and loop.time() - purged_at > 3600:
+                    purged_at = loop.time()
+                    await self.purge_sent()
+            except Exception as e:
+                logger.error(f"Outbox relay worker {n} error: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+# Global outbox relay
+outbox_relay = OutboxRelay(
+    workers=int(os.getenv("OUTBOX_RELAY_WORKERS", "4")),
+    poll_seconds=float(os.getenv("OUTBOX_RELAY_POLL_SECONDS", "5")),
+    max_attempts=int(os.getenv("OUTBOX_RELAY_MAX_ATTEMPTS", "12")),
+)
@@ -0,0 +1,457 @@
+"""
+Offline co-purchase recommendations
+A scheduled job turns order history into per-product neighbor lists
+(bought together, bought by the same customers), time-decayed trending
+lists and per-customer lists, and publishes them to recommendation_lists.
+Workers serve the latest build from an in-memory snapshot, so every
+recommendation lookup is a dict access.
+
+Run the job or the offline evaluation by hand with
+    python -m app.services.recommendations build
+    python -m app.services.recommendations evaluate [k]
+"""
+
+import asyncio
+import heapq
+import logging
+import os
+import sys
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from operator import itemgetter
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import delete, func, insert, select
+
+logger = logging.getLogger(__name__)
+
+# Length of every stored list (the recommendations endpoint allows limit <= 50)
+TOP_K = 50
+
+# Orders with more distinct products (bulk/BOM orders) are left out of pair counting
+MAX_BASKET_ITEMS = 40
+# Most recent distinct products per customer used for customer-level similarity
+MAX_HISTORY_ITEMS = 50
+# Neighbors per purchase (from each similarity kind) feeding personalized lists
+PERSONAL_NEIGHBORS = 20
+# Customers scored per vectorized batch, bounding memory
+USER_CHUNK = 5000
+# Damps similarities backed by only a few co-occurrences: score *= n / (n + SHRINKAGE)
+SHRINKAGE = 2.0
+
+ASSOCIATION_HALF_LIFE_DAYS = 365
+TRENDING_HALF_LIFE_DAYS = 7
+TRENDING_WINDOW_DAYS = 60
+PERSONAL_HALF_LIFE_DAYS = 90
+# Customers without an order in this many days get no personalized list
+PERSONALIZED_ACTIVE_DAYS = 365
+
+# pg advisory lock held while a build runs, so only one worker builds at a time
+BUILD_LOCK_KEY = 0x52454353
+
+class Basket(NamedTuple):
+    """One counted order: customer, order time and {product_id: quantity}"""
+    user_id: Optional[str]
+    ordered_at: datetime
+    items: Dict[int, int]
+
+RecommendationLists = Dict[Tuple[str, str], List[Tuple[int, float]]]
+
+def _decay(now: datetime, at: datetime, half_life_days: float) -> float:
+    age_days = max((now - at).total_seconds() / 86400, 0.0)
+    return 0.5 ** (age_days / half_life_days)
+
+def _top(scores: Dict[int, float], k: int = TOP_K) -> List[Tuple[int, float]]:
+    return [(item, round(score, 6)) for item, score in heapq.nlargest(k, scores.items(), key=itemgetter(1))]
+
+def _cosine_pairs(groups: Sequence[Sequence[int]], weights: Sequence[float],
+                  n_items: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Shrunk, weighted cosine similarity between items sharing a group
+
+    groups hold distinct dense item indices (one group per order or per
+    customer history), each with a weight. This is the item-item product
+    X^T X of the sparse group x item matrix: pairs are generated per group
+    size with triangular index arrays and reduced with unique/bincount.
+    Returns symmetric (rows, cols, scores).
+    """
+    by_size: Dict[int, List[int]] = defaultdict(list)
+    for position, group in enumerate(groups):
+        if group:
+            by_size[len(group)].append(position)
+
+    weights = np.asarray(weights, dtype=np.float64)
+    totals = np.zeros(n_items)
+    keys, pair_weights = [], []
+    for size, positions in by_size.items():
+        matrix = np.sort(np.array([groups[position] for position in positions], dtype=np.int64), axis=1)
+        group_weights = weights[positions]
+        totals += np.bincount(matrix.ravel(), weights=np.repeat(group_weights, size), minlength=n_items)
+        if size < 2:
+            continue
+        upper_i, upper_j = np.triu_indices(size, 1)
+        keys.append((matrix[:, upper_i] * n_items + matrix[:, upper_j]).ravel())
+        pair_weights.append(np.repeat(group_weights, len(upper_i)))
+    if not keys:
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0)
+
+    keys, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+    co_weight = np.bincount(inverse, weights=np.concatenate(pair_weights))
+    co_count = np.bincount(inverse)
+    i, j = keys // n_items, keys % n_items
+    scores = co_weight / np.sqrt(totals[i] * totals[j]) * co_count / (co_count + SHRINKAGE)
+    return np.concatenate([i, j]), np.concatenate([j, i]), np.concatenate([scores, scores])
+
+def _top_per_row(rows: np.ndarray, cols: np.ndarray, scores: np.ndarray,
+                 k: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Best k (col, score) entries of each row, sorted by row then score"""
+    # One int64 sort on (row, score rank) beats a two-key lexsort several times over
+    score_rank = np.empty(len(scores), dtype=np.int64)
+    score_rank[np.argsort(-scores)] = np.arange(len(scores))
+    order = np.argsort(rows * len(scores) + score_rank)
+    rows, cols, scores = rows[order], cols[order], scores[order]
+    rank = np.arange(len(rows)) - np.searchsorted(rows, rows, side="left")
+    keep = rank < k
+    return rows[keep], cols[keep], scores[keep]
+
+def _row_lists(rows: np.ndarray, cols: np.ndarray, scores: np.ndarray,
+               row_keys: Sequence, product_ids: np.ndarray) -> Dict[object, List[Tuple[int, float]]]:
+    """Row-sorted sparse entries as {row key: [(product_id, score), ...]}"""
+    lists = {}
+    bounds = np.flatnonzero(np.diff(rows)) + 1
+    for row, row_cols, row_scores in zip(rows[np.r_[0, bounds]] if len(rows) else (),
+                                         np.split(product_ids[cols], bounds),
+                                         np.split(np.round(scores, 6), bounds)):
+        lists[row_keys[row]] = list(zip(row_cols.tolist(), row_scores.tolist()))
+    return lists
+
+def _ragged_take(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """Concatenation of range(start, start + count) for each pair"""
+    offsets = np.cumsum(counts) - counts
+    return np.arange(counts.sum()) - np.repeat(offsets, counts) + np.repeat(starts, counts)
+
+def compute_recommendations(baskets: Sequence[Basket], categories: Dict[int, Optional[int]],
+                            now: datetime) -> RecommendationLists:
+    """Build every recommendation list from order history
+
+    categories maps each recommendable (active) product to its category;
+    other products are ignored. Orders after `now` are ignored.
+    """
+    baskets = [basket for basket in baskets if basket.ordered_at <= now]
+    product_ids = np.fromiter(categories, dtype=np.int64, count=len(categories))
+    index = {product_id: position for position, product_id in enumerate(categories)}
+    n_items = len(index)
+    category_codes = {category: code for code, category in enumerate(set(categories.values()))}
+    item_categories = np.array([category_codes[categories[product_id]] for product_id in categories], dtype=np.int64)
+    lists: RecommendationLists = {}
+
+    # Bought together: co-occurrence within the same order
+    together_baskets = [basket for basket in baskets if len(basket.items) <= MAX_BASKET_ITEMS]
+    together = _top_per_row(*_cosine_pairs(
+        [[index[item] for item in basket.items if item in index] for basket in together_baskets],
+        [_decay(now, basket.ordered_at, ASSOCIATION_HALF_LIFE_DAYS) for basket in together_baskets],
+        n_items,
+    ), TOP_K)
+    for row, items in _row_lists(*together, product_ids, product_ids).items():
+        lists[("complementary", str(row))] = items
+
+    # Bought by the same customers, across their orders
+    histories: Dict[str, Dict[int, datetime]] = defaultdict(dict)
+    for basket in baskets:
+        if basket.user_id:
+            history = histories[basket.user_id]
+            for item in basket.items:
+                position = index.get(item)
+                if position is not None and (position not in history or history[position] < basket.ordered_at):
+                    history[position] = basket.ordered_at
+    user_ids = list(histories)
+    recent = [heapq.nlargest(MAX_HISTORY_ITEMS, history, key=history.get) for history in histories.values()]
+
+    rows, cols, scores = _cosine_pairs(recent, np.ones(len(recent)), n_items)
+    customers = _top_per_row(rows, cols, scores, TOP_K)
+    same_category = item_categories[rows] == item_categories[cols]
+    similar = _top_per_row(rows[same_category], cols[same_category], scores[same_category], TOP_K)
+    for row, items in _row_lists(*similar, product_ids, product_ids).items():
+        lists[("similar", str(row))] = items
+
+    # Trending: recent units sold, decayed with a short half-life
+    trending: Dict[int, float] = defaultdict(float)
+    window_start = now - timedelta(days=TRENDING_WINDOW_DAYS)
+    for basket in baskets:
+        if basket.ordered_at >= window_start:
+            weight = _decay(now, basket.ordered_at, TRENDING_HALF_LIFE_DAYS)
+            for item, quantity in basket.items.items():
+                if item in index:
+                    trending[item] += weight * quantity
+    by_category: Dict[str, Dict[int, float]] = defaultdict(dict)
+    for item, score in trending.items():
+        by_category[str(categories[item])][item] = score
+    if trending:
+        lists[("trending", "all")] = _top(trending)
+    for category_key, category_scores in by_category.items():
+        lists[("trending", category_key)] = _top(category_scores)
+
+    # Personalized: neighbors of a customer's recent purchases, weighted by
+    # recency, minus what they already bought. Each purchase contributes its
+    # PERSONAL_NEIGHBORS best neighbors from both similarity kinds.
+    neighbor_rows, neighbor_cols, neighbor_scores = (
+        np.concatenate(parts) for parts in zip(
+            _top_per_row(*together, PERSONAL_NEIGHBORS),
+            _top_per_row(*customers, PERSONAL_NEIGHBORS),
+        )
+    )
+    order = np.argsort(neighbor_rows, kind="stable")
+    neighbor_rows, neighbor_cols, neighbor_scores = neighbor_rows[order], neighbor_cols[order], neighbor_scores[order]
+    starts = np.searchsorted(neighbor_rows, np.arange(n_items), side="left")
+    counts = np.searchsorted(neighbor_rows, np.arange(n_items), side="right") - starts
+
+    active_since = now - timedelta(days=PERSONALIZED_ACTIVE_DAYS)
+    active_users = [
+        position for position, history in enumerate(histories.values())
+        if history and max(history.values()) >= active_since
+    ]
+    for chunk_start in range(0, len(active_users), USER_CHUNK):
+        chunk = active_users[chunk_start:chunk_start + USER_CHUNK]
+        history_users, history_items, history_weights = [], [], []
+        owned = []
+        for local, position in enumerate(chunk):
+            history = histories[user_ids[position]]
+            owned.extend(local * n_items + item for item in history)
+            for item in recent[position]:
+                history_users.append(local)
+                history_items.append(item)
+                history_weights.append(_decay(now, history[item], PERSONAL_HALF_LIFE_DAYS))
+        history_items = np.array(history_items, dtype=np.int64)
+        item_counts = counts[history_items]
+        taken = _ragged_take(starts[history_items], item_counts)
+        keys = np.repeat(np.array(history_users, dtype=np.int64), item_counts) * n_items + neighbor_cols[taken]
+        weights = np.repeat(np.array(history_weights), item_counts) * neighbor_scores[taken]
+
+        keys, inverse = np.unique(keys, return_inverse=True)
+        weights = np.bincount(inverse, weights=weights)
+        unowned = ~np.isin(keys, np.array(owned, dtype=np.int64))
+        keys, weights = keys[unowned], weights[unowned]
+        personalized = _top_per_row(keys // n_items, keys % n_items, weights, TOP_K)
+        chunk_user_ids = [user_ids[position] for position in chunk]
+        for user_id, items in _row_lists(*personalized, chunk_user_ids, product_ids).items():
+            lists[("personalized", user_id)] = items
+
+    return lists
+
+def evaluate(baskets: Sequence[Basket], categories: Dict[int, Optional[int]],
+             k: int = 10, test_fraction: float = 0.2) -> Dict[str, float]:
+    """Precision@k of a build trained on older orders, tested on the newest
+
+    Orders are split by time. Bought-together lists are scored by how many
+    of a test order's other products each of its products predicts.
+    Personalized lists (falling back to trending, as served) are scored on
+    the new products each returning customer bought after the split, next
+    to a trending-only baseline.
+    """
+    ordered = sorted(baskets, key=lambda basket: basket.ordered_at)
+    split = int(len(ordered) * (1 - test_fraction))
+    if split == 0 or split == len(ordered):
+        raise ValueError("Not enough orders for a train/test split")
+    train, test = ordered[:split], ordered[split:]
+    lists = compute_recommendations(train, categories, train[-1].ordered_at)
+
+    def top_ids(kind: str, key: str, exclude=()) -> List[int]:
+        return [item for item, _ in lists.get((kind, key), []) if item not in exclude][:k]
+
+    seeds = covered = together_hits = 0
+    for basket in test:
+        items = {item for item in basket.items if item in categories}
+        if len(items) < 2:
+            continue
+        for seed in items:
+            seeds += 1
+            predicted = top_ids("complementary", str(seed))
+            if predicted:
+                covered += 1
+                together_hits += len(set(predicted) & (items - {seed}))
+
+    bought_before: Dict[str, set] = defaultdict(set)
+    bought_after: Dict[str, set] = defaultdict(set)
+    for period, bought in ((train, bought_before), (test, bought_after)):
+        for basket in period:
+            if basket.user_id:
+                bought[basket.user_id].update(item for item in basket.items if item in categories)
+
+    users = personalized_users = personalized_hits = baseline_hits = relevant_total = 0
+    for user_id, after in bought_after.items():
+        before = bought_before.get(user_id)
+        relevant = after - before if before else set()
+        if not relevant:
+            continue
+        users += 1
+        relevant_total += len(relevant)
+        baseline = top_ids("trending", "all", exclude=before)
+        predicted = top_ids("personalized", user_id, exclude=before)
+        if predicted:
+            personalized_users += 1
+        else:
+            predicted = baseline
+        personalized_hits += len(set(predicted) & relevant)
+        baseline_hits += len(set(baseline) & relevant)
+
+    return {
+        "k": k,
+        "train_orders": len(train),
+        "test_orders": len(test),
+        "together_seeds": seeds,
+        "together_coverage": covered / seeds if seeds else 0.0,
+        "together_precision_at_k": together_hits / (covered * k) if covered else 0.0,
+        "returning_customers": users,
+        "personalized_coverage": personalized_users / users if users else 0.0,
+        "personalized_precision_at_k": personalized_hits / (users * k) if users else 0.0,
+        "personalized_recall_at_k": personalized_hits / relevant_total if relevant_total else 0.0,
+        "trending_precision_at_k": baseline_hits / (users * k) if users else 0.0,
+    }
+
+async def load_order_history(db) -> Tuple[List[Basket], Dict[int, Optional[int]]]:
+    """Counted orders as baskets, plus {product_id: category_id} for active products"""
+    from app.models.commerce import COUNTED_ORDER_STATUSES, Order, OrderItem, Product
+
+    result = await db.execute(
+        select(Order.id, Order.user_id, Order.created_at, OrderItem.product_id, OrderItem.quantity)
+        .join(OrderItem, OrderItem.order_id == Order.id)
+        .where(Order.status.in_(COUNTED_ORDER_STATUSES))
+    )
+    baskets: Dict[int, Basket] = {}
+    for order_id, user_id, ordered_at, product_id, quantity in result:
+        basket = baskets.get(order_id)
+        if basket is None:
+            basket = baskets[order_id] = Basket(user_id, ordered_at, {})
+        basket.items[product_id] = basket.items.get(product_id, 0) + quantity
+
+    result = await db.execute(select(Product.id, Product.category_id).where(Product.is_active == True))
+    return list(baskets.values()), dict(result.all())
+
+async def build_recommendations(db, min_interval: Optional[timedelta] = None) -> Optional[int]:
+    """Recompute and publish all lists; returns the list count
+
+    Returns None without building when another worker holds the build lock
+    or a build newer than min_interval has already been published.
+    """
+    from app.models.commerce import RecommendationList
+
+    if not (await db.execute(select(func.pg_try_advisory_xact_lock(BUILD_LOCK_KEY)))).scalar():
+        return None
+    now = datetime.now(timezone.utc)
+    if min_interval is not None:
+        latest = (await db.execute(select(func.max(RecommendationList.generated_at)))).scalar()
+        if latest is not None and now - latest < min_interval:
+            await db.rollback()
+            return None
+
+    baskets, categories = await load_order_history(db)
+    lists = await asyncio.to_thread(compute_recommendations, baskets, categories, now)
+
+    # Readers keep seeing the previous build until this transaction commits
+    await db.execute(delete(RecommendationList))
+    rows = [
+        {"kind": kind, "key": key, "items": [list(entry) for entry in items], "generated_at": now}
+        for (kind, key), items in lists.items()
+    ]
+    for start in range(0, len(rows), 1000):
+        await db.execute(insert(RecommendationList), rows[start:start + 1000])
+    await db.commit()
+    logger.info(f"Published {len(rows)} recommendation lists from {len(baskets)} orders")
+    return len(rows)
+
+class RecommendationService:
+    """Serves the latest published recommendation build from memory
+
+    Every worker reloads when a newer build appears. If build_seconds is
+    set, workers also run the build on that schedule; the advisory lock and
+    the published build time keep it to one build per interval.
+    """
+
+    def __init__(self, reload_seconds: int = 300, build_seconds: int = 0):
+        self.reload_seconds = reload_seconds
+        self.build_seconds = build_seconds
+        self._lists: Dict[Tuple[str, str], Tuple[int, ...]] = {}
+        self._version: Optional[datetime] = None
+        self._next_build = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def ready(self) -> bool:
+        return self._version is not None
+
+    def get(self, kind: str, key, limit: int) -> List[int]:
+        """Recommended product ids, best first (empty if none were built)"""
+        return list(self._lists.get((kind, str(key)), ())[:limit])
+
+    async def start(self) -> None:
+        await self.reload()
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def reload(self) -> None:
+        from app.core.db import AsyncSessionLocal
+        from app.models.commerce import RecommendationList
+
+        try:
+            async with AsyncSessionLocal() as db:
+                version = (await db.execute(select(func.max(RecommendationList.generated_at)))).scalar()
+                if version is None or version == self._version:
+                    return
+                result = await db.execute(
+                    select(RecommendationList.kind, RecommendationList.key, RecommendationList.items)
+                )
+                self._lists = {
+                    (kind, key): tuple(int(entry[0]) for entry in items)
+                    for kind, key, items in result
+                }
+                self._version = version
+            logger.info(f"Loaded {len(self._lists)} recommendation lists built at {version}")
+        except Exception as e:
+            logger.error(f"Failed to load recommendations: {e}")
+
+    async def build(self) -> None:
+        from app.core.db import AsyncSessionLocal
+
+        try:
+            async with AsyncSessionLocal() as db:
+                await build_recommendations(db, min_interval=timedelta(seconds=self.build_seconds * 0.9))
+        except Exception as e:
+            logger.error(f"Failed to build recommendations: {e}")
+
+    async def _loop(self) -> None:
+        while True:
+            if self.build_seconds and time.monotonic() >= self._next_build:
+                self._next_build = time.monotonic() + self.build_seconds
+                await self.build()
+                await self.reload()
+            await asyncio.sleep(self.reload_seconds)
+            await self.reload()
+
+# Global recommendation service
+recommendations = RecommendationService(
+    reload_seconds=int(os.getenv("RECOMMENDATION_RELOAD_SECONDS", "300")),
+    build_seconds=int(os.getenv("RECOMMENDATION_BUILD_SECONDS", "21600")),
+)
+
+async def _main(argv: List[str]) -> None:
+    from app.core.db import AsyncSessionLocal
+
+    command = argv[1] if len(argv) > 1 else "build"
+    async with AsyncSessionLocal() as db:
+        if command == "evaluate":
+            baskets, categories = await load_order_history(db)
+            k = int(argv[2]) if len(argv) > 2 else 10
+            for name, value in evaluate(baskets, categories, k=k).items():
+                print(f"{name}: {value:.4f}" if isinstance(value, float) else f"{name}: {value}")
+        else:
+            count = await build_recommendations(db)
+            print(f"Published {count} recommendation lists" if count is not None else "Another build is running")
+
+if __name__ == "__main__":
+    asyncio.run(_main(sys.argv))
@@ -0,0 +1,209 @@
+"""
+Consumption forecasting for quick reorder suggestions
+A scheduled job estimates, for every customer and product they buy
+repeatedly, how fast they use it up and when they will run out, using
+exponential smoothing over the intervals between their orders. Results are
+published to reorder_suggestions for the quick reorder routes to read.
+
+Run the job by hand with
+    python -m app.services.reorder_forecast
+"""
+
+import asyncio
+import logging
+import os
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, func, insert, select
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest interval/quantity in the smoothed estimates
+SMOOTHING_ALPHA = 0.4
+# Orders this close together count as one purchase
+MIN_INTERVAL_DAYS = 1.0
+# Order history considered by the forecast
+HISTORY_DAYS = 730
+# Forecasts whose depletion date passed this many intervals ago are dropped
+# (the customer has stopped buying the product)
+STALE_INTERVALS = 2.0
+# A suggestion is due when the product is forecast to run out within this many days
+REORDER_LEAD_DAYS = 7
+
+# pg advisory lock held while a build runs, so only one worker builds at a time
+BUILD_LOCK_KEY = 0x524f4643
+
+class ReorderForecast(NamedTuple):
+    order_count: int
+    total_quantity: int
+    last_ordered_at: datetime
+    last_quantity: int
+    interval_days: float
+    consumption_rate: float
+    suggested_quantity: int
+    predicted_depletion_at: datetime
+
+def remaining_quantity(last_quantity: float, consumption_rate: float,
+                       last_ordered_at: datetime, now: datetime) -> float:
+    """Units of the last purchase expected to be left at `now`"""
+    used = consumption_rate * (now - last_ordered_at).total_seconds() / 86400
+    return max(last_quantity - used, 0.0)
+
+def forecast_consumption(purchases: Sequence[Tuple[datetime, int]], now: datetime) -> Optional[ReorderForecast]:
+    """Smoothed consumption forecast for one customer and product
+
+    purchases are (ordered_at, quantity) in any order. Each interval between
+    two purchases is taken to use up the quantity bought at its start, so
+    the rate is smoothed quantity / smoothed interval. Returns None with
+    fewer than two purchases or when the forecast is stale.
+    """
+    events: List[List] = []
+    for ordered_at, quantity in sorted(purchases):
+        if events and (ordered_at - events[-1][0]).total_seconds() < MIN_INTERVAL_DAYS * 86400:
+            events[-1][1] += quantity
+        else:
+            events.append([ordered_at, quantity])
+    if len(events) < 2:
+        return None
+
+    interval = quantity = None
+    for (previous_at, previous_quantity), (ordered_at, _) in zip(events, events[1:]):
+        days = (ordered_at - previous_at).total_seconds() / 86400
+        if interval is None:
+            interval, quantity = days, float(previous_quantity)
+        else:
+            interval = SMOOTHING_ALPHA * days + (1 - SMOOTHING_ALPHA) * interval
+            quantity = SMOOTHING_ALPHA * previous_quantity + (1 - SMOOTHING_ALPHA) * quantity
+
+    rate = quantity / interval
+    last_ordered_at, last_quantity = events[-1]
+    depletion_at = last_ordered_at + timedelta(days=last_quantity / rate)
+    if now - depletion_at > timedelta(days=interval * STALE_INTERVALS):
+        return None
+
+    return ReorderForecast(
+        order_count=len(events),
+        total_quantity=sum(event[1] for event in events),
+        last_ordered_at=last_ordered_at,
+        last_quantity=last_quantity,
+        interval_days=interval,
+        consumption_rate=rate,
+        suggested_quantity=max(1, round(quantity)),
+        predicted_depletion_at=depletion_at,
+    )
+
+def forecast_all(series: Dict[Tuple[str, int], List[Tuple[datetime, int]]],
+                 now: datetime) -> Dict[Tuple[str, int], ReorderForecast]:
+    forecasts = {}
+    for key, purchases in series.items():
+        forecast = forecast_consumption(purchases, now)
+        if forecast is not None:
+            forecasts[key] = forecast
+    return forecasts
+
+async def build_reorder_suggestions(db, min_interval: Optional[timedelta] = None) -> Optional[int]:
+    """Recompute and publish all reorder suggestions; returns the row count
+
+    Returns None without building when another worker holds the build lock
+    or a build newer than min_interval has already been published.
+    """
+    from app.models.commerce import COUNTED_ORDER_STATUSES, Order, OrderItem
+    from app.models.subscriptions import ReorderSuggestion
+
+    if not (await db.execute(select(func.pg_try_advisory_xact_lock(BUILD_LOCK_KEY)))).scalar():
+        return None
+    now = datetime.now(timezone.utc)
+    if min_interval is not None:
+        latest = (await db.execute(select(func.max(ReorderSuggestion.generated_at)))).scalar()
+        if latest is not None and now - latest < min_interval:
+            await db.rollback()
+            return None
+
+    result = await db.execute(
+        select(Order.user_id, OrderItem.product_id, Order.created_at, OrderItem.quantity)
+        .join(OrderItem, OrderItem.order_id == Order.id)
+        .where(
+            Order.user_id.isnot(None),
+            Order.status.in_(COUNTED_ORDER_STATUSES),
+            Order.created_at >= now - timedelta(days=HISTORY_DAYS),
+        )
+    )
+    series: Dict[Tuple[str, int], List[Tuple[datetime, int]]] = defaultdict(list)
+    for user_id, product_id, ordered_at, quantity in result:
+        series[(user_id, product_id)].append((ordered_at, quantity))
+    forecasts = await asyncio.to_thread(forecast_all, series, now)
+
+    # Readers keep seeing the previous build until this transaction commits
+    await db.execute(delete(ReorderSuggestion))
+    rows = [
+        {
+            "user_id": user_id,
+            "product_id": product_id,
+            "order_count": forecast.order_count,
+            "total_quantity": forecast.total_quantity,
+            "last_ordered_at": forecast.last_ordered_at,
+            "last_quantity": forecast.last_quantity,
+            "interval_days": round(forecast.interval_days, 2),
+            "consumption_rate": round(forecast.consumption_rate, 4),
+            "suggested_quantity": forecast.suggested_quantity,
+            "predicted_depletion_at": forecast.predicted_depletion_at,
+            "generated_at": now,
+        }
+        for (user_id, product_id), forecast in forecasts.items()
+    ]
+    for start in range(0, len(rows), 1000):
+        await db.execute(insert(ReorderSuggestion), rows[start:start + 1000])
+    await db.commit()
+    logger.info(f"Published {len(rows)} reorder suggestions from {len(series)} purchase histories")
+    return len(rows)
+
+class ReorderForecastService:
+    """Runs the reorder forecast build on a schedule
+
+    Every worker runs the loop; the advisory lock and the published build
+    time keep it to one build per interval.
+    """
+
+    def __init__(self, build_seconds: int = 21600):
+        self.build_seconds = build_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        if self.build_seconds and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def build(self) -> None:
+        from app.core.db import AsyncSessionLocal
+
+        try:
+            async with AsyncSessionLocal() as db:
+                await build_reorder_suggestions(db, min_interval=timedelta(seconds=self.build_seconds * 0.9))
+        except Exception as e:
+            logger.error(f"Failed to build reorder suggestions: {e}")
+
+    async def _loop(self) -> None:
+        while True:
+            await self.build()
+            await asyncio.sleep(self.build_seconds)
+
+# Global reorder forecast service
+reorder_forecast = ReorderForecastService(
+    build_seconds=int(os.getenv("REORDER_FORECAST_BUILD_SECONDS", "21600"))
+)
+
+async def _main() -> None:
+    from app.core.db import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        count = await build_reorder_suggestions(db)
+    print(f"Published {count} reorder suggestions" if count is not None else "Another build is running")
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -0,0 +1,499 @@
+"""
+In-memory autocomplete index for storefront search suggestions
+Product names, brands, categories and popular search queries are kept in a
+sorted key array searched with bisect, so each keystroke is answered without
+touching the database. Catalog writes update the index incrementally; a
+periodic full rebuild picks up order volume and any drift; catalog writes
+made while it runs are replayed onto the new index before it is swapped in.
+
+Search queries are only suggested once QUERY_MIN_SEARCHERS different
+searchers ran them within QUERY_WINDOW_SECONDS, scored by that number of
+searchers, and only when every word is a catalog word, so one client
+repeating a query (or typing junk) cannot put it in front of products.
+"""
+
+import asyncio
+import heapq
+import logging
+import os
+import re
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from types import SimpleNamespace
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import func, select
+
+logger = logging.getLogger(__name__)
+
+# Relative weight of each suggestion kind; an entry's weight is
+# KIND_WEIGHTS[kind] * its popularity score
+KIND_WEIGHTS = {
+    "brand": 3.0,
+    "category": 2.0,
+    "product": 1.0,
+    "query": 0.5,
+}
+
+# Indexed key length; longer prefixes are matched on their first MAX_KEY_CHARS
+MAX_KEY_CHARS = 40
+# Prefix ranges larger than this get a maintained top-K list instead of a scan
+MAX_SCAN = 256
+TOP_CACHE_SIZE = 40
+TOP_CACHE_MIN = 24
+
+MIN_QUERY_CHARS = 2
+MAX_QUERY_CHARS = 100
+# A query is suggested once this many searchers (client IPs) ran it
+QUERY_MIN_SEARCHERS = 3
+# Searchers remembered per query, which also caps a query's score
+QUERY_MAX_SEARCHERS = 50
+# Searchers not seen again within this window stop counting
+QUERY_WINDOW_SECONDS = 7 * 24 * 3600
+# Distinct queries tracked; the least recently searched is evicted
+MAX_TRACKED_QUERIES = 5000
+
+_SEP = "\x00"
+_WORD_START = re.compile(r"(?<![0-9a-z])[0-9a-z]")
+_WHITESPACE = re.compile(r"\s+")
+_WORD = re.compile(r"[0-9a-z]+")
+
+def normalize(text: str) -> str:
+    return _WHITESPACE.sub(" ", text.strip().lower())
+
+def _words(text: str) -> List[str]:
+    return _WORD.findall(text.lower())
+
+def _word_suffixes(norm: str) -> List[str]:
+    """Suffixes of norm starting at each word, truncated to MAX_KEY_CHARS"""
+    return sorted({norm[m.start():m.start() + MAX_KEY_CHARS] for m in _WORD_START.finditer(norm)})
+
+def searcher_key(request) -> str:
+    """Who ran a search, for counting distinct searchers: the client IP
+
+    The optional bearer token is not verified, so a user id from it would let
+    one client count as any number of searchers.
+    """
+    return f"ip:{request.client.host if request is not None and request.client else 'unknown'}"
+
+class SuggestionIndex:
+    """Prefix index over weighted suggestion entries
+
+    Every entry (kind, normalized text) is stored once per word it contains,
+    as "<suffix>\\0<entry id>" in a sorted list, so "fila" finds
+    "PLA Filament 1.75mm". Short, very common prefixes keep a top-K list that
+    is maintained in place as weights change, so a one-letter prefix does not
+    rescan a large slice of the index on every keystroke.
+    """
+
+    def __init__(self):
+        self._keys: List[str] = []
+        self._scores: Dict[str, float] = {}  # entry id -> popularity score
+        self._display: Dict[str, str] = {}  # entry id -> suggestion text
+        self._top_cache: Dict[str, List[str]] = {}  # prefix -> top entry ids
+
+        # Catalog state needed to apply incremental product/category changes
+        self._products: Dict[int, Tuple[str, Optional[str], Optional[int], int]] = {}
+        self._categories: Dict[int, str] = {}
+        self._brands: Dict[str, str] = {}  # normalized -> display
+        self._vocabulary: Set[str] = set()  # words of product, brand and category names
+
+        # Query text -> {searcher: last seen}, least recently searched first
+        self._queries: "OrderedDict[str, Dict[str, float]]" = OrderedDict()
+
+        # Changes made while a rebuild runs, as (method name, args) to replay
+        self._pending: Optional[List[Tuple[str, tuple]]] = None
+
+        self.ready = False
+
+    # Lookups
+
+    def suggest(self, query: str, limit: int = 10) -> List[str]:
+        """Suggestions for a typed prefix, most popular first"""
+        prefix = normalize(query)[:MAX_KEY_CHARS]
+        if not prefix:
+            return []
+
+        candidates = self._top_cache.get(prefix)
+        if candidates is None:
+            lo = bisect_left(self._keys, prefix)
+            hi = lo
+            end = min(len(self._keys), lo + MAX_SCAN + 1)
+            while hi < end and self._keys[hi].startswith(prefix):
+                hi += 1
+            if hi - lo > MAX_SCAN:
+                candidates = self._build_top(prefix, lo)
+                self._top_cache[prefix] = candidates
+            else:
+                entry_ids = {key.split(_SEP, 1)[1] for key in self._keys[lo:hi]}
+                candidates = heapq.nlargest(limit * 2, entry_ids, key=self._weight)
+
+        suggestions = []
+        seen = set()
+        for entry_id in candidates:
+            text = self._display[entry_id]
+            if text.lower() not in seen:
+                seen.add(text.lower())
+                suggestions.append(text)
+                if len(suggestions) == limit:
+                    break
+        return suggestions
+
+    def brands(self) -> List[str]:
+        """Brand names with at least one active product, alphabetically"""
+        return sorted(self._brands.values())
+
+    # Incremental updates
+
+    def upsert_product(self, product) -> None:
+        """Apply a created or updated product (inactive products are removed)"""
+        if self._pending is not None:
+            self._pending.append(("upsert_product", (SimpleNamespace(
+                id=product.id, is_active=product.is_active, name=product.name,
+                brand=product.brand, category_id=product.category_id,
+            ),)))
+        state = self._products.get(product.id)
+        if not product.is_active or not product.name:
+            self._remove_product(product.id)
+            return
+        if state is not None and state[:3] == (product.name, product.brand, product.category_id):
+            return
+        self._remove_product(product.id)
+        self._add_product(product.id, product.name, product.brand, product.category_id,
+                          state[3] if state else 0)
+
+    def _add_product(self, product_id: int, name: str, brand: Optional[str],
+                     category_id: Optional[int], units: int) -> None:
+        self._products[product_id] = (name, brand, category_id, units)
+        self._vocabulary.update(_words(f"{name} {brand or ''}"))
+        self._adjust("product", name, 1 + units)
+        if brand:
+            self._adjust("brand", brand, 1)
+        if category_id in self._categories:
+            self._adjust("category", self._categories[category_id], 1)
+
+    def remove_product(self, product_id: int) -> None:
+        if self._pending is not None:
+            self._pending.append(("remove_product", (product_id,)))
+        self._remove_product(product_id)
+
+    def _remove_product(self, product_id: int) -> None:
+        state = self._products.pop(product_id, None)
+        if state is None:
+            return
+        name, brand, category_id, units = state
+        self._adjust("product", name, -(1 + units))
+        if brand:
+            self._adjust("brand", brand, -1)
+        if category_id in self._categories:
+            self._adjust("category", self._categories[category_id], -1)
+
+    def upsert_category(self, category) -> None:
+        """Apply a created, renamed or deactivated category"""
+        if self._pending is not None:
+            self._pending.append(("upsert_category", (SimpleNamespace(
+                id=category.id, is_active=category.is_active, name=category.name,
+            ),)))
+        self._remove_category(category.id)
+        if not category.is_active or not category.name:
+            return
+        self._categories[category.id] = category.name
+        self._vocabulary.update(_words(category.name))
+        self._adjust("category", category.name, 1 + self._category_product_count(category.id))
+
+    def remove_category(self, category_id: int) -> None:
+        if self._pending is not None:
+            self._pending.append(("remove_category", (category_id,)))
+        self._remove_category(category_id)
+
+    def _remove_category(self, category_id: int) -> None:
+        name = self._categories.pop(category_id, None)
+        if name is not None:
+            self._adjust("category", name, -(1 + self._category_product_count(category_id)))
+
+    def record_query(self, query: str, result_count: int, searcher: str) -> None:
+        """Count a storefront search by searcher (client IP)
+
+        Only queries that found products and consist of catalog words are
+        tracked. A query is suggested, scored by its number of distinct
+        searchers, once QUERY_MIN_SEARCHERS have run it.
+        """
+        if result_count <= 0:
+            return
+        words = _words(query)
+        text = " ".join(words)
+        if not MIN_QUERY_CHARS <= len(text) <= MAX_QUERY_CHARS:
+            return
+        if any(word not in self._vocabulary for word in words):
+            return
+
+        searchers = self._queries.get(text)
+        if searchers is None:
+            while len(self._queries) >= MAX_TRACKED_QUERIES:
+                evicted, evicted_searchers = self._queries.popitem(last=False)
+                self._adjust("query", evicted, -self._query_score(evicted_searchers))
+                if self._pending is not None:
+                    self._pending.append(("_sync_query", (evicted,)))
+            searchers = self._queries[text] = {}
+        else:
+            self._queries.move_to_end(text)
+
+        before = self._query_score(searchers)
+        if searcher in searchers or len(searchers) < QUERY_MAX_SEARCHERS:
+            searchers[searcher] = time.time()
+        self._adjust("query", text, self._query_score(searchers) - before)
+        if self._pending is not None:
+            self._pending.append(("_sync_query", (text,)))
+
+    @staticmethod
+    def _query_score(searchers: Dict[str, float]) -> int:
+        return len(searchers) if len(searchers) >= QUERY_MIN_SEARCHERS else 0
+
+    # Full rebuild
+
+    async def rebuild(self, db) -> int:
+        """Reload the index from the database and swap it in
+
+        Incremental changes made from the first query until the swap are
+        recorded and replayed onto the new index, so a catalog write that
+        lands after the snapshot is read is not lost.
+        """
+        from app.models.commerce import Category, OrderItem, Product
+
+        self._pending = []
+        try:
+            products = (await db.execute(
+                select(Product.id, Product.name, Product.brand, Product.category_id)
+                .where(Product.is_active == True)
+            )).all()
+            categories = (await db.execute(
+                select(Category.id, Category.name).where(Category.is_active == True)
+            )).all()
+            units_sold = dict((await db.execute(
+                select(OrderItem.product_id, func.sum(OrderItem.quantity)).group_by(OrderItem.product_id)
+            )).all())
+
+            fresh = SuggestionIndex()
+            fresh._queries = self._queries
+            await asyncio.to_thread(fresh._load, products, categories, units_sold, self._prune_queries())
+
+            # No await from here to the swap, so nothing can be recorded in between
+            for method, args in self._pending:
+                getattr(fresh, method)(*args)
+        finally:
+            self._pending = None
+
+        self._keys = fresh._keys
+        self._scores = fresh._scores
+        self._display = fresh._display
+        self._top_cache = fresh._top_cache
+        self._products = fresh._products
+        self._categories = fresh._categories
+        self._brands = fresh._brands
+        self._vocabulary = fresh._vocabulary
+        self.ready = True
+        return len(self._scores)
+
+    def _load(self, products, categories, units_sold, query_scores) -> None:
+        self._categories = {category_id: name for category_id, name in categories if name}
+        category_counts: Dict[int, int] = {}
+        for product_id, name, brand, category_id in products:
+            if not name:
+                continue
+            units = int(units_sold.get(product_id) or 0)
+            self._products[product_id] = (name, brand, category_id, units)
+            self._bump("product", name, 1 + units)
+            self._vocabulary.update(_words(name))
+            if brand:
+                self._bump("brand", brand, 1)
+                self._brands[normalize(brand)] = brand
+                self._vocabulary.update(_words(brand))
+            category_counts[category_id] = category_counts.get(category_id, 0) + 1
+        for category_id, name in self._categories.items():
+            self._bump("category", name, 1 + category_counts.get(category_id, 0))
+            self._vocabulary.update(_words(name))
+        for text, score in query_scores:
+            # Queries for words that left the catalog are no longer suggested
+            if all(word in self._vocabulary for word in text.split()):
+                self._bump("query", text, score)
+
+        self._keys = sorted(
+            f"{suffix}{_SEP}{entry_id}"
+            for entry_id in self._scores
+            for suffix in _word_suffixes(entry_id.split(_SEP, 1)[1])
+        )
+        self._warm_top_cache()
+
+    def _warm_top_cache(self, max_prefix_chars: int = 2) -> None:
+        """Precompute top lists for the short prefixes typed first"""
+        for length in range(1, max_prefix_chars + 1):
+            lo = 0
+            while lo < len(self._keys):
+                prefix = self._keys[lo][:length]
+                hi = bisect_left(self._keys, prefix + "\U0010ffff", lo)
+                if _SEP not in prefix and hi - lo > MAX_SCAN:
+                    self._top_cache[prefix] = self._build_top(prefix, lo)
+                lo = hi
+
+    def _prune_queries(self) -> List[Tuple[str, float]]:
+        """Forget searchers outside the window; returns the suggested queries
+
+        Query counts are only kept in memory and carried across rebuilds
+        here, bounded by MAX_TRACKED_QUERIES and QUERY_WINDOW_SECONDS.
+        """
+        cutoff = time.time() - QUERY_WINDOW_SECONDS
+        scores = []
+        for text in list(self._queries):
+            searchers = self._queries[text]
+            for searcher in [s for s, seen in searchers.items() if seen < cutoff]:
+                del searchers[searcher]
+            if not searchers:
+                del self._queries[text]
+            elif self._query_score(searchers):
+                scores.append((text, self._query_score(searchers)))
+        return scores
+
+    # Internals
+
+    def _sync_query(self, text: str) -> None:
+        """Bring a query's score in line with its tracked searchers"""
+        entry_id = self._entry_id("query", text)
+        searchers = self._queries.get(text)
+        score = self._query_score(searchers) if searchers else 0
+        if any(word not in self._vocabulary for word in text.split()):
+            score = 0
+        self._adjust("query", text, score - self._scores.get(entry_id, 0))
+
+    def _category_product_count(self, category_id: int) -> int:
+        return sum(1 for state in self._products.values() if state[2] == category_id)
+
+    @staticmethod
+    def _entry_id(kind: str, text: str) -> str:
+        return f"{kind}{_SEP}{normalize(text)}"
+
+    def _weight(self, entry_id: str) -> float:
+        return KIND_WEIGHTS[entry_id.split(_SEP, 1)[0]] * self._scores[entry_id]
+
+    def _bump(self, kind: str, text: str, delta: float) -> None:
+        """Adjust a score during bulk load (keys are built afterwards)"""
+        entry_id = self._entry_id(kind, text)
+        self._display.setdefault(entry_id, text.strip())
+        self._scores[entry_id] = self._scores.get(entry_id, 0) + delta
+
+    def _adjust(self, kind: str, text: str, delta: float) -> None:
+        """Adjust an entry's score, adding or removing its keys as needed"""
+        if not delta:
+            return
+        entry_id = self._entry_id(kind, text)
+        norm = entry_id.split(_SEP, 1)[1]
+        if not norm:
+            return
+        suffixes = _word_suffixes(norm)
+        old = self._scores.get(entry_id)
+        score = (old or 0) + delta
+
+        if score <= 0:
+            if old is None:
+                return
+            self._update_cached(entry_id, suffixes, self._weight(entry_id), None)
+            del self._scores[entry_id]
+            del self._display[entry_id]
+            for suffix in suffixes:
+                key = f"{suffix}{_SEP}{entry_id}"
+                i = bisect_left(self._keys, key)
+                if i < len(self._keys) and self._keys[i] == key:
+                    del self._keys[i]
+            if kind == "brand":
+                self._brands.pop(norm, None)
+            return
+
+        old_weight = None
+        if old is None:
+            self._display[entry_id] = text.strip()
+            for suffix in suffixes:
+                insort(self._keys, f"{suffix}{_SEP}{entry_id}")
+            if kind == "brand":
+                self._brands[norm] = text.strip()
+        else:
+            old_weight = self._weight(entry_id)
+        self._scores[entry_id] = score
+        self._update_cached(entry_id, suffixes, old_weight, self._weight(entry_id))
+
+    def _update_cached(self, entry_id: str, suffixes: Iterable[str],
+                       old_weight: Optional[float], new_weight: Optional[float]) -> None:
+        """Keep cached top lists exact after an entry's weight changes
+
+        Invariant: every entry missing from a prefix's list weighs no more than
+        the list's last entry. Lists that shrink below TOP_CACHE_MIN are dropped
+        and rebuilt on the next lookup.
+        """
+        if not self._top_cache:
+            return
+        prefixes = {
+            suffix[:i]
+            for suffix in suffixes
+            for i in range(1, len(suffix) + 1)
+            if suffix[:i] in self._top_cache
+        }
+        for prefix in prefixes:
+            top = self._top_cache[prefix]
+            listed = entry_id in top
+            if listed:
+                top.remove(entry_id)
+            if new_weight is None:
+                keep = False
+            elif listed:
+                # Unlisted entries weigh at most the old floor, which may have been this entry
+                keep = not top or new_weight >= min(old_weight, self._weight(top[-1]))
+            else:
+                keep = bool(top) and new_weight >= self._weight(top[-1])
+            if keep:
+                top.append(entry_id)
+                top.sort(key=self._weight, reverse=True)
+                del top[TOP_CACHE_SIZE:]
+            if len(top) < TOP_CACHE_MIN:
+                del self._top_cache[prefix]
+
+    def _build_top(self, prefix: str, lo: int) -> List[str]:
+        hi = bisect_left(self._keys, prefix + "\U0010ffff", lo)
+        entry_ids = {key[key.index(_SEP) + 1:] for key in self._keys[lo:hi]}
+        return heapq.nlargest(TOP_CACHE_SIZE, entry_ids, key=self._weight)
+
+class SearchSuggestionService:
+    """Owns the global suggestion index and its periodic rebuild"""
+
+    def __init__(self, rebuild_seconds: int = 900):
+        self.index = SuggestionIndex()
+        self.rebuild_seconds = rebuild_seconds
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        await self.refresh()
+        if self._task is None:
+            self._task = asyncio.create_task(self._rebuild_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def refresh(self) -> None:
+        from app.core.db import AsyncSessionLocal
+
+        try:
+            async with AsyncSessionLocal() as db:
+                entries = await self.index.rebuild(db)
+            logger.info(f"Search suggestion index rebuilt with {entries} entries")
+        except Exception as e:
+            logger.error(f"Failed to rebuild search suggestion index: {e}")
+
+    async def _rebuild_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.rebuild_seconds)
+            await self.refresh()
+
+# Global suggestion service
+search_suggestions = SearchSuggestionService(
+    rebuild_seconds=int(os.getenv("SEARCH_SUGGESTION_REBUILD_SECONDS", "900"))
+)
@@ -0,0 +1,336 @@
+"""
+Webhook inbox for payment provider events
+Webhook routes only verify the signature and record the raw event in
+webhook_events (deduplicated on provider + event id), then return 200.
+A pool of workers claims pending events with FOR UPDATE SKIP LOCKED and
+applies them: order payment transitions, with the MakrCave dispatch of
+paid service orders queued in the outbox (app.services.outbox). Failed
+events are retried with exponential backoff, and claims held by a worker
+that died are picked up again once their lock expires.
+"""
+
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import selectinload
+
+from app.services.outbox import CAVE_PUBLISH_PATH, MAKRCAVE, enqueue, enqueue_event
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+PROCESSING = "processing"
+PROCESSED = "processed"
+FAILED = "failed"  # gave up after max_attempts; needs a manual replay
+
+# ==========================================
+# Event handlers
+# ==========================================
+
+async def _load_order(db, order_id: Any):
+    from app.models.commerce import Order
+
+    try:
+        order_id = int(order_id)
+    except (TypeError, ValueError):
+        logger.warning(f"Webhook references invalid order id {order_id!r}")
+        return None
+    result = await db.execute(select(Order).where(Order.id == order_id).with_for_update())
+    return result.scalar_one_or_none()
+
+async def mark_order_paid(db, order_id: Any, payment_id: str, payment_method: Optional[str] = None):
+    """Move an order to paid and queue its service orders for MakrCave
+
+    The outbox messages commit together with the transition, so each paid
+    order is dispatched once however often the event is redelivered.
+    """
+    order = await _load_order(db, order_id)
+    if order is None or order.payment_status == "completed":
+        await db.commit()
+        return
+    order.status = "paid"
+    order.payment_status = "completed"
+    order.payment_id = payment_id
+    if payment_method:
+        order.payment_method = payment_method
+    enqueue_event(
+        db,
+        "order.payment_received",
+        {"order_id": order.id, "payment_id": payment_id, "total": str(order.total)},
+        "order",
+        order.id,
+        user_id=order.user_id,
+    )
+    await queue_service_order_dispatch(db, order)
+    await db.commit()
+    logger.info(f"Order {order.id} marked as paid")
+
+async def mark_payment_failed(db, order_id: Any, reason: Optional[str] = None):
+    """Record a failed payment attempt; orders awaiting payment fail with it"""
+    order = await _load_order(db, order_id)
+    if order is None or order.payment_status == "completed":
+        await db.commit()
+        return
+    order.payment_status = "failed"
+    if order.status == "payment_pending":
+        order.status = "failed"
+    enqueue_event(
+        db,
+        "order.updated",
+        {"order_id": order.id, "status": order.status, "details": {"payment_failure_reason": reason or "Unknown"}},
+        "order",
+        order.id,
+        user_id=order.user_id,
+    )
+    await db.commit()
+    logger.info(f"Order {order.id} payment failed: {reason or 'Unknown'}")
+
+async def queue_service_order_dispatch(db, order):
+    """Add MakrCave job publishes for the order's undispatched service orders
+
+    The outbox relay sends them after the caller commits and records the
+    MakrCave job on each service order.
+    """
+    from app.models.services import Quote, ServiceOrder
+
+    result = await db.execute(
+        select(ServiceOrder)
+        .options(selectinload(ServiceOrder.quote).selectinload(Quote.upload))
+        .where(ServiceOrder.order_id == order.id, ServiceOrder.status.notin_(["publishing", "dispatched"]))
+    )
+    service_orders: List[ServiceOrder] = result.scalars().all()
+
+    for service_order in service_orders:
+        quote = service_order.quote
+        if not quote or not quote.upload:
+            logger.warning("Missing quote or upload for service order %s", service_order.id)
+            continue
+
+        payload = {
+            "service_order_id": str(service_order.id),
+            "upload_file_key": quote.upload.file_key,
+            "material": quote.material,
+            "quality": quote.quality,
+            "est_weight_g": float(quote.estimated_weight_g or 0),
+            "est_time_min": quote.estimated_time_minutes or 0,
+            "delivery": {
+                "mode": service_order.shipping_method or "ship",
+                "address": (order.addresses or {}).get("shipping")
+                if isinstance(order.addresses, dict)
+                else order.addresses,
+                "estimated_date": (
+                    service_order.estimated_completion
+                    or datetime.utcnow()
+                ).isoformat(),
+            },
+            "capabilities": {"min_nozzle_mm": 0.4, "bed_min_mm": [220, 220, 250]},
+        }
+        service_order.status = "publishing"
+        enqueue(db, MAKRCAVE, CAVE_PUBLISH_PATH, payload, "service_order", service_order.id)
+
+async def handle_stripe_event(db, event_type: str, event: Dict[str, Any]):
+    payment_intent = event.get("data", {}).get("object", {})
+    order_id = (payment_intent.get("metadata") or {}).get("order_id")
+    if not order_id:
+        return
+    if event_type == "payment_intent.succeeded":
+        await mark_order_paid(db, order_id, payment_intent["id"])
+    elif event_type == "payment_intent.payment_failed":
+        error = payment_intent.get("last_payment_error") or {}
+        await mark_payment_failed(db, order_id, error.get("message"))
+
+async def handle_razorpay_event(db, event_type: str, event: Dict[str, Any]):
+    payment = event.get("payload", {}).get("payment", {}).get("entity", {})
+    order_id = (payment.get("notes") or {}).get("order_id")
+    if not order_id:
+        return
+    if event_type == "payment.captured":
+        await mark_order_paid(db, order_id, payment["id"], payment.get("method"))
+    elif event_type == "payment.failed":
+        await mark_payment_failed(db, order_id, payment.get("error_description"))
+
+EVENT_HANDLERS = {
+    "stripe": handle_stripe_event,
+    "razorpay": handle_razorpay_event,
+}
+
+# ==========================================
+# Inbox and worker pool
+# ==========================================
+
+class WebhookInbox:
+    """Durable webhook inbox drained by a pool of async workers
+
+    Every app worker runs the pool; SKIP LOCKED keeps them from claiming
+    the same event. Events recorded by this process wake the pool
+    immediately, others are found by polling.
+    """
+
+    def __init__(self, workers: int = 4, batch_size: int = 10, poll_seconds: float = 5.0,
+                 lock_seconds: int = 300, max_attempts: int = 10, retention_days: int = 30):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+        self.lock_seconds = lock_seconds
+        self.max_attempts = max_attempts
+        self.retention_days = retention_days
+        self._wakeup = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    async def record(self, db, provider: str, event_id: str, event_type: str,
+                     payload: Dict[str, Any]) -> bool:
+        """Store a verified event; returns False if it was already received"""
+        from app.models.admin import WebhookEvent
+
+        stmt = (
+            pg_insert(WebhookEvent)
+            .values(
+                provider=provider,
+                event_id=event_id,
+                event_type=event_type,
+                payload=payload,
+                status=PENDING,
+                next_attempt_at=datetime.now(timezone.utc),
+            )
+            .on_conflict_do_nothing(index_elements=["provider", "event_id"])
+            .returning(WebhookEvent.id)
+        )
+        inserted = (await db.execute(stmt)).first() is not None
+        await db.commit()
+        if inserted:
+            self._wakeup.set()
+        return inserted
+
+    async def claim(self, db) -> list:
+        """Claim up to batch_size due events (and abandoned claims)"""
+        from app.models.admin import WebhookEvent
+
+        now = datetime.now(timezone.utc)
+        due = (
+            select(WebhookEvent.id)
+            .where(
+                or_(
+                    and_(WebhookEvent.status == PENDING, WebhookEvent.next_attempt_at <= now),
+                    and_(WebhookEvent.status == PROCESSING, WebhookEvent.locked_until < now),
+                )
+            )
+            .order_by(WebhookEvent.id)
+            .limit(self.batch_size)
+            .with_for_update(skip_locked=True)
+        )
+        result = await db.execute(
+            update(WebhookEvent)
+            .where(WebhookEvent.id.in_(due.scalar_subquery()))
+            .values(
+                status=PROCESSING,
+                locked_until=now + timedelta(seconds=self.lock_seconds),
+                attempts=WebhookEvent.attempts + 1,
+            )
+            .returning(
+                WebhookEvent.id, WebhookEvent.provider, WebhookEvent.event_id,
+                WebhookEvent.event_type, WebhookEvent.payload, WebhookEvent.attempts,
+            )
+            .execution_options(synchronize_session=False)
+        )
+        events = result.all()
+        await db.commit()
+        return events
+
+    async def process(self, event) -> bool:
+        """Apply one claimed event and record the outcome"""
+        from app.core.db import AsyncSessionLocal
+        from app.models.admin import WebhookEvent
+
+        error = None
+        try:
+            handler = EVENT_HANDLERS.get(event.provider)
+            if handler is None:
+                raise ValueError(f"No handler for {event.provider} webhooks")
+            async with AsyncSessionLocal() as db:
+                await handler(db, event.event_type, event.payload)
+        except Exception as e:
+            error = str(e)
+            logger.error(f"Webhook {event.provider} {event.event_id} failed (attempt {event.attempts}): {e}")
+
+        now = datetime.now(timezone.utc)
+        if error is None:
+            values = {"status": PROCESSED, "processed_at": now, "locked_until": None, "last_error": None}
+        elif event.attempts >= self.max_attempts:
+            values = {"status": FAILED, "locked_until": None, "last_error": error}
+        else:
+            backoff = min(2 ** event.attempts * 5, 3600)
+            values = {
+                "status": PENDING,
+                "next_attempt_at": now + timedelta(seconds=backoff),
+                "locked_until": None,
+                "last_error": error,
+            }
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(WebhookEvent).where(WebhookEvent.id == event.id).values(**values))
+            await db.commit()
+        return error is None
+
+    async def drain(self) -> int:
+        """Claim and process due events until none are left; returns the count"""
+        from app.core.db import AsyncSessionLocal
+
+        processed = 0
+        while True:
+            async with AsyncSessionLocal() as db:
+                events = await self.claim(db)
+            if not events:
+                return processed
+            for event in events:
+                await self.process(event)
+            processed += len(events)
+
+    async def purge_processed(self) -> int:
+        """Delete processed events older than the retention period"""
+        from app.core.db import AsyncSessionLocal
+        from app.models.admin import WebhookEvent
+
+        cutoff = datetime.now(timezone.utc) - timedelta(days=self.retention_days)
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                delete(WebhookEvent).where(WebhookEvent.status == PROCESSED, WebhookEvent.processed_at < cutoff)
+            )
+            await db.commit()
+        return result.rowcount
+
+    async def start(self) -> None:
+        if self.workers and not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker(n)) for n in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def _worker(self, n: int) -> None:
+        purged_at = 0.0
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                await self.drain()
+                if n == 0 and loop.time() - purged_at > 3600:
+                    purged_at = loop.time()
+                    await self.purge_processed()
+            except Exception as e:
+                logger.error(f"Webhook inbox worker {n} error: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+# Global webhook inbox
+webhook_inbox = WebhookInbox(
+    workers=int(os.getenv("WEBHOOK_INBOX_WORKERS", "4")),
+    poll_seconds=float(os.getenv("WEBHOOK_INBOX_POLL_SECONDS", "5")),
+    max_attempts=int(os.getenv("WEBHOOK_INBOX_MAX_ATTEMPTS", "10")),
+)
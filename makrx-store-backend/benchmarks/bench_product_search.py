@@ -0,0 +1,227 @@
+"""
+Product search: tsvector full-text match and pg_trgm word-similarity fallback
+
+Seeds a generated catalog of --products products (brands, product kinds,
+materials, colours and sizes of a maker store), then times the search
+behind GET /products for a set of queries: the product_text_search()
+condition, ordered by relevance, as a page of --limit rows plus the total
+count. Queries come in three groups:
+
+- selective: a few words that the tsvector match narrows to a small set
+- broad: one common word matching a large share of the catalog
+- fallback: misspelled or partial words with no tsvector hit, found only
+  through word similarity (%>) on name and brand
+
+Every selective and broad query must match through the tsvector, and every
+fallback query must have no tsvector match but at least one trigram match;
+the run fails otherwise. --ilike also times the leading-wildcard ILIKE
+search that product_text_search replaced.
+
+Needs PostgreSQL with the pg_trgm extension. The products table of
+--database-url is dropped and recreated, so point it at a scratch database.
+
+    python benchmarks/bench_product_search.py --database-url postgresql+psycopg2://makrx@localhost/makrx_bench
+"""
+
+import argparse
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+from sqlalchemy import Column, Computed, Index, MetaData, Table, create_engine, func, or_, select, text
+from sqlalchemy.orm import sessionmaker
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from app.core.product_search import product_text_search  # noqa: E402
+from app.models.commerce import Product  # noqa: E402
+
+BRANDS = [
+    "Prusa", "Bambu Lab", "Creality", "Elegoo", "Anycubic", "Polymaker", "eSun", "Sunlu",
+    "Raise3D", "Formlabs", "Ultimaker", "Flashforge", "E3D", "Slice Engineering", "Hatchbox", "Overture",
+]
+KINDS = [
+    "PLA filament", "PETG filament", "ABS filament", "TPU filament", "silk PLA filament",
+    "standard resin", "tough resin", "hardened steel nozzle", "brass nozzle", "hotend kit",
+    "PEI build plate", "textured build plate", "stepper motor", "extruder gear set",
+    "heated bed", "thermistor", "silicone sock", "PTFE tube", "cooling fan", "belt kit",
+]
+COLOURS = ["black", "white", "grey", "red", "orange", "yellow", "green", "blue", "purple", "gold", "silver"]
+SIZES = ["0.2mm", "0.4mm", "0.6mm", "0.8mm", "1.75mm", "2.85mm", "250g", "500g", "1kg", "2kg", "5kg"]
+FILLER = (
+    "print quality dimensional accuracy tolerance compatible printers spool vacuum sealed "
+    "desiccant high flow low warping layer adhesion replacement upgrade"
+).split()
+
+QUERIES = {
+    "selective": ["prusa nozzle", "bambu silk orange", "hardened steel nozzle 0.6mm", "polymaker petg"],
+    "broad": ["filament", "nozzle", "resin"],
+    "fallback": ["polymakr", "creallity", "anycubik resin", "elego", "prusaa"],
+}
+
+def create_tables(engine):
+    """Create products with its generated column and search indexes, without foreign keys"""
+    metadata = MetaData()
+    source = Product.__table__
+    columns = []
+    for column in source.columns:
+        args = [Computed(column.computed.sqltext, persisted=column.computed.persisted)] if column.computed else []
+        columns.append(Column(
+            column.name, column.type, *args, primary_key=column.primary_key,
+            nullable=column.nullable, server_default=column.server_default,
+        ))
+    table = Table(source.name, metadata, *columns)
+    for index in source.indexes:
+        options = {
+            f"postgresql_{key}": value for key, value in index.dialect_options["postgresql"].items() if value
+        }
+        Index(index.name, *(table.c[column.name] for column in index.columns), **options)
+
+    with engine.begin() as conn:
+        conn.execute(text(f"DROP TABLE IF EXISTS {source.name} CASCADE"))
+    metadata.create_all(engine)
+    return table
+
+def has_pg_trgm(engine):
+    with engine.begin() as conn:
+        available = conn.execute(
+            text("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        ).scalar()
+        if available:
+            conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+    return bool(available)
+
+def generate_products(count, rnd):
+    for n in range(count):
+        brand = rnd.choice(BRANDS)
+        kind = rnd.choice(KINDS)
+        colour = rnd.choice(COLOURS)
+        size = rnd.choice(SIZES)
+        name = f"{brand} {kind} {colour} {size}"
+        yield {
+            "id": n + 1,
+            "slug": f"product-{n + 1}",
+            "name": name,
+            "brand": brand,
+            "short_description": f"{colour.title()} {kind}, {size}",
+            "description": f"{name}. " + " ".join(rnd.choices(FILLER, k=24)),
+            "category_id": rnd.randrange(1, 60),
+            "price": rnd.randrange(99, 25000) / 100,
+            "stock_qty": rnd.randrange(0, 200),
+            "is_active": True,
+            "attributes": {"colour": colour, "size": size},
+            "tags": [kind.split()[-1], colour],
+        }
+
+def seed(engine, table, count, rnd, batch_size=10000):
+    rows = []
+    with engine.begin() as conn:
+        for row in generate_products(count, rnd):
+            rows.append(row)
+            if len(rows) >= batch_size:
+                conn.execute(table.insert(), rows)
+                rows = []
+        if rows:
+            conn.execute(table.insert(), rows)
+        conn.execute(text(f"ANALYZE {table.name}"))
+
+def search_page(db, q, limit):
+    """The GET /products search: a relevance-ordered page plus the total count"""
+    condition, relevance = product_text_search(q)
+    base = select(Product.id).where(Product.is_active == True, condition)  # noqa: E712
+    total = db.execute(select(func.count()).select_from(base.subquery())).scalar()
+    ids = db.execute(
+        base.order_by(relevance.desc(), Product.created_at.desc()).limit(limit)
+    ).scalars().all()
+    return total, ids
+
+def ilike_page(db, q, limit):
+    """The search as it was before product_text_search"""
+    term = f"%{q.strip()}%"
+    condition = or_(
+        Product.name.ilike(term),
+        Product.description.ilike(term),
+        Product.short_description.ilike(term),
+        Product.brand.ilike(term),
+    )
+    base = select(Product.id).where(Product.is_active == True, condition)  # noqa: E712
+    total = db.execute(select(func.count()).select_from(base.subquery())).scalar()
+    ids = db.execute(base.order_by(Product.created_at.desc()).limit(limit)).scalars().all()
+    return total, ids
+
+def tsvector_matches(db, q):
+    tsquery = func.websearch_to_tsquery("english", q)
+    return db.execute(
+        select(func.count()).select_from(Product).where(Product.search_vector.op("@@")(tsquery))
+    ).scalar()
+
+def measure(session_factory, search, q, limit, repeat):
+    timings = []
+    total = None
+    for _ in range(repeat):
+        with session_factory() as db:
+            start = time.perf_counter()
+            total, _ = search(db, q, limit)
+            timings.append(time.perf_counter() - start)
+    return timings, total
+
+def report(name, q, timings, total):
+    timings = sorted(timings)
+    p95 = timings[max(int(len(timings) * 0.95) - 1, 0)]
+    print(
+        f"{name:<10} {q!r:<32} {total:>7} hits   "
+        f"p50 {statistics.median(timings) * 1e3:8.2f} ms   p95 {p95 * 1e3:8.2f} ms"
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--products", type=int, default=500000)
+    parser.add_argument("--repeat", type=int, default=20, help="timed runs per query")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--database-url", required=True, help="PostgreSQL URL with a synchronous driver")
+    parser.add_argument("--ilike", action="store_true", help="also time the ILIKE search it replaced")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    if engine.dialect.name != "postgresql":
+        sys.exit("product search needs PostgreSQL")
+    if not has_pg_trgm(engine):
+        sys.exit("pg_trgm is not available on this server")
+    table = create_tables(engine)
+
+    session_factory = sessionmaker(bind=engine)
+    rnd = random.Random(args.seed)
+
+    start = time.perf_counter()
+    seed(engine, table, args.products, rnd)
+    print(f"seeded {args.products} products in {time.perf_counter() - start:.1f}s")
+
+    failures = []
+    for group in QUERIES:
+        print(f"-- {group}")
+        for q in QUERIES[group]:
+            with session_factory() as db:
+                fts_hits = tsvector_matches(db, q)
+            if group == "fallback" and fts_hits:
+                failures.append(f"fallback query {q!r} has {fts_hits} tsvector matches")
+            elif group != "fallback" and not fts_hits:
+                failures.append(f"{group} query {q!r} has no tsvector match")
+
+            timings, total = measure(session_factory, search_page, q, args.limit, args.repeat)
+            report("search", q, timings, total)
+            if not total:
+                failures.append(f"{group} query {q!r} found nothing")
+            if args.ilike:
+                timings, total = measure(session_factory, ilike_page, q, args.limit, max(args.repeat // 5, 1))
+                report("ilike", q, timings, total)
+
+    if failures:
+        sys.exit("\n".join(failures))
+    print(f"all {sum(len(queries) for queries in QUERIES.values())} queries matched through the expected path")
+
+if __name__ == "__main__":
+    main()
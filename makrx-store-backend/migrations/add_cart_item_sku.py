@@ -0,0 +1,67 @@
+"""
+Database migration for set-based bulk cart writes
+Adds cart_items.product_sku and the unique (cart_id, product_sku) index
+used as the ON CONFLICT target of bulk cart upserts, and
+cart_items.variant_id for the variant a SKU resolved to
+"""
+
+from sqlalchemy import text
+from app.core.db import engine
+
+
+def upgrade():
+    """Apply the migration"""
+
+    sql_statements = [
+        """
+        ALTER TABLE cart_items ADD COLUMN IF NOT EXISTS product_sku VARCHAR(100);
+        """,
+
+        """
+        ALTER TABLE cart_items ADD COLUMN IF NOT EXISTS variant_id INTEGER REFERENCES product_variants (id);
+        """,
+
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS ix_cart_items_cart_sku ON cart_items (cart_id, product_sku);
+        """,
+    ]
+
+    # Execute all statements
+    with engine.connect() as conn:
+        for sql in sql_statements:
+            try:
+                conn.execute(text(sql))
+                conn.commit()
+                print(f"✓ Executed: {sql[:50]}...")
+            except Exception as e:
+                print(f"✗ Failed: {sql[:50]}... - {e}")
+                conn.rollback()
+
+
+def downgrade():
+    """Reverse the migration"""
+
+    sql_statements = [
+        "ALTER TABLE cart_items DROP COLUMN IF EXISTS variant_id;",
+        "DROP INDEX IF EXISTS ix_cart_items_cart_sku;",
+        "ALTER TABLE cart_items DROP COLUMN IF EXISTS product_sku;",
+    ]
+
+    with engine.connect() as conn:
+        for sql in sql_statements:
+            try:
+                conn.execute(text(sql))
+                conn.commit()
+                print(f"✓ Reverted: {sql[:50]}...")
+            except Exception as e:
+                print(f"✗ Failed to revert: {sql[:50]}... - {e}")
+                conn.rollback()
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "downgrade":
+        downgrade()
+    else:
+        upgrade()
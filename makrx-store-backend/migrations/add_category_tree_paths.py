@@ -0,0 +1,76 @@
+"""
+Database migration for materialized category paths
+Backfills categories.path and categories.level for the whole hierarchy
+(the enhanced catalog migration only populated root categories) and adds a
+prefix index for subtree lookups
+"""
+
+from sqlalchemy import text
+from app.core.db import engine
+
+
+def upgrade():
+    """Apply the migration"""
+
+    sql_statements = [
+        # Recompute path/level from parent links, roots first
+        """
+        WITH RECURSIVE tree AS (
+            SELECT id, slug::text AS path, 0 AS level
+            FROM categories
+            WHERE parent_id IS NULL
+            UNION ALL
+            SELECT c.id, tree.path || '/' || c.slug, tree.level + 1
+            FROM categories c
+            JOIN tree ON c.parent_id = tree.id
+        )
+        UPDATE categories
+        SET path = tree.path, level = tree.level
+        FROM tree
+        WHERE categories.id = tree.id
+          AND (categories.path IS DISTINCT FROM tree.path OR categories.level IS DISTINCT FROM tree.level);
+        """,
+
+        # Subtree lookups (path LIKE 'parent/%')
+        """
+        CREATE INDEX IF NOT EXISTS ix_categories_path_prefix ON categories(path varchar_pattern_ops);
+        """,
+    ]
+
+    # Execute all statements
+    with engine.connect() as conn:
+        for sql in sql_statements:
+            try:
+                conn.execute(text(sql))
+                conn.commit()
+                print(f"✓ Executed: {sql[:50]}...")
+            except Exception as e:
+                print(f"✗ Failed: {sql[:50]}... - {e}")
+                conn.rollback()
+
+
+def downgrade():
+    """Reverse the migration"""
+
+    sql_statements = [
+        "DROP INDEX IF EXISTS ix_categories_path_prefix;",
+    ]
+
+    with engine.connect() as conn:
+        for sql in sql_statements:
+            try:
+                conn.execute(text(sql))
+                conn.commit()
+                print(f"✓ Reverted: {sql[:50]}...")
+            except Exception as e:
+                print(f"✗ Failed to revert: {sql[:50]}... - {e}")
+                conn.rollback()
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "downgrade":
+        downgrade()
+    else:
+        upgrade()
@@ -0,0 +1,72 @@
+"""
+Database migration for the shared idempotency store
+Creates idempotency_keys, the durable side of app.core.idempotency
+(Redis caches in front of it)
+"""
+
+from sqlalchemy import text
+from app.core.db import engine
+
+
+def upgrade():
+    """Apply the migration"""
+
+    sql_statements = [
+        """
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            id SERIAL PRIMARY KEY,
+            scope VARCHAR(100) NOT NULL,
+            key VARCHAR(255) NOT NULL,
+            fingerprint VARCHAR(64),
+            status VARCHAR(20) NOT NULL DEFAULT 'in_progress',
+            response JSONB,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            locked_until TIMESTAMP WITH TIME ZONE,
+            completed_at TIMESTAMP WITH TIME ZONE,
+            expires_at TIMESTAMP WITH TIME ZONE NOT NULL
+        );
+        """,
+
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS ix_idempotency_keys_scope_key ON idempotency_keys (scope, key);
+        CREATE INDEX IF NOT EXISTS ix_idempotency_keys_expires_at ON idempotency_keys (expires_at);
+        """,
+    ]
+
+    # Execute all statements
+    with engine.connect() as conn:
+        for sql in sql_statements:
+            try:
+                conn.execute(text(sql))
+                conn.commit()
+                print(f"✓ Executed: {sql[:50]}...")
+            except Exception as e:
+                print(f"✗ Failed: {sql[:50]}... - {e}")
+                conn.rollback()
+
+
+def downgrade():
+    """Reverse the migration"""
+
+    sql_statements = [
+        "DROP TABLE IF EXISTS idempotency_keys;",
+    ]
+
+    with engine.connect() as conn:
+        for sql in sql_statements:
+            try:
+                conn.execute(text(sql))
+                conn.commit()
+                print(f"✓ Reverted: {sql[:50]}...")
+            except Exception as e:
+                print(f"✗ Failed to revert: {sql[:50]}... - {e}")
+                conn.rollback()
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "downgrade":
+        downgrade()
+    else:
+        upgrade()
@@ -0,0 +1,76 @@
+"""
+Database migration for the transactional outbox
+Creates outbox_messages, written together with order and service order
+changes and delivered by the relay in app.services.outbox
+"""
+
+from sqlalchemy import text
+from app.core.db import engine
+
+
+def upgrade():
+    """Apply the migration"""
+
+    sql_statements = [
+        """
+        CREATE TABLE IF NOT EXISTS outbox_messages (
+            id SERIAL PRIMARY KEY,
+            aggregate_type VARCHAR(50) NOT NULL,
+            aggregate_id VARCHAR(255) NOT NULL,
+            destination VARCHAR(50) NOT NULL,
+            topic VARCHAR(255) NOT NULL,
+            payload JSONB NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            locked_until TIMESTAMP WITH TIME ZONE,
+            last_error TEXT,
+            response JSONB,
+            created_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            sent_at TIMESTAMP WITH TIME ZONE
+        );
+        """,
+
+        """
+        CREATE INDEX IF NOT EXISTS ix_outbox_messages_aggregate ON outbox_messages (aggregate_type, aggregate_id, id);
+        CREATE INDEX IF NOT EXISTS ix_outbox_messages_status_next_attempt ON outbox_messages (status, next_attempt_at);
+        """,
+    ]
+
+    # Execute all statements
+    with engine.connect() as conn:
+        for sql in sql_statements:
+            try:
+                conn.execute(text(sql))
+                conn.commit()
+                print(f"✓ Executed: {sql[:50]}...")
+            except Exception as e:
+                print(f"✗ Failed: {sql[:50]}... - {e}")
+                conn.rollback()
+
+
+def downgrade():
+    """Reverse the migration"""
+
+    sql_statements = [
+        "DROP TABLE IF EXISTS outbox_messages;",
+    ]
+
+    with engine.connect() as conn:
+        for sql in sql_statements:
+            try:
+                conn.execute(text(sql))
+                conn.commit()
+                print(f"✓ Reverted: {sql[:50]}...")
+            except Exception as e:
+                print(f"✗ Failed to revert: {sql[:50]}... - {e}")
+                conn.rollback()
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "downgrade":
+        downgrade()
+    else:
+        upgrade()
@@ -0,0 +1,86 @@
+"""
+Database migration for product full-text search
+Adds the weighted search_vector column with its GIN index, and pg_trgm
+trigram indexes for typo-tolerant name/brand matching
+"""
+
+from sqlalchemy import text
+from app.core.db import engine
+
+
+def upgrade():
+    """Apply the migration"""
+
+    sql_statements = [
+        # Trigram operator classes
+        """
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        """,
+
+        # Weighted search document, maintained by Postgres on every write
+        """
+        ALTER TABLE products
+        ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+            setweight(to_tsvector('english', coalesce(name, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(brand, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(short_description, '')), 'C') ||
+            setweight(to_tsvector('english', coalesce(description, '')), 'D')
+        ) STORED;
+        """,
+
+        # Search indexes
+        """
+        CREATE INDEX IF NOT EXISTS ix_products_search_vector ON products USING gin (search_vector);
+        CREATE INDEX IF NOT EXISTS ix_products_name_trgm ON products USING gin (name gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS ix_products_brand_trgm ON products USING gin (brand gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS ix_products_tags ON products USING gin (tags jsonb_path_ops);
+        CREATE INDEX IF NOT EXISTS ix_products_attributes ON products USING gin (attributes jsonb_path_ops);
+        """,
+
+        """
+        ANALYZE products;
+        """,
+    ]
+
+    # Execute all statements
+    with engine.connect() as conn:
+        for sql in sql_statements:
+            try:
+                conn.execute(text(sql))
+                conn.commit()
+                print(f"✓ Executed: {sql[:50]}...")
+            except Exception as e:
+                print(f"✗ Failed: {sql[:50]}... - {e}")
+                conn.rollback()
+
+
+def downgrade():
+    """Reverse the migration"""
+
+    sql_statements = [
+        "DROP INDEX IF EXISTS ix_products_attributes;",
+        "DROP INDEX IF EXISTS ix_products_tags;",
+        "DROP INDEX IF EXISTS ix_products_brand_trgm;",
+        "DROP INDEX IF EXISTS ix_products_name_trgm;",
+        "DROP INDEX IF EXISTS ix_products_search_vector;",
+        "ALTER TABLE products DROP COLUMN IF EXISTS search_vector;",
+    ]
+
+    with engine.connect() as conn:
+        for sql in sql_statements:
+            try:
+                conn.execute(text(sql))
+                conn.commit()
+                print(f"✓ Reverted: {sql[:50]}...")
+            except Exception as e:
+                print(f"✗ Failed to revert: {sql[:50]}... - {e}")
+                conn.rollback()
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "downgrade":
+        downgrade()
+    else:
+        upgrade()
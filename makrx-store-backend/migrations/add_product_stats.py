@@ -0,0 +1,113 @@
+"""
+Database migration for denormalized product counters
+Creates product_stats (rating and sales counters per product) and backfills
+it from published product reviews and counted orders. Afterwards the
+counters are maintained by the review and order flush hooks.
+"""
+
+from sqlalchemy import text
+from app.core.db import engine
+
+
+def upgrade():
+    """Apply the migration"""
+
+    sql_statements = [
+        """
+        CREATE TABLE IF NOT EXISTS product_stats (
+            product_id INTEGER PRIMARY KEY REFERENCES products(id),
+            rating_count INTEGER NOT NULL DEFAULT 0,
+            rating_sum INTEGER NOT NULL DEFAULT 0,
+            average_rating NUMERIC(3, 2),
+            verified_reviews INTEGER NOT NULL DEFAULT 0,
+            units_sold INTEGER NOT NULL DEFAULT 0,
+            order_count INTEGER NOT NULL DEFAULT 0,
+            popularity_score DOUBLE PRECISION NOT NULL DEFAULT 0,
+            last_ordered_at TIMESTAMP WITH TIME ZONE,
+            updated_at TIMESTAMP WITH TIME ZONE DEFAULT now()
+        );
+        """,
+
+        """
+        CREATE INDEX IF NOT EXISTS ix_product_stats_rating ON product_stats (average_rating);
+        CREATE INDEX IF NOT EXISTS ix_product_stats_popularity ON product_stats (popularity_score);
+        """,
+
+        # Backfill ratings from published product reviews
+        """
+        INSERT INTO product_stats (product_id, rating_count, rating_sum, average_rating, verified_reviews)
+        SELECT p.id, count(*), sum(r.rating), round(avg(r.rating), 2),
+               count(*) FILTER (WHERE r.verified_purchase)
+        FROM reviews r
+        JOIN products p ON p.id::text = r.target_id
+        WHERE r.target_type = 'product' AND r.status = 'published'
+        GROUP BY p.id
+        ON CONFLICT (product_id) DO UPDATE SET
+            rating_count = EXCLUDED.rating_count,
+            rating_sum = EXCLUDED.rating_sum,
+            average_rating = EXCLUDED.average_rating,
+            verified_reviews = EXCLUDED.verified_reviews,
+            updated_at = now();
+        """,
+
+        # Backfill sales; popularity uses the same 30-day half-life and
+        # 2024-01-01 epoch scaling as app.models.commerce.popularity_weight
+        """
+        INSERT INTO product_stats (product_id, units_sold, order_count, popularity_score, last_ordered_at)
+        SELECT oi.product_id, sum(oi.quantity), count(DISTINCT o.id),
+               sum(oi.quantity * power(2.0, extract(epoch FROM o.created_at - timestamptz '2024-01-01 00:00:00+00') / 86400 / 30)),
+               max(o.created_at)
+        FROM order_items oi
+        JOIN orders o ON o.id = oi.order_id
+        WHERE o.status IN ('paid', 'processing', 'shipped', 'delivered', 'completed')
+        GROUP BY oi.product_id
+        ON CONFLICT (product_id) DO UPDATE SET
+            units_sold = EXCLUDED.units_sold,
+            order_count = EXCLUDED.order_count,
+            popularity_score = EXCLUDED.popularity_score,
+            last_ordered_at = EXCLUDED.last_ordered_at,
+            updated_at = now();
+        """,
+
+        """
+        ANALYZE product_stats;
+        """,
+    ]
+
+    # Execute all statements
+    with engine.connect() as conn:
+        for sql in sql_statements:
+            try:
+                conn.execute(text(sql))
+                conn.commit()
+                print(f"✓ Executed: {sql[:50]}...")
+            except Exception as e:
+                print(f"✗ Failed: {sql[:50]}... - {e}")
+                conn.rollback()
+
+
+def downgrade():
+    """Reverse the migration"""
+
+    sql_statements = [
+        "DROP TABLE IF EXISTS product_stats;",
+    ]
+
+    with engine.connect() as conn:
+        for sql in sql_statements:
+            try:
+                conn.execute(text(sql))
+                conn.commit()
+                print(f"✓ Reverted: {sql[:50]}...")
+            except Exception as e:
+                print(f"✗ Failed to revert: {sql[:50]}... - {e}")
+                conn.rollback()
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "downgrade":
+        downgrade()
+    else:
+        upgrade()
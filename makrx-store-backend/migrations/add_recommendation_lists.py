@@ -0,0 +1,66 @@
+"""
+Database migration for offline product recommendations
+Creates recommendation_lists, which the recommendation job in
+app.services.recommendations replaces on every build
+"""
+
+from sqlalchemy import text
+from app.core.db import engine
+
+
+def upgrade():
+    """Apply the migration"""
+
+    sql_statements = [
+        """
+        CREATE TABLE IF NOT EXISTS recommendation_lists (
+            kind VARCHAR(20) NOT NULL,
+            key VARCHAR(255) NOT NULL,
+            items JSONB NOT NULL DEFAULT '[]',
+            generated_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            PRIMARY KEY (kind, key)
+        );
+        """,
+
+        """
+        CREATE INDEX IF NOT EXISTS ix_recommendation_lists_generated_at ON recommendation_lists (generated_at);
+        """,
+    ]
+
+    # Execute all statements
+    with engine.connect() as conn:
+        for sql in sql_statements:
+            try:
+                conn.execute(text(sql))
+                conn.commit()
+                print(f"✓ Executed: {sql[:50]}...")
+            except Exception as e:
+                print(f"✗ Failed: {sql[:50]}... - {e}")
+                conn.rollback()
+
+
+def downgrade():
+    """Reverse the migration"""
+
+    sql_statements = [
+        "DROP TABLE IF EXISTS recommendation_lists;",
+    ]
+
+    with engine.connect() as conn:
+        for sql in sql_statements:
+            try:
+                conn.execute(text(sql))
+                conn.commit()
+                print(f"✓ Reverted: {sql[:50]}...")
+            except Exception as e:
+                print(f"✗ Failed to revert: {sql[:50]}... - {e}")
+                conn.rollback()
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "downgrade":
+        downgrade()
+    else:
+        upgrade()
@@ -0,0 +1,74 @@
+"""
+Database migration for quick reorder consumption forecasts
+Creates reorder_suggestions, which the forecast job in
+app.services.reorder_forecast replaces on every build
+"""
+
+from sqlalchemy import text
+from app.core.db import engine
+
+
+def upgrade():
+    """Apply the migration"""
+
+    sql_statements = [
+        """
+        CREATE TABLE IF NOT EXISTS reorder_suggestions (
+            id SERIAL PRIMARY KEY,
+            user_id VARCHAR(255) NOT NULL,
+            product_id INTEGER NOT NULL REFERENCES products(id),
+            order_count INTEGER NOT NULL,
+            total_quantity INTEGER NOT NULL,
+            last_ordered_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            last_quantity INTEGER NOT NULL,
+            interval_days NUMERIC(10, 2) NOT NULL,
+            consumption_rate NUMERIC(12, 4) NOT NULL,
+            suggested_quantity INTEGER NOT NULL,
+            predicted_depletion_at TIMESTAMP WITH TIME ZONE NOT NULL,
+            generated_at TIMESTAMP WITH TIME ZONE NOT NULL
+        );
+        """,
+
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS ix_reorder_suggestions_user_product ON reorder_suggestions (user_id, product_id);
+        CREATE INDEX IF NOT EXISTS ix_reorder_suggestions_user_depletion ON reorder_suggestions (user_id, predicted_depletion_at);
+        """,
+    ]
+
+    # Execute all statements
+    with engine.connect() as conn:
+        for sql in sql_statements:
+            try:
+                conn.execute(text(sql))
+                conn.commit()
+                print(f"✓ Executed: {sql[:50]}...")
+            except Exception as e:
+                print(f"✗ Failed: {sql[:50]}... - {e}")
+                conn.rollback()
+
+
+def downgrade():
+    """Reverse the migration"""
+
+    sql_statements = [
+        "DROP TABLE IF EXISTS reorder_suggestions;",
+    ]
+
+    with engine.connect() as conn:
+        for sql in sql_statements:
+            try:
+                conn.execute(text(sql))
+                conn.commit()
+                print(f"✓ Reverted: {sql[:50]}...")
+            except Exception as e:
+                print(f"✗ Failed to revert: {sql[:50]}... - {e}")
+                conn.rollback()
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "downgrade":
+        downgrade()
+    else:
+        upgrade()
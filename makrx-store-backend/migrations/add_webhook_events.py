@@ -0,0 +1,74 @@
+"""
+Database migration for the payment webhook inbox
+Creates webhook_events, where the webhook routes queue verified events for
+the workers in app.services.webhook_inbox
+"""
+
+from sqlalchemy import text
+from app.core.db import engine
+
+
+def upgrade():
+    """Apply the migration"""
+
+    sql_statements = [
+        """
+        CREATE TABLE IF NOT EXISTS webhook_events (
+            id SERIAL PRIMARY KEY,
+            provider VARCHAR(20) NOT NULL,
+            event_id VARCHAR(255) NOT NULL,
+            event_type VARCHAR(100) NOT NULL,
+            payload JSONB NOT NULL,
+            status VARCHAR(20) NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            locked_until TIMESTAMP WITH TIME ZONE,
+            last_error TEXT,
+            received_at TIMESTAMP WITH TIME ZONE DEFAULT now(),
+            processed_at TIMESTAMP WITH TIME ZONE
+        );
+        """,
+
+        """
+        CREATE UNIQUE INDEX IF NOT EXISTS ix_webhook_events_provider_event ON webhook_events (provider, event_id);
+        CREATE INDEX IF NOT EXISTS ix_webhook_events_status_next_attempt ON webhook_events (status, next_attempt_at);
+        """,
+    ]
+
+    # Execute all statements
+    with engine.connect() as conn:
+        for sql in sql_statements:
+            try:
+                conn.execute(text(sql))
+                conn.commit()
+                print(f"✓ Executed: {sql[:50]}...")
+            except Exception as e:
+                print(f"✗ Failed: {sql[:50]}... - {e}")
+                conn.rollback()
+
+
+def downgrade():
+    """Reverse the migration"""
+
+    sql_statements = [
+        "DROP TABLE IF EXISTS webhook_events;",
+    ]
+
+    with engine.connect() as conn:
+        for sql in sql_statements:
+            try:
+                conn.execute(text(sql))
+                conn.commit()
+                print(f"✓ Reverted: {sql[:50]}...")
+            except Exception as e:
+                print(f"✗ Failed to revert: {sql[:50]}... - {e}")
+                conn.rollback()
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == "downgrade":
+        downgrade()
+    else:
+        upgrade()
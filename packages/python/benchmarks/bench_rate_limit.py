@@ -0,0 +1,107 @@
+"""
+Rate limit middleware overhead at a paced request rate
+
+Drives an ASGI app wrapped in a rate limit middleware (the same backend.hit
+call the auth-service and makrcave RateLimitMiddleware make) at --rps for
+--seconds, and reports the added latency per request against the bare app,
+plus whether the target rate was sustained. Runs the in-process backend,
+the Redis backend when --redis-url is given, and a Redis backend pointed at
+a dead address to show the fallback cost.
+
+    python benchmarks/bench_rate_limit.py --rps 5000 --seconds 5 \\
+        --redis-url redis://localhost:6379/15
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from typing import Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from makrx_rate_limit import InMemoryRateLimitBackend, RedisRateLimitBackend  # noqa: E402
+
+async def app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+def rate_limited(inner, backend, calls: int, period: int):
+    async def middleware(scope, receive, send):
+        allowed, _ = await backend.hit(f"bench:{scope['client'][0]}", calls, period)
+        if not allowed:
+            await send({"type": "http.response.start", "status": 429, "headers": []})
+            await send({"type": "http.response.body", "body": b""})
+            return
+        await inner(scope, receive, send)
+    return middleware
+
+async def run(handler, rps: int, seconds: float, clients: int):
+    """Fire requests on a fixed schedule; returns per-request latencies"""
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    latencies = []
+
+    async def one(ip: str):
+        scope = {"type": "http", "method": "GET", "path": "/", "client": (ip, 1234)}
+        start = time.perf_counter()
+        await handler(scope, receive, send)
+        latencies.append(time.perf_counter() - start)
+
+    total = int(rps * seconds)
+    tasks = []
+    started = time.perf_counter()
+    for n in range(total):
+        delay = started + n / rps - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        ip = f"10.0.{random.randrange(clients) // 256}.{random.randrange(256)}"
+        tasks.append(asyncio.create_task(one(ip)))
+    await asyncio.gather(*tasks)
+    elapsed = time.perf_counter() - started
+    return latencies, total / elapsed
+
+def report(name: str, latencies, achieved: float, baseline_p50: Optional[float] = None):
+    latencies = sorted(latencies)
+    p50 = statistics.median(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    line = f"{name:<22} {achieved:8.0f} rps   p50 {p50 * 1e6:7.1f} us   p99 {p99 * 1e6:8.1f} us"
+    if baseline_p50 is not None:
+        line += f"   overhead p50 {(p50 - baseline_p50) * 1e6:7.1f} us"
+    print(line)
+    return p50
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--rps", type=int, default=5000)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--clients", type=int, default=2000, help="distinct client IPs")
+    parser.add_argument("--redis-url", default=os.getenv("RATE_LIMIT_REDIS_URL"))
+    args = parser.parse_args()
+
+    calls, period = 1000, 3600
+    latencies, achieved = await run(app, args.rps, args.seconds, args.clients)
+    baseline = report("no rate limit", latencies, achieved)
+
+    scenarios = [("in-process", InMemoryRateLimitBackend())]
+    if args.redis_url:
+        scenarios.append(("redis", RedisRateLimitBackend(args.redis_url, prefix="bench")))
+    try:
+        scenarios.append(("redis down (fallback)", RedisRateLimitBackend("redis://127.0.0.1:1/0")))
+    except ImportError:
+        pass
+
+    for name, backend in scenarios:
+        handler = rate_limited(app, backend, calls, period)
+        latencies, achieved = await run(handler, args.rps, args.seconds, args.clients)
+        report(name, latencies, achieved, baseline)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,160 @@
+"""
+Sliding-window-counter rate limit backends shared by the MakrX backends
+Used by the auth-service and makrcave RateLimitMiddleware. Each key keeps
+two counters (current and previous window), so a check is O(1). The Redis
+backend shares limits across workers and hosts; the in-process backend is
+its fallback and the default without REDIS_URL/RATE_LIMIT_REDIS_URL.
+"""
+
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+class InMemoryRateLimitBackend:
+    """In-process sliding-window-counter backend.
+
+    Keeps only two counters per key (current and previous window), so each
+    check is O(1). Keys are kept in least-recently-used order and the table
+    is capped at max_keys: a new key evicts the key that was hit longest
+    ago, which is stale or at least the least active client, so flooding
+    the table with new keys cannot reset the counts of clients that are
+    still sending requests. Limits are per process; use
+    RedisRateLimitBackend to share them across workers.
+    """
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        # key -> [window_index, current_count, previous_count], LRU first
+        self.windows: "OrderedDict[str, list]" = OrderedDict()
+
+    async def hit(self, key: str, limit: int, period: int) -> Tuple[bool, int]:
+        return self.check(key, limit, period)
+
+    def check(self, key: str, limit: int, period: int) -> Tuple[bool, int]:
+        now = time.time()
+        window = int(now // period)
+        state = self.windows.get(key)
+
+        if state is None:
+            while len(self.windows) >= self.max_keys:
+                self.windows.popitem(last=False)
+            state = self.windows[key] = [window, 0, 0]
+        else:
+            self.windows.move_to_end(key)
+            if state[0] != window:
+                # Roll forward; anything older than the previous window is gone
+                state[2] = state[1] if state[0] == window - 1 else 0
+                state[1] = 0
+                state[0] = window
+
+        weight = 1 - (now % period) / period
+        count = int(state[2] * weight) + state[1]
+        if count >= limit:
+            return False, count
+
+        state[1] += 1
+        return True, count + 1
+
+class RedisRateLimitBackend:
+    """Sliding-window-counter backend shared by every worker via Redis.
+
+    One atomic Lua call per request reads the previous window, checks the
+    weighted count and increments the current window only when allowed.
+    Redis calls time out after socket_timeout seconds; after a failure the
+    backend uses the in-process fallback for retry_seconds (doubling up to
+    max_retry_seconds while Redis keeps failing), then lets a single request
+    probe Redis again, so an outage costs one slow request per retry
+    interval instead of a timeout on every request.
+    """
+
+    SCRIPT = """
+    local current = tonumber(redis.call('GET', KEYS[1]) or '0')
+    local previous = tonumber(redis.call('GET', KEYS[2]) or '0')
+    local count = math.floor(previous * tonumber(ARGV[2])) + current
+    if count >= tonumber(ARGV[1]) then
+        return {0, count}
+    end
+    current = redis.call('INCR', KEYS[1])
+    if current == 1 then
+        redis.call('EXPIRE', KEYS[1], ARGV[3])
+    end
+    return {1, count + 1}
+    """
+
+    def __init__(self, redis_url: str, prefix: str = "ratelimit",
+                 fallback: Optional[InMemoryRateLimitBackend] = None,
+                 socket_timeout: float = 0.05, retry_seconds: float = 5.0,
+                 max_retry_seconds: float = 60.0):
+        import redis.asyncio as redis
+
+        self.client = redis.from_url(
+            redis_url,
+            socket_timeout=socket_timeout,
+            socket_connect_timeout=socket_timeout,
+        )
+        self.prefix = prefix
+        self.fallback = fallback or InMemoryRateLimitBackend()
+        self.script = self.client.register_script(self.SCRIPT)
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+        self._backoff = retry_seconds
+        self._open_until = 0.0  # Redis is skipped until this monotonic time
+        self._probing = False
+
+    async def hit(self, key: str, limit: int, period: int) -> Tuple[bool, int]:
+        probe = False
+        if self._open_until:
+            if self._probing or time.monotonic() < self._open_until:
+                return self.fallback.check(key, limit, period)
+            # Retry interval is over: let this one request try Redis again
+            self._probing = probe = True
+
+        now = time.time()
+        window = int(now // period)
+        weight = 1 - (now % period) / period
+        try:
+            allowed, count = await self.script(
+                keys=[
+                    f"{self.prefix}:{key}:{window}",
+                    f"{self.prefix}:{key}:{window - 1}",
+                ],
+                args=[limit, weight, period * 2],
+            )
+        except Exception as e:
+            # Requests already in flight when Redis went away fail too;
+            # only the first failure (or a failed probe) opens the circuit
+            if probe or not self._open_until:
+                logger.warning(
+                    f"Redis rate limit backend unavailable, using in-process limits "
+                    f"for {self._backoff:.0f}s: {e}"
+                )
+                self._open_until = time.monotonic() + self._backoff
+                self._backoff = min(self._backoff * 2, self.max_retry_seconds)
+            return self.fallback.check(key, limit, period)
+        finally:
+            if probe:
+                self._probing = False
+
+        if probe:
+            logger.info("Redis rate limit backend recovered")
+            self._open_until = 0.0
+            self._backoff = self.retry_seconds
+        return bool(allowed), int(count)
+
+def create_rate_limit_backend():
+    """Use Redis when RATE_LIMIT_REDIS_URL/REDIS_URL is set, else in-process"""
+    redis_url = os.getenv("RATE_LIMIT_REDIS_URL") or os.getenv("REDIS_URL")
+    if redis_url:
+        try:
+            return RedisRateLimitBackend(
+                redis_url,
+                socket_timeout=float(os.getenv("RATE_LIMIT_REDIS_TIMEOUT", "0.05")),
+                retry_seconds=float(os.getenv("RATE_LIMIT_REDIS_RETRY_SECONDS", "5")),
+            )
+        except ImportError:
+            logger.warning("redis package not installed, using in-process rate limits")
+    return InMemoryRateLimitBackend()